@@ -1,3 +1,4 @@
 from run_lambda.context import MockLambdaContext, MockCognitoIdentity, \
     MockClientContext
 from run_lambda.call import run_lambda, LambdaResult, LambdaCallSummary
+from run_lambda.patches import PatchSet, PatchCallStats
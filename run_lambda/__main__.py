@@ -1,22 +1,66 @@
 import argparse
-import imp
 import json
-import os
 import sys
 
+import run_lambda.asyncinvoke as asyncinvoke
 import run_lambda.call as call
+import run_lambda.coldstart as coldstart
+import run_lambda.compare as compare
 import run_lambda.context as context
+import run_lambda.corpus as corpus
+import run_lambda.emf as emf
+import run_lambda.gcsweep as gcsweep
+import run_lambda.init as init
+import run_lambda.leaks as leaks
+import run_lambda.logs as logs
+import run_lambda.metrics as metrics
+import run_lambda.package as package
+import run_lambda.replay as replay
+import run_lambda.resultcache as resultcache
+import run_lambda.resultlog as resultlog
+import run_lambda.streaming as streaming
+import run_lambda.simulator as simulator
+import run_lambda.tracing as tracing
+import run_lambda.usage as usage
+import run_lambda.watch as watch
+
+
+# Subcommands of the ``run_lambda`` command, keyed by name. Each command is
+# invoked with the remaining command-line arguments.
+COMMANDS = {
+    "async": asyncinvoke.main,
+    "coldstart": coldstart.main,
+    "compare": compare.main,
+    "gcsweep": gcsweep.main,
+    "leaks": leaks.main,
+    "merge": replay.merge_main,
+    "query": resultlog.main,
+    "replay": replay.main,
+    "simulate": simulator.main,
+}
 
 
 def arguments():
-    parser = argparse.ArgumentParser(description="Run AWS Lambda function locally")
+    parser = argparse.ArgumentParser(
+        description="Run AWS Lambda function locally",
+        epilog="Other commands: {}. Run \"run_lambda COMMAND --help\" for "
+               "more information.".format(", ".join(sorted(COMMANDS))))
     parser.add_argument("filename", type=str,
-                        help="name of file containing Lambda function")
+                        help="name of file containing Lambda function, or of "
+                             "deployment package (.zip)")
     parser.add_argument("event", type=str,
-                        help="filename of file containing JSON event data")
+                        help="filename of file containing JSON event data. May "
+                             "also be a JSON lines (.jsonl) file or a directory "
+                             "of event files, to run a set of events")
     parser.add_argument("-f", "--function", metavar="HANDLER_FUNCTION",
                         dest="function_name", type=str, default="handler",
-                        help="Name of handler function. Defaults to \"handler\"")
+                        help="Name of handler function. Defaults to \"handler\". "
+                             "For a deployment package, the handler setting, "
+                             "e.g. \"app.handler\"")
+    parser.add_argument("--layer", metavar="LAYER_ZIP", dest="layers",
+                        action="append", default=[],
+                        help="Layer of a deployment package. May be repeated, "
+                             "in the order the layers are configured")
     parser.add_argument("-t", "--timeout", metavar="TIMEOUT",
                         dest="timeout", type=int, default=None,
                         help="Timeout (in seconds) for function call. If not provided, "
@@ -24,21 +68,67 @@ def arguments():
     parser.add_argument("-c", "--context", metavar="CONTEXT_FILENAME", type=str, default=None,
                         dest="context_file",
                         help="Filename of file containing JSON context data")
+    parser.add_argument("-i", "--import-times", action="store_true",
+                        dest="import_times",
+                        help="Display a per-module breakdown of the time spent "
+                             "importing the Lambda function's module")
+    parser.add_argument("--gc-freeze", action="store_true", dest="gc_freeze",
+                        help="Freeze the garbage collector after the Lambda "
+                             "function's module is imported, so that later "
+                             "collections do not scan the objects it created")
+    parser.add_argument("--gc-threshold", metavar="T0[,T1[,T2]]", dest="gc_threshold",
+                        type=gcsweep.parse_threshold, default=None,
+                        help="Garbage collection thresholds to set after the "
+                             "Lambda function's module is imported")
+    parser.add_argument("-w", "--watch", action="store_true", dest="watch",
+                        help="Keep running, and re-run the event(s) whenever the "
+                             "Lambda function's module or the local modules it "
+                             "imports change")
+    parser.add_argument("--metrics-port", metavar="PORT", dest="metrics_port",
+                        type=int, default=None,
+                        help="Serve invocation metrics in the OpenMetrics text "
+                             "format on PORT (useful with --watch)")
+    parser.add_argument("--statsd", metavar="HOST:PORT", dest="statsd",
+                        type=str, default=None,
+                        help="Push invocation metrics to a StatsD server")
+    parser.add_argument("--trace", metavar="TRACE_FILENAME", dest="trace_file",
+                        type=str, default=None,
+                        help="Write a trace of the invocation(s) to TRACE_FILENAME, "
+                             "in the Chrome trace-event JSON format")
+    parser.add_argument("--log-dir", metavar="DIRECTORY", dest="log_dir",
+                        type=str, default=None,
+                        help="Also write the log of each invocation under "
+                             "DIRECTORY/LOG_GROUP/LOG_STREAM, as CloudWatch "
+                             "Logs would")
+    parser.add_argument("--result-log", metavar="FILENAME", dest="result_log",
+                        type=str, default=None,
+                        help="Append the result of each invocation to the binary "
+                             "result log FILENAME, to query with \"run_lambda "
+                             "query\"")
+    parser.add_argument("--stream-output", metavar="FILENAME", dest="stream_output",
+                        type=str, default=None,
+                        help="Write the responses of a streaming Lambda function "
+                             "to FILENAME, as they are streamed")
+    parser.add_argument("--shard", metavar="INDEX/COUNT", dest="shard",
+                        type=corpus.Shard.parse, default=None,
+                        help="Only run the events of shard INDEX (from 1 to COUNT) "
+                             "of COUNT, e.g. 3/8. Events are assigned to shards "
+                             "by a hash of their keys")
+    parser.add_argument("--result-cache", metavar="DIRECTORY", dest="result_cache",
+                        type=str, default=None,
+                        help="Serve the results of calls from a cache in DIRECTORY "
+                             "when the Lambda function's source code, the event "
+                             "and the context are unchanged. Only for Lambda "
+                             "functions whose results depend on nothing else")
+    parser.add_argument("--serialize", action="store_true", dest="serialize",
+                        help="Pass events and responses through JSON, as Lambda "
+                             "does, enforcing its payload size limits, and report "
+                             "the size of each response")
     return parser.parse_args()
 
 
 def load_module(filepath):
-    abspath = os.path.abspath(filepath)
-    sys.path.insert(0, os.path.dirname(abspath))
-
-    basename = os.path.basename(abspath)
-    module_name, extension = os.path.splitext(basename)
-    module_info = imp.find_module(module_name)
-    module = imp.load_module(module_name, *module_info)
-
-    sys.path.pop(0)
-    module_info[0].close()
-    return module
+    return init.load_module(filepath)
 
 
 def load_context(args):
@@ -49,17 +139,108 @@ def load_context(args):
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        return COMMANDS[sys.argv[1]](sys.argv[2:])
+
     args = arguments()
+    args.listeners = metrics_listeners(args)
+    args.tracer = None if args.trace_file is None else tracing.Tracer()
+    sink = None if args.log_dir is None else logs.LogSink(args.log_dir)
+    if sink is not None:
+        args.listeners.append(sink.record)
+    result_log = None if args.result_log is None \
+        else resultlog.ResultLogWriter(args.result_log)
+    if result_log is not None:
+        args.listeners.append(result_log.record)
+    # responses of streaming functions, of all calls of this run
+    args.stream_output_file = None if args.stream_output is None \
+        else open(args.stream_output, "wb", 0)
+
+    try:
+        loader, args.function_name = package.module_loader(
+            args.filename, args.function_name, layers=args.layers)
+        def initialize():
+            loaded = loader()
+            init.configure_gc(freeze=args.gc_freeze, threshold=args.gc_threshold)
+            return loaded
+        module, init_summary = init.timed_init(initialize, profile_imports=args.import_times)
+        run_events(args, module,
+                   init_duration_in_millis=init_summary.duration_in_millis)
+        if result_log is not None:
+            result_log.flush()
+        if args.import_times:
+            sys.stdout.write("\n")
+            init_summary.display()
+
+        if args.watch:
+            def on_reload(reloaded_module, changed, duration_in_millis):
+                sys.stdout.write("\n--- Reloaded {m} in {d:.1f} ms ---\n\n".format(
+                    m=", ".join(sorted(changed)), d=duration_in_millis))
+                run_events(args, reloaded_module)
+                if result_log is not None:
+                    result_log.flush()
+                sys.stdout.flush()
+
+            sys.stdout.write("\nWatching for changes (press Ctrl-C to stop)...\n")
+            sys.stdout.flush()
+            try:
+                watch.ModuleWatcher(module).run_forever(on_reload)
+            except KeyboardInterrupt:
+                pass
+    finally:
+        if sink is not None:
+            sink.close()
+        if result_log is not None:
+            result_log.close()
+        if args.stream_output_file is not None:
+            args.stream_output_file.close()
+
+
+def metrics_listeners(args):
+    if args.metrics_port is None and args.statsd is None:
+        return []
+    statsd = None
+    if args.statsd is not None:
+        host, _, port = args.statsd.rpartition(":")
+        statsd = metrics.StatsdClient(host=host or "localhost", port=int(port))
+    registry = metrics.MetricsRegistry(statsd=statsd)
+    if args.metrics_port is not None:
+        metrics.serve(registry, args.metrics_port)
+    return [registry.record]
 
-    with open(args.event) as event_file:
-        event = json.load(event_file)
 
-    module = load_module(args.filename)
+def run_events(args, module, init_duration_in_millis=None):
+    events = corpus.load_events(args.event, shard=args.shard)
     function = getattr(module, args.function_name)
-    context = load_context(args)
-    result = call.run_lambda(function, event, context=context,
-                             timeout_in_seconds=args.timeout)
-    result.display()
+    aggregator = emf.EmfAggregator()
+    usage_statistics = usage.UsageStatistics()
+    run_lambda = call.run_lambda if args.result_cache is None \
+        else resultcache.ResultCache(args.result_cache).run_lambda
+    for index, (key, event) in enumerate(events):
+        if len(events) > 1:
+            sys.stdout.write("{s}Event: {k}\n\n".format(s="\n" if index > 0 else "",
+                                                       k=key))
+        response_stream = None if args.stream_output_file is None \
+            else streaming.ResponseStream(args.stream_output_file)
+        result = run_lambda(function, event, context=load_context(args),
+                            timeout_in_seconds=args.timeout,
+                            init_duration_in_millis=init_duration_in_millis,
+                            listeners=args.listeners,
+                            tracer=args.tracer,
+                            response_stream=response_stream,
+                            serialize=args.serialize)
+        init_duration_in_millis = None  # only the first call is a cold start
+        result.display()
+        aggregator.add(result.summary.emf_metrics)
+        usage_statistics.observe(result.summary.usage, result.summary.duration_in_millis)
+    if len(events) > 1:
+        sys.stdout.write("\nResource usage:\n")
+        usage_statistics.display()
+    if len(events) > 1 and aggregator.statistics():
+        sys.stdout.write("\nEmbedded metrics:\n")
+        aggregator.display()
+    if args.tracer is not None:
+        args.tracer.export_chrome_trace(args.trace_file)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
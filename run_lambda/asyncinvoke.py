@@ -0,0 +1,492 @@
+"""
+Emulation of asynchronous invocation of Lambda functions.
+
+When a Lambda function is invoked asynchronously, its events are placed on an
+internal queue, from which they are processed by up to the function's
+concurrency. Failed invocations (errors and timeouts) are retried, by default
+twice, with a backoff between attempts, and events older than a maximum age
+are discarded. Once an event succeeds, or its retries or age run out, the
+outcome is sent to the on-success or on-failure destination, and failed events
+go to the dead-letter queue.
+
+An :class:`AsyncInvoker` reproduces this with worker threads, each with its own
+:class:`Container <run_lambda.container.Container>`::
+
+    invoker = AsyncInvoker(lambda: Container.of_file("my_function.py"),
+                           concurrency=4, dead_letter_filename="dlq.jsonl")
+    for event in events:
+        invoker.invoke(event)
+    report = invoker.drain()
+    report.display()
+
+Retry delays are real: in Lambda they are about one and two minutes, so
+emulations usually configure much shorter delays.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import sys
+import threading
+import timeit
+import traceback
+
+from run_lambda import context as context_module
+from run_lambda import corpus
+from run_lambda import dashboard
+from run_lambda import payload
+from run_lambda import utils
+from run_lambda.container import Container, init_error_result
+
+SUCCESS = "Success"
+RETRIES_EXHAUSTED = "RetriesExhausted"
+EVENT_AGE_EXCEEDED = "EventAgeExceeded"
+
+
+class AsyncInvoker(object):
+    def __init__(self, container_factory, concurrency=1, maximum_retry_attempts=2,
+                 retry_delay_in_seconds=1.0, maximum_event_age_in_seconds=21600,
+                 timeout_in_seconds=None, patches=None, listeners=None,
+                 on_success=None, on_failure=None, dead_letter_filename=None,
+                 dashboard=None, serialize=False):
+        """
+        :param function container_factory: function taking no arguments and
+            returning a new, uninitialized
+            :class:`Container <run_lambda.container.Container>`
+        :param int concurrency: number of worker threads, each with its own
+            container
+        :param int maximum_retry_attempts: number of times a failed event is
+            retried, between 0 and 2 in Lambda
+        :param float retry_delay_in_seconds: delay before the first retry;
+            each later retry waits twice as long as the previous one
+        :param float maximum_event_age_in_seconds: age after which events are
+            discarded instead of being (re)tried
+        :param int timeout_in_seconds: timeout of each invocation, in seconds
+        :param patches: patches applied to each invocation, as accepted by
+            :func:`run_lambda <run_lambda.run_lambda>`
+        :param list listeners: listeners called after each invocation attempt,
+            as accepted by :func:`run_lambda <run_lambda.run_lambda>`
+        :param function on_success: on-success destination; called with the
+            :class:`AsyncEvent` of each event that succeeds
+        :param function on_failure: on-failure destination; called with the
+            :class:`AsyncEvent` of each event that fails
+        :param str dead_letter_filename: name of a JSON lines file, to which
+            an invocation record is appended for each failed event
+        :param Dashboard dashboard: if provided, each invocation attempt is
+            shown on this dashboard (see :mod:`run_lambda.dashboard`)
+        :param bool serialize: whether to pass events and responses through
+            JSON, as Lambda does, with the event size limit of asynchronous
+            invocations (see :mod:`run_lambda.payload`)
+        """
+        self._container_factory = container_factory
+        self._concurrency = concurrency
+        self._maximum_retry_attempts = maximum_retry_attempts
+        self._retry_delay_in_seconds = retry_delay_in_seconds
+        self._maximum_event_age_in_seconds = maximum_event_age_in_seconds
+        self._invoke_kwargs = {"timeout_in_seconds": timeout_in_seconds,
+                               "patches": patches, "listeners": listeners}
+        if serialize:
+            self._invoke_kwargs.update(serialize=True, invocation_type=payload.EVENT)
+        self._on_success = on_success
+        self._on_failure = on_failure
+        self._dead_letter_filename = dead_letter_filename
+        self._dead_letter_lock = threading.Lock()
+        self._dashboard = dashboard
+        self._serialize = serialize
+
+        self._condition = threading.Condition()
+        self._queue = []  # heap of (due time, sequence number, AsyncEvent)
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._stopping = False
+        self._events = []
+        self._start_time = None
+        self._workers = []
+
+    def invoke(self, event):
+        """
+        Queues an event for asynchronous invocation.
+
+        :param dict event: event data
+        :return: the queued event, which is updated as it is processed
+        :rtype: AsyncEvent
+        :raises LambdaError: if events are serialized, and ``event`` is too
+            large to be queued
+        """
+        if self._serialize:
+            payload.encode_event(event, payload.EVENT)
+        async_event = AsyncEvent(event, utils.random_aws_request_id(),
+                                 timeit.default_timer())
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("invoke() called after drain()")
+            if self._start_time is None:
+                self._start_time = async_event.queued_time
+                self._start_workers()
+            self._events.append(async_event)
+            self._push(async_event.queued_time, async_event)
+        return async_event
+
+    def drain(self):
+        """
+        Waits until every queued event has succeeded or failed, then stops the
+        workers.
+
+        :rtype: AsyncReport
+        """
+        with self._condition:
+            while self._queue or self._in_flight:
+                self._condition.wait()
+            self._stopping = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+        end_time = timeit.default_timer()
+        return AsyncReport(list(self._events),
+                           end_time - (self._start_time or end_time))
+
+    def _start_workers(self):
+        for index in range(self._concurrency):
+            worker = threading.Thread(target=self._work,
+                                      name="worker-{}".format(index + 1))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _push(self, due_time, async_event):
+        heapq.heappush(self._queue, (due_time, next(self._sequence), async_event))
+        self._condition.notify_all()
+
+    def _work(self):
+        container = None
+        while True:
+            with self._condition:
+                async_event = None
+                while async_event is None:
+                    if self._stopping:
+                        return
+                    if not self._queue:
+                        self._condition.wait()
+                        continue
+                    delay = self._queue[0][0] - timeit.default_timer()
+                    if delay > 0:
+                        self._condition.wait(delay)
+                        continue
+                    async_event = heapq.heappop(self._queue)[2]
+                self._in_flight += 1
+            retry_time = None
+            try:
+                if container is None:
+                    container = self._container_factory()
+                retry_time = self._attempt(container, async_event)
+            except Exception:
+                # e.g. the container factory or a destination raised; neither
+                # the worker nor the event may be lost, or drain() would wait
+                # forever
+                traceback.print_exc(file=sys.stderr)
+                if async_event.condition is None:
+                    async_event.condition = RETRIES_EXHAUSTED
+                    async_event.finished_time = timeit.default_timer()
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    if retry_time is not None:
+                        self._push(retry_time, async_event)
+                    self._condition.notify_all()
+
+    def _attempt(self, container, async_event):
+        # returns the time to retry the event at, or None if it is done
+        start_time = timeit.default_timer()
+        if start_time - async_event.queued_time > self._maximum_event_age_in_seconds:
+            self._finish(async_event, EVENT_AGE_EXCEEDED)
+            return None
+        context = context_module.MockLambdaContext.Builder()\
+            .set_aws_request_id(async_event.request_id)\
+            .set_log_stream_name(container.log_stream_name)\
+            .build()
+        if self._dashboard is not None:
+            self._dashboard.begin(async_event.request_id)
+        try:
+            result = container.invoke(async_event.event, context=context,
+                                      **self._invoke_kwargs)
+        except Exception as e:
+            # the function's initialization failed; as in Lambda, the attempt
+            # fails, and the next one initializes the container again
+            result = init_error_result(context, e)
+        if self._dashboard is not None:
+            self._dashboard.end(result, async_event.request_id)
+        async_event.attempts.append(AsyncAttempt(start_time, result))
+        if not (result.timed_out or result.exception is not None):
+            self._finish(async_event, SUCCESS)
+            return None
+        if async_event.retry_count >= self._maximum_retry_attempts:
+            self._finish(async_event, RETRIES_EXHAUSTED)
+            return None
+        return timeit.default_timer() + \
+            self._retry_delay_in_seconds * 2 ** async_event.retry_count
+
+    def _finish(self, async_event, condition):
+        async_event.condition = condition
+        async_event.finished_time = timeit.default_timer()
+        if condition == SUCCESS:
+            if self._on_success is not None:
+                self._on_success(async_event)
+            return
+        if self._on_failure is not None:
+            self._on_failure(async_event)
+        if self._dead_letter_filename is not None:
+            line = json.dumps(async_event.invocation_record(), default=repr)
+            with self._dead_letter_lock:
+                with open(self._dead_letter_filename, "a") as dead_letter_file:
+                    dead_letter_file.write(line + "\n")
+
+
+class AsyncAttempt(object):
+    """
+    A single attempt at invoking an asynchronous event.
+    """
+    def __init__(self, start_time, result):
+        self.start_time = start_time
+        self.result = result
+
+    @property
+    def failed(self):
+        return self.result.timed_out or self.result.exception is not None
+
+
+class AsyncEvent(object):
+    """
+    An asynchronously invoked event, and its attempts.
+    """
+    def __init__(self, event, request_id, queued_time):
+        self.event = event
+        self.request_id = request_id
+        self.queued_time = queued_time
+        self.attempts = []
+        self.condition = None
+        self.finished_time = None
+
+    @property
+    def retry_count(self):
+        """
+        :property: Number of attempts after the first
+        :rtype: int
+        """
+        return max(0, len(self.attempts) - 1)
+
+    @property
+    def succeeded(self):
+        """
+        :property: Whether the event was processed successfully
+        :rtype: bool
+        """
+        return self.condition == SUCCESS
+
+    def ages_in_millis(self):
+        """
+        :return: age of the event at the start of each attempt, in
+            milliseconds, as in Lambda's ``AsyncEventAge`` metric
+        :rtype: list[float]
+        """
+        return [1000 * (attempt.start_time - self.queued_time) for attempt in self.attempts]
+
+    def invocation_record(self):
+        """
+        :return: the invocation record sent to destinations by Lambda
+        :rtype: dict
+        """
+        record = {
+            "version": "1.0",
+            "requestContext": {
+                "requestId": self.request_id,
+                "condition": self.condition,
+                "approximateInvokeCount": len(self.attempts),
+            },
+            "requestPayload": self.event,
+        }
+        if self.attempts:
+            result = self.attempts[-1].result
+            if result.timed_out:
+                record["responsePayload"] = {"errorMessage": "Task timed out"}
+            elif result.exception is not None:
+                record["responsePayload"] = {
+                    "errorMessage": str(result.exception),
+                    "errorType": type(result.exception).__name__,
+                }
+            else:
+                record["responsePayload"] = result.value
+        return record
+
+
+class AsyncReport(object):
+    """
+    The outcome of draining an :class:`AsyncInvoker`.
+    """
+    def __init__(self, events, duration_in_seconds):
+        self._events = events
+        self._duration_in_seconds = duration_in_seconds
+
+    @property
+    def events(self):
+        """
+        :property: Events, in the order they were queued
+        :rtype: list[AsyncEvent]
+        """
+        return self._events
+
+    @property
+    def success_count(self):
+        """
+        :property: Number of events processed successfully
+        :rtype: int
+        """
+        return sum(1 for event in self._events if event.succeeded)
+
+    @property
+    def failure_count(self):
+        """
+        :property: Number of events that failed, or were discarded
+        :rtype: int
+        """
+        return len(self._events) - self.success_count
+
+    @property
+    def expired_count(self):
+        """
+        :property: Number of events discarded for exceeding the maximum age
+        :rtype: int
+        """
+        return sum(1 for event in self._events if event.condition == EVENT_AGE_EXCEEDED)
+
+    @property
+    def retry_count(self):
+        """
+        :property: Total number of retries
+        :rtype: int
+        """
+        return sum(event.retry_count for event in self._events)
+
+    @property
+    def duration_in_seconds(self):
+        """
+        :property: Time from the first event being queued to the queue being
+            drained, in seconds
+        :rtype: float
+        """
+        return self._duration_in_seconds
+
+    @property
+    def throughput(self):
+        """
+        :property: Events processed (successfully or not) per second
+        :rtype: float
+        """
+        if self._duration_in_seconds <= 0:
+            return 0.0
+        return len(self._events) / self._duration_in_seconds
+
+    def event_age_percentile(self, percent):
+        """
+        :param float percent: percentile, between 0 and 100
+        :return: percentile of the ages of events at the start of their
+            attempts, in milliseconds
+        :rtype: float
+        """
+        ages = sorted(age for event in self._events for age in event.ages_in_millis())
+        return utils.percentile(ages, percent) if ages else 0.0
+
+    def display(self, outfile=None):
+        if outfile is None:
+            outfile = sys.stdout
+        outfile.write("Events: {}\n".format(len(self._events)))
+        outfile.write("Succeeded: {}\n".format(self.success_count))
+        outfile.write("Failed: {f} ({e} exceeded maximum age)\n".format(
+            f=self.failure_count, e=self.expired_count))
+        outfile.write("Retries: {}\n".format(self.retry_count))
+        outfile.write("Drained in {d:.2f} s ({t:.1f} events/s)\n\n".format(
+            d=self._duration_in_seconds, t=self.throughput))
+        outfile.write("{:<22}{:>10}{:>10}{:>10}{:>10}\n"
+                      .format("", "p50", "p90", "p99", "max"))
+        outfile.write("{:<22}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}\n".format(
+            "Event age (ms)", self.event_age_percentile(50),
+            self.event_age_percentile(90), self.event_age_percentile(99),
+            self.event_age_percentile(100)))
+
+
+def arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda async",
+        description="Invoke an AWS Lambda function asynchronously with a set "
+                    "of events, with retries and a dead-letter queue")
+    parser.add_argument("filename", type=str,
+                        help="name of file containing Lambda function, or of "
+                             "deployment package (.zip)")
+    parser.add_argument("event", type=str,
+                        help="filename of file containing JSON event data. May "
+                             "also be a JSON lines (.jsonl) file or a directory "
+                             "of event files")
+    parser.add_argument("-f", "--function", metavar="HANDLER_FUNCTION",
+                        dest="function_name", type=str, default="handler",
+                        help="Name of handler function. Defaults to \"handler\"")
+    parser.add_argument("-t", "--timeout", metavar="TIMEOUT",
+                        dest="timeout", type=int, default=None,
+                        help="Timeout (in seconds) for each function call")
+    parser.add_argument("--concurrency", metavar="N", type=int, default=1,
+                        help="Number of concurrent workers. Defaults to 1")
+    parser.add_argument("--retries", metavar="N", type=int, default=2,
+                        help="Maximum number of retries of a failed event. "
+                             "Defaults to 2")
+    parser.add_argument("--retry-delay", metavar="SECONDS", dest="retry_delay",
+                        type=float, default=1.0,
+                        help="Delay before the first retry, doubled for each "
+                             "later retry. Defaults to 1")
+    parser.add_argument("--max-event-age", metavar="SECONDS", dest="max_event_age",
+                        type=float, default=21600,
+                        help="Maximum age of events. Defaults to 21600 (6 hours)")
+    parser.add_argument("--dlq", metavar="FILENAME", dest="dead_letter_filename",
+                        type=str, default=None,
+                        help="Append an invocation record for each failed event "
+                             "to the JSON lines file FILENAME")
+    parser.add_argument("--dashboard", action="store_true", dest="dashboard",
+                        help="Show a live dashboard of the run in the terminal")
+    parser.add_argument("--serialize", action="store_true", dest="serialize",
+                        help="Pass events and responses through JSON, as Lambda "
+                             "does, enforcing its payload size limits")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arguments(sys.argv[1:] if argv is None else argv)
+    events = corpus.load_events(args.event)
+    board = None
+    if args.dashboard:
+        board = dashboard.Dashboard(
+            title="run_lambda async {f} {e}".format(f=args.filename, e=args.event),
+            total=len(events))
+    invoker = AsyncInvoker(
+        lambda: Container.of_file(args.filename, args.function_name),
+        concurrency=args.concurrency,
+        maximum_retry_attempts=args.retries,
+        retry_delay_in_seconds=args.retry_delay,
+        maximum_event_age_in_seconds=args.max_event_age,
+        timeout_in_seconds=args.timeout,
+        dead_letter_filename=args.dead_letter_filename,
+        dashboard=board,
+        serialize=args.serialize)
+    if board is not None:
+        board.start()
+    try:
+        for key, event in events:
+            try:
+                invoker.invoke(event)
+            except payload.LambdaError as e:
+                sys.stderr.write("{k}: {e}\n".format(k=key, e=e))
+        report = invoker.drain()
+    finally:
+        if board is not None:
+            board.stop()
+    report.display(sys.stdout)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,31 @@
+import ctypes
 import logging
 import math
+import os
 import signal
 import sys
+import threading
+import time
 import timeit
 import traceback
 
-import memory_profiler
 import mock
+import psutil
 from six import StringIO
 
 from run_lambda import context as context_module
-
-
-def run_lambda(handle, event, context=None, timeout_in_seconds=None, patches=None):
+from run_lambda import deadlines
+from run_lambda import emf
+from run_lambda import patches as patches_module
+from run_lambda import payload
+from run_lambda import streaming
+from run_lambda import usage as usage_module
+
+
+def run_lambda(handle, event, context=None, timeout_in_seconds=None, patches=None,
+               init_duration_in_millis=None, listeners=None, tracer=None,
+               clock=None, response_stream=None, serialize=False,
+               invocation_type=payload.REQUEST_RESPONSE):
     """
     Run the Lambda function ``handle``, with the specified arguments and
     parameters.
@@ -23,46 +36,251 @@ def run_lambda(handle, event, context=None, timeout_in_seconds=None, patches=Non
         default context object will be used.
     :param int timeout_in_seconds: timeout in seconds. If not provided, the
         function will be called with no timeout
-    :param dict patches: dictionary of name-to-value mappings that will be
-        patched inside the Lambda function
+    :param patches: dictionary of name-to-value mappings that will be
+        patched inside the Lambda function, or a
+        :class:`PatchSet <run_lambda.PatchSet>` to apply for the duration of
+        the call
+    :type patches: dict or PatchSet
+    :param int init_duration_in_millis: duration of the initialization phase
+        that preceded this call, in milliseconds. If provided, the call is
+        reported as a cold start.
+    :param list listeners: functions to call with the context object and the
+        result, once the call completes, e.g.
+        :meth:`MetricsRegistry.record <run_lambda.metrics.MetricsRegistry.record>`
+    :param Tracer tracer: tracer to record a span for the call in. When
+        provided, a dictionary of ``patches`` is applied as a
+        :class:`PatchSet <run_lambda.PatchSet>`, so that calls to patched
+        targets are recorded as child spans.
+    :param VirtualClock clock: virtual clock used by latency-modelled fakes
+        (see :mod:`run_lambda.latency`). Virtual time spent during the call is
+        added to its duration.
+    :param ResponseStream response_stream: stream to deliver the response of
+        a streaming Lambda function to (see :mod:`run_lambda.streaming`). If
+        not provided, streamed responses are counted and discarded.
+    :param bool serialize: whether to pass the event and response through
+        JSON, as Lambda does, enforcing its payload size limits (see
+        :mod:`run_lambda.payload`)
+    :param str invocation_type: ``"RequestResponse"`` or ``"Event"``, which
+        determines the event size limit when ``serialize`` is set
     :return: value returned by Lambda function
     :rtype: LambdaResult
     """
     if context is None:
         context = context_module.MockLambdaContext.Builder().build()
 
-    patches_list = [] if patches is None \
-        else [mock.patch(name, value) for name, value in patches.items()]
+    if patches is None:
+        patches_list = []
+    elif isinstance(patches, patches_module.PatchSet):
+        patches_list = [patches]
+    elif tracer is not None:
+        patches_list = [patches_module.PatchSet(patches)]
+    else:
+        patches_list = [mock.patch(name, value) for name, value in patches.items()]
     for patch in patches_list:
         patch.start()
 
-    setup_timeout(context, timeout_in_seconds)
+    request = request_error = None
+    if serialize:
+        # the caller encodes the event, before the call begins
+        try:
+            request = payload.encode_event(event, invocation_type)
+        except payload.LambdaError as e:
+            request_error = e
+
+    deadline = setup_timeout(context, timeout_in_seconds, clock=clock)
 
+    span = None if tracer is None else start_span(tracer, context, init_duration_in_millis)
     builder = None
     result = None
     try:
-        builder = LambdaCallSummary.Builder(context)
-        value = handle(event, context)
-        result = LambdaResult(builder.build(), value=value)
+        builder = LambdaCallSummary.Builder(
+            context, init_duration_in_millis=init_duration_in_millis, clock=clock)
+        try:
+            if request_error is not None:
+                raise request_error
+            if request is not None:
+                event = payload.decode_event(request)
+            if streaming.is_streaming_handler(handle):
+                builder.stream = response_stream or streaming.ResponseStream()
+                builder.stream.start()
+                streaming.call_streaming_handler(handle, event, builder.stream, context)
+                value = None
+            else:
+                value = handle(event, context)
+                if serialize:
+                    value = builder.serialize(value)
+            if deadline is not None and clock is not None:
+                clock.check_timeout()
+        finally:
+            if deadline is not None:
+                deadline.cancel()
+                if clock is not None:
+                    clock.cancel_timeout()
+        summary = builder.build()
+        if builder.response_size_in_bytes is not None:
+            value = payload.decode_response(value)
+        result = LambdaResult(summary, value=value)
     except LambdaTimeout:
         result = LambdaResult(builder.build(), timed_out=True)
+    except payload.LambdaError as e:
+        builder.log.write("[ERROR] {}\n".format(e))
+        result = LambdaResult(builder.build(), exception=e)
     except Exception as e:
         traceback.print_exc(file=builder.log)
         result = LambdaResult(builder.build(), exception=e)
     finally:
-        signal.alarm(0)  # disable any pending alarms
+        if deadline is not None:
+            deadline.cancel()
         for patch in patches_list:
             patch.stop()
+        if span is not None:
+            end_span(tracer, span, result)
+        if result is not None and listeners is not None:
+            for listener in listeners:
+                listener(context, result)
         return result
 
 
-def setup_timeout(context, timeout_in_seconds=None):
-    if timeout_in_seconds is not None:
+def setup_timeout(context, timeout_in_seconds=None, clock=None):
+    """
+    Arranges for a :class:`LambdaTimeout` to be raised in the current thread
+    after ``timeout_in_seconds``. The deadline is tracked by the shared
+    :func:`timer wheel <run_lambda.deadlines.default_wheel>`, so any number of
+    calls, on any threads, can have deadlines pending at once. When it
+    passes, the main thread is interrupted with ``SIGALRM`` (which also
+    interrupts blocking calls such as ``time.sleep``), since signal handlers
+    only run on the main thread; other threads are interrupted with an
+    asynchronous exception. Virtual time spent on ``clock`` also counts
+    towards the timeout.
+
+    :return: the pending timeout, to cancel once the call completes, or
+        ``None`` if there is no timeout
+    """
+    if timeout_in_seconds is None:
+        return None
+    if isinstance(threading.current_thread(), threading._MainThread):
+        if not hasattr(signal, "pthread_kill"):
+            timeout = _AlarmTimeout(timeout_in_seconds)
+            context.activate(timeout_in_seconds, clock=clock)
+        else:
+            timeout = _SignalTimeout(timeout_in_seconds)
+            context.activate(timeout_in_seconds, deadline=timeout.deadline, clock=clock)
+    else:
+        timeout = _ThreadTimeout(timeout_in_seconds)
+        context.activate(timeout_in_seconds, deadline=timeout.deadline, clock=clock)
+    if clock is not None:
+        clock.start_timeout(timeout_in_seconds)
+    return timeout
+
+
+class _AlarmTimeout(object):
+    """
+    Fallback for platforms without ``signal.pthread_kill``, which supports
+    a single pending deadline.
+    """
+    def __init__(self, timeout_in_seconds):
         def on_timeout(signum, frame):
             raise LambdaTimeout()
         signal.signal(signal.SIGALRM, on_timeout)
-        signal.alarm(timeout_in_seconds)
-        context.activate(timeout_in_seconds)
+        signal.alarm(int(math.ceil(timeout_in_seconds)))
+
+    def cancel(self):
+        signal.alarm(0)  # disable any pending alarms
+
+
+# timeouts of (possibly nested) calls on the main thread that have not been
+# cancelled; only accessed on the main thread
+_main_thread_timeouts = []
+
+
+class _SignalTimeout(object):
+    def __init__(self, timeout_in_seconds):
+        self._thread_id = threading.current_thread().ident
+        self._fired = False
+        signal.signal(signal.SIGALRM, _on_alarm)
+        _main_thread_timeouts.append(self)
+        self.deadline = deadlines.default_wheel().schedule(timeout_in_seconds, self._fire)
+
+    def _fire(self):
+        self._fired = True
+        signal.pthread_kill(self._thread_id, signal.SIGALRM)
+
+    def cancel(self):
+        self.deadline.cancel()
+        if self in _main_thread_timeouts:
+            _main_thread_timeouts.remove(self)
+
+
+def _on_alarm(signum, frame):
+    # a signal may arrive after the timeout that sent it was cancelled, in
+    # which case it is ignored
+    for timeout in _main_thread_timeouts:
+        if timeout._fired:
+            _main_thread_timeouts.remove(timeout)
+            raise LambdaTimeout()
+
+
+class _ThreadTimeout(object):
+    def __init__(self, timeout_in_seconds):
+        self._thread_id = threading.current_thread().ident
+        self._lock = threading.Lock()
+        self._pending = True
+        self._fired = False
+        self.deadline = deadlines.default_wheel().schedule(timeout_in_seconds, self._fire)
+
+    def _fire(self):
+        with self._lock:
+            if self._pending:
+                self._fired = True
+                raise_in_thread(self._thread_id, LambdaTimeout)
+
+    def cancel(self):
+        with self._lock:
+            if not self._pending:
+                return
+            self._pending = False
+            self.deadline.cancel()
+            if self._fired:
+                # the exception may not have been delivered yet
+                raise_in_thread(self._thread_id, None)
+
+
+def raise_in_thread(thread_id, exception_type):
+    """
+    Asynchronously raises ``exception_type`` in the thread ``thread_id``, the
+    next time it executes Python code. If ``exception_type`` is ``None``, a
+    pending asynchronous exception is cleared instead.
+    """
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id),
+        None if exception_type is None else ctypes.py_object(exception_type))
+
+
+def start_span(tracer, context, init_duration_in_millis=None):
+    start = timeit.default_timer()
+    if init_duration_in_millis is not None:
+        tracer.add_span("Initialization", start - init_duration_in_millis / 1000.0,
+                        start, category="init",
+                        attributes={"function_name": context.function_name})
+    return tracer.start_span(context.function_name, category="invocation", attributes={
+        "function_name": context.function_name,
+        "function_version": context.function_version,
+        "invoked_function_arn": context.invoked_function_arn,
+        "memory_limit_in_mb": context.memory_limit_in_mb,
+        "aws_request_id": context.aws_request_id,
+        "log_group_name": context.log_group_name,
+        "log_stream_name": context.log_stream_name,
+        "cold_start": init_duration_in_millis is not None,
+    }, start=start)
+
+
+def end_span(tracer, span, result):
+    if result is not None:
+        span.attributes["timed_out"] = result.timed_out
+        if result.exception is not None:
+            span.attributes["exception"] = repr(result.exception)
+        span.attributes["max_memory_used_in_mb"] = result.summary.max_memory_used_in_mb
+    tracer.end_span(span)
 
 
 class LambdaTimeout(BaseException):
@@ -73,11 +291,13 @@ class LambdaResult(object):
     """
     Represents the result of locally running a Lambda function.
     """
-    def __init__(self, summary, value=None, timed_out=False, exception=None):
+    def __init__(self, summary, value=None, timed_out=False, exception=None,
+                 cached=False):
         self._summary = summary
         self._value = value
         self._timed_out = timed_out
         self._exception = exception
+        self._cached = cached
 
     @property
     def summary(self):
@@ -113,28 +333,53 @@ class LambdaResult(object):
         """
         return self._exception
 
+    @property
+    def cached(self):
+        """
+        :property: Whether the result was served from a
+            :class:`ResultCache <run_lambda.resultcache.ResultCache>`, rather
+            than by calling the Lambda function. The summary of a cached
+            result is that of the original call.
+        :rtype: bool
+        """
+        return self._cached
+
     def __str__(self):
-        return "{{summary={s}; value={v}; timed_out={t}; exception={e}}}"\
+        cached = "; cached=True" if self._cached else ""
+        return "{{summary={s}; value={v}; timed_out={t}; exception={e}{c}}}"\
             .format(s=str(self._summary), v=self._value,
-                    t=self._timed_out, e=repr(self._exception))
+                    t=self._timed_out, e=repr(self._exception), c=cached)
 
     def display(self, outfile=None):
         if outfile is None:
             outfile = sys.stdout
+        if self._cached:
+            outfile.write("Served from result cache\n\n")
         if self._timed_out:
             outfile.write("Timed out\n\n")
         elif self._exception is not None:
             outfile.write("Raised an exception: {}\n\n".format(repr(self._exception)))
+        elif self._summary.stream is not None:
+            outfile.write("Streamed a response\n\n")
         else:
             outfile.write("Returned value {}\n\n".format(self._value))
         self._summary.display(outfile=outfile)
 
 
 class LambdaCallSummary(object):
-    def __init__(self, duration_in_millis, max_memory_used_in_mb, log):
+    def __init__(self, duration_in_millis, max_memory_used_in_mb, log,
+                 init_duration_in_millis=None, emf_metrics=None, stream=None,
+                 usage=None, serialization_duration_in_millis=None,
+                 response_size_in_bytes=None):
         self._duration_in_millis = duration_in_millis
         self._max_memory_used_in_mb = max_memory_used_in_mb
         self._log = log
+        self._init_duration_in_millis = init_duration_in_millis
+        self._emf_metrics = [] if emf_metrics is None else emf_metrics
+        self._stream = stream
+        self._usage = usage
+        self._serialization_duration_in_millis = serialization_duration_in_millis
+        self._response_size_in_bytes = response_size_in_bytes
 
     @property
     def duration_in_millis(self):
@@ -151,8 +396,10 @@ class LambdaCallSummary(object):
     def max_memory_used_in_mb(self):
         """
         Maximum amount of memory used during call to Lambda function,
-        in megabytes. This value is an estimate of how much memory the call
-        would have used if actually run in AWS. We have found that these
+        in megabytes: the growth of the process's peak resident set size
+        during the call, plus the overhead of the Lambda environment. This
+        value is an estimate of how much memory the call would have used if
+        actually run in AWS. We have found that these
         estimates are almost always within 5MB of the amount of memory used by
         corresponding remote calls.
 
@@ -170,43 +417,146 @@ class LambdaCallSummary(object):
         """
         return self._log
 
+    @property
+    def init_duration_in_millis(self):
+        """
+        Duration of the initialization phase (importing the function's module
+        and running its top-level code) that preceded the call, in
+        milliseconds. Only cold starts have an initialization phase.
+
+        :property: Duration of the initialization phase, in milliseconds, or
+            ``None`` if the call was not a cold start
+        :rtype: int
+        """
+        return self._init_duration_in_millis
+
+    @property
+    def emf_metrics(self):
+        """
+        Metrics published by the call in CloudWatch Embedded Metric Format
+        records (see :mod:`run_lambda.emf`), in the order they were logged.
+
+        :property: Metrics published by the call
+        :rtype: list[MetricDatum]
+        """
+        return self._emf_metrics
+
+    @property
+    def stream(self):
+        """
+        Summary of the response of a streaming Lambda function (see
+        :mod:`run_lambda.streaming`): time to first byte, chunk count, total
+        bytes and throughput.
+
+        :property: Summary of the streamed response, or ``None`` if the
+            response was not streamed
+        :rtype: StreamSummary
+        """
+        return self._stream
+
+    @property
+    def usage(self):
+        """
+        Resource usage of the call (see :mod:`run_lambda.usage`): CPU time,
+        garbage collections, context switches and page faults. Comparing CPU
+        time to the duration tells whether the call was CPU-bound or waiting.
+
+        :property: Resource usage of the call, or ``None`` if not measured
+        :rtype: ResourceUsage
+        """
+        return self._usage
+
+    @property
+    def serialization_duration_in_millis(self):
+        """
+        Time spent encoding the response as JSON, after the Lambda function
+        returned (see :mod:`run_lambda.payload`). It is included in
+        :attr:`duration_in_millis`, as it is in Lambda.
+
+        :property: Time spent encoding the response, in milliseconds, or
+            ``None`` if the response was not serialized
+        :rtype: float
+        """
+        return self._serialization_duration_in_millis
+
+    @property
+    def response_size_in_bytes(self):
+        """
+        :property: Size of the response encoded as JSON, in bytes, or
+            ``None`` if the response was not serialized
+        :rtype: int
+        """
+        return self._response_size_in_bytes
+
     def __str__(self):
-        return "{{duration={d} milliseconds; max_memory={m} MB; log={l}}}"\
-            .format(d=self._duration_in_millis,
+        init = "" if self._init_duration_in_millis is None \
+            else "init_duration={} milliseconds; ".format(self._init_duration_in_millis)
+        return "{{{i}duration={d} milliseconds; max_memory={m} MB; log={l}}}"\
+            .format(i=init,
+                    d=self._duration_in_millis,
                     m=self._max_memory_used_in_mb,
                     l=repr(self._log))
 
     def display(self, outfile=None):
         if outfile is None:
             outfile = sys.stdout
+        if self._init_duration_in_millis is not None:
+            outfile.write("Init duration: {} ms\n\n"
+                          .format(self._init_duration_in_millis))
         outfile.write("Duration: {} ms\n\n".format(self._duration_in_millis))
+        if self._stream is not None:
+            self._stream.display(outfile=outfile)
+        if self._response_size_in_bytes is not None:
+            outfile.write("Response size: {b} bytes (serialized in {d:.3f} ms)\n\n".format(
+                b=self._response_size_in_bytes, d=self._serialization_duration_in_millis))
         outfile.write("Max memory used: {} MB\n\n"
                       .format(self._max_memory_used_in_mb))
+        if self._usage is not None:
+            self._usage.display(outfile=outfile)
         outfile.write("Log:\n")
         outfile.write(self._log)
 
     class Builder(object):
-        def __init__(self, context):
+        def __init__(self, context, init_duration_in_millis=None, clock=None):
             self._context = context
+            self._init_duration_in_millis = init_duration_in_millis
+            self._clock = clock
+            self.stream = None  # response stream, for streaming functions
+            self.serialization_duration_in_millis = None
+            self.response_size_in_bytes = None
 
-            self._start_mem = memory_profiler.memory_usage()[0]
+            self._start_mem = _memory_in_mb()
+            self._peak_mem = _PeakMemory(self._start_mem)
 
-            self._log = StringIO()
+            # EMF records are parsed from the log as it is written
+            self._log = emf.CaptureStream(StringIO())
             self._log.write("START RequestId: {r} Version: {v}\n".format(
                 r=context.aws_request_id, v=context.function_version
             ))
             self._start_time = timeit.default_timer()
-            self._previous_stdout = sys.stdout
-
-            handler = logging.StreamHandler(stream=self._log)
-            logging.getLogger().addHandler(handler)
-            sys.stdout = self._log
+            self._start_virtual_time = 0 if clock is None else clock.elapsed_in_seconds()
+            self._handler = logging.StreamHandler(stream=self._log)
+            self._handler.addFilter(_ThreadFilter())
+            logging.getLogger().addHandler(self._handler)
+            self._previous_stream = _capture_stdout(self._log)
+            self._usage_meter = usage_module.UsageMeter()
+            self._usage_meter.start()
 
         def build(self):
             end_time = timeit.default_timer()
-            end_mem = memory_profiler.memory_usage()[0]
-
-            sys.stdout = self._previous_stdout
+            usage = self._usage_meter.stop()
+            if self._clock is not None:
+                # virtual time spent during the call counts towards its duration
+                end_time += self._clock.elapsed_in_seconds() - self._start_virtual_time
+            peak_mem = self._peak_mem.stop()
+            stream_summary = None
+            if self.stream is not None:
+                self.stream.close()
+                stream_summary = self.stream.summary()
+
+            _release_stdout(self._previous_stream)
+            logging.getLogger().removeHandler(self._handler)
+            self._log.finish()
 
             self._log.write("END RequestId: {r}\n".format(
                 r=self._context.aws_request_id))
@@ -214,18 +564,204 @@ class LambdaCallSummary(object):
             duration_in_millis = int(math.ceil(1000 * (end_time - self._start_time)))
             # The memory overhead of setting up the AWS Lambda environment
             # (when actually run in AWS) is roughly 14 MB
-            max_memory_used_in_mb = (end_mem - self._start_mem) / 1048576 + 14
+            max_memory_used_in_mb = int(math.ceil(peak_mem - self._start_mem)) + 14
 
-            self._log.write(
-                "REPORT RequestId: {r}\tDuration: {d} ms\t"
-                "Max Memory Used: {m} MB\n"
+            report = "REPORT RequestId: {r}\tDuration: {d} ms\t" \
+                     "Max Memory Used: {m} MB"\
                 .format(r=self._context.aws_request_id,
                         d=duration_in_millis,
-                        m=max_memory_used_in_mb))
+                        m=max_memory_used_in_mb)
+            report += "\t" + usage.report_fields()
+            if self._init_duration_in_millis is not None:
+                report += "\tInit Duration: {} ms".format(self._init_duration_in_millis)
+            self._log.write(report + "\n")
 
             log = self._log.getvalue()
-            return LambdaCallSummary(duration_in_millis, max_memory_used_in_mb, log)
+            return LambdaCallSummary(duration_in_millis, max_memory_used_in_mb, log,
+                                     init_duration_in_millis=self._init_duration_in_millis,
+                                     emf_metrics=self._log.metrics,
+                                     stream=stream_summary,
+                                     usage=usage,
+                                     serialization_duration_in_millis=(
+                                         self.serialization_duration_in_millis),
+                                     response_size_in_bytes=self.response_size_in_bytes)
+
+        def serialize(self, value):
+            """
+            Encodes the value returned by the Lambda function as the runtime
+            does, recording the time it takes and the size of the response.
+
+            :return: the encoded response
+            :rtype: bytes
+            :raises LambdaError: if the value cannot be encoded, or is too large
+            """
+            start = timeit.default_timer()
+            response = payload.encode_response(value)
+            self.serialization_duration_in_millis = 1000 * (timeit.default_timer() - start)
+            self.response_size_in_bytes = len(response)
+            return response
 
         @property
         def log(self):
             return self._log
+
+
+_process = None
+
+
+def _memory_in_mb():
+    """
+    :return: the resident set size of the process, in megabytes
+    """
+    global _process
+    # a single Process is reused (per process, in case of forks): creating one
+    # per sample is slower, and leaves a little memory behind each time
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process()
+    return _process.memory_info().rss / 1048576.0
+
+
+class _PeakMemory(object):
+    """
+    The peak resident set size of the process while a call is running, in
+    megabytes. On Linux, the kernel tracks the peak, and it is reset when a
+    call starts while no other call is running (so calls overlapping on
+    several threads share a peak, as they share memory). Elsewhere, a single
+    background thread samples the resident set size every
+    ``_SAMPLE_INTERVAL_IN_SECONDS`` for all running calls.
+    """
+    def __init__(self, start_mem):
+        global _kernel_peak
+        self.peak = start_mem
+        with _sampler_lock:
+            if not _peaks:
+                _kernel_peak = _reset_peak_rss()
+            self._kernel_peak = _kernel_peak
+            _peaks.add(self)
+            if not self._kernel_peak:
+                _start_sampler()
+
+    def stop(self):
+        """
+        :return: the peak resident set size, in megabytes
+        :rtype: float
+        """
+        with _sampler_lock:
+            _peaks.discard(self)
+        mem = _peak_rss_in_mb() if self._kernel_peak else _memory_in_mb()
+        self.peak = max(self.peak, mem)
+        return self.peak
+
+
+_SAMPLE_INTERVAL_IN_SECONDS = 0.005
+
+_sampler_lock = threading.Lock()
+_peaks = set()  # _PeakMemory of each running call
+_kernel_peak = False  # whether the kernel's peak was reset before the running calls
+_sampler_pid = None  # process the sampler thread is running in, if any
+
+
+def _reset_peak_rss():
+    # Linux 4.0+; the peak is only reset for the current process
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _peak_rss_in_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+    return _memory_in_mb()
+
+
+def _start_sampler():
+    # called with _sampler_lock held; a forked child has no sampler thread
+    global _sampler_pid
+    if _sampler_pid == os.getpid():
+        return
+    _sampler_pid = os.getpid()
+    thread = threading.Thread(target=_sample, name="run_lambda-memory")
+    thread.daemon = True
+    thread.start()
+
+
+def _sample():
+    global _sampler_pid
+    while True:
+        with _sampler_lock:
+            peaks = [peak for peak in _peaks if not peak._kernel_peak]
+            if not peaks:
+                _sampler_pid = None
+                return
+        mem = _memory_in_mb()
+        for peak in peaks:
+            if mem > peak.peak:
+                peak.peak = mem
+        time.sleep(_SAMPLE_INTERVAL_IN_SECONDS)
+
+
+class _ThreadFilter(logging.Filter):
+    """
+    Only passes log records emitted by the thread that created the filter.
+    """
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self._thread_id = threading.current_thread().ident
+
+    def filter(self, record):
+        return record.thread == self._thread_id
+
+
+class _StdoutRouter(object):
+    """
+    Replaces ``sys.stdout`` while calls are running, and routes writes to the
+    log of the call running on the current thread, if any, so that calls can
+    run concurrently on several threads.
+    """
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def _target(self):
+        stream = getattr(self.local, "stream", None)
+        return self.default if stream is None else stream
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+_router_lock = threading.Lock()
+_router = None
+_capture_count = 0
+
+
+def _capture_stdout(stream):
+    global _router, _capture_count
+    with _router_lock:
+        if _capture_count == 0:
+            _router = _StdoutRouter(sys.stdout)
+            sys.stdout = _router
+        _capture_count += 1
+        router = _router
+    previous = getattr(router.local, "stream", None)
+    router.local.stream = stream
+    return previous
+
+
+def _release_stdout(previous):
+    global _router, _capture_count
+    with _router_lock:
+        _router.local.stream = previous
+        _capture_count -= 1
+        if _capture_count == 0:
+            if sys.stdout is _router:
+                sys.stdout = _router.default
+            _router = None
@@ -0,0 +1,407 @@
+"""
+Record-and-replay cassettes for patched calls.
+
+In record mode, a cassette's patches pass calls through to the real targets,
+and record each call's arguments and response (or raised exception). In replay
+mode, the recorded responses are served instead, looked up by the call's
+normalized arguments::
+
+    with Cassette.record("get_item.cassette") as cassette:
+        run_lambda.run_lambda(my_function.handler, event,
+                              patches=cassette.patch_set(["my_function.get_item"]))
+
+    with Cassette.replay("get_item.cassette") as cassette:
+        run_lambda.run_lambda(my_function.handler, event,
+                              patches=cassette.patch_set(["my_function.get_item"]))
+
+When the same arguments are recorded more than once, replays serve the
+recorded responses in order, repeating the last one once they run out.
+
+Cassette files are binary: a sequence of length-prefixed, JSON-encoded
+responses, followed by a JSON index from argument hashes to response offsets.
+Opening a cassette for replay only reads its index; responses are read when
+they are first needed.
+
+Cassettes only contain data, so that replaying a cassette shared by someone
+else cannot run code. Responses may contain ``None``, booleans, numbers,
+strings, bytes, lists, tuples, dictionaries, sets, decimals, dates and
+datetimes, and objects and exceptions whose attributes are themselves such
+values. Objects and exceptions are replayed as instances of their recorded
+class, created without calling its ``__init__``, if the class's module has
+already been imported (a module named in a cassette is never imported).
+Otherwise, and for exceptions whose attributes cannot be recorded, a
+:class:`RecordedException` is raised in their place.
+"""
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+import mmap
+import struct
+import sys
+import threading
+
+import six
+
+from run_lambda import patches as patches_module
+from run_lambda import utils
+
+RECORD = "record"
+REPLAY = "replay"
+
+_MAGIC = b"RLCASS2\n"
+_FOOTER_MAGIC = b"RLCIDX2\n"
+_LENGTH = struct.Struct(">I")
+_FOOTER = struct.Struct(">Q8s")
+
+_RETURNED = 0
+_RAISED = 1
+
+
+class CassetteError(Exception):
+    """
+    Raised when a cassette cannot be read, or when a replayed call was not
+    recorded.
+    """
+    pass
+
+
+class RecordedException(Exception):
+    """
+    Replayed in place of a recorded exception whose class or attributes
+    could not be restored.
+    """
+    pass
+
+
+class Cassette(object):
+    def __init__(self, filename, mode, normalize=None):
+        """
+        :param str filename: name of cassette file
+        :param str mode: either ``RECORD`` or ``REPLAY``
+        :param function normalize: function taking the patched name and the
+            call's positional and keyword arguments, and returning a
+            deterministic, hashable key for the call. Defaults to
+            :func:`normalize_call`.
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError("Invalid cassette mode {}".format(repr(mode)))
+        self._filename = filename
+        self._mode = mode
+        self._normalize = normalize_call if normalize is None else normalize
+        self._lock = threading.Lock()
+        self._recorded = {}  # call hash -> list of encoded responses
+        self._closed = False
+        self._file = None
+        self._data = None
+        self._index = {}
+        self._positions = {}
+        if mode == REPLAY:
+            self._open()
+
+    @staticmethod
+    def record(filename, **kwargs):
+        """
+        :return: a cassette that records calls to ``filename``
+        :rtype: Cassette
+        """
+        return Cassette(filename, RECORD, **kwargs)
+
+    @staticmethod
+    def replay(filename, **kwargs):
+        """
+        :return: a cassette that replays the calls recorded in ``filename``
+        :rtype: Cassette
+        """
+        return Cassette(filename, REPLAY, **kwargs)
+
+    @property
+    def mode(self):
+        """
+        :property: Mode of cassette, ``RECORD`` or ``REPLAY``
+        :rtype: str
+        """
+        return self._mode
+
+    def __len__(self):
+        """
+        :return: number of distinct calls in the cassette
+        """
+        return len(self._recorded) if self._mode == RECORD else len(self._index)
+
+    def patch_set(self, names):
+        """
+        Returns a patch set that records or replays calls to the targets
+        ``names``.
+
+        :param list[str] names: dotted names of targets to record or replay
+        :rtype: PatchSet
+        """
+        patches = {}
+        for name in names:
+            if self._mode == RECORD:
+                patches[name] = self._recorder(name, patches_module.resolve(name))
+            else:
+                patches[name] = self._replayer(name)
+        return patches_module.PatchSet(patches)
+
+    def close(self):
+        """
+        Closes the cassette. In record mode, this writes the cassette file.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._mode == RECORD:
+            self._write()
+        else:
+            self._data.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _recorder(self, name, original):
+        def record(*args, **kwargs):
+            key = self._hash(name, args, kwargs)
+            try:
+                value = original(*args, **kwargs)
+            except Exception as e:
+                self._store(key, _RAISED, e)
+                raise
+            self._store(key, _RETURNED, value)
+            return value
+        record.__name__ = getattr(original, "__name__", "record")
+        return record
+
+    def _replayer(self, name):
+        def replay(*args, **kwargs):
+            outcome, value = self._lookup(name, args, kwargs)
+            if outcome == _RAISED:
+                raise value
+            return value
+        replay.__name__ = name.rsplit(".", 1)[-1]
+        return replay
+
+    def _hash(self, name, args, kwargs):
+        key = self._normalize(name, args, kwargs)
+        return hashlib.sha1(repr(key).encode("utf-8")).digest()
+
+    def _store(self, key, outcome, value):
+        try:
+            payload = _dumps([outcome, encode(value)])
+        except TypeError as e:
+            if outcome != _RAISED:
+                raise CassetteError("Cannot record response: {}".format(e))
+            payload = _dumps([outcome, encode(RecordedException(repr(value)))])
+        with self._lock:
+            self._recorded.setdefault(key, []).append(payload)
+
+    def _write(self):
+        with open(self._filename, "wb") as cassette_file:
+            cassette_file.write(_MAGIC)
+            offset = len(_MAGIC)
+            index = {}
+            for key, payloads in self._recorded.items():
+                for payload in payloads:
+                    cassette_file.write(_LENGTH.pack(len(payload)))
+                    cassette_file.write(payload)
+                    index.setdefault(key, []).append(offset)
+                    offset += _LENGTH.size + len(payload)
+            cassette_file.write(_dumps({_hex(key): offsets
+                                        for key, offsets in index.items()}))
+            cassette_file.write(_FOOTER.pack(offset, _FOOTER_MAGIC))
+
+    def _open(self):
+        self._file = open(self._filename, "rb")
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise CassetteError("{} is not a cassette file".format(self._filename))
+        size = len(self._data)
+        if size < len(_MAGIC) + _FOOTER.size or self._data[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise CassetteError("{} is not a cassette file".format(self._filename))
+        index_offset, footer_magic = _FOOTER.unpack_from(self._data, size - _FOOTER.size)
+        if footer_magic != _FOOTER_MAGIC:
+            self.close()
+            raise CassetteError("{} is truncated".format(self._filename))
+        try:
+            index = _loads(self._data[index_offset:size - _FOOTER.size])
+            self._index = {_unhex(key): [int(offset) for offset in offsets]
+                           for key, offsets in index.items()}
+        except (ValueError, TypeError, AttributeError):
+            self.close()
+            raise CassetteError("{} has a corrupt index".format(self._filename))
+
+    def _lookup(self, name, args, kwargs):
+        key = self._hash(name, args, kwargs)
+        offsets = self._index.get(key)
+        if offsets is None:
+            raise CassetteError("No recorded call {n}(*{a}, **{k}) in {f}".format(
+                n=name, a=repr(args), k=repr(kwargs), f=self._filename))
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = min(position + 1, len(offsets) - 1)
+        offset = offsets[position]
+        try:
+            length, = _LENGTH.unpack_from(self._data, offset)
+            start = offset + _LENGTH.size
+            outcome, value = _loads(self._data[start:start + length])
+            return outcome, decode(value)
+        except (struct.error, ValueError, TypeError, KeyError, IndexError):
+            raise CassetteError("Corrupt response for {n} at offset {o} in {f}".format(
+                n=name, o=offset, f=self._filename))
+
+
+def normalize_call(name, args, kwargs):
+    """
+    The default normalization of calls: a call is identified by the patched
+    name, and its arguments with dictionaries sorted by key, sets sorted, and
+    other objects replaced by their type and attributes.
+
+    :return: normalized representation of the call
+    :rtype: tuple
+    """
+    return name, utils.normalize(args), utils.normalize(kwargs)
+
+
+def _hex(key):
+    return base64.b16encode(key).decode("ascii")
+
+
+def _unhex(text):
+    return base64.b16decode(text.encode("ascii"))
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(data):
+    return json.loads(data.decode("utf-8"))
+
+
+# Values are encoded as JSON: None, booleans, numbers and strings as they are,
+# and other values as single-entry objects whose key is the value's type.
+
+def encode(value):
+    """
+    Encodes a value as it is stored in cassettes, for :func:`decode`.
+
+    :param value: a value of one of the types that cassettes can contain
+    :return: ``value``, as JSON-serializable data
+    :raises TypeError: if ``value``, or a value it contains, cannot be encoded
+    """
+    if value is None or isinstance(value, (bool, float) + six.integer_types):
+        return value
+    if isinstance(value, six.text_type):
+        return value
+    if isinstance(value, bytes):
+        return {"bytes": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, list):
+        return {"list": [encode(v) for v in value]}
+    if isinstance(value, tuple):
+        return {"tuple": [encode(v) for v in value]}
+    if isinstance(value, dict):
+        return {"dict": [[encode(k), encode(v)] for k, v in value.items()]}
+    if isinstance(value, (set, frozenset)):
+        return {type(value).__name__: [encode(v) for v in value]}
+    if isinstance(value, decimal.Decimal):
+        return {"decimal": str(value)}
+    if isinstance(value, datetime.datetime):
+        offset = value.utcoffset()
+        return {"datetime": [value.replace(tzinfo=None).isoformat(),
+                             None if offset is None else _total_seconds(offset)]}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    attributes = getattr(value, "__dict__", None)
+    if isinstance(value, BaseException):
+        return {"exception": [_class_name(type(value)), encode(value.args),
+                              encode(attributes or {})]}
+    if attributes is not None:
+        return {"object": [_class_name(type(value)), encode(attributes)]}
+    raise TypeError("cannot record {}".format(type(value).__name__))
+
+
+def decode(value):
+    """
+    Decodes a value encoded by :func:`encode`, without importing any module.
+
+    :param value: JSON-serializable data returned by :func:`encode`
+    :return: the encoded value
+    :raises CassetteError: if the value is an object whose module has not
+        been imported
+    :raises ValueError: if the data was not returned by :func:`encode`
+    """
+    if not isinstance(value, dict):
+        return value
+    (kind, data), = value.items()
+    if kind == "bytes":
+        return base64.b64decode(data.encode("ascii"))
+    if kind == "list":
+        return [decode(v) for v in data]
+    if kind == "tuple":
+        return tuple(decode(v) for v in data)
+    if kind == "dict":
+        return dict((decode(k), decode(v)) for k, v in data)
+    if kind == "set":
+        return set(decode(v) for v in data)
+    if kind == "frozenset":
+        return frozenset(decode(v) for v in data)
+    if kind == "decimal":
+        return decimal.Decimal(data)
+    if kind == "datetime":
+        text, offset = data
+        result = datetime.datetime.strptime(
+            text, "%Y-%m-%dT%H:%M:%S.%f" if "." in text else "%Y-%m-%dT%H:%M:%S")
+        if offset is not None and hasattr(datetime, "timezone"):
+            result = result.replace(tzinfo=datetime.timezone(
+                datetime.timedelta(seconds=offset)))
+        return result
+    if kind == "date":
+        return datetime.datetime.strptime(data, "%Y-%m-%d").date()
+    if kind == "exception":
+        class_name, args, attributes = data
+        cls = _imported_class(class_name)
+        if cls is None or not issubclass(cls, BaseException):
+            return RecordedException("{c}{a}".format(c=class_name, a=repr(decode(args))))
+        exception = cls.__new__(cls)
+        exception.args = decode(args)
+        exception.__dict__.update(decode(attributes))
+        return exception
+    if kind == "object":
+        class_name, attributes = data
+        cls = _imported_class(class_name)
+        if cls is None:
+            raise CassetteError("Cannot replay an instance of {}, whose module has not "
+                                "been imported".format(class_name))
+        instance = cls.__new__(cls)
+        instance.__dict__.update(decode(attributes))
+        return instance
+    raise ValueError("Unknown value type {}".format(kind))
+
+
+def _class_name(cls):
+    return "{m}:{n}".format(m=cls.__module__, n=getattr(cls, "__qualname__", cls.__name__))
+
+
+def _imported_class(class_name):
+    # only looks classes up in modules that are already imported
+    module_name, _, qualified_name = class_name.partition(":")
+    if module_name == "exceptions":  # Python 2
+        module_name = six.moves.builtins.__name__
+    target = sys.modules.get(module_name)
+    for part in qualified_name.split("."):
+        target = getattr(target, part, None)
+    return target if isinstance(target, type) else None
+
+
+def _total_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
@@ -0,0 +1,190 @@
+"""
+The ``run_lambda coldstart`` command, which measures the cold-start latency of
+a Lambda function by invoking it in a series of fresh Python processes.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+import run_lambda.call as call
+import run_lambda.context as context_module
+import run_lambda.init as init
+import run_lambda.package as package
+import run_lambda.utils as utils
+
+# Prefix of the line on which a child process reports its measurements. The
+# Lambda function may write arbitrary output of its own at import time.
+_RESULT_PREFIX = "RUN_LAMBDA_COLDSTART "
+
+
+def arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda coldstart",
+        description="Measure cold starts of an AWS Lambda function, by "
+                    "invoking it in fresh Python processes")
+    parser.add_argument("filename", type=str,
+                        help="name of file containing Lambda function, or of "
+                             "deployment package (.zip)")
+    parser.add_argument("event", type=str,
+                        help="filename of file containing JSON event data")
+    parser.add_argument("-n", "--runs", metavar="RUNS", dest="runs", type=int,
+                        default=10, help="Number of cold starts. Defaults to 10")
+    parser.add_argument("-f", "--function", metavar="HANDLER_FUNCTION",
+                        dest="function_name", type=str, default="handler",
+                        help="Name of handler function. Defaults to \"handler\". "
+                             "For a deployment package, the handler setting, "
+                             "e.g. \"app.handler\"")
+    parser.add_argument("--layer", metavar="LAYER_ZIP", dest="layers",
+                        action="append", default=[],
+                        help="Layer of a deployment package. May be repeated, "
+                             "in the order the layers are configured")
+    parser.add_argument("-t", "--timeout", metavar="TIMEOUT",
+                        dest="timeout", type=int, default=None,
+                        help="Timeout (in seconds) for each function call")
+    parser.add_argument("-c", "--context", metavar="CONTEXT_FILENAME", type=str,
+                        default=None, dest="context_file",
+                        help="Filename of file containing JSON context data")
+    parser.add_argument("-i", "--import-times", action="store_true",
+                        dest="import_times",
+                        help="Display a per-module breakdown of import times, "
+                             "averaged over all runs")
+    parser.add_argument("--json", action="store_true", dest="json",
+                        help="Print the measurements of each run as JSON, "
+                             "instead of a report")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arguments(sys.argv[1:] if argv is None else argv)
+    if args.child:
+        return run_child(args)
+
+    runs = [run_cold_start(args) for _ in range(args.runs)]
+    if args.json:
+        sys.stdout.write(json.dumps(runs, indent=2, sort_keys=True) + "\n")
+    else:
+        if package.is_package(args.filename):
+            display_layout(package.Package(args.filename, layers=args.layers), sys.stdout)
+        display(runs, sys.stdout, import_times=args.import_times)
+
+
+def run_cold_start(args):
+    """
+    Invokes the Lambda function once, in a fresh Python process.
+
+    :return: the measurements reported by the child process, plus the
+        ``process_duration_in_millis`` of the whole process
+    :rtype: dict
+    """
+    command = [sys.executable, "-m", "run_lambda.coldstart", "--child",
+               args.filename, args.event, "-f", args.function_name]
+    if args.timeout is not None:
+        command += ["-t", str(args.timeout)]
+    if args.context_file is not None:
+        command += ["-c", args.context_file]
+    if args.import_times:
+        command.append("-i")
+    for layer in args.layers:
+        command += ["--layer", layer]
+
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [package_root, env.get("PYTHONPATH")] if p)
+
+    start_time = timeit.default_timer()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, env=env)
+    stdout, stderr = process.communicate()
+    end_time = timeit.default_timer()
+
+    for line in reversed(stdout.decode("utf-8", "replace").splitlines()):
+        if line.startswith(_RESULT_PREFIX):
+            run = json.loads(line[len(_RESULT_PREFIX):])
+            run["process_duration_in_millis"] = 1000 * (end_time - start_time)
+            return run
+    raise RuntimeError("Cold start process failed (exit code {c}):\n{e}"
+                       .format(c=process.returncode,
+                               e=stderr.decode("utf-8", "replace")))
+
+
+def run_child(args):
+    with open(args.event) as event_file:
+        event = json.load(event_file)
+    if args.context_file is not None:
+        with open(args.context_file) as context_file:
+            context = context_module.MockLambdaContext.of_json(json.load(context_file))
+    else:
+        context = context_module.MockLambdaContext.Builder().build()
+
+    loader, function_name = package.module_loader(
+        args.filename, args.function_name, layers=args.layers)
+    module, init_summary = init.timed_init(loader, profile_imports=args.import_times)
+    result = call.run_lambda(getattr(module, function_name), event,
+                             context=context, timeout_in_seconds=args.timeout,
+                             init_duration_in_millis=init_summary.duration_in_millis)
+    run = {
+        "init_duration_in_millis": init_summary.duration_in_millis,
+        "duration_in_millis": result.summary.duration_in_millis,
+        "max_memory_used_in_mb": result.summary.max_memory_used_in_mb,
+        "timed_out": result.timed_out,
+        "exception": None if result.exception is None else repr(result.exception),
+    }
+    if init_summary.imports is not None:
+        run["imports"] = [t.to_json() for t in init_summary.imports]
+    sys.stdout.write(_RESULT_PREFIX + json.dumps(run) + "\n")
+
+
+def display_layout(code, outfile):
+    outfile.write("{:<40}{:>10}{:>14}{:>14}\n".format(
+        "Package", "files", "zipped (MB)", "unzipped (MB)"))
+    for filename, file_count, compressed_bytes, uncompressed_bytes in code.layout():
+        outfile.write("{:<40}{:>10}{:>14.2f}{:>14.2f}\n".format(
+            os.path.basename(filename), file_count,
+            compressed_bytes / 1048576.0, uncompressed_bytes / 1048576.0))
+    outfile.write("\n")
+
+
+def display(runs, outfile, import_times=False):
+    outfile.write("Cold starts: {}\n".format(len(runs)))
+    failures = [run for run in runs
+                if run["timed_out"] or run["exception"] is not None]
+    if failures:
+        outfile.write("Failed invocations: {}\n".format(len(failures)))
+    outfile.write("\n{:<28}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(
+        "", "min", "p50", "p90", "p99", "max", "mean"))
+    for label, key in [("Init duration (ms)", "init_duration_in_millis"),
+                       ("Duration (ms)", "duration_in_millis"),
+                       ("Process duration (ms)", "process_duration_in_millis"),
+                       ("Max memory used (MB)", "max_memory_used_in_mb")]:
+        values = sorted(run[key] for run in runs)
+        outfile.write("{:<28}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}\n"
+                      .format(label, values[0],
+                              utils.percentile(values, 50),
+                              utils.percentile(values, 90),
+                              utils.percentile(values, 99),
+                              values[-1],
+                              sum(values) / float(len(values))))
+
+    if import_times:
+        totals = {}
+        for run in runs:
+            for import_time in run.get("imports", []):
+                name = import_time["name"]
+                self_ms, cumulative_ms = totals.get(name, (0.0, 0.0))
+                totals[name] = (self_ms + import_time["self_in_millis"],
+                                cumulative_ms + import_time["cumulative_in_millis"])
+        outfile.write("\nMean import times (slowest 20):\n")
+        outfile.write("{:>12} | {:>12} | module\n".format("self [ms]", "cumulative"))
+        slowest = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (self_ms, cumulative_ms) in slowest[:20]:
+            outfile.write("{:>12.3f} | {:>12.3f} | {}\n".format(
+                self_ms / len(runs), cumulative_ms / len(runs), name))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
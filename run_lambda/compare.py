@@ -0,0 +1,489 @@
+"""
+The ``run_lambda compare`` command, which compares the performance of two
+versions of a Lambda function over a set of events.
+
+Both versions are run on every event, several times, alternating which
+version runs first so that slow drifts in machine load affect both equally.
+Events are spread across worker processes. For each event, and overall, the
+command compares ``duration_in_millis`` and ``max_memory_used_in_mb``, and
+flags events for which the two versions return different values.
+
+Overall differences are summarized by the relative change in total duration
+(and the change in mean memory), with a 95% bootstrap confidence interval over
+events, and a Wilcoxon signed-rank test of the per-event differences (exact
+for up to 50 events). A budget is also exceeded by a change that exceeds it
+but is measured over too few events to ever be significant (e.g. 5 events
+cannot give p < 0.05), rather than passing unnoticed.
+
+Both versions run in the same process, but each imports its own copy of the
+local modules next to its handler file (e.g. a ``utils`` module that both
+versions have): between a version's calls, its local modules are kept out of
+``sys.modules``. Modules that were already imported before the comparison
+started are shared by both versions.
+"""
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+
+from run_lambda import corpus
+from run_lambda import package
+from run_lambda.container import Container
+
+_OLD = 0
+_NEW = 1
+
+# state of each worker process
+_worker = {}
+
+
+def arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda compare",
+        description="Compare the performance of two versions of an AWS "
+                    "Lambda function over a set of events")
+    parser.add_argument("old", type=str,
+                        help="name of file containing the old version of the function")
+    parser.add_argument("new", type=str,
+                        help="name of file containing the new version of the function")
+    parser.add_argument("events", type=str,
+                        help="event file, JSON lines file or directory of events")
+    parser.add_argument("-f", "--function", metavar="HANDLER_FUNCTION",
+                        dest="function_name", type=str, default="handler",
+                        help="Name of handler function. Defaults to \"handler\"")
+    parser.add_argument("-t", "--timeout", metavar="TIMEOUT",
+                        dest="timeout", type=int, default=None,
+                        help="Timeout (in seconds) for each function call")
+    parser.add_argument("-r", "--repetitions", metavar="N", type=int, default=3,
+                        help="Number of times each version is run on each "
+                             "event. Defaults to 3")
+    parser.add_argument("-w", "--workers", metavar="N", type=int, default=None,
+                        help="Number of worker processes. Defaults to the "
+                             "number of CPUs")
+    parser.add_argument("--max-slowdown", metavar="PERCENT", dest="max_slowdown",
+                        type=float, default=5.0,
+                        help="Fail if the new version is significantly slower "
+                             "than the old one by more than PERCENT percent. "
+                             "Defaults to 5")
+    parser.add_argument("--max-memory-increase", metavar="MB",
+                        dest="max_memory_increase", type=float, default=None,
+                        help="Fail if the new version uses significantly more "
+                             "memory than the old one, by more than MB megabytes "
+                             "on average")
+    parser.add_argument("--alpha", metavar="ALPHA", type=float, default=0.05,
+                        help="Significance level of tests. Defaults to 0.05")
+    parser.add_argument("--fail-on-value-change", action="store_true",
+                        dest="fail_on_value_change",
+                        help="Fail if the versions return different values for "
+                             "any event")
+    parser.add_argument("--json", action="store_true", dest="json",
+                        help="Print the comparison as JSON, instead of a report")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arguments(sys.argv[1:] if argv is None else argv)
+    comparison = compare(args.old, args.new, corpus.load_events(args.events),
+                         function_name=args.function_name,
+                         timeout_in_seconds=args.timeout,
+                         repetitions=args.repetitions,
+                         workers=args.workers)
+    failures = comparison.failures(max_slowdown_percent=args.max_slowdown,
+                                   max_memory_increase_in_mb=args.max_memory_increase,
+                                   alpha=args.alpha,
+                                   fail_on_value_change=args.fail_on_value_change)
+    if args.json:
+        output = comparison.to_json()
+        output["failures"] = failures
+        sys.stdout.write(json.dumps(output, indent=2, sort_keys=True) + "\n")
+    else:
+        comparison.display(sys.stdout)
+        for failure in failures:
+            sys.stdout.write("FAIL: {}\n".format(failure))
+    return 1 if failures else 0
+
+
+def compare(old_filename, new_filename, events, function_name="handler",
+            timeout_in_seconds=None, repetitions=3, workers=None):
+    """
+    Runs two versions of a Lambda function over the same events.
+
+    :param str old_filename: name of file containing the old version
+    :param str new_filename: name of file containing the new version
+    :param list events: list of ``(key, event)`` pairs, as returned by
+        :func:`run_lambda.corpus.load_events`
+    :param str function_name: name of handler function in both files
+    :param int timeout_in_seconds: timeout of each call
+    :param int repetitions: number of times each version is run on each event
+    :param int workers: number of worker processes. If 1, events are run in
+        the current process.
+    :rtype: Comparison
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    init_args = (old_filename, new_filename, function_name, timeout_in_seconds,
+                 repetitions)
+    tasks = [(index, key, event) for index, (key, event) in enumerate(events)]
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(*init_args)
+        comparisons = [_compare_event(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(min(workers, len(tasks)), _init_worker, init_args)
+        try:
+            comparisons = pool.map(_compare_event, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return Comparison(comparisons)
+
+
+def _init_worker(old_filename, new_filename, function_name, timeout_in_seconds,
+                 repetitions):
+    _worker["versions"] = [_Version(old_filename, function_name),
+                           _Version(new_filename, function_name)]
+    _worker["timeout"] = timeout_in_seconds
+    _worker["repetitions"] = repetitions
+
+
+def _compare_event(task):
+    index, key, event = task
+    versions = _worker["versions"]
+    samples = [[], []]
+    outcomes = [None, None]
+    for repetition in range(_worker["repetitions"]):
+        order = (_OLD, _NEW) if (index + repetition) % 2 == 0 else (_NEW, _OLD)
+        for version in order:
+            result = versions[version].invoke(
+                event, timeout_in_seconds=_worker["timeout"])
+            samples[version].append((result.summary.duration_in_millis,
+                                     result.summary.max_memory_used_in_mb))
+            if outcomes[version] is None:
+                outcomes[version] = _outcome(result)
+    return EventComparison(key, samples[_OLD], samples[_NEW],
+                           outcomes[_OLD], outcomes[_NEW])
+
+
+class _Version(object):
+    """
+    A version of the Lambda function, whose directory is only on
+    ``sys.path``, and whose local modules are only in ``sys.modules``, while
+    it is being initialized or invoked.
+    """
+    def __init__(self, filename, function_name):
+        self._directory = os.path.dirname(os.path.abspath(filename))
+        self._modules = {}
+        self._container = Container.of_file(filename, function_name)
+        with self._imports():
+            self._container.initialize()
+
+    def invoke(self, event, **kwargs):
+        with self._imports():
+            return self._container.invoke(event, **kwargs)
+
+    @contextlib.contextmanager
+    def _imports(self):
+        loaded = set(sys.modules)
+        sys.modules.update(self._modules)
+        sys.path.insert(0, self._directory)
+        try:
+            yield
+        finally:
+            sys.path.remove(self._directory)
+            for name, module in list(sys.modules.items()):
+                if name in self._modules or \
+                        (name not in loaded and package.is_within(module, [self._directory])):
+                    self._modules[name] = sys.modules.pop(name)
+
+
+def _outcome(result):
+    if result.timed_out:
+        return "timed out"
+    if result.exception is not None:
+        return "raised " + repr(result.exception)
+    return "returned " + json.dumps(result.value, sort_keys=True, default=repr)
+
+
+class EventComparison(object):
+    """
+    Comparison of the two versions of a Lambda function on a single event.
+    """
+    def __init__(self, key, old_samples, new_samples, old_outcome, new_outcome):
+        self.key = key
+        self.old_durations = [duration for duration, _ in old_samples]
+        self.new_durations = [duration for duration, _ in new_samples]
+        self.old_memory = [memory for _, memory in old_samples]
+        self.new_memory = [memory for _, memory in new_samples]
+        self.old_outcome = old_outcome
+        self.new_outcome = new_outcome
+
+    @property
+    def outcome_changed(self):
+        """
+        :property: Whether the versions returned different values (or one
+            raised an exception or timed out and the other did not)
+        :rtype: bool
+        """
+        return self.old_outcome != self.new_outcome
+
+    @property
+    def duration_difference_in_millis(self):
+        """
+        :property: Difference of mean durations (new minus old), with an
+            approximate 95% confidence interval, as a ``(difference, low,
+            high)`` tuple
+        :rtype: tuple
+        """
+        return _difference_interval(self.old_durations, self.new_durations)
+
+    @property
+    def memory_difference_in_mb(self):
+        """
+        :property: Difference of mean memory used (new minus old), with an
+            approximate 95% confidence interval, as a ``(difference, low,
+            high)`` tuple
+        :rtype: tuple
+        """
+        return _difference_interval(self.old_memory, self.new_memory)
+
+
+class Comparison(object):
+    """
+    Comparison of two versions of a Lambda function over a set of events.
+    """
+    def __init__(self, events):
+        self._events = events
+
+    @property
+    def events(self):
+        """
+        :property: Per-event comparisons, in the order of the events
+        :rtype: list[EventComparison]
+        """
+        return self._events
+
+    @property
+    def changed_events(self):
+        """
+        :property: Events for which the versions returned different values
+        :rtype: list[EventComparison]
+        """
+        return [event for event in self._events if event.outcome_changed]
+
+    def duration_change(self):
+        """
+        :return: relative change in total duration, in percent, with a 95%
+            confidence interval and a p-value, as a ``(change, low, high,
+            p_value)`` tuple
+        :rtype: tuple
+        """
+        old, new = self._means("durations")
+        change = _relative_change(old, new, range(len(old)))
+        low, high = _bootstrap(lambda sample: _relative_change(old, new, sample),
+                               len(old))
+        return change, low, high, wilcoxon_signed_rank(old, new)
+
+    def memory_change(self):
+        """
+        :return: change in mean memory used, in megabytes, with a 95%
+            confidence interval and a p-value, as a ``(change, low, high,
+            p_value)`` tuple
+        :rtype: tuple
+        """
+        old, new = self._means("memory")
+        change = _mean_difference(old, new, range(len(old)))
+        low, high = _bootstrap(lambda sample: _mean_difference(old, new, sample),
+                               len(old))
+        return change, low, high, wilcoxon_signed_rank(old, new)
+
+    def failures(self, max_slowdown_percent=5.0, max_memory_increase_in_mb=None,
+                 alpha=0.05, fail_on_value_change=False):
+        """
+        :return: descriptions of the budgets the new version exceeds. A budget
+            is exceeded when the change exceeds it and is significant at level
+            ``alpha``, or when the change exceeds it and there are too few
+            events for any change to be significant at level ``alpha``.
+        :rtype: list[str]
+        """
+        failures = []
+        if not self._events:
+            return failures
+        change, _, _, p_value = self.duration_change()
+        if max_slowdown_percent is not None and change > max_slowdown_percent:
+            description = "duration increased by {c:.1f}% (budget {b:.1f}%".format(
+                c=change, b=max_slowdown_percent)
+            failures.extend(self._significance_failures(
+                description, "durations", p_value, alpha))
+        change, _, _, p_value = self.memory_change()
+        if max_memory_increase_in_mb is not None and change > max_memory_increase_in_mb:
+            description = "memory increased by {c:.1f} MB (budget {b:.1f} MB".format(
+                c=change, b=max_memory_increase_in_mb)
+            failures.extend(self._significance_failures(
+                description, "memory", p_value, alpha))
+        if fail_on_value_change and self.changed_events:
+            failures.append("{} event(s) returned different values"
+                            .format(len(self.changed_events)))
+        return failures
+
+    def _means(self, name):
+        # per-event means of the old and new durations or memory
+        return ([_mean(getattr(event, "old_" + name)) for event in self._events],
+                [_mean(getattr(event, "new_" + name)) for event in self._events])
+
+    def _significance_failures(self, description, name, p_value, alpha):
+        if p_value < alpha:
+            return ["{d}, p={p:.3g})".format(d=description, p=p_value)]
+        # with n differing events, the smallest possible p-value is 2 / 2^n
+        count = sum(1 for old, new in zip(*self._means(name)) if old != new)
+        if 2.0 ** (1 - count) >= alpha:
+            return ["{d}, insufficient samples: {n} event(s) cannot show a "
+                    "significant change at level {a:g})".format(
+                        d=description, n=count, a=alpha)]
+        return []
+
+    def to_json(self):
+        output = {"events": [{
+            "key": event.key,
+            "old_durations_in_millis": event.old_durations,
+            "new_durations_in_millis": event.new_durations,
+            "old_max_memory_used_in_mb": event.old_memory,
+            "new_max_memory_used_in_mb": event.new_memory,
+            "outcome_changed": event.outcome_changed,
+        } for event in self._events]}
+        if self._events:
+            for name, change in [("duration_change_percent", self.duration_change()),
+                                 ("memory_change_in_mb", self.memory_change())]:
+                output[name] = dict(zip(["change", "low", "high", "p_value"], change))
+        return output
+
+    def display(self, outfile=None):
+        if outfile is None:
+            outfile = sys.stdout
+        outfile.write("Events: {}\n\n".format(len(self._events)))
+        if not self._events:
+            return
+        outfile.write("{:<40}{:>12}{:>12}{:>24}\n".format(
+            "event", "old (ms)", "new (ms)", "difference (95% CI)"))
+        for event in self._events:
+            difference, low, high = event.duration_difference_in_millis
+            outfile.write("{:<40}{:>12.1f}{:>12.1f}{:>24}{}\n".format(
+                _truncate(event.key, 39), _mean(event.old_durations),
+                _mean(event.new_durations),
+                "{:+.1f} [{:+.1f}, {:+.1f}]".format(difference, low, high),
+                "  VALUE CHANGED" if event.outcome_changed else ""))
+
+        change, low, high, p_value = self.duration_change()
+        outfile.write("\nDuration change: {c:+.1f}% (95% CI [{l:+.1f}%, {h:+.1f}%], "
+                      "p={p:.3g})\n".format(c=change, l=low, h=high, p=p_value))
+        change, low, high, p_value = self.memory_change()
+        outfile.write("Memory change: {c:+.2f} MB (95% CI [{l:+.2f}, {h:+.2f}], "
+                      "p={p:.3g})\n".format(c=change, l=low, h=high, p=p_value))
+        for event in self.changed_events:
+            outfile.write("\nValue changed for {}:\n  old: {}\n  new: {}\n".format(
+                event.key, _truncate(event.old_outcome, 200),
+                _truncate(event.new_outcome, 200)))
+
+
+def wilcoxon_signed_rank(old, new):
+    """
+    Two-sided Wilcoxon signed-rank test of the paired samples ``old`` and
+    ``new``. Pairs with equal values are dropped. For up to
+    ``_EXACT_MAX_COUNT`` remaining pairs, the p-value is computed from the
+    exact distribution of the statistic (with average ranks for ties);
+    otherwise, from the normal approximation with tie correction.
+
+    :return: p-value of the test
+    :rtype: float
+    """
+    differences = [n - o for o, n in zip(old, new) if n != o]
+    count = len(differences)
+    if count == 0:
+        return 1.0
+    ordered = sorted(range(count), key=lambda i: abs(differences[i]))
+    ranks = [0.0] * count
+    tie_correction = 0.0
+    start = 0
+    while start < count:
+        end = start
+        while end + 1 < count and \
+                abs(differences[ordered[end + 1]]) == abs(differences[ordered[start]]):
+            end += 1
+        for position in range(start, end + 1):
+            ranks[ordered[position]] = (start + end) / 2.0 + 1
+        ties = end - start + 1
+        tie_correction += ties ** 3 - ties
+        start = end + 1
+    positive = sum(rank for rank, d in zip(ranks, differences) if d > 0)
+    if count <= _EXACT_MAX_COUNT:
+        return _exact_p_value(ranks, positive)
+    mean = count * (count + 1) / 4.0
+    variance = count * (count + 1) * (2 * count + 1) / 24.0 - tie_correction / 48.0
+    if variance <= 0:
+        return 1.0
+    z = (abs(positive - mean) - 0.5) / math.sqrt(variance)
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+# the normal approximation is poor for few pairs, and cannot tell, e.g., that
+# 5 pairs can never give p < 0.05
+_EXACT_MAX_COUNT = 50
+
+
+def _exact_p_value(ranks, positive):
+    # every pair's difference is equally likely to be positive or negative
+    # under the null hypothesis; average ranks are multiples of 0.5, so sums
+    # are counted in halves
+    halves = [int(round(2 * rank)) for rank in ranks]
+    counts = [1] + [0] * sum(halves)  # number of sign assignments per sum
+    for half in halves:
+        for total in range(len(counts) - 1, half - 1, -1):
+            counts[total] += counts[total - half]
+    observed = int(round(2 * positive))
+    below = sum(counts[:observed + 1])
+    above = sum(counts[observed:])
+    return min(1.0, 2.0 * min(below, above) / 2 ** len(ranks))
+
+
+def _bootstrap(statistic, count, resamples=2000, seed=0):
+    rng = random.Random(seed)
+    values = sorted(statistic([rng.randrange(count) for _ in range(count)])
+                    for _ in range(resamples))
+    return values[int(0.025 * resamples)], values[int(0.975 * resamples) - 1]
+
+
+def _relative_change(old, new, sample):
+    old_total = sum(old[i] for i in sample)
+    new_total = sum(new[i] for i in sample)
+    if old_total == 0:
+        return 0.0 if new_total == 0 else float("inf")
+    return 100.0 * (new_total / float(old_total) - 1)
+
+
+def _mean_difference(old, new, sample):
+    sample = list(sample)
+    return sum(new[i] - old[i] for i in sample) / float(len(sample))
+
+
+def _difference_interval(old, new):
+    difference = _mean(new) - _mean(old)
+    standard_error = math.sqrt(_variance(old) / len(old) + _variance(new) / len(new))
+    return difference, difference - 1.96 * standard_error, \
+        difference + 1.96 * standard_error
+
+
+def _mean(values):
+    return sum(values) / float(len(values))
+
+
+def _variance(values):
+    if len(values) < 2:
+        return 0.0
+    mean = _mean(values)
+    return sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+
+
+def _truncate(text, length):
+    return text if len(text) <= length else text[:length - 3] + "..."
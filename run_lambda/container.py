@@ -0,0 +1,182 @@
+import itertools
+import os
+import sys
+import threading
+import traceback
+
+from run_lambda import call
+from run_lambda import context as context_module
+from run_lambda import init
+from run_lambda import package
+from run_lambda import utils
+
+_module_counter = itertools.count()
+# Imports manipulate process-wide state (sys.path, sys.modules), so containers
+# on different threads are initialized one at a time.
+_initialize_lock = threading.Lock()
+
+
+class Container(object):
+    """
+    A local stand-in for an AWS Lambda execution environment (a "container").
+    A container is initialized on its first invocation, which is reported as
+    a cold start; later invocations reuse the initialized handler, and are
+    warm.
+    """
+    def __init__(self, initialize, function_version="$LATEST",
+                 profile_imports=False, gc_freeze=False, gc_threshold=None):
+        """
+        :param function initialize: function performing the initialization
+            phase; it takes no arguments and returns the handler function
+        :param str function_version: version of the Lambda function, used to
+            name the container's log stream
+        :param bool profile_imports: whether to record a per-module breakdown
+            of import times during initialization
+        :param bool gc_freeze: whether to freeze the garbage collector at the
+            end of initialization, so that the objects created by it are not
+            scanned by later collections (see :func:`run_lambda.init.configure_gc`)
+        :param tuple[int] gc_threshold: garbage collection thresholds to set
+            at the end of initialization. Like ``gc_freeze``, this applies to
+            the whole process.
+        """
+        self._initialize = initialize
+        self._profile_imports = profile_imports
+        self._gc_freeze = gc_freeze
+        self._gc_threshold = gc_threshold
+        self._handler = None
+        self._init_summary = None
+        self._invocation_count = 0
+        self._log_stream_name = utils.random_log_stream_name(function_version)
+
+    @staticmethod
+    def of_file(filename, function_name="handler", layers=None, **kwargs):
+        """
+        Creates a container for the handler function ``function_name``,
+        defined in the Python source file ``filename``. Each container imports
+        its own copy of the file, so containers do not share module-level
+        state (modules imported by the file are shared, as usual).
+
+        ``filename`` may also be a deployment package zip file (see
+        :mod:`run_lambda.package`), in which case ``function_name`` is the
+        handler setting, e.g. ``"app.handler"``, and each container imports
+        its own copy of every module in the package and its layers.
+
+        :param str filename: name of file containing Lambda function
+        :param str function_name: name of handler function
+        :param list[str] layers: names of layer zip files
+        :rtype: Container
+        """
+        if package.is_package(filename):
+            code = package.Package(filename, layers=layers)
+            module_name, handler_name = package.split_handler(function_name)
+            code.paths  # extracts zip files outside of initialization
+
+            def initialize():
+                return getattr(code.load_module(module_name, isolated=True), handler_name)
+            return Container(initialize, **kwargs)
+        if layers:
+            raise ValueError("Layers can only be used with deployment packages")
+
+        def initialize():
+            base_name = os.path.splitext(os.path.basename(filename))[0]
+            module_name = "{b}__container{n}".format(b=base_name, n=next(_module_counter))
+            module = init.load_module(filename, module_name=module_name)
+            sys.modules.pop(module_name, None)
+            return getattr(module, function_name)
+        return Container(initialize, **kwargs)
+
+    @property
+    def initialized(self):
+        """
+        :property: Whether the container has been initialized
+        :rtype: bool
+        """
+        return self._handler is not None
+
+    @property
+    def init_summary(self):
+        """
+        :property: Summary of the container's initialization phase, or
+            ``None`` if the container has not been initialized
+        :rtype: InitSummary
+        """
+        return self._init_summary
+
+    @property
+    def invocation_count(self):
+        """
+        :property: Number of invocations handled by the container
+        :rtype: int
+        """
+        return self._invocation_count
+
+    @property
+    def log_stream_name(self):
+        """
+        :property: Name of the CloudWatch log stream of the container
+        :rtype: str
+        """
+        return self._log_stream_name
+
+    def initialize(self):
+        """
+        Initializes the container, if it has not been initialized already.
+
+        :return: whether the container was initialized by this call
+        :rtype: bool
+        """
+        if self._handler is not None:
+            return False
+        def initialize():
+            handler = self._initialize()
+            init.configure_gc(freeze=self._gc_freeze, threshold=self._gc_threshold)
+            return handler
+        with _initialize_lock:
+            self._handler, self._init_summary = init.timed_init(
+                initialize, profile_imports=self._profile_imports)
+        return True
+
+    def invoke(self, event, context=None, **kwargs):
+        """
+        Invokes the container's handler. If the container has not been
+        initialized, it is initialized first, and the call is reported as a
+        cold start.
+
+        Additional keyword arguments are passed through to
+        :func:`run_lambda <run_lambda.run_lambda>`.
+
+        :param dict event: dictionary containing event data
+        :param MockLambdaContext context: context object. If not provided, a
+            default context object, logging to the container's log stream,
+            will be used.
+        :rtype: LambdaResult
+        """
+        cold = self.initialize()
+        if context is None:
+            context = context_module.MockLambdaContext.Builder()\
+                .set_log_stream_name(self._log_stream_name)\
+                .build()
+        init_duration_in_millis = self._init_summary.duration_in_millis if cold else None
+        self._invocation_count += 1
+        return call.run_lambda(self._handler, event, context=context,
+                               init_duration_in_millis=init_duration_in_millis,
+                               **kwargs)
+
+
+def init_error_result(context, exception, init_duration_in_millis=None):
+    """
+    Returns the result of an invocation whose initialization phase failed,
+    e.g. because the handler's module raised an ``ImportError``. It must be
+    called while ``exception`` is being handled, so that its traceback is
+    written to the invocation's log.
+
+    :param MockLambdaContext context: context of the invocation
+    :param Exception exception: exception raised by the initialization
+    :param int init_duration_in_millis: time spent initializing before the
+        exception was raised
+    :rtype: LambdaResult
+    """
+    builder = call.LambdaCallSummary.Builder(
+        context, init_duration_in_millis=init_duration_in_millis)
+    traceback.print_exc(file=builder.log)
+    return call.LambdaResult(builder.build(), exception=exception)
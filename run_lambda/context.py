@@ -27,6 +27,9 @@ class MockLambdaContext(object):
 
         self._default_remaining_time_in_millis = default_remaining_time_in_millis
         self._expiration = None
+        self._deadline = None
+        self._clock = None
+        self._clock_start = 0.0
 
     @property
     def function_name(self):
@@ -101,11 +104,19 @@ class MockLambdaContext(object):
         """
         return self._client_context
 
-    def activate(self, timeout_in_seconds):
+    def activate(self, timeout_in_seconds, deadline=None, clock=None):
         """
         :param int timeout_in_seconds:
+        :param Deadline deadline: deadline of the call, as scheduled on a
+            :class:`TimerWheel <run_lambda.deadlines.TimerWheel>`. If
+            provided, the remaining time is that of the deadline.
+        :param VirtualClock clock: virtual clock of the call, whose virtual
+            time is also subtracted from the remaining time
         """
         self._expiration = datetime.datetime.now() + datetime.timedelta(seconds=timeout_in_seconds)
+        self._deadline = deadline
+        self._clock = clock
+        self._clock_start = 0.0 if clock is None else clock.elapsed_in_seconds()
 
     def get_remaining_time_in_millis(self):
         """
@@ -118,8 +129,12 @@ class MockLambdaContext(object):
         if self._expiration is None:  # if not activated
             default = self._default_remaining_time_in_millis
             return default if default is not None else 1000
-        diff = self._expiration - datetime.datetime.now()
-        remaining_seconds = diff.total_seconds()
+        if self._deadline is not None:
+            remaining_seconds = self._deadline.remaining_in_seconds
+        else:
+            remaining_seconds = (self._expiration - datetime.datetime.now()).total_seconds()
+        if self._clock is not None:
+            remaining_seconds -= self._clock.elapsed_in_seconds() - self._clock_start
         return max(int(1000 * remaining_seconds), 0)
 
     @staticmethod
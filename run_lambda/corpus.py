@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import struct
+
+
+class Shard(object):
+    """
+    One of ``count`` disjoint shards of a set of events. Events are assigned
+    to shards by a hash of their keys, so the assignment of an event does not
+    depend on the other events in the set, on the order they are loaded in,
+    or on the machine or process loading them.
+    """
+    def __init__(self, index, count):
+        """
+        :param int index: index of the shard, from 1 to ``count``
+        :param int count: number of shards
+        """
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError("Invalid shard: {i}/{c}".format(i=index, c=count))
+        self.index = index
+        self.count = count
+
+    @staticmethod
+    def parse(spec):
+        """
+        :param str spec: shard, in the format ``INDEX/COUNT``, e.g. ``3/8``
+        :rtype: Shard
+        """
+        index, slash, count = spec.partition("/")
+        try:
+            return Shard(int(index), int(count))
+        except ValueError:
+            raise ValueError("Invalid shard (expected INDEX/COUNT, e.g. 3/8): {}"
+                             .format(spec))
+
+    def contains(self, key):
+        """
+        :param str key: key of an event, as returned by :func:`load_events`
+        :return: whether the event belongs to this shard
+        :rtype: bool
+        """
+        return shard_index(key, self.count) == self.index
+
+    def __eq__(self, other):
+        return isinstance(other, Shard) and \
+            (self.index, self.count) == (other.index, other.count)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.index, self.count))
+
+    def __str__(self):
+        return "{i}/{c}".format(i=self.index, c=self.count)
+
+
+def shard_index(key, count):
+    """
+    :param str key: key of an event
+    :param int count: number of shards
+    :return: index of the shard, from 1 to ``count``, that the event belongs to
+    :rtype: int
+    """
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return struct.unpack(">Q", digest[:8])[0] % count + 1
+
+
+def load_events(path, shard=None):
+    """
+    Loads a set of events from ``path``, which is one of
+
+    - a JSON file, containing a single event
+    - a JSON lines file (with extension ``.jsonl``), containing one event per
+      line
+    - a directory, whose ``.json`` and ``.jsonl`` files (including those in
+      subdirectories) are loaded as above, in order of their paths
+
+    Each event is paired with a key that identifies it within the set: its
+    file's path relative to ``path`` (or the file's name, if ``path`` is a
+    file), followed by ``:LINE_NUMBER`` for events from JSON lines files.
+
+    :param str path: path of file or directory
+    :param Shard shard: if provided, only the events of this shard are loaded
+    :return: list of ``(key, event)`` pairs
+    :rtype: list
+    """
+    return list(iter_events(path, shard=shard))
+
+
+def iter_events(path, shard=None):
+    """
+    Like :func:`load_events`, but loads events one at a time, as they are
+    iterated over. Events outside of ``shard`` are not parsed.
+
+    :rtype: iterator
+    """
+    if not os.path.isdir(path):
+        return _iter_file(path, os.path.basename(path), shard)
+
+    filenames = []
+    for directory, _, names in os.walk(path):
+        for name in names:
+            if name.endswith(".json") or name.endswith(".jsonl"):
+                filenames.append(os.path.join(directory, name))
+    return _iter_files(path, sorted(filenames), shard)
+
+
+def _iter_files(path, filenames, shard):
+    for filename in filenames:
+        key = os.path.relpath(filename, path).replace(os.sep, "/")
+        for key_and_event in _iter_file(filename, key, shard):
+            yield key_and_event
+
+
+def _iter_file(filename, key, shard):
+    if not filename.endswith(".jsonl"):
+        if shard is None or shard.contains(key):
+            with open(filename) as event_file:
+                yield key, json.load(event_file)
+        return
+    with open(filename) as event_file:
+        for line_number, line in enumerate(event_file, 1):
+            line_key = "{k}:{n}".format(k=key, n=line_number)
+            if line.strip() and (shard is None or shard.contains(line_key)):
+                yield line_key, json.loads(line)
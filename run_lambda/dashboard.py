@@ -0,0 +1,277 @@
+"""
+A live terminal dashboard for long batch and load runs.
+
+A :class:`Dashboard` is told when each invocation begins and ends, by the
+worker threads making them, and redraws the terminal at a fixed rate from a
+separate thread::
+
+    with Dashboard(title="replay of events/") as dashboard:
+        for key, event in events:
+            dashboard.begin(key)
+            dashboard.end(container.invoke(event), key)
+
+It shows the throughput, the number of invocations in flight, error, timeout
+and cold start counts, a histogram and percentiles of recent call durations,
+percentiles of recent memory use, the status of each worker, and the slowest
+recent calls with the last line of their logs.
+
+Each worker thread only updates its own counters and its own buffer of recent
+calls, without taking any lock; the drawing thread reads them as they are. An
+invocation therefore only costs its workers a few counter increments and a
+``deque`` append, however often the dashboard is redrawn. Recent calls are
+those that ended within ``window_in_seconds``, of the last
+``RECENT_CALLS_PER_WORKER`` calls of each worker.
+"""
+import collections
+import math
+import sys
+import threading
+import timeit
+
+from run_lambda import utils
+
+RECENT_CALLS_PER_WORKER = 4096
+
+_CLEAR = "\x1b[H\x1b[2J"
+_BAR_WIDTH = 40
+
+
+class _Worker(object):
+    # the state of one worker thread, only written by that thread
+    def __init__(self, name):
+        self.name = name
+        self.started = 0
+        self.finished = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cold_starts = 0
+        self.current_key = None
+        self.current_start = None
+        # (end time, duration in ms, max memory used in MB, key, result)
+        self.recent = collections.deque(maxlen=RECENT_CALLS_PER_WORKER)
+
+
+class Dashboard(object):
+    def __init__(self, outfile=None, refresh_interval_in_seconds=0.5, window_in_seconds=10.0,
+                 slowest_count=5, title=None, total=None):
+        """
+        :param outfile: terminal to draw on. Defaults to ``sys.stdout``.
+        :param float refresh_interval_in_seconds: time between redraws
+        :param float window_in_seconds: age of the calls that the histogram,
+            percentiles and slowest calls are computed over
+        :param int slowest_count: number of slowest recent calls to show
+        :param str title: title of the run
+        :param int total: total number of invocations expected, to show
+            progress against
+        """
+        self._outfile = outfile
+        self._refresh_interval_in_seconds = refresh_interval_in_seconds
+        self._window_in_seconds = window_in_seconds
+        self._slowest_count = slowest_count
+        self._title = title
+        self.total = total
+        self._local = threading.local()
+        self._workers = []
+        self._workers_lock = threading.Lock()  # only taken by new workers
+        self._start_time = timeit.default_timer()
+        # (time, finished) at previous redraws, to compute throughput from
+        self._history = collections.deque(maxlen=max(2, int(math.ceil(
+            window_in_seconds / refresh_interval_in_seconds)) + 1))
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def begin(self, key=None):
+        """
+        Records that the current thread has begun an invocation.
+
+        :param str key: key identifying the invocation, e.g. its event's key
+        """
+        worker = self._worker()
+        worker.current_key = key
+        worker.current_start = timeit.default_timer()
+        worker.started += 1
+
+    def end(self, result, key=None):
+        """
+        Records the result of the current thread's invocation.
+
+        :param LambdaResult result: result of the invocation
+        :param str key: key identifying the invocation
+        """
+        worker = self._worker()
+        summary = result.summary
+        if result.timed_out:
+            worker.timeouts += 1
+        elif result.exception is not None:
+            worker.errors += 1
+        if summary.init_duration_in_millis is not None:
+            worker.cold_starts += 1
+        worker.recent.append((timeit.default_timer(), summary.duration_in_millis,
+                              summary.max_memory_used_in_mb, key, result))
+        worker.current_key = None
+        worker.current_start = None
+        worker.finished += 1
+
+    def record(self, context, result):
+        """
+        Records the result of an invocation that the dashboard was not told
+        the beginning of. This method has the signature of a listener of
+        :func:`run_lambda <run_lambda.run_lambda>`.
+        """
+        self._worker().started += 1
+        self.end(result, key=context.aws_request_id)
+
+    def start(self):
+        """
+        Starts redrawing the dashboard.
+        """
+        self._start_time = timeit.default_timer()
+        self._thread = threading.Thread(target=self._run, name="run_lambda-dashboard")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops redrawing the dashboard, after drawing it one last time.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self._draw()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def render(self, now=None):
+        """
+        :param float now: current time, as measured by
+            ``timeit.default_timer``. Defaults to the current time.
+        :return: the dashboard, as text
+        :rtype: str
+        """
+        if now is None:
+            now = timeit.default_timer()
+        with self._workers_lock:
+            workers = list(self._workers)
+        started = sum(worker.started for worker in workers)
+        finished = sum(worker.finished for worker in workers)
+        recent = []
+        for worker in workers:
+            # copied in a single step, so the worker cannot append midway
+            recent.extend(call for call in list(worker.recent)
+                          if call[0] >= now - self._window_in_seconds)
+
+        lines = []
+        elapsed = now - self._start_time
+        lines.append("{t} - {e:.1f} s elapsed".format(t=self._title or "run_lambda",
+                                                     e=elapsed))
+        lines.append("Invocations: {f} ({r:.1f}/s)  In flight: {i}  Errors: {e}  "
+                     "Timeouts: {t}  Cold starts: {c}".format(
+                         f=finished, r=self._throughput(now, finished),
+                         i=max(started - finished, 0),
+                         e=sum(worker.errors for worker in workers),
+                         t=sum(worker.timeouts for worker in workers),
+                         c=sum(worker.cold_starts for worker in workers)))
+        if self.total:
+            lines.append("Progress: {f}/{t} ({p:.0f}%)".format(
+                f=finished, t=self.total, p=100.0 * finished / self.total))
+
+        lines.append("")
+        durations = sorted(call[1] for call in recent)
+        memories = sorted(call[2] for call in recent)
+        window = "last {:g} s, {} calls".format(self._window_in_seconds, len(recent))
+        if durations:
+            lines.append("Duration ({w}): {p}".format(w=window, p=_percentiles(durations, "ms")))
+            lines.extend(_histogram(durations))
+            lines.append("Memory: {}".format(_percentiles(memories, "MB")))
+        else:
+            lines.append("Duration ({}): no calls".format(window))
+
+        lines.append("")
+        lines.append("Workers:")
+        for worker in workers:
+            current_start, current_key = worker.current_start, worker.current_key
+            if current_start is not None:
+                status = "busy {d:>8.0f} ms  {k}".format(
+                    d=1000 * (now - current_start), k=current_key or "")
+            else:
+                status = "idle"
+            lines.append("  {n:<16}{c:>10} calls {e:>6} errors  {s}".format(
+                n=worker.name, c=worker.finished,
+                e=worker.errors + worker.timeouts, s=status))
+
+        slowest = sorted(recent, key=lambda call: call[1], reverse=True)[:self._slowest_count]
+        if slowest:
+            lines.append("")
+            lines.append("Slowest recent calls:")
+            for _, duration, _, key, result in slowest:
+                lines.append("  {d:>10.1f} ms  {k}  | {l}".format(
+                    d=duration, k=key or "", l=_log_preview(result)))
+        return "\n".join(lines) + "\n"
+
+    def _worker(self):
+        worker = getattr(self._local, "worker", None)
+        if worker is None:
+            thread_name = threading.current_thread().name
+            worker = _Worker("main" if thread_name == "MainThread" else thread_name)
+            with self._workers_lock:
+                self._workers.append(worker)
+            self._local.worker = worker
+        return worker
+
+    def _throughput(self, now, finished):
+        self._history.append((now, finished))
+        first_time, first_finished = self._history[0]
+        if now - first_time <= 0:
+            elapsed = now - self._start_time
+            return finished / elapsed if elapsed > 0 else 0.0
+        return (finished - first_finished) / (now - first_time)
+
+    def _run(self):
+        while not self._stopping.wait(self._refresh_interval_in_seconds):
+            self._draw()
+
+    def _draw(self):
+        outfile = sys.stdout if self._outfile is None else self._outfile
+        outfile.write(_CLEAR + self.render())
+        outfile.flush()
+
+
+def _percentiles(sorted_values, unit):
+    return "  ".join("{n} {v:.1f} {u}".format(n=name, v=value, u=unit) for name, value in [
+        ("p50", utils.percentile(sorted_values, 50)),
+        ("p90", utils.percentile(sorted_values, 90)),
+        ("p99", utils.percentile(sorted_values, 99)),
+        ("max", sorted_values[-1])])
+
+
+def _histogram(sorted_durations):
+    # buckets doubling in width: (0, 1 ms], (1, 2 ms], (2, 4 ms], ...
+    counts = collections.Counter(
+        0 if duration <= 1 else int(math.ceil(math.log(duration, 2)))
+        for duration in sorted_durations)
+    largest = max(counts.values())
+    lines = []
+    for exponent in range(min(counts), max(counts) + 1):
+        count = counts.get(exponent, 0)
+        bar = "#" * int(round(_BAR_WIDTH * count / float(largest)))
+        lines.append("  <= {b:>8g} ms |{bar:<{w}}| {c}".format(
+            b=2 ** exponent, bar=bar, w=_BAR_WIDTH, c=count))
+    return lines
+
+
+def _log_preview(result, width=60):
+    # the last line that is neither a START/END/REPORT line nor empty
+    for line in reversed(result.summary.log.splitlines()):
+        if line.strip() and not line.startswith(("START RequestId:", "END RequestId:",
+                                                 "REPORT RequestId:")):
+            line = line.strip()
+            return line if len(line) <= width else line[:width - 3] + "..."
+    return ""
@@ -0,0 +1,241 @@
+"""
+A hierarchical timer wheel, which tracks the deadlines of many concurrent
+invocations with a single thread.
+
+Time is divided into ticks. The first level of the wheel has a slot for each
+of the next ``256`` ticks; each slot of the next levels covers a whole turn of
+the level below it. A deadline is placed in the slot of the lowest level that
+reaches its expiry tick, and is moved down a level ("cascaded") when the level
+below comes round to it, so scheduling and cancelling a deadline take constant
+time however many deadlines are pending.
+
+:func:`run_lambda <run_lambda.run_lambda>` schedules the timeout of each call
+on the :func:`default_wheel`.
+"""
+import logging
+import os
+import threading
+import timeit
+
+_logger = logging.getLogger(__name__)
+
+_default_wheel = None
+_default_wheel_lock = threading.Lock()
+
+
+def default_wheel():
+    """
+    :return: the process-wide timer wheel, which is created on first use (and
+        again in a forked child process, where the wheel's thread does not
+        survive)
+    :rtype: TimerWheel
+    """
+    global _default_wheel
+    with _default_wheel_lock:
+        if _default_wheel is None or _default_wheel._pid != os.getpid():
+            _default_wheel = TimerWheel()
+        return _default_wheel
+
+
+class Deadline(object):
+    """
+    A callback scheduled on a :class:`TimerWheel`.
+    """
+    def __init__(self, wheel, when, tick, callback):
+        self._wheel = wheel
+        self._when = when
+        self._tick = tick
+        self._callback = callback
+        self._slot = None
+        self._expired = False
+
+    @property
+    def when(self):
+        """
+        :property: Time at which the deadline expires, as measured by
+            ``timeit.default_timer``
+        :rtype: float
+        """
+        return self._when
+
+    @property
+    def remaining_in_seconds(self):
+        """
+        :property: Time left until the deadline expires, in seconds (never
+            negative)
+        :rtype: float
+        """
+        return max(self._when - timeit.default_timer(), 0.0)
+
+    @property
+    def pending(self):
+        """
+        :property: Whether the deadline has neither expired nor been cancelled
+        :rtype: bool
+        """
+        return self._slot is not None
+
+    @property
+    def expired(self):
+        """
+        :property: Whether the deadline's callback has been called
+        :rtype: bool
+        """
+        return self._expired
+
+    def cancel(self):
+        """
+        Cancels the deadline, if it is pending.
+
+        :return: whether the deadline was pending; if not, its callback has
+            been (or is being) called, or it was already cancelled
+        :rtype: bool
+        """
+        return self._wheel._cancel(self)
+
+
+class TimerWheel(object):
+    def __init__(self, tick_in_seconds=0.01, slots_per_level=(256, 64, 64, 64)):
+        """
+        :param float tick_in_seconds: resolution of the wheel. Deadlines
+            expire at most one tick late (give or take scheduling delays).
+        :param tuple[int] slots_per_level: number of slots of each level of
+            the wheel, each a power of two. Deadlines further away than the
+            wheel's span (about 6 days, by default) are cascaded until they
+            come within it.
+        """
+        self._tick_in_seconds = tick_in_seconds
+        self._bits = []
+        for slot_count in slots_per_level:
+            if slot_count & (slot_count - 1):
+                raise ValueError("Number of slots must be a power of two: {}".format(slot_count))
+            self._bits.append(slot_count.bit_length() - 1)
+        self._levels = [[set() for _ in range(slot_count)] for slot_count in slots_per_level]
+        self._start = timeit.default_timer()
+        self._current_tick = 0
+        self._count = 0
+        self._closed = False
+        self._condition = threading.Condition(threading.Lock())
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="run_lambda-timer-wheel")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        """
+        :return: number of pending deadlines
+        """
+        return self._count
+
+    def schedule(self, delay_in_seconds, callback):
+        """
+        Schedules ``callback`` to be called, with no arguments, on the wheel's
+        thread once ``delay_in_seconds`` have passed. Callbacks should return
+        quickly; they hold up the expiry of other deadlines.
+
+        :rtype: Deadline
+        """
+        when = timeit.default_timer() + delay_in_seconds
+        # round up, so that deadlines never expire early
+        tick = int(-(-(when - self._start) // self._tick_in_seconds))
+        deadline = Deadline(self, when, tick, callback)
+        with self._condition:
+            if self._closed:
+                raise ValueError("schedule on closed timer wheel")
+            if self._count == 0:
+                # the wheel does not turn while it is empty, so catch up
+                self._current_tick = self._elapsed_ticks()
+            self._place(deadline, self._current_tick + 1)
+            self._count += 1
+            if self._count == 1:
+                self._condition.notify()
+        return deadline
+
+    def close(self):
+        """
+        Stops the wheel's thread. Pending deadlines never expire.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _cancel(self, deadline):
+        with self._condition:
+            if deadline._slot is None:
+                return False
+            deadline._slot.discard(deadline)
+            deadline._slot = None
+            self._count -= 1
+            return True
+
+    def _place(self, deadline, earliest_tick):
+        tick = max(deadline._tick, earliest_tick)
+        delta = tick - self._current_tick
+        shift = 0
+        last_level = len(self._bits) - 1
+        for level, bits in enumerate(self._bits):
+            if delta < (1 << (shift + bits)):
+                break
+            if level == last_level:
+                # beyond the span of the wheel: wait in the furthest slot, and
+                # be placed again from there
+                tick = self._current_tick + (1 << (shift + bits)) - 1
+                break
+            shift += bits
+        slot = self._levels[level][(tick >> shift) & ((1 << bits) - 1)]
+        slot.add(deadline)
+        deadline._slot = slot
+
+    def _advance(self):
+        """
+        Advances the wheel by a tick, and returns the deadlines that expire.
+        """
+        self._current_tick += 1
+        tick = self._current_tick
+        shift = self._bits[0]
+        for level in range(1, len(self._bits)):
+            if tick & ((1 << shift) - 1):
+                break
+            bits = self._bits[level]
+            slot = self._levels[level][(tick >> shift) & ((1 << bits) - 1)]
+            if slot:
+                self._levels[level][(tick >> shift) & ((1 << bits) - 1)] = set()
+                for deadline in slot:
+                    self._place(deadline, tick)
+            shift += bits
+        index = tick & ((1 << self._bits[0]) - 1)
+        expired = self._levels[0][index]
+        if not expired:
+            return ()
+        self._levels[0][index] = set()
+        for deadline in expired:
+            deadline._slot = None
+            deadline._expired = True
+        self._count -= len(expired)
+        return expired
+
+    def _elapsed_ticks(self):
+        return int((timeit.default_timer() - self._start) // self._tick_in_seconds)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._count == 0 and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                now_tick = self._elapsed_ticks()
+                if now_tick <= self._current_tick:
+                    self._condition.wait(
+                        self._start + (self._current_tick + 1) * self._tick_in_seconds
+                        - timeit.default_timer())
+                    continue
+                expired = []
+                while self._current_tick < now_tick and self._count > 0:
+                    expired.extend(self._advance())
+            for deadline in expired:
+                try:
+                    deadline._callback()
+                except Exception:
+                    _logger.exception("Deadline callback failed")
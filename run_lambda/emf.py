@@ -0,0 +1,243 @@
+"""
+Extraction of CloudWatch Embedded Metric Format (EMF) records from invocation
+logs.
+
+Lambda functions can publish custom metrics by printing EMF records: JSON
+objects, one per line, whose ``_aws`` member declares the metrics and
+dimensions found in the rest of the object::
+
+    {"_aws": {"Timestamp": 1481450400000,
+              "CloudWatchMetrics": [{"Namespace": "orders",
+                                     "Dimensions": [["Service"]],
+                                     "Metrics": [{"Name": "Processed",
+                                                  "Unit": "Count"}]}]},
+     "Service": "checkout", "Processed": 12}
+
+EMF records are parsed as they are written to the log of a call, and are
+available as the :attr:`emf_metrics <run_lambda.LambdaCallSummary.emf_metrics>`
+of its summary. An :class:`EmfAggregator` combines the metrics of many calls.
+"""
+import json
+import sys
+import threading
+
+
+class MetricDatum(object):
+    """
+    The values of one metric, for one dimension set, in one EMF record.
+    """
+    def __init__(self, namespace, name, dimensions, values, unit=None):
+        """
+        :param str namespace: namespace of the metric
+        :param str name: name of the metric
+        :param tuple dimensions: sorted ``(name, value)`` pairs
+        :param list values: values of the metric
+        :param str unit: unit of the metric, if declared
+        """
+        self.namespace = namespace
+        self.name = name
+        self.dimensions = dimensions
+        self.values = values
+        self.unit = unit
+
+    @property
+    def key(self):
+        """
+        :property: ``(namespace, name, dimensions)``, identifying the metric
+        :rtype: tuple
+        """
+        return self.namespace, self.name, self.dimensions
+
+    def __repr__(self):
+        return "MetricDatum({n}, {m}, {d}, {v}, {u})".format(
+            n=repr(self.namespace), m=repr(self.name), d=repr(self.dimensions),
+            v=repr(self.values), u=repr(self.unit))
+
+
+def parse_record(line):
+    """
+    Parses a line of a log as an EMF record.
+
+    :param str line: line of log
+    :return: the metrics declared by the record, or an empty list if the line
+        is not a valid EMF record
+    :rtype: list[MetricDatum]
+    """
+    if "_aws" not in line:
+        return []
+    try:
+        record = json.loads(line)
+        directives = record["_aws"]["CloudWatchMetrics"]
+        data = []
+        for directive in directives:
+            namespace = directive.get("Namespace", "aws-embedded-metrics")
+            dimension_sets = directive.get("Dimensions") or [[]]
+            for metric in directive.get("Metrics", []):
+                name = metric["Name"]
+                values = record.get(name)
+                if values is None:
+                    continue
+                if not isinstance(values, list):
+                    values = [values]
+                values = [float(value) for value in values]
+                for dimension_set in dimension_sets:
+                    dimensions = tuple(sorted(
+                        (dimension, str(record.get(dimension, "")))
+                        for dimension in dimension_set))
+                    data.append(MetricDatum(namespace, name, dimensions, values,
+                                            unit=metric.get("Unit")))
+        return data
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return []
+
+
+class MetricStatistics(object):
+    """
+    Statistics of the values of one metric, as in a CloudWatch statistic set.
+    """
+    def __init__(self, unit=None):
+        self.unit = unit
+        self.sample_count = 0
+        self.sum = 0.0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+
+    @property
+    def average(self):
+        return self.sum / self.sample_count if self.sample_count else 0.0
+
+    def observe(self, value):
+        self.sample_count += 1
+        self.sum += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def add(self, other):
+        self.unit = self.unit or other.unit
+        self.sample_count += other.sample_count
+        self.sum += other.sum
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+
+def aggregate(statistics, data):
+    """
+    Adds the values of ``data`` to ``statistics``.
+
+    :param dict statistics: dictionary mapping metric keys to their
+        :class:`MetricStatistics`, updated in place
+    :param list[MetricDatum] data: metrics to add
+    """
+    for datum in data:
+        metric = statistics.get(datum.key)
+        if metric is None:
+            metric = statistics[datum.key] = MetricStatistics(datum.unit)
+        for value in datum.values:
+            metric.observe(value)
+
+
+class EmfAggregator(object):
+    """
+    Aggregates the EMF metrics of many calls, per namespace, metric name and
+    dimensions.
+    """
+    def __init__(self):
+        self._statistics = {}
+        self._lock = threading.Lock()
+
+    def record(self, context, result):
+        """
+        Records the EMF metrics of a call. This method has the signature of a
+        listener of :func:`run_lambda <run_lambda.run_lambda>`.
+
+        :param MockLambdaContext context: context of the call
+        :param LambdaResult result: result of the call
+        """
+        self.add(result.summary.emf_metrics)
+
+    def add(self, data):
+        """
+        :param list[MetricDatum] data: metrics to aggregate
+        """
+        with self._lock:
+            aggregate(self._statistics, data)
+
+    def statistics(self):
+        """
+        :return: dictionary mapping ``(namespace, name, dimensions)`` keys to
+            the statistics of the metric
+        :rtype: dict[tuple, MetricStatistics]
+        """
+        with self._lock:
+            return dict(self._statistics)
+
+    def display(self, outfile=None, duration_in_seconds=None):
+        """
+        :param file outfile: file to write to. Defaults to standard output.
+        :param float duration_in_seconds: duration of the run. If provided,
+            the rate of each metric (its sum per second) is also displayed.
+        """
+        if outfile is None:
+            outfile = sys.stdout
+        header = "{:<40}{:>10}{:>12}{:>12}{:>12}{:>12}".format(
+            "metric", "samples", "sum", "avg", "min", "max")
+        if duration_in_seconds:
+            header += "{:>12}".format("sum/s")
+        outfile.write(header + "\n")
+        for key, metric in sorted(self.statistics().items()):
+            line = "{:<40}{:>10}{:>12.6g}{:>12.6g}{:>12.6g}{:>12.6g}".format(
+                format_key(key), metric.sample_count, metric.sum, metric.average,
+                metric.minimum, metric.maximum)
+            if duration_in_seconds:
+                line += "{:>12.6g}".format(metric.sum / duration_in_seconds)
+            outfile.write(line + "\n")
+
+
+def format_key(key):
+    """
+    :return: a readable name for a metric key, e.g.
+        ``orders/Processed{Service=checkout}``
+    :rtype: str
+    """
+    namespace, name, dimensions = key
+    labels = ",".join("{k}={v}".format(k=k, v=v) for k, v in dimensions)
+    return "{n}/{m}{l}".format(n=namespace, m=name,
+                               l="{" + labels + "}" if labels else "")
+
+
+class CaptureStream(object):
+    """
+    Wraps the stream capturing the log of a call, parsing EMF records out of
+    complete lines as they are written.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+        self._partial = []  # pieces of the current, incomplete line
+        self.metrics = []
+
+    def write(self, s):
+        self._stream.write(s)
+        if "\n" not in s:
+            self._partial.append(s)
+            return
+        lines = s.split("\n")
+        if self._partial:
+            self._partial.append(lines[0])
+            lines[0] = "".join(self._partial)
+        last = lines.pop()
+        self._partial = [last] if last else []
+        for line in lines:
+            if "_aws" in line:
+                self.metrics.extend(parse_record(line))
+
+    def finish(self):
+        """
+        Parses any incomplete final line.
+        """
+        line = "".join(self._partial)
+        self._partial = []
+        if "_aws" in line:
+            self.metrics.extend(parse_record(line))
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
@@ -0,0 +1,227 @@
+"""
+The ``run_lambda gcsweep`` command, which runs a set of events on a warm
+container under several garbage collector settings, and compares the
+resulting call durations.
+
+Each setting is applied at the end of the container's initialization phase,
+as a Lambda function could at the end of its module's top-level code, and is
+run in a fresh Python process, since garbage collector settings apply to the
+whole process. A setting is written as ``default``, ``freeze``,
+``threshold=T0[,T1[,T2]]``, or a combination joined with ``+``, e.g.
+``freeze+threshold=50000,20,20``.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import run_lambda.container as container_module
+import run_lambda.corpus as corpus
+import run_lambda.utils as utils
+
+_RESULT_PREFIX = "RUN_LAMBDA_GCSWEEP "
+
+DEFAULT_SETTINGS = ["default", "freeze", "threshold=50000,20,20",
+                    "freeze+threshold=50000,20,20"]
+
+
+class GcSetting(object):
+    """
+    Garbage collector settings to apply after initialization.
+    """
+    def __init__(self, freeze=False, threshold=None):
+        """
+        :param bool freeze: whether to freeze the garbage collector
+        :param tuple[int] threshold: collection thresholds
+        """
+        self.freeze = freeze
+        self.threshold = threshold
+
+    @staticmethod
+    def parse(spec):
+        """
+        :param str spec: setting, in the format described above
+        :rtype: GcSetting
+        """
+        setting = GcSetting()
+        for part in spec.split("+"):
+            part = part.strip()
+            if part == "default":
+                continue
+            elif part == "freeze":
+                setting.freeze = True
+            elif part.startswith("threshold="):
+                setting.threshold = parse_threshold(part[len("threshold="):])
+            else:
+                raise ValueError("Invalid garbage collector setting: {}".format(part))
+        return setting
+
+    def __str__(self):
+        parts = []
+        if self.freeze:
+            parts.append("freeze")
+        if self.threshold is not None:
+            parts.append("threshold=" + ",".join(str(t) for t in self.threshold))
+        return "+".join(parts) or "default"
+
+
+def parse_threshold(text):
+    """
+    :param str text: one to three comma-separated thresholds
+    :rtype: tuple[int]
+    """
+    threshold = tuple(int(value) for value in text.split(","))
+    if not 1 <= len(threshold) <= 3:
+        raise ValueError("Expected one to three thresholds: {}".format(text))
+    return threshold
+
+
+def arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda gcsweep",
+        description="Run a set of events on a warm container under several "
+                    "garbage collector settings, and compare call durations")
+    parser.add_argument("filename", type=str,
+                        help="name of file containing Lambda function, or of "
+                             "deployment package (.zip)")
+    parser.add_argument("event", type=str,
+                        help="event file, JSON lines file or directory of event "
+                             "files to run")
+    parser.add_argument("-f", "--function", metavar="HANDLER_FUNCTION",
+                        dest="function_name", type=str, default="handler",
+                        help="Name of handler function. Defaults to \"handler\". "
+                             "For a deployment package, the handler setting, "
+                             "e.g. \"app.handler\"")
+    parser.add_argument("--layer", metavar="LAYER_ZIP", dest="layers",
+                        action="append", default=[],
+                        help="Layer of a deployment package. May be repeated, "
+                             "in the order the layers are configured")
+    parser.add_argument("-s", "--setting", metavar="SETTING", dest="settings",
+                        action="append", default=None,
+                        help="Garbage collector setting, e.g. \"freeze\" or "
+                             "\"freeze+threshold=50000,20,20\". May be repeated; "
+                             "the first setting is the baseline. Defaults to "
+                             "{}".format(", ".join(DEFAULT_SETTINGS)))
+    parser.add_argument("-n", "--passes", metavar="PASSES", dest="passes",
+                        type=int, default=5,
+                        help="Number of passes over the events under each "
+                             "setting. Defaults to 5")
+    parser.add_argument("-t", "--timeout", metavar="TIMEOUT",
+                        dest="timeout", type=int, default=None,
+                        help="Timeout (in seconds) for each function call")
+    parser.add_argument("--json", action="store_true", dest="json",
+                        help="Print the measurements of each setting as JSON, "
+                             "instead of a report")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.settings is None:
+        args.settings = DEFAULT_SETTINGS
+    try:
+        args.settings = [GcSetting.parse(spec) for spec in args.settings]
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main(argv=None):
+    args = arguments(sys.argv[1:] if argv is None else argv)
+    if args.child:
+        return run_child(args)
+
+    runs = [run_setting(args, setting) for setting in args.settings]
+    if args.json:
+        sys.stdout.write(json.dumps(runs, indent=2, sort_keys=True) + "\n")
+    else:
+        display(runs, sys.stdout)
+
+
+def run_setting(args, setting):
+    """
+    Runs the events under ``setting``, in a fresh Python process.
+
+    :return: the measurements reported by the child process
+    :rtype: dict
+    """
+    command = [sys.executable, "-m", "run_lambda.gcsweep", "--child",
+               args.filename, args.event, "-f", args.function_name,
+               "-s", str(setting), "-n", str(args.passes)]
+    if args.timeout is not None:
+        command += ["-t", str(args.timeout)]
+    for layer in args.layers:
+        command += ["--layer", layer]
+
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [package_root, env.get("PYTHONPATH")] if p)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, env=env)
+    stdout, stderr = process.communicate()
+    for line in reversed(stdout.decode("utf-8", "replace").splitlines()):
+        if line.startswith(_RESULT_PREFIX):
+            return json.loads(line[len(_RESULT_PREFIX):])
+    raise RuntimeError("Sweep process failed (exit code {c}):\n{e}"
+                       .format(c=process.returncode,
+                               e=stderr.decode("utf-8", "replace")))
+
+
+def run_child(args):
+    setting = args.settings[0]
+    events = [event for _, event in corpus.load_events(args.event)]
+    container = container_module.Container.of_file(
+        args.filename, args.function_name, layers=args.layers or None,
+        gc_freeze=setting.freeze, gc_threshold=setting.threshold)
+    run = {
+        "setting": str(setting),
+        "init_duration_in_millis": None,
+        "durations_in_millis": [],
+        "gc_pauses_in_millis": [],
+        "gc_collections": [0, 0, 0],
+        "failures": 0,
+    }
+    for _ in range(args.passes):
+        for event in events:
+            result = container.invoke(event, timeout_in_seconds=args.timeout)
+            summary = result.summary
+            if result.timed_out or result.exception is not None:
+                run["failures"] += 1
+            if summary.init_duration_in_millis is not None:
+                # the cold start is reported separately
+                run["init_duration_in_millis"] = summary.init_duration_in_millis
+                continue
+            run["durations_in_millis"].append(summary.duration_in_millis)
+            run["gc_pauses_in_millis"].append(summary.usage.total_gc_pause_in_millis)
+            for generation, count in enumerate(summary.usage.gc_collections):
+                run["gc_collections"][generation] += count
+    sys.stdout.write(_RESULT_PREFIX + json.dumps(run) + "\n")
+
+
+def display(runs, outfile):
+    outfile.write("{:<32}{:>10}{:>10}{:>10}{:>10}{:>14}{:>10}{:>10}\n".format(
+        "setting", "p50 (ms)", "p90 (ms)", "p99 (ms)", "mean (ms)",
+        "GC mean (ms)", "gen2 GCs", "p99 chg"))
+    baseline_p99 = None
+    for run in runs:
+        durations = sorted(run["durations_in_millis"])
+        if not durations:
+            outfile.write("{:<32}  no warm calls\n".format(run["setting"]))
+            continue
+        p99 = utils.percentile(durations, 99)
+        if baseline_p99 is None:
+            baseline_p99 = p99
+        change = "" if baseline_p99 == 0 \
+            else "{:+.1f}%".format(100.0 * (p99 - baseline_p99) / baseline_p99)
+        outfile.write("{:<32}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>14.1f}{:>10}{:>10}\n".format(
+            run["setting"], utils.percentile(durations, 50),
+            utils.percentile(durations, 90), p99,
+            sum(durations) / float(len(durations)),
+            sum(run["gc_pauses_in_millis"]) / len(durations),
+            run["gc_collections"][2], change))
+    failures = sum(run["failures"] for run in runs)
+    if failures:
+        outfile.write("\nFailed invocations: {}\n".format(failures))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
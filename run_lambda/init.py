@@ -0,0 +1,227 @@
+import gc
+import imp
+import math
+import os
+import sys
+import timeit
+
+from six.moves import builtins
+
+
+def load_module(filepath, module_name=None):
+    """
+    Imports the Python source file at ``filepath``.
+
+    :param str filepath: path of the file to import
+    :param str module_name: name to import the module under. Defaults to the
+        file's base name, without its extension.
+    :return: the imported module
+    :rtype: module
+    """
+    abspath = os.path.abspath(filepath)
+    sys.path.insert(0, os.path.dirname(abspath))
+    try:
+        basename = os.path.basename(abspath)
+        file_module_name, extension = os.path.splitext(basename)
+        module_info = imp.find_module(file_module_name)
+        try:
+            module = imp.load_module(module_name or file_module_name, *module_info)
+        finally:
+            module_info[0].close()
+    finally:
+        sys.path.pop(0)
+    return module
+
+
+def timed_load_module(filepath, module_name=None, profile_imports=False):
+    """
+    Imports the Python source file at ``filepath``, measuring the duration of
+    the initialization phase (the import itself, plus the module's top-level
+    code).
+
+    :param str filepath: path of the file to import
+    :param str module_name: name to import the module under
+    :param bool profile_imports: whether to record a per-module breakdown of
+        import times
+    :return: the imported module, and a summary of its initialization
+    :rtype: (module, InitSummary)
+    """
+    return timed_init(lambda: load_module(filepath, module_name=module_name),
+                      profile_imports=profile_imports)
+
+
+def timed_init(initialize, profile_imports=False):
+    """
+    Calls ``initialize``, measuring how long it takes.
+
+    :param function initialize: function performing the initialization phase
+    :param bool profile_imports: whether to record a per-module breakdown of
+        import times
+    :return: the value returned by ``initialize``, and a summary of the
+        initialization
+    :rtype: (any, InitSummary)
+    """
+    timer = ImportTimer() if profile_imports else None
+    start_time = timeit.default_timer()
+    if timer is not None:
+        with timer:
+            value = initialize()
+    else:
+        value = initialize()
+    end_time = timeit.default_timer()
+    duration_in_millis = int(math.ceil(1000 * (end_time - start_time)))
+    imports = timer.import_times if timer is not None else None
+    return value, InitSummary(duration_in_millis, imports=imports)
+
+
+def configure_gc(freeze=False, threshold=None):
+    """
+    Tunes the garbage collector at the end of an initialization phase, as a
+    Lambda function could at the end of its module's top-level code. Both
+    settings apply to the whole process.
+
+    :param bool freeze: whether to move every object allocated so far (e.g.
+        large module-level object graphs) to a permanent generation, which
+        later garbage collections do not scan. Requires Python 3.7 or later.
+    :param tuple[int] threshold: collection thresholds, as passed to
+        ``gc.set_threshold``
+    """
+    if threshold is not None:
+        gc.set_threshold(*threshold)
+    if freeze:
+        if not hasattr(gc, "freeze"):
+            raise ValueError("Freezing the garbage collector requires Python 3.7 or later")
+        # collect first, so that garbage left by initialization is not frozen
+        gc.collect()
+        gc.freeze()
+
+
+class InitSummary(object):
+    """
+    Summary of the initialization phase of a Lambda function, i.e. the import
+    of its module and its module's top-level code.
+    """
+    def __init__(self, duration_in_millis, imports=None):
+        self._duration_in_millis = duration_in_millis
+        self._imports = imports
+
+    @property
+    def duration_in_millis(self):
+        """
+        :property: Duration of the initialization phase, in milliseconds
+        :rtype: int
+        """
+        return self._duration_in_millis
+
+    @property
+    def imports(self):
+        """
+        :property: Per-module import times, in the order the imports
+            completed, or ``None`` if imports were not profiled
+        :rtype: list[ImportTime]
+        """
+        return self._imports
+
+    def display(self, outfile=None, limit=20):
+        if outfile is None:
+            outfile = sys.stdout
+        outfile.write("Init duration: {} ms\n\n".format(self._duration_in_millis))
+        if self._imports is None:
+            return
+        outfile.write("Import times (slowest {}):\n".format(limit))
+        outfile.write("{:>12} | {:>12} | module\n".format("self [ms]", "cumulative"))
+        slowest = sorted(self._imports, key=lambda t: t.cumulative_in_millis,
+                         reverse=True)[:limit]
+        for import_time in slowest:
+            outfile.write("{:>12.3f} | {:>12.3f} | {}\n".format(
+                import_time.self_in_millis, import_time.cumulative_in_millis,
+                import_time.name))
+        outfile.write("\n")
+
+
+class ImportTime(object):
+    """
+    Time taken by a single import that loaded at least one new module.
+    """
+    def __init__(self, name, self_in_millis, cumulative_in_millis):
+        self._name = name
+        self._self_in_millis = self_in_millis
+        self._cumulative_in_millis = cumulative_in_millis
+
+    @property
+    def name(self):
+        """
+        :property: Name of imported module
+        :rtype: str
+        """
+        return self._name
+
+    @property
+    def self_in_millis(self):
+        """
+        :property: Time spent importing the module, excluding nested imports,
+            in milliseconds
+        :rtype: float
+        """
+        return self._self_in_millis
+
+    @property
+    def cumulative_in_millis(self):
+        """
+        :property: Time spent importing the module, including nested imports,
+            in milliseconds
+        :rtype: float
+        """
+        return self._cumulative_in_millis
+
+    def to_json(self):
+        return {"name": self._name, "self_in_millis": self._self_in_millis,
+                "cumulative_in_millis": self._cumulative_in_millis}
+
+    @staticmethod
+    def of_json(json):
+        return ImportTime(json["name"], json["self_in_millis"],
+                          json["cumulative_in_millis"])
+
+
+class ImportTimer(object):
+    """
+    Context manager that records how long each import statement executed
+    inside of it takes, similar to ``python -X importtime``. Imports of modules
+    that are already loaded are not recorded.
+    """
+    def __init__(self):
+        self._original_import = None
+        self._stack = []
+        self.import_times = []
+
+    def __enter__(self):
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        builtins.__import__ = self._original_import
+        return False
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        loaded_before = len(sys.modules)
+        frame = [0.0]  # time spent in nested imports
+        self._stack.append(frame)
+        start_time = timeit.default_timer()
+        try:
+            module = self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = timeit.default_timer() - start_time
+            self._stack.pop()
+        if self._stack:
+            self._stack[-1][0] += cumulative
+        if len(sys.modules) > loaded_before:
+            self.import_times.append(ImportTime(
+                name or getattr(module, "__name__", ""),
+                1000 * (cumulative - frame[0]),
+                1000 * cumulative))
+        return module
@@ -0,0 +1,282 @@
+"""
+Fakes with modelled latency, for patching out the downstream services of a
+Lambda function.
+
+Values passed as ``patches`` to :func:`run_lambda <run_lambda.run_lambda>`
+usually return instantly, which hides the cost of the I/O a function performs.
+Wrapping a fake in a :class:`LatencyFake` makes each call to it take a latency
+sampled from a model, and optionally fail at configured error and throttle
+rates::
+
+    table = LatencyFake(FakeTable(), DistributionLatency.lognormal(8, 0.5),
+                        throttle_rate=0.01)
+    result = run_lambda.run_lambda(my_function.handler, event,
+                                   patches={"my_function.table": table})
+
+By default, latency is spent really sleeping. With a :class:`VirtualClock`,
+latency is instead added to the clock, and (when the same clock is passed to
+:func:`run_lambda <run_lambda.run_lambda>`) to the call's
+``duration_in_millis``, without slowing down the run. Virtual time is
+accounted per thread, so only calls made on the thread running the Lambda
+function are charged to it; use real sleeps to measure the effect of making
+calls concurrently. Virtual time also counts towards the call's timeout, and
+is subtracted from the context's ``get_remaining_time_in_millis()``: a call
+whose real and virtual time exceed its timeout times out, when it next spends
+latency or when it returns.
+"""
+import math
+import random
+import threading
+import time
+import timeit
+
+from run_lambda import call
+
+
+class RealClock(object):
+    """
+    A clock that spends latency by sleeping.
+    """
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def elapsed_in_seconds(self):
+        return 0.0
+
+    def start_timeout(self, timeout_in_seconds):
+        pass  # real sleeps are interrupted by the call's own deadline
+
+    def check_timeout(self):
+        pass
+
+    def cancel_timeout(self):
+        pass
+
+
+class VirtualClock(object):
+    """
+    A clock that spends latency by adding it to a per-thread total, instead of
+    sleeping.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def sleep(self, seconds):
+        remaining = self._remaining_in_seconds()
+        if remaining is not None and seconds > remaining:
+            # the call's deadline passes while waiting
+            self._local.elapsed = self.elapsed_in_seconds() + max(remaining, 0.0)
+            self._timeout()
+        self._local.elapsed = self.elapsed_in_seconds() + seconds
+
+    def elapsed_in_seconds(self):
+        """
+        :return: total virtual time spent on the current thread, in seconds
+        :rtype: float
+        """
+        return getattr(self._local, "elapsed", 0.0)
+
+    def start_timeout(self, timeout_in_seconds):
+        """
+        Starts counting real and virtual time spent on the current thread
+        against a call's timeout.
+
+        :param float timeout_in_seconds: timeout of the call
+        """
+        self._local.timeout = (timeit.default_timer(), self.elapsed_in_seconds(),
+                               timeout_in_seconds)
+
+    def check_timeout(self):
+        """
+        :raises LambdaTimeout: if the real and virtual time spent on the
+            current thread exceed the timeout
+        """
+        remaining = self._remaining_in_seconds()
+        if remaining is not None and remaining < 0:
+            self._timeout()
+
+    def cancel_timeout(self):
+        self._local.timeout = None
+
+    def _remaining_in_seconds(self):
+        timeout = getattr(self._local, "timeout", None)
+        if timeout is None:
+            return None
+        real_start, virtual_start, timeout_in_seconds = timeout
+        return timeout_in_seconds - (timeit.default_timer() - real_start) \
+            - (self.elapsed_in_seconds() - virtual_start)
+
+    def _timeout(self):
+        self._local.timeout = None
+        raise call.LambdaTimeout()
+
+
+REAL_CLOCK = RealClock()
+
+
+class FixedLatency(object):
+    """
+    A latency model where every call takes the same time.
+    """
+    def __init__(self, millis):
+        self._millis = millis
+
+    def sample(self, rng):
+        return self._millis
+
+
+class DistributionLatency(object):
+    """
+    A latency model where latencies are drawn from a distribution.
+    """
+    def __init__(self, sampler):
+        """
+        :param function sampler: function that takes a :class:`random.Random`
+            and returns a latency, in milliseconds
+        """
+        self._sampler = sampler
+
+    def sample(self, rng):
+        return max(0.0, self._sampler(rng))
+
+    @staticmethod
+    def lognormal(median_in_millis, sigma):
+        """
+        :param float median_in_millis: median latency, in milliseconds
+        :param float sigma: standard deviation of the latency's logarithm
+        :rtype: DistributionLatency
+        """
+        mu = math.log(median_in_millis)
+        return DistributionLatency(lambda rng: rng.lognormvariate(mu, sigma))
+
+    @staticmethod
+    def normal(mean_in_millis, stddev_in_millis):
+        """
+        Normally distributed latencies, truncated at zero.
+
+        :rtype: DistributionLatency
+        """
+        return DistributionLatency(
+            lambda rng: rng.gauss(mean_in_millis, stddev_in_millis))
+
+    @staticmethod
+    def exponential(mean_in_millis):
+        """
+        :rtype: DistributionLatency
+        """
+        return DistributionLatency(
+            lambda rng: rng.expovariate(1.0 / mean_in_millis))
+
+    @staticmethod
+    def uniform(low_in_millis, high_in_millis):
+        """
+        :rtype: DistributionLatency
+        """
+        return DistributionLatency(
+            lambda rng: rng.uniform(low_in_millis, high_in_millis))
+
+
+class EmpiricalLatency(object):
+    """
+    A latency model where latencies are sampled from recorded latencies, e.g.
+    from production.
+    """
+    def __init__(self, samples_in_millis):
+        """
+        :param list samples_in_millis: recorded latencies, in milliseconds
+        """
+        if not samples_in_millis:
+            raise ValueError("EmpiricalLatency requires at least one sample")
+        self._samples = list(samples_in_millis)
+
+    def sample(self, rng):
+        return rng.choice(self._samples)
+
+    @staticmethod
+    def of_file(filename):
+        """
+        Loads recorded latencies from a file containing one latency, in
+        milliseconds, per line.
+
+        :param str filename: name of file
+        :rtype: EmpiricalLatency
+        """
+        with open(filename) as samples_file:
+            return EmpiricalLatency([float(line) for line in samples_file if line.strip()])
+
+
+class InjectedError(Exception):
+    """
+    Raised by a :class:`LatencyFake` to simulate a failed call.
+    """
+    pass
+
+
+class InjectedThrottle(InjectedError):
+    """
+    Raised by a :class:`LatencyFake` to simulate a throttled call.
+    """
+    pass
+
+
+class LatencyFake(object):
+    """
+    Wraps a fake (a function, or an object whose methods are called) so that
+    every call to it first spends a latency sampled from a latency model.
+    Calls can also fail, with an :class:`InjectedError` (or
+    :class:`InjectedThrottle`) raised after the latency is spent.
+    """
+    def __init__(self, fake, latency, error_rate=0.0, throttle_rate=0.0,
+                 clock=None, seed=None, error_factory=None, throttle_factory=None):
+        """
+        :param fake: fake function or object
+        :param latency: latency model, e.g. a :class:`FixedLatency`,
+            :class:`DistributionLatency` or :class:`EmpiricalLatency`
+        :param float error_rate: fraction of calls that fail with an error
+        :param float throttle_rate: fraction of calls that are throttled
+        :param clock: clock to spend latency on. Defaults to sleeping.
+        :type clock: RealClock or VirtualClock
+        :param int seed: seed of the random number generator
+        :param function error_factory: function taking the name of the called
+            method (or ``None``) and returning the exception to raise for an
+            error. Defaults to :class:`InjectedError`.
+        :param function throttle_factory: as ``error_factory``, for throttles.
+            Defaults to :class:`InjectedThrottle`.
+        """
+        self._fake = fake
+        self._latency = latency
+        self._error_rate = error_rate
+        self._throttle_rate = throttle_rate
+        self._clock = REAL_CLOCK if clock is None else clock
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._error_factory = error_factory or \
+            (lambda name: InjectedError("Injected error in {}".format(name or "call")))
+        self._throttle_factory = throttle_factory or \
+            (lambda name: InjectedThrottle("Rate exceeded in {}".format(name or "call")))
+        self._methods = {}
+
+    def __call__(self, *args, **kwargs):
+        return self._call(None, self._fake, args, kwargs)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._fake, name)
+        if not callable(attribute):
+            return attribute
+        method = self._methods.get(name)
+        if method is None:
+            def method(*args, **kwargs):
+                return self._call(name, getattr(self._fake, name), args, kwargs)
+            self._methods[name] = method
+        return method
+
+    def _call(self, name, function, args, kwargs):
+        with self._lock:
+            latency_in_millis = self._latency.sample(self._random)
+            outcome = self._random.random()
+        self._clock.sleep(latency_in_millis / 1000.0)
+        if outcome < self._throttle_rate:
+            raise self._throttle_factory(name)
+        if outcome < self._throttle_rate + self._error_rate:
+            raise self._error_factory(name)
+        return function(*args, **kwargs)
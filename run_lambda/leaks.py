@@ -0,0 +1,416 @@
+"""
+The ``run_lambda leaks`` command, and the :class:`LeakDetector` behind it,
+which hunt for memory leaks across warm invocations.
+
+A leak that grows a container's memory by a few kilobytes per invocation is
+invisible in a single call, but runs a container out of memory after a few
+thousand. The detector runs an event (or set of events) through a warm
+:class:`Container <run_lambda.container.Container>` many times, takes a
+``tracemalloc`` snapshot at regular intervals, and fits a linear trend to the
+memory allocated by each allocation site across the snapshots. Sites whose
+memory keeps growing are reported with their growth per invocation, along
+with the number of further invocations after which the container would reach
+its memory limit at the current rate::
+
+    container = Container.of_file("my_function.py", "handler")
+    report = LeakDetector(container, [event], invocations=2000).run()
+    report.display()
+
+Allocations made by run_lambda itself are not traced.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import psutil
+
+import run_lambda.container as container_module
+import run_lambda.context as context_module
+import run_lambda.corpus as corpus
+
+_RUN_LAMBDA_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+class LeakDetector(object):
+    def __init__(self, container, events, invocations=1000, snapshot_interval=100,
+                 frame_count=1, warmup_invocations=1, timeout_in_seconds=None,
+                 context_factory=None):
+        """
+        :param Container container: container to invoke
+        :param list events: events to invoke the container with, in turn
+        :param int invocations: number of measured invocations
+        :param int snapshot_interval: number of invocations between snapshots
+        :param int frame_count: number of frames of each allocation's
+            traceback that identify its site. With more than one frame,
+            allocations made by the same line on behalf of different callers
+            are told apart.
+        :param int warmup_invocations: number of invocations before the
+            first snapshot, e.g. to fill caches that are meant to grow. The
+            cold start is always one of them.
+        :param int timeout_in_seconds: timeout of each invocation
+        :param function context_factory: function returning the context of
+            each invocation. Defaults to the container's default context.
+        """
+        if snapshot_interval <= 0 or invocations < 2 * snapshot_interval:
+            raise ValueError("At least two snapshot intervals of invocations are needed")
+        self._container = container
+        self._events = events
+        self._invocations = invocations
+        self._snapshot_interval = snapshot_interval
+        self._frame_count = frame_count
+        self._warmup_invocations = max(warmup_invocations, 1)
+        self._timeout_in_seconds = timeout_in_seconds
+        self._context_factory = context_factory
+        self._invocation_count = 0
+        self._failures = 0
+        self._memory_limit_in_mb = None
+
+    def run(self):
+        """
+        Runs the invocations.
+
+        :rtype: LeakReport
+        :raises ValueError: if ``tracemalloc`` is not available
+        """
+        try:
+            import tracemalloc
+        except ImportError:
+            raise ValueError("Leak detection requires Python 3.4 or later")
+        start = timeit.default_timer()
+        for _ in range(self._warmup_invocations):
+            self._invoke()
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(self._frame_count)
+        try:
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                       tracemalloc.Filter(False, os.path.join(_RUN_LAMBDA_DIRECTORY, "*"))]
+            points = [(0, _site_sizes(tracemalloc.take_snapshot().filter_traces(filters),
+                                      self._frame_count))]
+            for measured in range(1, self._invocations + 1):
+                self._invoke()
+                if measured % self._snapshot_interval == 0:
+                    snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+                    points.append((measured, _site_sizes(snapshot, self._frame_count)))
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+        memory_limit_in_bytes = None if self._memory_limit_in_mb is None \
+            else int(self._memory_limit_in_mb) * 1048576
+        return LeakReport(points, psutil.Process().memory_info().rss,
+                          memory_limit_in_bytes, failures=self._failures,
+                          duration_in_seconds=timeit.default_timer() - start)
+
+    def _invoke(self):
+        event = self._events[self._invocation_count % len(self._events)]
+        if self._context_factory is not None:
+            context = self._context_factory()
+        else:
+            context = context_module.MockLambdaContext.Builder()\
+                .set_log_stream_name(self._container.log_stream_name).build()
+        self._memory_limit_in_mb = context.memory_limit_in_mb
+        result = self._container.invoke(event, context=context,
+                                        timeout_in_seconds=self._timeout_in_seconds)
+        if result.timed_out or result.exception is not None:
+            self._failures += 1
+        self._invocation_count += 1
+
+
+def _site_sizes(snapshot, frame_count):
+    key_type = "lineno" if frame_count == 1 else "traceback"
+    return dict((statistic.traceback, (statistic.size, statistic.count))
+                for statistic in snapshot.statistics(key_type))
+
+
+def fit_line(xs, ys):
+    """
+    Fits a line to the points ``(xs[i], ys[i])`` by least squares.
+
+    :return: the line's slope and intercept, and the coefficient of
+        determination (R squared) of the fit
+    :rtype: (float, float, float)
+    """
+    n = float(len(xs))
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    syy = sum((y - mean_y) ** 2 for y in ys)
+    slope = sxy / sxx if sxx else 0.0
+    intercept = mean_y - slope * mean_x
+    r_squared = 1.0 if syy == 0 else (sxy * sxy) / (sxx * syy) if sxx else 0.0
+    return slope, intercept, r_squared
+
+
+class LeakSite(object):
+    """
+    An allocation site whose memory grows across invocations.
+    """
+    def __init__(self, traceback, bytes_per_invocation, r_squared, growth_in_bytes,
+                 growth_in_blocks, size_in_bytes):
+        self._traceback = traceback
+        self._bytes_per_invocation = bytes_per_invocation
+        self._r_squared = r_squared
+        self._growth_in_bytes = growth_in_bytes
+        self._growth_in_blocks = growth_in_blocks
+        self._size_in_bytes = size_in_bytes
+
+    @property
+    def traceback(self):
+        """
+        :property: Traceback of the site, most recent frame last
+        :rtype: tracemalloc.Traceback
+        """
+        return self._traceback
+
+    @property
+    def location(self):
+        """
+        :property: ``FILENAME:LINE_NUMBER`` of the most recent frame
+        :rtype: str
+        """
+        frame = self._traceback[-1] if len(self._traceback) else None
+        return "?" if frame is None else "{f}:{l}".format(f=frame.filename, l=frame.lineno)
+
+    @property
+    def bytes_per_invocation(self):
+        """
+        :property: Growth of the site's memory per invocation, as fitted
+        :rtype: float
+        """
+        return self._bytes_per_invocation
+
+    @property
+    def r_squared(self):
+        """
+        :property: How well a steady growth fits the site's memory, from 0
+            (not at all) to 1 (perfectly)
+        :rtype: float
+        """
+        return self._r_squared
+
+    @property
+    def growth_in_bytes(self):
+        """
+        :property: Growth of the site's memory between the first and last
+            snapshots
+        :rtype: int
+        """
+        return self._growth_in_bytes
+
+    @property
+    def growth_in_blocks(self):
+        """
+        :property: Growth of the site's number of allocated blocks between the
+            first and last snapshots
+        :rtype: int
+        """
+        return self._growth_in_blocks
+
+    @property
+    def size_in_bytes(self):
+        """
+        :property: Memory allocated by the site at the last snapshot
+        :rtype: int
+        """
+        return self._size_in_bytes
+
+
+class LeakReport(object):
+    """
+    The memory growth measured by a :class:`LeakDetector`.
+    """
+    def __init__(self, points, memory_used_in_bytes, memory_limit_in_bytes,
+                 failures=0, duration_in_seconds=0.0, min_r_squared=0.8):
+        """
+        :param list points: ``(invocation count, {traceback: (size, count)})``
+            pairs, one per snapshot
+        :param int memory_used_in_bytes: memory used by the process at the end
+        :param int memory_limit_in_bytes: memory limit of the function
+        :param float min_r_squared: minimum goodness of fit of a site's growth
+            for it to be reported as leaking
+        """
+        self._points = points
+        self._memory_used_in_bytes = memory_used_in_bytes
+        self._memory_limit_in_bytes = memory_limit_in_bytes
+        self._failures = failures
+        self._duration_in_seconds = duration_in_seconds
+        self._min_r_squared = min_r_squared
+        xs = [invocations for invocations, _ in points]
+        self._total_slope, _, self._total_r_squared = fit_line(
+            xs, [sum(size for size, _ in sizes.values()) for _, sizes in points])
+        self._sites = self._growing_sites(xs)
+
+    def _growing_sites(self, xs):
+        first, last = self._points[0][1], self._points[-1][1]
+        sites = []
+        for traceback in last:
+            ys = [sizes.get(traceback, (0, 0))[0] for _, sizes in self._points]
+            slope, _, r_squared = fit_line(xs, ys)
+            if slope <= 0 or r_squared < self._min_r_squared or ys[-1] <= ys[0]:
+                continue
+            first_size, first_count = first.get(traceback, (0, 0))
+            last_size, last_count = last[traceback]
+            sites.append(LeakSite(traceback, slope, r_squared, last_size - first_size,
+                                  last_count - first_count, last_size))
+        sites.sort(key=lambda site: site.bytes_per_invocation, reverse=True)
+        return sites
+
+    @property
+    def invocation_count(self):
+        """
+        :property: Number of measured invocations
+        :rtype: int
+        """
+        return self._points[-1][0]
+
+    @property
+    def failure_count(self):
+        """
+        :property: Number of invocations that raised an exception or timed out
+        :rtype: int
+        """
+        return self._failures
+
+    @property
+    def bytes_per_invocation(self):
+        """
+        :property: Growth of the total traced memory per invocation, as fitted
+        :rtype: float
+        """
+        return self._total_slope
+
+    @property
+    def sites(self):
+        """
+        :property: Allocation sites whose memory grows steadily, the fastest
+            growing first
+        :rtype: list[LeakSite]
+        """
+        return self._sites
+
+    @property
+    def memory_used_in_bytes(self):
+        """
+        :property: Memory (resident set size) used by the process after the
+            invocations
+        :rtype: int
+        """
+        return self._memory_used_in_bytes
+
+    def projected_invocations_until_limit(self):
+        """
+        :return: number of further invocations after which the memory used
+            would reach the function's memory limit, if it kept growing at the
+            rate of the leaking sites, or ``None`` if nothing leaks (or the
+            limit is unknown)
+        :rtype: int
+        """
+        rate = sum(site.bytes_per_invocation for site in self._sites)
+        if rate <= 0 or self._memory_limit_in_bytes is None:
+            return None
+        headroom = self._memory_limit_in_bytes - self._memory_used_in_bytes
+        return max(int(headroom / rate), 0)
+
+    def display(self, outfile=None, top=10):
+        if outfile is None:
+            outfile = sys.stdout
+        outfile.write("Invocations: {i} in {d:.1f} s ({s} snapshots)\n".format(
+            i=self.invocation_count, d=self._duration_in_seconds, s=len(self._points)))
+        if self._failures:
+            outfile.write("Failed invocations: {}\n".format(self._failures))
+        outfile.write("Traced memory growth: {b:.1f} bytes/invocation (R^2 {r:.2f})\n".format(
+            b=self._total_slope, r=self._total_r_squared))
+        if self._memory_limit_in_bytes is not None:
+            outfile.write("Memory used: {u:.1f} MB of {l:.0f} MB\n".format(
+                u=self._memory_used_in_bytes / 1048576.0,
+                l=self._memory_limit_in_bytes / 1048576.0))
+        if not self._sites:
+            outfile.write("\nNo steadily growing allocation sites\n")
+            return
+        projected = self.projected_invocations_until_limit()
+        if projected is not None:
+            outfile.write("Projected memory limit after: {} more invocations\n".format(projected))
+        outfile.write("\n{:>14}{:>14}{:>10}{:>8}  {}\n".format(
+            "bytes/invoc", "growth (B)", "blocks", "R^2", "site"))
+        for site in self._sites[:top]:
+            outfile.write("{:>14.1f}{:>14}{:>10}{:>8.2f}  {}\n".format(
+                site.bytes_per_invocation, site.growth_in_bytes,
+                site.growth_in_blocks, site.r_squared, site.location))
+            for frame in list(site.traceback)[-2::-1]:
+                outfile.write("{:>46}    called from {f}:{l}\n".format(
+                    "", f=frame.filename, l=frame.lineno))
+
+
+def arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda leaks",
+        description="Invoke an AWS Lambda function repeatedly in a warm "
+                    "container, and report the allocation sites whose "
+                    "memory keeps growing")
+    parser.add_argument("filename", type=str,
+                        help="name of file containing Lambda function, or of "
+                             "deployment package (.zip)")
+    parser.add_argument("event", type=str,
+                        help="event file, JSON lines file or directory of event "
+                             "files, invoked in turn")
+    parser.add_argument("-f", "--function", metavar="HANDLER_FUNCTION",
+                        dest="function_name", type=str, default="handler",
+                        help="Name of handler function. Defaults to \"handler\". "
+                             "For a deployment package, the handler setting, "
+                             "e.g. \"app.handler\"")
+    parser.add_argument("--layer", metavar="LAYER_ZIP", dest="layers",
+                        action="append", default=[],
+                        help="Layer of a deployment package. May be repeated, "
+                             "in the order the layers are configured")
+    parser.add_argument("-n", "--invocations", metavar="INVOCATIONS",
+                        dest="invocations", type=int, default=1000,
+                        help="Number of measured invocations. Defaults to 1000")
+    parser.add_argument("--interval", metavar="INVOCATIONS", dest="interval",
+                        type=int, default=100,
+                        help="Number of invocations between snapshots. "
+                             "Defaults to 100")
+    parser.add_argument("--warmup", metavar="INVOCATIONS", dest="warmup",
+                        type=int, default=1,
+                        help="Number of invocations before the first snapshot. "
+                             "Defaults to 1")
+    parser.add_argument("--frames", metavar="FRAMES", dest="frames", type=int,
+                        default=1,
+                        help="Number of traceback frames identifying an "
+                             "allocation site. Defaults to 1")
+    parser.add_argument("--top", metavar="SITES", dest="top", type=int, default=10,
+                        help="Number of allocation sites to display. Defaults to 10")
+    parser.add_argument("-t", "--timeout", metavar="TIMEOUT",
+                        dest="timeout", type=int, default=None,
+                        help="Timeout (in seconds) for each function call")
+    parser.add_argument("-c", "--context", metavar="CONTEXT_FILENAME", type=str,
+                        default=None, dest="context_file",
+                        help="Filename of file containing JSON context data, "
+                             "whose memory_limit_in_mb is used for projections")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arguments(sys.argv[1:] if argv is None else argv)
+    events = [event for _, event in corpus.load_events(args.event)]
+    container = container_module.Container.of_file(
+        args.filename, args.function_name, layers=args.layers or None)
+    context_factory = None
+    if args.context_file is not None:
+        with open(args.context_file) as context_file:
+            context_json = json.load(context_file)
+
+        def context_factory():
+            return context_module.MockLambdaContext.of_json(context_json)
+    detector = LeakDetector(container, events, invocations=args.invocations,
+                            snapshot_interval=args.interval, frame_count=args.frames,
+                            warmup_invocations=args.warmup,
+                            timeout_in_seconds=args.timeout,
+                            context_factory=context_factory)
+    detector.run().display(top=args.top)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+Writing of invocation logs to local files, laid out like CloudWatch Logs.
+
+A :class:`LogSink` is a listener of :func:`run_lambda <run_lambda.run_lambda>`
+that writes the log of each call under
+``DIRECTORY/LOG_GROUP_NAME/LOG_STREAM_NAME/``, using the log group and stream
+names of the call's context. Each line is prefixed with a timestamp, as in
+CloudWatch Logs exports. Calls only enqueue their logs; a background thread
+writes them in batches, so Lambda functions never wait on the disk.
+
+Each log stream is written as a series of numbered segments
+(``000000.log``, ``000001.log``, ...). Once a segment reaches its maximum size,
+it is closed (and, optionally, compressed to ``.log.gz``) and a new segment is
+started.
+"""
+import collections
+import datetime
+import gzip
+import os
+import shutil
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+_STOP = object()
+
+
+class LogSink(object):
+    def __init__(self, directory, max_segment_bytes=64 * 1024 * 1024, compress=True,
+                 flush_interval_in_seconds=1.0, max_open_files=128):
+        """
+        :param str directory: root directory of logs
+        :param int max_segment_bytes: size at which segments are rotated
+        :param bool compress: whether to gzip rotated segments
+        :param float flush_interval_in_seconds: maximum time logs are buffered
+            before being flushed to disk
+        :param int max_open_files: maximum number of segment files kept open
+        """
+        self._directory = directory
+        self._max_segment_bytes = max_segment_bytes
+        self._compress = compress
+        self._flush_interval_in_seconds = flush_interval_in_seconds
+        self._max_open_files = max_open_files
+        self._queue = queue.Queue()
+        self._segments = collections.OrderedDict()
+        self._closed = False
+        self._error = None  # exc_info of a failure of the writer thread
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def directory(self):
+        """
+        :property: Root directory of logs
+        :rtype: str
+        """
+        return self._directory
+
+    def record(self, context, result):
+        """
+        Enqueues the log of a call. This method has the signature of a
+        listener of :func:`run_lambda <run_lambda.run_lambda>`.
+
+        :param MockLambdaContext context: context of the call
+        :param LambdaResult result: result of the call
+        :raises Exception: the error the background thread failed with, if
+            it failed to write earlier logs
+        """
+        self._raise_error()
+        self._queue.put((context.log_group_name, context.log_stream_name,
+                         datetime.datetime.utcnow(), result.summary.log))
+
+    def stream_directory(self, log_group_name, log_stream_name):
+        """
+        :return: directory containing the segments of a log stream
+        :rtype: str
+        """
+        return os.path.join(self._directory, *(_path_components(log_group_name)
+                                               + _path_components(log_stream_name)))
+
+    def close(self):
+        """
+        Writes all enqueued logs, and closes all segments.
+
+        :raises Exception: the error the background thread failed with, if
+            it failed to write any logs
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _raise_error(self):
+        if self._error is not None:
+            six.reraise(*self._error)
+
+    def _run(self):
+        try:
+            self._write_batches()
+        except Exception:
+            # later logs cannot be written either; callers see the error on
+            # their next call of record() or close()
+            self._error = sys.exc_info()
+        finally:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+
+    def _write_batches(self):
+        stopping = False
+        while not stopping:
+            try:
+                entries = [self._queue.get(timeout=self._flush_interval_in_seconds)]
+            except queue.Empty:
+                continue
+            # drain everything that is already enqueued, to write in one batch
+            while True:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if entries[-1] is _STOP:
+                entries.pop()
+                stopping = True
+            self._write(entries)
+
+    def _write(self, entries):
+        written = []
+        for log_group_name, log_stream_name, timestamp, log in entries:
+            segment = self._segment(log_group_name, log_stream_name)
+            prefix = timestamp.strftime("%Y-%m-%dT%H:%M:%S.") \
+                + "{:03d}Z ".format(timestamp.microsecond // 1000)
+            data = "".join(prefix + line + "\n" for line in log.splitlines())
+            segment.write(data.encode("utf-8"))
+            written.append(segment)
+            if segment.size >= self._max_segment_bytes:
+                segment.close()
+                if self._compress:
+                    _compress(segment.filename)
+                segment.open_next()
+        for segment in written:
+            segment.flush()
+
+    def _segment(self, log_group_name, log_stream_name):
+        key = (log_group_name, log_stream_name)
+        segment = self._segments.pop(key, None)
+        if segment is None:
+            segment = _Segment(self.stream_directory(log_group_name, log_stream_name))
+            if len(self._segments) >= self._max_open_files:
+                _, evicted = self._segments.popitem(last=False)
+                evicted.close()
+        self._segments[key] = segment  # most recently used last
+        return segment
+
+
+class _Segment(object):
+    def __init__(self, directory):
+        self._directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        indexes = [int(name.split(".")[0]) for name in os.listdir(directory)
+                   if name.split(".")[0].isdigit()]
+        self._index = max(indexes) if indexes else 0
+        if os.path.exists(self.filename + ".gz"):  # already rotated
+            self._index += 1
+        # the file is only opened once something is written to it
+        self._file = None
+        self.size = 0
+
+    @property
+    def filename(self):
+        return os.path.join(self._directory, "{:06d}.log".format(self._index))
+
+    def _open(self):
+        self._file = open(self.filename, "ab")
+        self.size = self._file.tell()
+
+    def open_next(self):
+        self.close()
+        self._index += 1
+        self.size = 0
+
+    def write(self, data):
+        if self._file is None:
+            self._open()
+        self._file.write(data)
+        self.size += len(data)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _compress(filename):
+    with open(filename, "rb") as source:
+        with gzip.open(filename + ".gz", "wb") as destination:
+            shutil.copyfileobj(source, destination)
+    os.remove(filename)
+
+
+def _path_components(name):
+    return [component.replace(os.sep, "_") for component in name.split("/")
+            if component and component not in (".", "..")]
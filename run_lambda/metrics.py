@@ -0,0 +1,416 @@
+"""
+Invocation metrics, exposed in the OpenMetrics text format and optionally
+pushed to a StatsD server.
+
+A :class:`MetricsRegistry` is filled from the result of every call it is given,
+typically by passing its :meth:`record <MetricsRegistry.record>` method as one
+of the ``listeners`` of :func:`run_lambda <run_lambda.run_lambda>`::
+
+    registry = MetricsRegistry()
+    server = serve(registry, port=9102)
+    result = run_lambda.run_lambda(handler, event, listeners=[registry.record])
+"""
+import bisect
+import socket
+import threading
+
+from six.moves import BaseHTTPServer
+
+from run_lambda import emf
+from run_lambda import usage as usage_module
+
+DURATION_BUCKETS_IN_MILLIS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500,
+                              5000, 10000, 30000, 60000, 300000, 900000)
+MEMORY_BUCKETS_IN_MB = (16, 32, 64, 128, 256, 512, 1024, 1536, 2048, 3008,
+                        4096, 6144, 8192, 10240)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+class MetricsRegistry(object):
+    """
+    Aggregates invocation counts, errors, timeouts, cold starts, duration
+    and memory histograms, and resource usage, per Lambda function.
+
+    Recording is lock-light: each thread updates its own shard of counters,
+    and shards are only combined when the metrics are collected. A lock is
+    taken only the first time each thread records a call.
+    """
+    def __init__(self, prefix="run_lambda", statsd=None):
+        """
+        :param str prefix: prefix of metric names
+        :param StatsdClient statsd: client to push each recorded call to. If
+            not provided, metrics are not pushed.
+        """
+        self._prefix = prefix
+        self._statsd = statsd
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def record(self, context, result):
+        """
+        Records the result of a call to a Lambda function. This method has the
+        signature of a listener of :func:`run_lambda <run_lambda.run_lambda>`.
+
+        :param MockLambdaContext context: context of the call
+        :param LambdaResult result: result of the call
+        """
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        series = shard.get(context.function_name)
+        if series is None:
+            series = shard[context.function_name] = _Series()
+        series.record(result)
+        if self._statsd is not None:
+            self._statsd.send_result(context.function_name, result)
+
+    def collect(self):
+        """
+        Combines the metrics recorded by every thread.
+
+        :return: dictionary mapping function names to their metrics
+        :rtype: dict[str, FunctionMetrics]
+        """
+        with self._lock:
+            shards = list(self._shards)
+        combined = {}
+        for shard in shards:
+            for function_name, series in list(shard.items()):
+                total = combined.get(function_name)
+                if total is None:
+                    total = combined[function_name] = _Series()
+                total.add(series)
+        return dict((name, FunctionMetrics(series)) for name, series in combined.items())
+
+    def render(self):
+        """
+        :return: the collected metrics, in the OpenMetrics text format
+        :rtype: str
+        """
+        lines = []
+        functions = sorted(self.collect().items())
+        for name, attribute, help_text in [
+                ("invocations", "invocation_count", "Number of invocations"),
+                ("errors", "error_count", "Number of invocations that raised an exception"),
+                ("timeouts", "timeout_count", "Number of invocations that timed out"),
+                ("cold_starts", "cold_start_count", "Number of cold starts")]:
+            metric = "{p}_{n}".format(p=self._prefix, n=name)
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("# HELP {m} {h}.".format(m=metric, h=help_text))
+            for function_name, metrics in functions:
+                lines.append("{m}_total{{function_name=\"{f}\"}} {v}".format(
+                    m=metric, f=_escape(function_name), v=getattr(metrics, attribute)))
+        for name, attribute, help_text in [
+                ("duration_milliseconds", "duration", "Duration of invocations"),
+                ("init_duration_milliseconds", "init_duration", "Duration of init phases"),
+                ("max_memory_used_megabytes", "memory", "Maximum memory used by invocations")]:
+            metric = "{p}_{n}".format(p=self._prefix, n=name)
+            lines.append("# TYPE {} histogram".format(metric))
+            lines.append("# HELP {m} {h}.".format(m=metric, h=help_text))
+            for function_name, metrics in functions:
+                histogram = getattr(metrics, attribute)
+                label = "function_name=\"{}\"".format(_escape(function_name))
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + (float("inf"),),
+                                        histogram.counts):
+                    cumulative += count
+                    lines.append("{m}_bucket{{{l},le=\"{b}\"}} {c}".format(
+                        m=metric, l=label, b=_format_bound(bound), c=cumulative))
+                lines.append("{m}_sum{{{l}}} {s}".format(m=metric, l=label, s=histogram.sum))
+                lines.append("{m}_count{{{l}}} {c}".format(m=metric, l=label, c=cumulative))
+        lines.extend(self._render_usage(functions))
+        lines.extend(self._render_emf(functions))
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _render_usage(self, functions):
+        lines = []
+        for name, help_text, label_name, samples in [
+                ("cpu_seconds", "CPU time of invocations", "mode", lambda usage: [
+                    ("user", usage.user_cpu_in_millis / 1000.0),
+                    ("system", usage.system_cpu_in_millis / 1000.0)]),
+                ("gc_collections", "Garbage collections during invocations", "generation",
+                 lambda usage: list(enumerate(usage.gc_collections))),
+                ("gc_pause_seconds", "Garbage collection pauses during invocations",
+                 "generation", lambda usage: [
+                     (generation, pause / 1000.0)
+                     for generation, pause in enumerate(usage.gc_pause_in_millis)]),
+                ("context_switches", "Context switches during invocations", "kind",
+                 lambda usage: [("voluntary", usage.voluntary_context_switches),
+                                ("involuntary", usage.involuntary_context_switches)]),
+                ("page_faults", "Page faults during invocations", "kind",
+                 lambda usage: [("minor", usage.minor_page_faults),
+                                ("major", usage.major_page_faults)])]:
+            metric = "{p}_{n}".format(p=self._prefix, n=name)
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("# HELP {m} {h}.".format(m=metric, h=help_text))
+            for function_name, metrics in functions:
+                for label_value, value in samples(metrics.usage):
+                    lines.append("{m}_total{{function_name=\"{f}\",{k}=\"{v}\"}} {c}".format(
+                        m=metric, f=_escape(function_name), k=label_name,
+                        v=label_value, c=value))
+        return lines
+
+    def _render_emf(self, functions):
+        # one summary per EMF metric name, labelled by namespace and dimensions
+        families = {}
+        for function_name, metrics in functions:
+            for (namespace, name, dimensions), statistics in metrics.emf.items():
+                labels = [("function_name", function_name), ("namespace", namespace)]
+                labels.extend(("dimension_" + _metric_name(k), v) for k, v in dimensions)
+                families.setdefault(name, []).append((labels, statistics))
+        lines = []
+        for name, samples in sorted(families.items()):
+            metric = "{p}_emf_{n}".format(p=self._prefix, n=_metric_name(name))
+            lines.append("# TYPE {} summary".format(metric))
+            lines.append("# HELP {m} Embedded metric {n}.".format(m=metric, n=name))
+            for labels, statistics in sorted(samples, key=lambda sample: sample[0]):
+                label = ",".join("{k}=\"{v}\"".format(k=k, v=_escape(v)) for k, v in labels)
+                lines.append("{m}_count{{{l}}} {c}".format(
+                    m=metric, l=label, c=statistics.sample_count))
+                lines.append("{m}_sum{{{l}}} {s}".format(m=metric, l=label, s=statistics.sum))
+        return lines
+
+
+class FunctionMetrics(object):
+    """
+    Metrics of the calls to a single Lambda function.
+    """
+    def __init__(self, series):
+        self._series = series
+
+    @property
+    def invocation_count(self):
+        """
+        :property: Number of invocations
+        :rtype: int
+        """
+        return self._series.invocations
+
+    @property
+    def error_count(self):
+        """
+        :property: Number of invocations that raised an exception
+        :rtype: int
+        """
+        return self._series.errors
+
+    @property
+    def timeout_count(self):
+        """
+        :property: Number of invocations that timed out
+        :rtype: int
+        """
+        return self._series.timeouts
+
+    @property
+    def cold_start_count(self):
+        """
+        :property: Number of invocations that were cold starts
+        :rtype: int
+        """
+        return self._series.cold_starts
+
+    @property
+    def duration(self):
+        """
+        :property: Histogram of durations, in milliseconds
+        :rtype: Histogram
+        """
+        return self._series.duration
+
+    @property
+    def init_duration(self):
+        """
+        :property: Histogram of init durations of cold starts, in milliseconds
+        :rtype: Histogram
+        """
+        return self._series.init_duration
+
+    @property
+    def memory(self):
+        """
+        :property: Histogram of the maximum memory used, in megabytes
+        :rtype: Histogram
+        """
+        return self._series.memory
+
+    @property
+    def emf(self):
+        """
+        :property: Statistics of the metrics published in Embedded Metric
+            Format records, keyed by ``(namespace, name, dimensions)``
+        :rtype: dict[tuple, MetricStatistics]
+        """
+        return self._series.emf
+
+    @property
+    def usage(self):
+        """
+        :property: Total resource usage of the invocations
+        :rtype: UsageStatistics
+        """
+        return self._series.usage
+
+
+class Histogram(object):
+    """
+    A histogram with fixed bucket upper bounds, plus a final unbounded bucket.
+    """
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def add(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+
+class _Series(object):
+    def __init__(self):
+        self.invocations = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cold_starts = 0
+        self.duration = Histogram(DURATION_BUCKETS_IN_MILLIS)
+        self.init_duration = Histogram(DURATION_BUCKETS_IN_MILLIS)
+        self.memory = Histogram(MEMORY_BUCKETS_IN_MB)
+        self.emf = {}
+        self.usage = usage_module.UsageStatistics()
+
+    def record(self, result):
+        summary = result.summary
+        self.invocations += 1
+        if result.timed_out:
+            self.timeouts += 1
+        elif result.exception is not None:
+            self.errors += 1
+        if summary.init_duration_in_millis is not None:
+            self.cold_starts += 1
+            self.init_duration.observe(summary.init_duration_in_millis)
+        self.duration.observe(summary.duration_in_millis)
+        self.memory.observe(summary.max_memory_used_in_mb)
+        emf.aggregate(self.emf, summary.emf_metrics)
+        if summary.usage is not None:
+            self.usage.observe(summary.usage, summary.duration_in_millis)
+
+    def add(self, other):
+        self.invocations += other.invocations
+        self.errors += other.errors
+        self.timeouts += other.timeouts
+        self.cold_starts += other.cold_starts
+        self.duration.add(other.duration)
+        self.init_duration.add(other.init_duration)
+        self.memory.add(other.memory)
+        self.usage.add(other.usage)
+        for key, statistics in other.emf.items():
+            total = self.emf.get(key)
+            if total is None:
+                total = self.emf[key] = emf.MetricStatistics(statistics.unit)
+            total.add(statistics)
+
+
+class StatsdClient(object):
+    """
+    Pushes metrics to a StatsD server over UDP. Sends are fire-and-forget;
+    errors (e.g. no server listening) are ignored.
+    """
+    def __init__(self, host="localhost", port=8125, prefix="run_lambda"):
+        self._address = (host, port)
+        self._prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def send_result(self, function_name, result):
+        summary = result.summary
+        name = "{p}.{f}".format(p=self._prefix, f=_statsd_name(function_name))
+        lines = ["{}.invocations:1|c".format(name),
+                 "{n}.duration:{d}|ms".format(n=name, d=summary.duration_in_millis),
+                 "{n}.max_memory_used:{m}|g".format(n=name, m=summary.max_memory_used_in_mb)]
+        if summary.usage is not None:
+            lines.append("{n}.cpu_time:{c:.1f}|ms".format(n=name, c=summary.usage.cpu_in_millis))
+            lines.append("{n}.gc_pause:{p:.1f}|ms".format(
+                n=name, p=summary.usage.total_gc_pause_in_millis))
+        if result.timed_out:
+            lines.append("{}.timeouts:1|c".format(name))
+        elif result.exception is not None:
+            lines.append("{}.errors:1|c".format(name))
+        if summary.init_duration_in_millis is not None:
+            lines.append("{}.cold_starts:1|c".format(name))
+            lines.append("{n}.init_duration:{d}|ms".format(
+                n=name, d=summary.init_duration_in_millis))
+        self.send(lines)
+
+    def send(self, lines):
+        try:
+            self._socket.sendto("\n".join(lines).encode("utf-8"), self._address)
+        except (socket.error, OSError):
+            pass
+
+    def close(self):
+        self._socket.close()
+
+
+def serve(registry, port, host="127.0.0.1"):
+    """
+    Serves the metrics of ``registry`` over HTTP, on a background thread, in
+    the OpenMetrics text format.
+
+    :param MetricsRegistry registry: registry to serve
+    :param int port: port to listen on. If 0, an unused port is chosen.
+    :param str host: address to listen on
+    :return: the running server; call its ``shutdown`` method to stop it
+    :rtype: BaseHTTPServer.HTTPServer
+    """
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = BaseHTTPServer.HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _escape(label_value):
+    return label_value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+
+
+def _format_bound(bound):
+    if bound == float("inf"):
+        return "+Inf"
+    return repr(float(bound))
+
+
+def _statsd_name(name):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
@@ -0,0 +1,262 @@
+"""
+Loading of Lambda functions from deployment packages (zip files) and layers.
+
+A :class:`Package` makes the code of a deployment package, and of the layers it
+uses, importable in the search-path order of the Lambda Python runtime: the
+function's code (``/var/task``) first, then the ``python/lib/pythonX.Y/
+site-packages`` and ``python`` directories of the layers (``/opt``), where
+later layers take precedence over earlier ones::
+
+    package = Package("function.zip", layers=["dependencies.zip"])
+    module = package.load_module("app.main")
+    result = run_lambda.run_lambda(module.handler, event)
+
+By default, each zip file is extracted once into a cache directory named after
+the SHA-256 hash of its content, and the extracted files are made read-only,
+as they are in Lambda. Alternatively, zip files can be imported from directly
+with :mod:`zipimport`, which cannot import compiled extension modules.
+"""
+import hashlib
+import importlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import zipfile
+
+from run_lambda import init
+
+
+def default_cache_directory():
+    """
+    :return: the default directory in which packages are extracted
+    :rtype: str
+    """
+    return os.path.join(os.environ.get("XDG_CACHE_HOME")
+                        or os.path.join(os.path.expanduser("~"), ".cache"),
+                        "run_lambda", "packages")
+
+
+def is_package(filename):
+    """
+    :return: whether ``filename`` names a deployment package
+    :rtype: bool
+    """
+    return filename.endswith(".zip")
+
+
+def split_handler(handler):
+    """
+    Splits a Lambda handler setting, e.g. ``"app/main.handler"`` or
+    ``"app.main.handler"``, into a module name and a function name.
+
+    :param str handler: handler setting
+    :return: module name and function name
+    :rtype: (str, str)
+    """
+    module_path, separator, function_name = handler.rpartition(".")
+    if not separator or not module_path:
+        raise ValueError("Invalid handler {}: expected MODULE.FUNCTION"
+                         .format(repr(handler)))
+    return module_path.replace("/", "."), function_name
+
+
+class Package(object):
+    def __init__(self, filename, layers=None, cache_directory=None, extract=True):
+        """
+        :param str filename: name of deployment package zip file
+        :param list[str] layers: names of layer zip files, in the order they
+            are configured for the function
+        :param str cache_directory: directory to extract zip files in.
+            Defaults to :func:`default_cache_directory`.
+        :param bool extract: whether to extract zip files. If ``False``, they
+            are imported from with :mod:`zipimport`.
+        """
+        self._filename = filename
+        self._layers = list(layers or [])
+        self._cache_directory = cache_directory or default_cache_directory()
+        self._extract = extract
+        self._paths = None
+
+    @property
+    def filename(self):
+        """
+        :property: Name of deployment package zip file
+        :rtype: str
+        """
+        return self._filename
+
+    @property
+    def layers(self):
+        """
+        :property: Names of layer zip files
+        :rtype: list[str]
+        """
+        return self._layers
+
+    @property
+    def paths(self):
+        """
+        :property: Entries added to the front of ``sys.path`` to import from
+            the package, in search order. Extracts zip files if needed.
+        :rtype: list[str]
+        """
+        if self._paths is None:
+            function_root = self._root(self._filename)
+            layer_roots = [self._root(layer) for layer in reversed(self._layers)]
+            site_packages = os.path.join(
+                "python", "lib", "python{}.{}".format(*sys.version_info[:2]),
+                "site-packages")
+            paths = [function_root]
+            for subdirectory in (site_packages, "python"):
+                for layer, root in zip(reversed(self._layers), layer_roots):
+                    if _contains_directory(layer, subdirectory):
+                        paths.append(os.path.join(root, subdirectory))
+            self._paths = paths
+        return self._paths
+
+    def load_module(self, module_name, isolated=False):
+        """
+        Imports the module ``module_name`` from the package. The package's
+        paths are added to the front of ``sys.path`` (if they are not there
+        already), and are left there so that the module can import lazily.
+
+        :param str module_name: dotted name of module
+        :param bool isolated: whether to remove the modules imported from the
+            package from ``sys.modules`` afterwards, so that loading the
+            module again re-imports it
+        :rtype: module
+        """
+        paths = self.paths
+        for path in reversed(paths):
+            if path in sys.path:
+                sys.path.remove(path)
+            sys.path.insert(0, path)
+        loaded = set(sys.modules)
+        module = importlib.import_module(module_name)
+        if isolated:
+            for name, imported in list(sys.modules.items()):
+                if name not in loaded and is_within(imported, paths):
+                    del sys.modules[name]
+        return module
+
+    def layout(self):
+        """
+        Describes the zip files of the package.
+
+        :return: list of ``(filename, file_count, compressed_bytes,
+            uncompressed_bytes)`` tuples, for the deployment package and then
+            each layer
+        :rtype: list[tuple]
+        """
+        layout = []
+        for filename in [self._filename] + self._layers:
+            with zipfile.ZipFile(filename) as archive:
+                infos = [info for info in archive.infolist()
+                         if not info.filename.endswith("/")]
+            layout.append((filename, len(infos),
+                           sum(info.compress_size for info in infos),
+                           sum(info.file_size for info in infos)))
+        return layout
+
+    def _root(self, filename):
+        if not self._extract:
+            return os.path.abspath(filename)
+        directory = os.path.join(self._cache_directory, _sha256(filename))
+        if not os.path.isdir(directory):
+            _extract(filename, directory)
+        return directory
+
+
+def module_loader(filename, handler, layers=None, **kwargs):
+    """
+    Prepares to import the module containing a Lambda function's handler, from
+    either a Python source file or a deployment package. Zip files are
+    extracted by this function, so that timing the returned loader only
+    measures the import.
+
+    :param str filename: name of Python source file, or of deployment package
+        zip file
+    :param str handler: for a source file, the name of the handler function;
+        for a deployment package, the handler setting, e.g. ``"app.handler"``
+    :param list[str] layers: names of layer zip files
+    :return: a function taking no arguments and returning the imported
+        module, and the name of the handler function in the module
+    :rtype: (function, str)
+    """
+    if not is_package(filename):
+        if layers:
+            raise ValueError("Layers can only be used with deployment packages")
+        return lambda: init.load_module(filename), handler
+    module_name, function_name = split_handler(handler)
+    code = Package(filename, layers=layers, **kwargs)
+    code.paths  # extracts zip files
+    return lambda: code.load_module(module_name), function_name
+
+
+def _sha256(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as package_file:
+        for chunk in iter(lambda: package_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _extract(filename, directory):
+    parent = os.path.dirname(directory)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    staging = tempfile.mkdtemp(dir=parent, prefix=".extracting-")
+    try:
+        with zipfile.ZipFile(filename) as archive:
+            archive.extractall(staging)
+        _make_read_only(staging)
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            if not os.path.isdir(directory):  # not extracted concurrently
+                raise
+    finally:
+        if os.path.isdir(staging):
+            _make_writable(staging)
+            shutil.rmtree(staging)
+
+
+def _make_read_only(directory):
+    read_only = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+    for root, directories, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            mode = os.stat(path).st_mode
+            os.chmod(path, read_only | (mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)))
+    # directories stay writable by their owner, so that the cache can be
+    # cleared, and so that Python can write bytecode caches
+
+
+def _make_writable(directory):
+    for root, directories, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            os.chmod(path, os.stat(path).st_mode | stat.S_IWUSR)
+
+
+def _contains_directory(filename, subdirectory):
+    prefix = subdirectory.replace(os.sep, "/") + "/"
+    with zipfile.ZipFile(filename) as archive:
+        return any(name.startswith(prefix) for name in archive.namelist())
+
+
+def is_within(module, paths):
+    """
+    :param module module: imported module
+    :param list[str] paths: absolute paths of directories
+    :return: whether the module was imported from a file under one of
+        ``paths``
+    :rtype: bool
+    """
+    module_file = getattr(module, "__file__", None)
+    if not module_file:
+        return False
+    module_file = os.path.abspath(module_file)
+    return any(module_file.startswith(os.path.join(path, "")) for path in paths)
@@ -0,0 +1,263 @@
+import inspect
+import threading
+import timeit
+
+from run_lambda import tracing
+
+_MISSING = object()
+
+
+class PatchSet(object):
+    """
+    A reusable set of patches. Each dotted target path is resolved once, when
+    the patch set is constructed, so the patches can be applied and removed
+    cheaply across many calls to
+    :func:`run_lambda <run_lambda.run_lambda>`.
+
+    A patch set can also be kept applied for a whole session, by using it as a
+    context manager (or calling :meth:`start` and :meth:`stop`). While a patch
+    set is applied, nested applications are no-ops. A patch set may be
+    applied on several threads at once (e.g. by concurrent calls); its
+    patches are removed once no thread has it applied.
+
+    Calls to patched values that are callable are counted and timed; see
+    :meth:`stats`. When a :class:`Tracer <run_lambda.tracing.Tracer>` is
+    active, each such call is also recorded as a span.
+    """
+    def __init__(self, patches):
+        """
+        :param dict patches: dictionary of name-to-value mappings, as would be
+            passed to :func:`run_lambda <run_lambda.run_lambda>`
+        """
+        self._patches = [_ResolvedPatch(name, value)
+                         for name, value in patches.items()]
+        self._lock = threading.Lock()
+        self._local = threading.local()  # nesting depth, per thread
+        self._thread_count = 0  # number of threads that have it applied
+
+    @property
+    def names(self):
+        """
+        :property: The dotted names of the patched targets
+        :rtype: list
+        """
+        return [patch.name for patch in self._patches]
+
+    @property
+    def applied(self):
+        """
+        :property: Whether the patches are currently applied, on any thread
+        :rtype: bool
+        """
+        return self._thread_count > 0
+
+    def start(self):
+        """
+        Applies the patches, if they are not already applied.
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            with self._lock:
+                if self._thread_count == 0:
+                    for patch in self._patches:
+                        patch.apply()
+                self._thread_count += 1
+        self._local.depth = depth + 1
+
+    def stop(self):
+        """
+        Undoes a call to :meth:`start` on the same thread. The patches are
+        removed once every call to :meth:`start`, on every thread, has been
+        matched by a call to :meth:`stop`.
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            raise RuntimeError("PatchSet.stop() called without matching start()")
+        self._local.depth = depth - 1
+        if depth == 1:
+            with self._lock:
+                self._thread_count -= 1
+                if self._thread_count == 0:
+                    for patch in reversed(self._patches):
+                        patch.restore()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def stats(self):
+        """
+        Returns call statistics for each patched target whose value is
+        callable.
+
+        :return: dictionary mapping each patched name to its statistics
+        :rtype: dict[str, PatchCallStats]
+        """
+        return dict((patch.name, patch.stats) for patch in self._patches
+                    if patch.stats is not None)
+
+    def reset_stats(self):
+        """
+        Resets the call statistics of every patched target.
+        """
+        for patch in self._patches:
+            if patch.stats is not None:
+                patch.stats.reset()
+
+
+class PatchCallStats(object):
+    """
+    Statistics for calls made to a single patched target.
+    """
+    def __init__(self):
+        # calls to the patched target may be made on several threads at once
+        self._lock = threading.Lock()
+        self._call_count = 0
+        self._total_seconds = 0.0
+
+    @property
+    def call_count(self):
+        """
+        :property: Number of calls made to the patched target
+        :rtype: int
+        """
+        return self._call_count
+
+    @property
+    def total_duration_in_millis(self):
+        """
+        :property: Total time spent in calls to the patched target, in
+            milliseconds
+        :rtype: float
+        """
+        return 1000 * self._total_seconds
+
+    def record(self, seconds):
+        with self._lock:
+            self._call_count += 1
+            self._total_seconds += seconds
+
+    def reset(self):
+        with self._lock:
+            self._call_count = 0
+            self._total_seconds = 0.0
+
+    def __str__(self):
+        return "{{calls={c}; duration={d:.3f} milliseconds}}"\
+            .format(c=self._call_count, d=self.total_duration_in_millis)
+
+
+class _ResolvedPatch(object):
+    def __init__(self, name, value):
+        self.name = name
+        target_path, self._attribute = _split_target(name)
+        self._target = _import_target(target_path)
+        if callable(value) and not inspect.isclass(value):
+            self.stats = PatchCallStats()
+            self._value = _wrap_callable(name, value, self.stats)
+        else:
+            self.stats = None
+            self._value = value
+        self._original = _MISSING
+
+    def apply(self):
+        target_dict = getattr(self._target, "__dict__", None)
+        if target_dict is not None:
+            self._original = target_dict.get(self._attribute, _MISSING)
+        else:
+            self._original = getattr(self._target, self._attribute, _MISSING)
+        setattr(self._target, self._attribute, self._value)
+
+    def restore(self):
+        if self._original is _MISSING:
+            delattr(self._target, self._attribute)
+        else:
+            setattr(self._target, self._attribute, self._original)
+        self._original = _MISSING
+
+
+def resolve(name):
+    """
+    Returns the object currently found at the dotted path ``name``, importing
+    modules along the path as needed.
+
+    :param str name: dotted path, e.g. ``"math.sqrt"``
+    :rtype: any
+    """
+    target_path, attribute = _split_target(name)
+    return getattr(_import_target(target_path), attribute)
+
+
+def _split_target(name):
+    try:
+        target_path, attribute = name.rsplit(".", 1)
+    except (TypeError, ValueError, AttributeError):
+        raise TypeError("Need a valid target to patch. You supplied: {}"
+                        .format(repr(name)))
+    return target_path, attribute
+
+
+def _import_target(path):
+    components = path.split(".")
+    import_path = components.pop(0)
+    thing = __import__(import_path)
+    for component in components:
+        import_path += "." + component
+        try:
+            thing = getattr(thing, component)
+        except AttributeError:
+            __import__(import_path)
+            thing = getattr(thing, component)
+    return thing
+
+
+def _wrap_callable(name, value, stats):
+    if inspect.isroutine(value):
+        def wrapper(*args, **kwargs):
+            return _call(name, value, stats, args, kwargs)
+        wrapper.__name__ = getattr(value, "__name__", "wrapper")
+        wrapper.__doc__ = getattr(value, "__doc__", None)
+        wrapper.__wrapped__ = value
+        return wrapper
+    return _CallableProxy(name, value, stats)
+
+
+def _call(name, value, stats, args, kwargs):
+    tracer = tracing.active_tracer()
+    start = timeit.default_timer()
+    span = None if tracer is None \
+        else tracer.start_span(name, category="patch", start=start)
+    try:
+        return value(*args, **kwargs)
+    finally:
+        end = timeit.default_timer()
+        stats.record(end - start)
+        if span is not None:
+            tracer.end_span(span, end=end)
+
+
+class _CallableProxy(object):
+    """
+    Wraps a callable object (e.g. a ``mock.MagicMock``) so that calls are
+    recorded, while attribute access is forwarded to the wrapped object.
+    """
+    def __init__(self, name, value, stats):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_value", value)
+        object.__setattr__(self, "_stats", stats)
+
+    def __call__(self, *args, **kwargs):
+        return _call(self._name, self._value, self._stats, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._value, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._value, name, value)
+
+    def __repr__(self):
+        return repr(self._value)
@@ -0,0 +1,139 @@
+"""
+Serialization of events and responses as the AWS Lambda Python runtime does
+it, with Lambda's payload size limits.
+
+By default, :func:`run_lambda <run_lambda.run_lambda>` passes the event to
+the Lambda function, and returns its response, as Python objects. With
+``serialize=True``, it instead
+
+- encodes the event as JSON, and rejects it with a
+  ``RequestEntityTooLargeException`` if it is larger than the limit of the
+  invocation type (6 MB for synchronous invocations, 256 KB for asynchronous
+  ones); otherwise the function receives the event decoded from JSON, as it
+  would in Lambda (e.g. tuples become lists)
+- encodes the response as JSON (``bytes`` responses are passed through), and
+  fails the call with a ``Runtime.MarshalError`` if the response cannot be
+  encoded, or a ``Function.ResponseSizeTooLarge`` error if it is larger than
+  6 MB; otherwise the call's value is the response decoded from JSON, as the
+  caller would receive it
+
+Encoding the response happens after the function returns but, as in Lambda,
+counts towards the call's duration; the time it takes is reported as the
+summary's ``serialization_duration_in_millis``, and the size of the encoded
+response as its ``response_size_in_bytes``.
+"""
+import decimal
+import json
+
+REQUEST_RESPONSE = "RequestResponse"
+EVENT = "Event"
+
+# maximum sizes of invocation requests, by invocation type
+REQUEST_LIMITS_IN_BYTES = {REQUEST_RESPONSE: 6291456, EVENT: 262144}
+RESPONSE_LIMIT_IN_BYTES = 6291556
+
+
+class LambdaError(Exception):
+    """
+    An error reported by Lambda itself, rather than raised by the Lambda
+    function, e.g. because a payload is too large.
+    """
+    def __init__(self, error_type, error_message):
+        super(LambdaError, self).__init__(error_message)
+        self._error_type = error_type
+        self._error_message = error_message
+
+    @property
+    def error_type(self):
+        """
+        :property: Type of error, e.g. ``Function.ResponseSizeTooLarge``
+        :rtype: str
+        """
+        return self._error_type
+
+    @property
+    def error_message(self):
+        """
+        :property: Message of error
+        :rtype: str
+        """
+        return self._error_message
+
+    def __reduce__(self):
+        return LambdaError, (self._error_type, self._error_message)
+
+    def __str__(self):
+        return "{t}: {m}".format(t=self._error_type, m=self._error_message)
+
+
+def encode_event(event, invocation_type=REQUEST_RESPONSE):
+    """
+    :param event: event data
+    :param str invocation_type: ``REQUEST_RESPONSE`` or ``EVENT``
+    :return: the invocation request for ``event``
+    :rtype: bytes
+    :raises LambdaError: if the event cannot be encoded, or is too large
+    """
+    try:
+        request = json.dumps(event).encode("utf-8")
+    except (TypeError, ValueError):
+        raise LambdaError("InvalidRequestContentException",
+                          "Could not parse request body into json")
+    limit = REQUEST_LIMITS_IN_BYTES[invocation_type]
+    if len(request) > limit:
+        raise LambdaError("RequestEntityTooLargeException",
+                          "Request must be smaller than {} bytes for the "
+                          "InvokeFunction operation".format(limit))
+    return request
+
+
+def decode_event(request):
+    """
+    :param bytes request: invocation request
+    :return: the event, as the Lambda function receives it
+    """
+    return json.loads(request.decode("utf-8"))
+
+
+def encode_response(value):
+    """
+    :param value: value returned by the Lambda function
+    :return: the response, as the runtime sends it
+    :rtype: bytes
+    :raises LambdaError: if the value cannot be encoded, or is too large
+    """
+    if isinstance(value, bytes):
+        response = value
+    else:
+        try:
+            response = _ENCODER.encode(value).encode("utf-8")
+        except Exception as e:
+            raise LambdaError("Runtime.MarshalError",
+                              "Unable to marshal response: {}".format(e))
+    if len(response) > RESPONSE_LIMIT_IN_BYTES:
+        raise LambdaError("Function.ResponseSizeTooLarge",
+                          "Response payload size exceeded maximum allowed payload "
+                          "size ({} bytes).".format(RESPONSE_LIMIT_IN_BYTES))
+    return response
+
+
+def decode_response(response):
+    """
+    :param bytes response: response, as the runtime sends it
+    :return: the value the caller receives
+    """
+    try:
+        return json.loads(response.decode("utf-8"))
+    except ValueError:  # a bytes response that is not JSON
+        return response
+
+
+class _Encoder(json.JSONEncoder):
+    # like the runtime's encoder, which also accepts decimals
+    def default(self, value):
+        if isinstance(value, decimal.Decimal):
+            return float(value)
+        return super(_Encoder, self).default(value)
+
+
+_ENCODER = _Encoder()
@@ -0,0 +1,334 @@
+"""
+A local runner for workflows that chain several Lambda functions.
+
+A workflow is built from steps: a :class:`Task` runs a Lambda function, a
+:class:`Sequence` feeds the output of each step to the next, a
+:class:`Parallel` runs branches on the same input, and a :class:`Map` runs a
+step on every item of its input::
+
+    workflow = Sequence("orders", [
+        Task("split", splitter.handler),
+        Map("process", Task("process", processor.handler), max_concurrency=32),
+        Task("reduce", reducer.handler),
+    ])
+    result = Pipeline(workflow, max_concurrency=32).run(event)
+    result.display()
+
+Unlike in AWS Step Functions, outputs are passed between steps as they are,
+without being serialized or copied, so handlers should not mutate their
+events. Map items run on a worker pool shared by the whole pipeline; each
+:class:`Map` runs at most ``max_concurrency`` of its items at once.
+
+Each run of a step is timed. The :meth:`critical path
+<PipelineResult.critical_path>` of a run is the chain of tasks that determined
+its total duration, and its slowest task is the pipeline's bottleneck.
+"""
+import sys
+import threading
+import timeit
+from multiprocessing.pool import ThreadPool
+
+from run_lambda import call
+
+
+class StepFailed(Exception):
+    """
+    Raised when a task of a pipeline raises an exception or times out.
+    """
+    def __init__(self, name, result):
+        """
+        :param str name: name of failed task
+        :param LambdaResult result: result of failed call
+        """
+        Exception.__init__(self, "Step {n} {w}".format(
+            n=name, w="timed out" if result.timed_out
+            else "raised {}".format(repr(result.exception))))
+        self.name = name
+        self.result = result
+
+
+class StepRun(object):
+    """
+    A timed run of a step.
+    """
+    def __init__(self, step, start, end, children=None, result=None):
+        self.step = step
+        self.start = start
+        self.end = end
+        self.children = children or []
+        self.result = result
+
+    @property
+    def name(self):
+        return self.step.name
+
+    @property
+    def duration_in_millis(self):
+        return 1000 * (self.end - self.start)
+
+    def critical_path(self):
+        """
+        :return: the task runs that determined the duration of this run, in
+            order
+        :rtype: list[StepRun]
+        """
+        if not self.children:
+            return [self]
+        if isinstance(self.step, Sequence):
+            return [run for child in self.children for run in child.critical_path()]
+        slowest = max(self.children, key=lambda child: child.end)
+        return slowest.critical_path()
+
+    def walk(self):
+        """
+        :return: this run and all runs nested in it
+        :rtype: iterator of StepRun
+        """
+        yield self
+        for child in self.children:
+            for run in child.walk():
+                yield run
+
+
+class Task(object):
+    def __init__(self, name, handler, timeout_in_seconds=None, patches=None):
+        """
+        :param str name: name of step
+        :param function handler: Lambda function to call with the step's input
+        :param int timeout_in_seconds: timeout of each call, in seconds
+        :param patches: patches applied to each call, as accepted by
+            :func:`run_lambda <run_lambda.run_lambda>`
+        """
+        self.name = name
+        self._handler = handler
+        self._timeout_in_seconds = timeout_in_seconds
+        self._patches = patches
+
+    def execute(self, value, pipeline):
+        start = timeit.default_timer()
+        result = call.run_lambda(self._handler, value,
+                                 timeout_in_seconds=self._timeout_in_seconds,
+                                 patches=self._patches,
+                                 listeners=pipeline.listeners)
+        end = timeit.default_timer()
+        if result.timed_out or result.exception is not None:
+            raise StepFailed(self.name, result)
+        return result.value, StepRun(self, start, end, result=result)
+
+
+class Sequence(object):
+    def __init__(self, name, steps):
+        """
+        :param str name: name of step
+        :param list steps: steps to run one after another, each on the output
+            of the previous one
+        """
+        self.name = name
+        self._steps = steps
+
+    def execute(self, value, pipeline):
+        start = timeit.default_timer()
+        runs = []
+        for step in self._steps:
+            value, run = step.execute(value, pipeline)
+            runs.append(run)
+        return value, StepRun(self, start, timeit.default_timer(), runs)
+
+
+class Parallel(object):
+    def __init__(self, name, branches):
+        """
+        :param str name: name of step
+        :param list branches: steps to run concurrently, each on the step's
+            input. The step's output is the list of their outputs.
+        """
+        self.name = name
+        self._branches = branches
+
+    def execute(self, value, pipeline):
+        start = timeit.default_timer()
+        outcomes = [None] * len(self._branches)
+        in_pool = pipeline.in_pool
+
+        def run_branch(index):
+            pipeline.in_pool = in_pool
+            try:
+                outcomes[index] = (True, self._branches[index].execute(value, pipeline))
+            except BaseException as e:
+                outcomes[index] = (False, e)
+
+        threads = [threading.Thread(target=run_branch, args=(index,))
+                   for index in range(len(self._branches))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for succeeded, outcome in outcomes:
+            if not succeeded:
+                raise outcome
+        return ([output for _, (output, _) in outcomes],
+                StepRun(self, start, timeit.default_timer(),
+                        [run for _, (_, run) in outcomes]))
+
+
+class Map(object):
+    def __init__(self, name, step, max_concurrency=None, items=None):
+        """
+        :param str name: name of step
+        :param step: step to run on each item
+        :param int max_concurrency: maximum number of items run at once. If
+            not provided, the pipeline's worker pool is the only limit.
+        :param function items: function taking the step's input and returning
+            the items to map over. Defaults to the input itself.
+        """
+        self.name = name
+        self._step = step
+        self._max_concurrency = max_concurrency
+        self._items = items
+
+    def execute(self, value, pipeline):
+        start = timeit.default_timer()
+        items = list(value if self._items is None else self._items(value))
+        semaphore = None if self._max_concurrency is None \
+            else threading.BoundedSemaphore(self._max_concurrency)
+
+        def run_item(item):
+            if semaphore is None:
+                return self._step.execute(item, pipeline)
+            with semaphore:
+                return self._step.execute(item, pipeline)
+
+        outcomes = pipeline.map(run_item, items)
+        return ([output for output, _ in outcomes],
+                StepRun(self, start, timeit.default_timer(),
+                        [run for _, run in outcomes]))
+
+
+class Pipeline(object):
+    def __init__(self, step, max_concurrency=8, listeners=None):
+        """
+        :param step: root step of the workflow
+        :param int max_concurrency: number of threads of the worker pool that
+            runs map items
+        :param list listeners: listeners called after each task's call, as
+            accepted by :func:`run_lambda <run_lambda.run_lambda>`
+        """
+        self._step = step
+        self._max_concurrency = max_concurrency
+        self.listeners = listeners
+        self._pool = None
+        self._local = threading.local()
+
+    def run(self, event):
+        """
+        Runs the workflow on ``event``.
+
+        :raises StepFailed: if a task fails
+        :rtype: PipelineResult
+        """
+        self._pool = ThreadPool(self._max_concurrency)
+        try:
+            value, run = self._step.execute(event, self)
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        return PipelineResult(value, run)
+
+    def map(self, function, items):
+        """
+        Calls ``function`` on each item on the worker pool, or inline when
+        called from a pool thread (for maps nested in maps), so that pool
+        threads never wait on each other.
+        """
+        if self.in_pool:
+            return [function(item) for item in items]
+
+        def run_in_pool(item):
+            self.in_pool = True
+            return function(item)
+        return self._pool.map(run_in_pool, items, chunksize=1)
+
+    @property
+    def in_pool(self):
+        """
+        :property: Whether the current thread runs work of the worker pool
+        :rtype: bool
+        """
+        return getattr(self._local, "in_pool", False)
+
+    @in_pool.setter
+    def in_pool(self, value):
+        self._local.in_pool = value
+
+
+class PipelineResult(object):
+    """
+    The output of a pipeline run, and its timings.
+    """
+    def __init__(self, value, run):
+        self._value = value
+        self._run = run
+
+    @property
+    def value(self):
+        """
+        :property: Output of the workflow
+        :rtype: any
+        """
+        return self._value
+
+    @property
+    def run(self):
+        """
+        :property: Timed run of the root step
+        :rtype: StepRun
+        """
+        return self._run
+
+    @property
+    def duration_in_millis(self):
+        return self._run.duration_in_millis
+
+    def critical_path(self):
+        """
+        :return: the task runs that determined the pipeline's duration
+        :rtype: list[StepRun]
+        """
+        return self._run.critical_path()
+
+    def bottleneck(self):
+        """
+        :return: the slowest task run on the critical path
+        :rtype: StepRun
+        """
+        return max(self.critical_path(), key=lambda run: run.duration_in_millis)
+
+    def step_statistics(self):
+        """
+        :return: dictionary mapping each step name to its number of runs,
+            total duration and maximum duration, in milliseconds
+        :rtype: dict[str, (int, float, float)]
+        """
+        statistics = {}
+        for run in self._run.walk():
+            count, total, maximum = statistics.get(run.name, (0, 0.0, 0.0))
+            statistics[run.name] = (count + 1, total + run.duration_in_millis,
+                                    max(maximum, run.duration_in_millis))
+        return statistics
+
+    def display(self, outfile=None):
+        if outfile is None:
+            outfile = sys.stdout
+        outfile.write("Duration: {:.1f} ms\n\n".format(self.duration_in_millis))
+        outfile.write("{:<30}{:>8}{:>14}{:>14}{:>14}\n".format(
+            "step", "runs", "total (ms)", "mean (ms)", "max (ms)"))
+        for name, (count, total, maximum) in sorted(self.step_statistics().items()):
+            outfile.write("{:<30}{:>8}{:>14.1f}{:>14.1f}{:>14.1f}\n".format(
+                name, count, total, total / count, maximum))
+        outfile.write("\nCritical path:\n")
+        bottleneck = self.bottleneck()
+        for run in self.critical_path():
+            outfile.write("  {n:<28}{d:>14.1f} ms{b}\n".format(
+                n=run.name, d=run.duration_in_millis,
+                b="  <- bottleneck" if run is bottleneck else ""))
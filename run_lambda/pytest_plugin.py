@@ -0,0 +1,301 @@
+"""
+A pytest plugin for testing Lambda functions.
+
+The plugin is registered automatically when run_lambda is installed. It
+provides the following fixtures:
+
+* ``lambda_pool``: a session-scoped :class:`WarmPool`, which keeps one warm
+  :class:`Container <run_lambda.container.Container>` per handler, so that a
+  handler's module is imported once per session rather than once per test.
+* ``lambda_invoke``: invokes a handler on its warm container, applying the
+  timeout of the test's ``lambda_timeout`` marker::
+
+      @pytest.mark.lambda_timeout(3)
+      def test_square_root(lambda_invoke):
+          result = lambda_invoke("my_function.py", {"number": 4})
+          assert_succeeded(result, 2.0)
+
+* ``lambda_context``: a factory for context objects, taking the fields to
+  set as keyword arguments, e.g.
+  ``lambda_context(function_name="orders", memory_limit_in_mb="512")``.
+
+and assertion helpers for :class:`LambdaResult <run_lambda.LambdaResult>`
+objects (:func:`assert_succeeded`, :func:`assert_raised`, etc.), whose
+failure messages include the call's log.
+
+Tests marked ``lambda_timeout(seconds, isolated=True)`` run in a forked
+process, which is killed if the test does not complete within ``seconds``
+(plus a second of grace). This protects the session from handlers that a
+timeout cannot interrupt, e.g. ones blocked in native code. Containers warmed
+up in an isolated test are discarded along with its process.
+
+Under pytest-xdist, each worker is a separate process with its own pool;
+:attr:`WarmPool.worker_id` identifies the worker.
+"""
+import os
+import pickle
+import select
+import signal
+import threading
+import time
+import traceback
+
+import pytest
+import six
+
+from run_lambda import container as container_module
+from run_lambda import context as context_module
+
+_MISSING = object()
+_GRACE_PERIOD_IN_SECONDS = 1
+
+
+class WarmPool(object):
+    """
+    A cache of warm containers, one per handler.
+    """
+    def __init__(self, worker_id="master"):
+        """
+        :param str worker_id: id of the pytest-xdist worker owning the pool,
+            or ``"master"`` when tests are not distributed
+        """
+        self._worker_id = worker_id
+        self._containers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def worker_id(self):
+        """
+        :property: Id of the pytest-xdist worker owning the pool
+        :rtype: str
+        """
+        return self._worker_id
+
+    def container(self, filename, function_name="handler", layers=None):
+        """
+        :return: the pool's container for the handler, which is initialized
+            on its first invocation
+        :rtype: Container
+        """
+        key = (os.path.abspath(filename), function_name, tuple(layers or ()))
+        with self._lock:
+            container = self._containers.get(key)
+            if container is None:
+                container = container_module.Container.of_file(
+                    filename, function_name, layers=layers)
+                self._containers[key] = container
+            return container
+
+    def invoke(self, filename, event, function_name="handler", layers=None,
+               **kwargs):
+        """
+        Invokes the handler on its warm container. Additional keyword
+        arguments are passed through to
+        :meth:`Container.invoke <run_lambda.container.Container.invoke>`.
+
+        :rtype: LambdaResult
+        """
+        return self.container(filename, function_name, layers).invoke(event, **kwargs)
+
+    def clear(self):
+        """
+        Discards all containers, so that the next invocation of each handler
+        is a cold start.
+        """
+        with self._lock:
+            self._containers.clear()
+
+
+def make_context(**fields):
+    """
+    :param fields: values of context fields, by name, as accepted by the
+        ``set_`` methods of
+        :class:`MockLambdaContext.Builder <run_lambda.MockLambdaContext.Builder>`
+    :rtype: MockLambdaContext
+    """
+    builder = context_module.MockLambdaContext.Builder()
+    for name, value in fields.items():
+        setter = getattr(builder, "set_" + name, None)
+        if setter is None:
+            raise TypeError("Unknown context field: {}".format(name))
+        setter(value)
+    return builder.build()
+
+
+def assert_succeeded(result, value=_MISSING):
+    """
+    Asserts that the call returned without raising an exception or timing
+    out, and, if ``value`` is provided, that it returned ``value``.
+    """
+    if result.timed_out:
+        _fail(result, "Call timed out")
+    if result.exception is not None:
+        _fail(result, "Call raised {}".format(repr(result.exception)))
+    if value is not _MISSING and result.value != value:
+        _fail(result, "Call returned {a}, expected {e}".format(
+            a=repr(result.value), e=repr(value)))
+
+
+def assert_raised(result, exception_type=Exception):
+    """
+    Asserts that the call raised an instance of ``exception_type``.
+    """
+    if not isinstance(result.exception, exception_type):
+        _fail(result, "Call {o}, expected it to raise {e}".format(
+            o=_outcome(result), e=exception_type.__name__))
+
+
+def assert_timed_out(result):
+    """
+    Asserts that the call timed out.
+    """
+    if not result.timed_out:
+        _fail(result, "Call {}, expected it to time out".format(_outcome(result)))
+
+
+def assert_duration_below(result, duration_in_millis):
+    """
+    Asserts that the call took less than ``duration_in_millis`` milliseconds.
+    """
+    actual = result.summary.duration_in_millis
+    if actual >= duration_in_millis:
+        _fail(result, "Call took {a:.1f} ms, expected less than {e} ms".format(
+            a=actual, e=duration_in_millis))
+
+
+def assert_memory_below(result, memory_in_mb):
+    """
+    Asserts that the call used less than ``memory_in_mb`` megabytes.
+    """
+    actual = result.summary.max_memory_used_in_mb
+    if actual >= memory_in_mb:
+        _fail(result, "Call used {a} MB, expected less than {e} MB".format(
+            a=actual, e=memory_in_mb))
+
+
+def assert_log_contains(result, text):
+    """
+    Asserts that the call's log contains ``text``.
+    """
+    if text not in result.summary.log:
+        _fail(result, "Call log does not contain {}".format(repr(text)))
+
+
+def _outcome(result):
+    if result.timed_out:
+        return "timed out"
+    if result.exception is not None:
+        return "raised {}".format(repr(result.exception))
+    return "returned {}".format(repr(result.value))
+
+
+def _fail(result, message):
+    log = result.summary.log
+    if log:
+        message = "{m}\nLog:\n{l}".format(m=message, l=log.rstrip("\n"))
+    raise AssertionError(message)
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "lambda_timeout(seconds, isolated=False): invoke Lambda functions with a "
+        "timeout of seconds; if isolated, run the test in a forked process that "
+        "is killed if the test runs for too long")
+
+
+@pytest.fixture(scope="session")
+def lambda_pool(request):
+    workerinput = getattr(request.config, "workerinput", None)
+    return WarmPool(worker_id="master" if workerinput is None else workerinput["workerid"])
+
+
+@pytest.fixture
+def lambda_context():
+    return make_context
+
+
+@pytest.fixture
+def lambda_invoke(request, lambda_pool):
+    marker = request.node.get_closest_marker("lambda_timeout")
+    default_timeout_in_seconds = None if marker is None else _marker_timeout(marker)
+
+    def invoke(filename, event, function_name="handler", layers=None, **kwargs):
+        kwargs.setdefault("timeout_in_seconds", default_timeout_in_seconds)
+        return lambda_pool.invoke(filename, event, function_name, layers, **kwargs)
+    return invoke
+
+
+def _marker_timeout(marker):
+    if marker.args:
+        return marker.args[0]
+    return marker.kwargs["seconds"]
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    marker = pyfuncitem.get_closest_marker("lambda_timeout")
+    if marker is None or not marker.kwargs.get("isolated") or not hasattr(os, "fork"):
+        return None
+    __tracebackhide__ = True
+    funcargs = dict((name, pyfuncitem.funcargs[name])
+                    for name in pyfuncitem._fixtureinfo.argnames)
+    _run_isolated(pyfuncitem.obj, funcargs,
+                  _marker_timeout(marker) + _GRACE_PERIOD_IN_SECONDS)
+    return True
+
+
+def _run_isolated(function, funcargs, limit_in_seconds):
+    __tracebackhide__ = True
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child
+        os.close(read_fd)
+        try:
+            function(**funcargs)
+            outcome = None
+        except BaseException as e:
+            # the traceback does not survive pickling, so it is sent as text
+            outcome = _picklable_exception(e), traceback.format_exc()
+        with os.fdopen(write_fd, "wb") as pipe:
+            pickle.dump(outcome, pipe)
+        os._exit(0)
+
+    os.close(write_fd)
+    data = b""
+    deadline = time.time() + limit_in_seconds
+    with os.fdopen(read_fd, "rb") as pipe:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([pipe], [], [], remaining)[0]:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                pytest.fail("Isolated test did not complete within {} seconds"
+                            .format(limit_in_seconds), pytrace=False)
+            chunk = os.read(pipe.fileno(), 65536)
+            if not chunk:
+                break
+            data += chunk
+    _, status = os.waitpid(pid, 0)
+    if not data:
+        pytest.fail("Isolated test process exited with status {}".format(status),
+                    pytrace=False)
+    outcome = pickle.loads(data)
+    if outcome is not None:
+        exception, text = outcome
+        six.raise_from(exception, _IsolatedTraceback(text))
+
+
+class _IsolatedTraceback(Exception):
+    # shown as the cause of an exception raised by an isolated test, with the
+    # traceback it had in the test's process
+    def __str__(self):
+        return "\n\n" + self.args[0]
+
+
+def _picklable_exception(e):
+    try:
+        pickle.loads(pickle.dumps(e))
+        return e
+    except Exception:
+        return AssertionError("{t}: {e}".format(t=type(e).__name__, e=e))
@@ -0,0 +1,528 @@
+"""
+The ``run_lambda replay`` command, which runs a corpus of events through a
+warm container and writes a self-contained result file, and the
+``run_lambda merge`` command, which combines result files into one report.
+
+A large corpus can be split into shards with ``--shard INDEX/COUNT``; each
+event is assigned to a shard by a hash of its key (see
+:class:`Shard <run_lambda.corpus.Shard>`), so every process, on one machine or
+on many, agrees on the assignment without coordinating. Each shard's result
+file holds the counts of its invocations and outcomes, its total resource
+usage, and histograms of its call durations and memory usage. Histograms are
+merged bucket by bucket, so the percentiles of a merged report are those of
+all of the calls, not averages of per-shard percentiles::
+
+    $ for i in 1 2 3 4; do
+    >   run_lambda replay my_function.py events/ --shard $i/4 -o results/$i.json &
+    > done; wait
+    $ run_lambda merge results/
+
+Result files are written atomically, so shards running on machines that only
+share a file system can write to the same directory, and a merge never reads
+a partially written file. A merge reports any shards that are missing.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import timeit
+
+import run_lambda.container as container_module
+import run_lambda.context as context_module
+import run_lambda.corpus as corpus
+import run_lambda.dashboard as dashboard
+import run_lambda.resultlog as resultlog
+import run_lambda.usage as usage_module
+
+FORMAT = "run_lambda-replay-1"
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+# maximum number of failed events whose keys are kept in a result
+_MAX_FAILURES = 1000
+
+
+class LogHistogram(object):
+    """
+    A histogram with logarithmically sized buckets, from which percentiles
+    can be estimated to within ``relative_accuracy`` of their true value.
+    Histograms with the same accuracy are merged exactly: a merged histogram
+    is the same as one that observed all of the values of the histograms
+    merged into it.
+    """
+    def __init__(self, relative_accuracy=0.01):
+        """
+        :param float relative_accuracy: maximum relative error of estimated
+            percentiles, between 0 and 1
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # bucket index -> count; bucket i holds values in (gamma^(i-1), gamma^i]
+        self.counts = {}
+        # count of values that are zero or less
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        if value > 0:
+            index = int(math.ceil(math.log(value) / self._log_gamma))
+            self.counts[index] = self.counts.get(index, 0) + 1
+        else:
+            self.zero_count += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def add(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge histograms of different accuracies")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    @property
+    def mean(self):
+        """
+        :property: Mean of the observed values, or ``None`` if there are none
+        :rtype: float
+        """
+        return None if self.count == 0 else self.sum / self.count
+
+    def percentile(self, percent):
+        """
+        :param float percent: percentile to estimate, between 0 and 100
+        :return: estimate of the ``percent``-th percentile of the observed
+            values, or ``None`` if there are none
+        :rtype: float
+        """
+        if self.count == 0:
+            return None
+        rank = percent / 100.0 * (self.count - 1)
+        if rank < self.zero_count:
+            return max(self.min, 0.0)
+        seen = self.zero_count
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                estimate = 2 * self._gamma ** index / (self._gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def to_json(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "counts": dict((str(index), count) for index, count in self.counts.items()),
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @staticmethod
+    def of_json(json):
+        histogram = LogHistogram(json["relative_accuracy"])
+        histogram.counts = dict((int(index), count) for index, count in json["counts"].items())
+        histogram.zero_count = json["zero_count"]
+        histogram.count = json["count"]
+        histogram.sum = json["sum"]
+        histogram.min = json["min"]
+        histogram.max = json["max"]
+        return histogram
+
+
+class ReplayResult(object):
+    """
+    Aggregate results of running a corpus of events, or some shards of it.
+    """
+    def __init__(self, function_name, filename, events, shards):
+        """
+        :param str function_name: name of the handler function
+        :param str filename: file containing the Lambda function
+        :param str events: path of the corpus of events
+        :param list[Shard] shards: shards of the corpus covered
+        """
+        self.function_name = function_name
+        self.filename = filename
+        self.events = events
+        self.shards = list(shards)
+        self.invocations = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cold_starts = 0
+        self.elapsed_in_seconds = 0.0
+        self.duration = LogHistogram()
+        self.memory = LogHistogram()
+        self.init_duration = LogHistogram()
+        self.usage = usage_module.UsageStatistics()
+        # (key, outcome) pairs of up to _MAX_FAILURES failed events
+        self.failures = []
+
+    @property
+    def shard_count(self):
+        """
+        :property: Number of shards the corpus is split into
+        :rtype: int
+        """
+        return self.shards[0].count
+
+    def missing_shards(self):
+        """
+        :return: shards of the corpus that are not covered
+        :rtype: list[Shard]
+        """
+        covered = set(self.shards)
+        return [corpus.Shard(index, self.shard_count)
+                for index in range(1, self.shard_count + 1)
+                if corpus.Shard(index, self.shard_count) not in covered]
+
+    def record(self, key, result):
+        """
+        :param str key: key of the event
+        :param LambdaResult result: result of the call
+        """
+        summary = result.summary
+        self.invocations += 1
+        outcome = None
+        if result.timed_out:
+            self.timeouts += 1
+            outcome = "timed out"
+        elif result.exception is not None:
+            self.errors += 1
+            outcome = "raised {t}: {e}".format(t=type(result.exception).__name__,
+                                              e=result.exception)
+        if outcome is not None and len(self.failures) < _MAX_FAILURES:
+            self.failures.append((key, outcome))
+        if summary.init_duration_in_millis is not None:
+            self.cold_starts += 1
+            self.init_duration.observe(summary.init_duration_in_millis)
+        self.duration.observe(summary.duration_in_millis)
+        self.memory.observe(summary.max_memory_used_in_mb)
+        if summary.usage is not None:
+            self.usage.observe(summary.usage, summary.duration_in_millis)
+
+    def add(self, other):
+        """
+        Merges the results of other shards of the same corpus into these.
+
+        :param ReplayResult other:
+        :raises ValueError: if ``other`` is not of the same function, file,
+            corpus and sharding, or if it covers any of the same shards
+        """
+        for name, description in [("function_name", "functions"),
+                                  ("filename", "files"), ("events", "corpora")]:
+            if getattr(other, name) != getattr(self, name):
+                raise ValueError("Cannot merge results of different {d}: {a}, {b}".format(
+                    d=description, a=getattr(self, name), b=getattr(other, name)))
+        if other.shard_count != self.shard_count:
+            raise ValueError("Cannot merge results of {a} and {b} shards"
+                             .format(a=self.shard_count, b=other.shard_count))
+        duplicates = set(self.shards) & set(other.shards)
+        if duplicates:
+            raise ValueError("Shard(s) covered more than once: {}".format(
+                ", ".join(str(shard) for shard in _sorted_shards(duplicates))))
+        self.shards = _sorted_shards(self.shards + other.shards)
+        self.invocations += other.invocations
+        self.errors += other.errors
+        self.timeouts += other.timeouts
+        self.cold_starts += other.cold_starts
+        self.elapsed_in_seconds = max(self.elapsed_in_seconds, other.elapsed_in_seconds)
+        self.duration.add(other.duration)
+        self.memory.add(other.memory)
+        self.init_duration.add(other.init_duration)
+        self.usage.add(other.usage)
+        self.failures = (self.failures + other.failures)[:_MAX_FAILURES]
+
+    def to_json(self):
+        return {
+            "format": FORMAT,
+            "function_name": self.function_name,
+            "filename": self.filename,
+            "events": self.events,
+            "shards": [str(shard) for shard in self.shards],
+            "invocations": self.invocations,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "cold_starts": self.cold_starts,
+            "elapsed_in_seconds": self.elapsed_in_seconds,
+            "duration_in_millis": self.duration.to_json(),
+            "max_memory_used_in_mb": self.memory.to_json(),
+            "init_duration_in_millis": self.init_duration.to_json(),
+            "usage": self.usage.to_json(),
+            "failures": [{"key": key, "outcome": outcome} for key, outcome in self.failures],
+        }
+
+    @staticmethod
+    def of_json(json):
+        if json.get("format") != FORMAT:
+            raise ValueError("Not a replay result")
+        result = ReplayResult(json["function_name"], json["filename"], json["events"],
+                              [corpus.Shard.parse(shard) for shard in json["shards"]])
+        result.invocations = json["invocations"]
+        result.errors = json["errors"]
+        result.timeouts = json["timeouts"]
+        result.cold_starts = json["cold_starts"]
+        result.elapsed_in_seconds = json["elapsed_in_seconds"]
+        result.duration = LogHistogram.of_json(json["duration_in_millis"])
+        result.memory = LogHistogram.of_json(json["max_memory_used_in_mb"])
+        result.init_duration = LogHistogram.of_json(json["init_duration_in_millis"])
+        result.usage = usage_module.UsageStatistics.of_json(json["usage"])
+        result.failures = [(failure["key"], failure["outcome"]) for failure in json["failures"]]
+        return result
+
+    @staticmethod
+    def load(filename):
+        """
+        :param str filename: name of a result file
+        :rtype: ReplayResult
+        """
+        with open(filename) as result_file:
+            try:
+                return ReplayResult.of_json(json.load(result_file))
+            except (ValueError, KeyError) as e:
+                raise ValueError("{f}: {e}".format(f=filename, e=e))
+
+    def write(self, filename):
+        """
+        Writes the result to ``filename``, atomically.
+
+        :param str filename:
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, temp_filename = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump(self.to_json(), temp_file, indent=2, sort_keys=True)
+        os.rename(temp_filename, filename)
+
+    def display(self, outfile=None):
+        if outfile is None:
+            outfile = sys.stdout
+        missing = self.missing_shards()
+        if self.shard_count > 1:
+            outfile.write("Shards: {c} of {n}\n".format(c=len(self.shards), n=self.shard_count))
+        if missing:
+            outfile.write("Missing shards: {}\n".format(
+                ", ".join(str(shard) for shard in missing)))
+        outfile.write("Invocations: {i}\nErrors: {e}\nTimeouts: {t}\nCold starts: {c}\n"
+                      .format(i=self.invocations, e=self.errors, t=self.timeouts,
+                              c=self.cold_starts))
+        if self.invocations == 0:
+            return
+        outfile.write("\n{:<22}".format("") + "".join(
+            "{:>10}".format("p{:g}".format(percent)) for percent in PERCENTILES)
+            + "{:>10}{:>10}\n".format("max", "mean"))
+        rows = [("Duration (ms)", self.duration), ("Max memory (MB)", self.memory)]
+        if self.init_duration.count:
+            rows.append(("Init duration (ms)", self.init_duration))
+        for label, histogram in rows:
+            outfile.write("{:<22}".format(label) + "".join(
+                "{:>10.1f}".format(histogram.percentile(percent)) for percent in PERCENTILES)
+                + "{:>10.1f}{:>10.1f}\n".format(histogram.max, histogram.mean))
+        outfile.write("\nResource usage:\n")
+        self.usage.display(outfile)
+        if self.failures:
+            failure_count = self.errors + self.timeouts
+            outfile.write("\nFailures{}:\n".format(
+                "" if failure_count == len(self.failures)
+                else " (first {s} of {c})".format(s=len(self.failures), c=failure_count)))
+            for key, outcome in self.failures:
+                outfile.write("  {k}: {o}\n".format(k=key, o=outcome))
+
+
+def _sorted_shards(shards):
+    return sorted(shards, key=lambda shard: shard.index)
+
+
+def replay(container, events, shard=None, timeout_in_seconds=None, context_factory=None,
+           function_name="handler", filename=None, result_log=None, dashboard=None,
+           serialize=False):
+    """
+    Runs the events of a corpus (or of one shard of it) through a container.
+
+    :param Container container: container to invoke
+    :param str events: path of the corpus of events (see
+        :func:`load_events <run_lambda.corpus.load_events>`)
+    :param Shard shard: shard of the corpus to run. Defaults to all events.
+    :param int timeout_in_seconds: timeout of each invocation
+    :param function context_factory: function returning the context of each
+        invocation. Defaults to the container's default context.
+    :param str function_name: name of the handler function, to record
+    :param str filename: file containing the Lambda function, to record
+    :param ResultLogWriter result_log: if provided, the result of each call
+        is appended to this log, keyed by its event's key (see
+        :mod:`run_lambda.resultlog`)
+    :param Dashboard dashboard: if provided, each call is shown on this
+        dashboard (see :mod:`run_lambda.dashboard`)
+    :param bool serialize: whether to pass events and responses through JSON,
+        as Lambda does (see :mod:`run_lambda.payload`)
+    :rtype: ReplayResult
+    """
+    if shard is None:
+        shard = corpus.Shard(1, 1)
+    result = ReplayResult(function_name, filename, events, [shard])
+    start = timeit.default_timer()
+    for key, event in corpus.iter_events(events, shard=shard):
+        context = None if context_factory is None else context_factory()
+        if dashboard is not None:
+            dashboard.begin(key)
+        call_result = container.invoke(event, context=context,
+                                       timeout_in_seconds=timeout_in_seconds,
+                                       serialize=serialize)
+        if dashboard is not None:
+            dashboard.end(call_result, key)
+        result.record(key, call_result)
+        if result_log is not None:
+            result_log.append(call_result, key=key)
+    result.elapsed_in_seconds = timeit.default_timer() - start
+    return result
+
+
+def merge(results):
+    """
+    :param list[ReplayResult] results: results of shards of the same corpus
+    :return: the merged results
+    :rtype: ReplayResult
+    :raises ValueError: if the results cannot be merged
+    """
+    if not results:
+        raise ValueError("No results to merge")
+    merged = ReplayResult.of_json(results[0].to_json())
+    for result in results[1:]:
+        merged.add(result)
+    return merged
+
+
+def arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda replay",
+        description="Run a corpus of events, or one shard of it, through a "
+                    "warm container, and report or save the aggregate results")
+    parser.add_argument("filename", type=str,
+                        help="name of file containing Lambda function, or of "
+                             "deployment package (.zip)")
+    parser.add_argument("event", type=str,
+                        help="event file, JSON lines file or directory of event "
+                             "files to run")
+    parser.add_argument("-f", "--function", metavar="HANDLER_FUNCTION",
+                        dest="function_name", type=str, default="handler",
+                        help="Name of handler function. Defaults to \"handler\". "
+                             "For a deployment package, the handler setting, "
+                             "e.g. \"app.handler\"")
+    parser.add_argument("--layer", metavar="LAYER_ZIP", dest="layers",
+                        action="append", default=[],
+                        help="Layer of a deployment package. May be repeated, "
+                             "in the order the layers are configured")
+    parser.add_argument("-t", "--timeout", metavar="TIMEOUT",
+                        dest="timeout", type=int, default=None,
+                        help="Timeout (in seconds) for each function call")
+    parser.add_argument("-c", "--context", metavar="CONTEXT_FILENAME", type=str,
+                        default=None, dest="context_file",
+                        help="Filename of file containing JSON context data")
+    parser.add_argument("--shard", metavar="INDEX/COUNT", dest="shard",
+                        type=corpus.Shard.parse, default=None,
+                        help="Only run the events of shard INDEX (from 1 to "
+                             "COUNT) of COUNT, e.g. 3/8")
+    parser.add_argument("-o", "--output", metavar="FILENAME", dest="output",
+                        type=str, default=None,
+                        help="Write the results to FILENAME, to be combined "
+                             "with those of other shards by \"run_lambda merge\", "
+                             "instead of printing a report")
+    parser.add_argument("--result-log", metavar="FILENAME", dest="result_log",
+                        type=str, default=None,
+                        help="Also append the result of each call to the binary "
+                             "result log FILENAME, to query with \"run_lambda "
+                             "query\"")
+    parser.add_argument("--dashboard", action="store_true", dest="dashboard",
+                        help="Show a live dashboard of the run in the terminal")
+    parser.add_argument("--serialize", action="store_true", dest="serialize",
+                        help="Pass events and responses through JSON, as Lambda "
+                             "does, enforcing its payload size limits, and report "
+                             "the size of each response")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arguments(sys.argv[1:] if argv is None else argv)
+    container = container_module.Container.of_file(
+        args.filename, args.function_name, layers=args.layers or None)
+    context_factory = None
+    if args.context_file is not None:
+        with open(args.context_file) as context_file:
+            context_json = json.load(context_file)
+        context_factory = lambda: context_module.MockLambdaContext.of_json(context_json)
+    result_log = None if args.result_log is None \
+        else resultlog.ResultLogWriter(args.result_log)
+    board = None
+    if args.dashboard:
+        board = dashboard.Dashboard(title="run_lambda replay {f} {e}{s}".format(
+            f=args.filename, e=args.event,
+            s="" if args.shard is None else " (shard {})".format(args.shard)))
+        board.start()
+    try:
+        result = replay(container, args.event, shard=args.shard,
+                        timeout_in_seconds=args.timeout, context_factory=context_factory,
+                        function_name=args.function_name, filename=args.filename,
+                        result_log=result_log, dashboard=board,
+                        serialize=args.serialize)
+    finally:
+        if board is not None:
+            board.stop()
+        if result_log is not None:
+            result_log.close()
+    if args.output is not None:
+        result.write(args.output)
+    else:
+        result.display(sys.stdout)
+
+
+def merge_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda merge",
+        description="Combine the result files of shards written by "
+                    "\"run_lambda replay\" into one report")
+    parser.add_argument("paths", metavar="PATH", type=str, nargs="+",
+                        help="result file, or directory of result files (.json)")
+    parser.add_argument("-o", "--output", metavar="FILENAME", dest="output",
+                        type=str, default=None,
+                        help="Also write the merged results to FILENAME")
+    return parser.parse_args(argv)
+
+
+def merge_main(argv=None):
+    args = merge_arguments(sys.argv[1:] if argv is None else argv)
+    filenames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                    if name.endswith(".json")))
+        else:
+            filenames.append(path)
+    try:
+        merged = merge([ReplayResult.load(filename) for filename in filenames])
+    except ValueError as e:
+        sys.stderr.write("run_lambda merge: {}\n".format(e))
+        return 2
+    if args.output is not None:
+        merged.write(args.output)
+    merged.display(sys.stdout)
+    return 1 if merged.missing_shards() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
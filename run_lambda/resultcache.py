@@ -0,0 +1,415 @@
+"""
+An on-disk cache of the results of calls to deterministic Lambda functions.
+
+A :class:`ResultCache` serves the result of a call from disk when the same
+handler has already been called with the same event and context::
+
+    cache = ResultCache(".run_lambda_cache")
+    result = cache.run_lambda(my_function.handler, event)
+    result.cached  # True if served from the cache
+
+Results are keyed on a hash of the handler's source code and of the local
+modules it transitively imports, the handler's name, the event, the timeout,
+the context fields listed in ``context_fields`` (by default, those that do
+not vary between calls; in particular, not the request id), and whether the
+call is a cold start. Any change to those source files gives the handler's
+calls new keys, so stale results are never served; they are evicted, least
+recently used first, once the cache outgrows ``max_size_in_bytes``.
+
+Local modules are found by following the ``import`` statements of the
+handler's source file to source files inside of its directory. Only use the
+cache for handlers whose results depend on nothing else, e.g. not on the
+time, on environment variables or on remote services. Calls with patches or a
+response stream, and calls that time out, are never cached.
+
+Results are stored as data, in the format of
+:mod:`cassettes <run_lambda.cassette>`, so that using a cache directory shared
+by someone else cannot run code. Results whose values a cassette could not
+contain are not stored; exceptions that cannot be stored are replaced by
+:class:`RecordedException <run_lambda.cassette.RecordedException>` instances.
+Stored results that can no longer be read, e.g. because the class of an object
+in them no longer exists, are removed, and their calls are made again.
+"""
+import ast
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import threading
+
+from run_lambda import call as call_module
+from run_lambda import cassette
+from run_lambda import context as context_module
+from run_lambda import payload
+from run_lambda import utils
+
+DEFAULT_CONTEXT_FIELDS = ("function_name", "function_version", "invoked_function_arn",
+                          "memory_limit_in_mb", "log_group_name")
+
+_SUFFIX = ".result"
+
+# fingerprints of source files, keyed by filename and root directory, and
+# stamped with the (mtime, size) of each file they cover
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+class ResultCache(object):
+    def __init__(self, directory, max_size_in_bytes=256 * 1024 * 1024,
+                 context_fields=DEFAULT_CONTEXT_FIELDS):
+        """
+        :param str directory: directory to store results in. Created if it
+            does not exist.
+        :param int max_size_in_bytes: maximum total size of the stored results
+        :param tuple[str] context_fields: names of the context properties that
+            results are keyed on
+        """
+        self._directory = directory
+        self._max_size_in_bytes = max_size_in_bytes
+        self._context_fields = tuple(context_fields)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # key -> [size, last use]; uses are numbered in order, starting from
+        # the order of the modification times of the stored results, which
+        # are updated whenever they are used
+        self._entries = {}
+        stored = []
+        for name in os.listdir(directory):
+            if name.endswith(_SUFFIX):
+                stat = os.stat(os.path.join(directory, name))
+                stored.append((stat.st_mtime, name[:-len(_SUFFIX)], stat.st_size))
+        stored.sort()
+        for use, (_, key, size) in enumerate(stored):
+            self._entries[key] = [size, use]
+        self._uses = len(stored)
+
+    @property
+    def directory(self):
+        """
+        :property: Directory that results are stored in
+        :rtype: str
+        """
+        return self._directory
+
+    @property
+    def size_in_bytes(self):
+        """
+        :property: Total size of the stored results
+        :rtype: int
+        """
+        with self._lock:
+            return sum(size for size, _ in self._entries.values())
+
+    @property
+    def hits(self):
+        """
+        :property: Number of calls served from the cache
+        :rtype: int
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        :property: Number of calls that were not served from the cache
+        :rtype: int
+        """
+        return self._misses
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def key(self, handle, event, context=None, timeout_in_seconds=None, serialize=False,
+            invocation_type=payload.REQUEST_RESPONSE, init_duration_in_millis=None):
+        """
+        Cold and warm calls have different keys; the duration of a cold
+        call's initialization phase is not part of its key, so that cold
+        calls can be served from the cache at all.
+
+        :return: the key that the result of calling ``handle`` with the
+            specified arguments is stored under
+        :rtype: str
+        """
+        if context is None:
+            context = context_module.MockLambdaContext.Builder().build()
+        handle = inspect.unwrap(handle) if hasattr(inspect, "unwrap") else handle
+        code = getattr(handle, "__code__", None) or handle.__call__.__code__
+        digest = hashlib.sha256()
+        parts = [code_fingerprint(code.co_filename),
+                 getattr(handle, "__qualname__", handle.__name__),
+                 utils.normalize(event),
+                 tuple((field, getattr(context, field)) for field in self._context_fields),
+                 timeout_in_seconds]
+        if serialize:
+            # serialized results have different values and summaries, and
+            # events may be too large for some invocation types only
+            parts.append(("serialize", invocation_type))
+        if init_duration_in_millis is not None:
+            # the summaries of cold calls report their init duration
+            parts.append("cold start")
+        for part in parts:
+            digest.update(repr(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def run_lambda(self, handle, event, context=None, timeout_in_seconds=None,
+                   patches=None, listeners=None, response_stream=None, **kwargs):
+        """
+        Serves the result of the call from the cache if possible, and
+        otherwise calls :func:`run_lambda <run_lambda.run_lambda>` and stores
+        its result. Takes the same arguments as
+        :func:`run_lambda <run_lambda.run_lambda>`; ``listeners`` are also
+        called with results served from the cache.
+
+        :rtype: LambdaResult
+        """
+        if context is None:
+            context = context_module.MockLambdaContext.Builder().build()
+        if patches is not None or response_stream is not None:
+            with self._lock:
+                self._misses += 1
+            return call_module.run_lambda(
+                handle, event, context=context, timeout_in_seconds=timeout_in_seconds,
+                patches=patches, listeners=listeners, response_stream=response_stream,
+                **kwargs)
+
+        key = self.key(handle, event, context, timeout_in_seconds,
+                       serialize=kwargs.get("serialize", False),
+                       invocation_type=kwargs.get("invocation_type",
+                                                  payload.REQUEST_RESPONSE),
+                       init_duration_in_millis=kwargs.get("init_duration_in_millis"))
+        result = self.get(key)
+        if result is not None:
+            with self._lock:
+                self._hits += 1
+            for listener in listeners or []:
+                listener(context, result)
+            return result
+        with self._lock:
+            self._misses += 1
+        result = call_module.run_lambda(
+            handle, event, context=context, timeout_in_seconds=timeout_in_seconds,
+            listeners=listeners, **kwargs)
+        if not result.timed_out:
+            self.put(key, result)
+        return result
+
+    def get(self, key):
+        """
+        :return: the result stored under ``key``, marked as cached, or
+            ``None`` if there is none
+        :rtype: LambdaResult
+        """
+        filename = self._filename(key)
+        try:
+            with open(filename, "rb") as result_file:
+                data = result_file.read()
+        except (IOError, OSError):
+            return None
+        try:
+            summary, value, exception = [cassette.decode(part)
+                                         for part in json.loads(data.decode("utf-8"))]
+        except Exception:
+            # e.g. stored by an older version, or an object whose class no
+            # longer exists
+            with self._lock:
+                self._remove(key)
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                _touch(filename)
+                entry[1] = self._use()
+        return call_module.LambdaResult(summary, value=value, exception=exception,
+                                        cached=True)
+
+    def put(self, key, result):
+        """
+        Stores ``result`` under ``key``, evicting the least recently used
+        results if the cache outgrows its maximum size. Results whose values
+        cannot be encoded are not stored.
+
+        :param str key:
+        :param LambdaResult result:
+        """
+        try:
+            exception = cassette.encode(result.exception)
+        except TypeError:
+            exception = cassette.encode(cassette.RecordedException(repr(result.exception)))
+        try:
+            data = json.dumps([cassette.encode(result.summary), cassette.encode(result.value),
+                               exception]).encode("utf-8")
+        except Exception:
+            return
+        if len(data) > self._max_size_in_bytes:
+            return
+        fd, temp_filename = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+        filename = self._filename(key)
+        os.rename(temp_filename, filename)
+        with self._lock:
+            self._entries[key] = [len(data), self._use()]
+            self._evict()
+
+    def clear(self):
+        """
+        Removes all stored results.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def _use(self):
+        self._uses += 1
+        return self._uses
+
+    def _evict(self):
+        total = sum(size for size, _ in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if total <= self._max_size_in_bytes:
+                break
+            total -= self._entries[key][0]
+            self._remove(key)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+
+    def _filename(self, key):
+        return os.path.join(self._directory, key + _SUFFIX)
+
+
+def code_fingerprint(filename, root_directory=None):
+    """
+    :param str filename: source file of a Lambda function
+    :param str root_directory: directory containing the local modules.
+        Defaults to the directory of ``filename``.
+    :return: hash of the source file, and of the local modules it
+        transitively imports
+    :rtype: str
+    """
+    filename = os.path.realpath(filename)
+    if root_directory is None:
+        root_directory = os.path.dirname(filename)
+    root_directory = os.path.join(os.path.realpath(root_directory), "")
+    cache_key = (filename, root_directory)
+    with _fingerprints_lock:
+        cached = _fingerprints.get(cache_key)
+    if cached is not None:
+        fingerprint, stamps = cached
+        if all(_stamp(path) == stamp for path, stamp in stamps.items()):
+            return fingerprint
+
+    files = local_source_files(filename, root_directory)
+    stamps = dict((path, _stamp(path)) for path in files)
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(os.path.relpath(path, root_directory).encode("utf-8") + b"\0")
+        with open(path, "rb") as source_file:
+            digest.update(hashlib.sha256(source_file.read()).digest())
+    fingerprint = digest.hexdigest()
+    with _fingerprints_lock:
+        _fingerprints[cache_key] = (fingerprint, stamps)
+    return fingerprint
+
+
+def local_source_files(filename, root_directory):
+    """
+    :param str filename: source file to start from
+    :param str root_directory: directory containing the local modules
+    :return: ``filename``, and the source files inside of ``root_directory``
+        that it transitively imports, excluding installed packages
+    :rtype: set[str]
+    """
+    root_directory = os.path.join(os.path.realpath(root_directory), "")
+    seen = set()
+    pending = [os.path.realpath(filename)]
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        for imported in imported_files(path, root_directory):
+            if imported not in seen:
+                pending.append(imported)
+    return seen
+
+
+def imported_files(path, root_directory):
+    """
+    :param str path: real path of a source file
+    :param str root_directory: real path of the directory containing the
+        local modules, ending with a separator
+    :return: the source files inside of ``root_directory`` that ``path``
+        imports directly, excluding installed packages
+    :rtype: list[str]
+    """
+    try:
+        with open(path, "rb") as source_file:
+            tree = ast.parse(source_file.read(), path)
+    except (IOError, OSError, SyntaxError, ValueError):
+        return []
+    package_parts = os.path.relpath(os.path.dirname(path), root_directory).split(os.sep)
+    if package_parts == ["."] or package_parts[0] == os.pardir:
+        package_parts = []
+
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name.split(".") for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package_parts[:len(package_parts) - node.level + 1] \
+                    if node.level <= len(package_parts) + 1 else None
+                if base is None:
+                    continue
+            else:
+                base = []
+            module = base + (node.module.split(".") if node.module else [])
+            names.append(module)
+            # names imported from a package may be submodules
+            names.extend(module + [alias.name] for alias in node.names
+                         if alias.name != "*")
+
+    files = []
+    for parts in names:
+        for length in range(1, len(parts) + 1):
+            resolved = _resolve(root_directory, parts[:length])
+            if resolved is not None:
+                files.append(resolved)
+    return files
+
+
+def _resolve(root_directory, parts):
+    base = os.path.join(root_directory, *parts)
+    for candidate in (base + ".py", os.path.join(base, "__init__.py")):
+        if os.path.isfile(candidate):
+            candidate = os.path.realpath(candidate)
+            if candidate.startswith(root_directory) and not utils.is_installed(candidate):
+                return candidate
+    return None
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns if hasattr(stat, "st_mtime_ns") else stat.st_mtime, stat.st_size
+
+
+def _touch(filename):
+    try:
+        os.utime(filename, None)
+    except OSError:
+        pass
+
@@ -0,0 +1,492 @@
+"""
+A compact, append-only binary log of the results of calls, and the
+``run_lambda query`` command to query it.
+
+A result log is a pair of files. The log itself (e.g. ``results.rlog``) holds
+the variable-length sections of each call: its key (the event's key or the
+request id), its value (or exception) and its log. A sidecar index
+(``results.rlog.idx``) holds one fixed-width record per call, with its
+timestamp, duration, init duration, maximum memory used and status, and the
+offsets of its sections in the log::
+
+    with ResultLogWriter("results.rlog") as writer:
+        run_lambda.run_lambda(my_function.handler, event, listeners=[writer.record])
+
+    log = ResultLog("results.rlog")
+    for record in log.slowest(100):
+        print(record.duration_in_millis, record.key)
+    for record in log.query(status=TIMED_OUT):
+        print(record.log)
+
+Both files are memory-mapped when read. Queries only decode the fixed-width
+records (a status filter does not even decode those), and a record's sections
+are only read when its ``key``, ``value`` or ``log`` is accessed.
+
+Writes are buffered, so that logging keeps up with tens of thousands of calls
+per second. If a log is not closed cleanly (e.g. because the process writing
+it was killed), the records of calls whose sections were not completely
+written are ignored when it is read, and dropped when it is next appended to.
+"""
+import argparse
+import datetime
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TIMED_OUT = "timed_out"
+
+_STATUSES = (SUCCEEDED, FAILED, TIMED_OUT)
+_STATUS_CODES = dict((status, code) for code, status in enumerate(_STATUSES))
+
+_LOG_MAGIC = b"RLRLOG1\n"
+_INDEX_MAGIC = b"RLRIDX1\n"
+# timestamp, duration, init duration (NaN for warm calls), max memory used,
+# status, offset of sections, lengths of key, value and log
+_RECORD = struct.Struct("<dddfB3xQIII")
+_STATUS_OFFSET = 28
+
+_BUFFER_SIZE = 1024 * 1024
+_CHUNK_RECORDS = 65536
+
+
+class ResultLogWriter(object):
+    def __init__(self, filename):
+        """
+        :param str filename: name of the log file. If it exists, results are
+            appended to it. The index is written to ``filename + ".idx"``.
+        """
+        self._filename = filename
+        self._lock = threading.Lock()
+        self._closed = False
+        self._log_file = _open_for_append(filename, _LOG_MAGIC)
+        self._index_file = _open_for_append(filename + ".idx", _INDEX_MAGIC)
+        # drop records that were not completely written, e.g. because the
+        # process writing them was killed
+        self._log_file.seek(0, os.SEEK_END)
+        self._index_file.seek(0, os.SEEK_END)
+        self._count = (self._index_file.tell() - len(_INDEX_MAGIC)) // _RECORD.size
+        self._offset = len(_LOG_MAGIC)
+        log_size = self._log_file.tell()
+        while self._count > 0:
+            self._index_file.seek(len(_INDEX_MAGIC) + (self._count - 1) * _RECORD.size)
+            fields = _RECORD.unpack(self._index_file.read(_RECORD.size))
+            end = fields[5] + sum(fields[6:])
+            if end <= log_size:
+                self._offset = end
+                break
+            self._count -= 1
+        self._index_file.truncate(len(_INDEX_MAGIC) + self._count * _RECORD.size)
+        self._log_file.truncate(self._offset)
+        self._index_file.seek(0, os.SEEK_END)
+        self._log_file.seek(0, os.SEEK_END)
+
+    @property
+    def filename(self):
+        """
+        :property: Name of the log file
+        :rtype: str
+        """
+        return self._filename
+
+    def __len__(self):
+        return self._count
+
+    def record(self, context, result):
+        """
+        Appends the result of a call, keyed by its request id. This method
+        has the signature of a listener of
+        :func:`run_lambda <run_lambda.run_lambda>`.
+
+        :param MockLambdaContext context: context of the call
+        :param LambdaResult result: result of the call
+        """
+        self.append(result, key=context.aws_request_id)
+
+    def append(self, result, key="", timestamp=None):
+        """
+        Appends the result of a call.
+
+        :param LambdaResult result: result of the call
+        :param str key: key identifying the call, e.g. the key of its event
+        :param float timestamp: time of the call, in seconds since the epoch.
+            Defaults to the current time.
+        """
+        summary = result.summary
+        if result.timed_out:
+            status, value = _STATUS_CODES[TIMED_OUT], b""
+        elif result.exception is not None:
+            status = _STATUS_CODES[FAILED]
+            value = "{t}: {e}".format(t=type(result.exception).__name__,
+                                      e=result.exception).encode("utf-8")
+        else:
+            status, value = _STATUS_CODES[SUCCEEDED], _encode_value(result.value)
+        key = key.encode("utf-8")
+        log = summary.log.encode("utf-8")
+        init_duration = summary.init_duration_in_millis
+        with self._lock:
+            if self._closed:
+                raise ValueError("Result log is closed")
+            self._log_file.write(key + value + log)
+            self._index_file.write(_RECORD.pack(
+                time.time() if timestamp is None else timestamp,
+                summary.duration_in_millis,
+                float("nan") if init_duration is None else init_duration,
+                summary.max_memory_used_in_mb, status, self._offset,
+                len(key), len(value), len(log)))
+            self._offset += len(key) + len(value) + len(log)
+            self._count += 1
+
+    def flush(self):
+        """
+        Writes all buffered results to disk.
+        """
+        with self._lock:
+            self._log_file.flush()
+            self._index_file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._log_file.close()  # sections first, then the index
+            self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def _open_for_append(filename, magic):
+    exists = os.path.exists(filename) and os.path.getsize(filename) > 0
+    result_file = open(filename, "r+b" if exists else "w+b", _BUFFER_SIZE)
+    if exists:
+        if result_file.read(len(magic)) != magic:
+            result_file.close()
+            raise ValueError("{} is not a result log file".format(filename))
+    else:
+        result_file.write(magic)
+    return result_file
+
+
+def _encode_value(value):
+    if value is None:
+        return b""
+    try:
+        text = json.dumps(value, sort_keys=True)
+    except (TypeError, ValueError):
+        text = repr(value)
+    return text.encode("utf-8")
+
+
+class LogRecord(object):
+    """
+    The result of a call, as read from a :class:`ResultLog`. Its
+    variable-length sections are read when first accessed.
+    """
+    def __init__(self, log, index, fields):
+        self._log = log
+        self._index = index
+        self._fields = fields
+
+    @property
+    def index(self):
+        """
+        :property: Position of the record in the log, from 0
+        :rtype: int
+        """
+        return self._index
+
+    @property
+    def timestamp(self):
+        """
+        :property: Time the result was logged, in seconds since the epoch
+        :rtype: float
+        """
+        return self._fields[0]
+
+    @property
+    def duration_in_millis(self):
+        """
+        :property: Duration of the call, in milliseconds
+        :rtype: float
+        """
+        return self._fields[1]
+
+    @property
+    def init_duration_in_millis(self):
+        """
+        :property: Duration of the initialization phase, in milliseconds, if
+            the call was a cold start, and otherwise ``None``
+        :rtype: float
+        """
+        init_duration = self._fields[2]
+        return None if math.isnan(init_duration) else init_duration
+
+    @property
+    def max_memory_used_in_mb(self):
+        """
+        :property: Maximum memory used during the call, in megabytes
+        :rtype: float
+        """
+        return self._fields[3]
+
+    @property
+    def status(self):
+        """
+        :property: Outcome of the call: ``SUCCEEDED``, ``FAILED`` or
+            ``TIMED_OUT``
+        :rtype: str
+        """
+        return _STATUSES[self._fields[4]]
+
+    @property
+    def key(self):
+        """
+        :property: Key identifying the call
+        :rtype: str
+        """
+        return self._section(0)
+
+    @property
+    def value(self):
+        """
+        :property: Value returned by the call, as JSON (or its ``repr``, if
+            it is not JSON-serializable); for a failed call, the type and
+            message of the raised exception; for a timed out call, empty
+        :rtype: str
+        """
+        return self._section(1)
+
+    @property
+    def log(self):
+        """
+        :property: Log of the call
+        :rtype: str
+        """
+        return self._section(2)
+
+    def _section(self, section):
+        offset, lengths = self._fields[5], self._fields[6:]
+        start = offset + sum(lengths[:section])
+        return self._log._read(start, lengths[section])
+
+
+class ResultLog(object):
+    """
+    A result log, opened for reading.
+    """
+    def __init__(self, filename):
+        """
+        :param str filename: name of the log file
+        """
+        self._filename = filename
+        self._log_file = open(filename, "rb")
+        self._index_file = open(filename + ".idx", "rb")
+        self._log_data = _map(self._log_file, filename, _LOG_MAGIC)
+        self._index_data = _map(self._index_file, filename + ".idx", _INDEX_MAGIC)
+        # records are only visible once their sections are written
+        count = (len(self._index_data) - len(_INDEX_MAGIC)) // _RECORD.size
+        while count > 0:
+            fields = self._fields(count - 1)
+            if fields[5] + sum(fields[6:]) <= len(self._log_data):
+                break
+            count -= 1
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("Record index out of range")
+        return LogRecord(self, index, self._fields(index))
+
+    def __iter__(self):
+        for index, fields in enumerate(self._iter_fields()):
+            yield LogRecord(self, index, fields)
+
+    def query(self, status=None, min_duration_in_millis=None, max_duration_in_millis=None,
+              since=None, until=None, cold=None):
+        """
+        :param str status: only include calls with this status
+        :param float min_duration_in_millis: only include calls at least this
+            long
+        :param float max_duration_in_millis: only include calls at most this
+            long
+        :param float since: only include calls logged at or after this time,
+            in seconds since the epoch
+        :param float until: only include calls logged before this time
+        :param bool cold: if provided, only include cold starts (if ``True``)
+            or warm calls (if ``False``)
+        :return: the matching records, in the order they were logged
+        :rtype: iterator[LogRecord]
+        """
+        if status is not None:
+            candidates = ((index, self._fields(index))
+                          for index in self._indexes_with_status(_STATUS_CODES[status]))
+        else:
+            candidates = enumerate(self._iter_fields())
+        for index, fields in candidates:
+            if _matches(fields, min_duration_in_millis, max_duration_in_millis,
+                        since, until, cold):
+                yield LogRecord(self, index, fields)
+
+    def slowest(self, count, **filters):
+        """
+        :param int count: maximum number of records to return
+        :param filters: filters, as for :meth:`query`
+        :return: the longest calls matching ``filters``, longest first
+        :rtype: list[LogRecord]
+        """
+        return heapq.nlargest(count, self.query(**filters),
+                              key=lambda record: record.duration_in_millis)
+
+    def close(self):
+        self._log_data.close()
+        self._index_data.close()
+        self._log_file.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _fields(self, index):
+        return _RECORD.unpack_from(self._index_data, len(_INDEX_MAGIC) + index * _RECORD.size)
+
+    def _iter_fields(self):
+        # decoded in chunks, so that iteration does not hold a view of the
+        # mapped index, nor a copy of all of it
+        for start in range(0, self._count, _CHUNK_RECORDS):
+            end = min(start + _CHUNK_RECORDS, self._count)
+            chunk = self._index_data[len(_INDEX_MAGIC) + start * _RECORD.size:
+                                     len(_INDEX_MAGIC) + end * _RECORD.size]
+            # Struct.iter_unpack() needs Python 3.4
+            for i in range(end - start):
+                yield _RECORD.unpack_from(chunk, i * _RECORD.size)
+
+    def _indexes_with_status(self, code):
+        # the status byte of every record, without decoding the records
+        start = len(_INDEX_MAGIC) + _STATUS_OFFSET
+        statuses = self._index_data[start:start + self._count * _RECORD.size:_RECORD.size]
+        code = bytes(bytearray([code]))
+        index = statuses.find(code)
+        while index != -1:
+            yield index
+            index = statuses.find(code, index + 1)
+
+    def _read(self, start, length):
+        return self._log_data[start:start + length].decode("utf-8", "replace")
+
+
+def _map(result_file, filename, magic):
+    try:
+        data = mmap.mmap(result_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:  # empty file
+        result_file.close()
+        raise ValueError("{} is not a result log file".format(filename))
+    if data[:len(magic)] != magic:
+        data.close()
+        result_file.close()
+        raise ValueError("{} is not a result log file".format(filename))
+    return data
+
+
+def _matches(fields, min_duration_in_millis, max_duration_in_millis, since, until, cold):
+    timestamp, duration, init_duration = fields[0], fields[1], fields[2]
+    if min_duration_in_millis is not None and duration < min_duration_in_millis:
+        return False
+    if max_duration_in_millis is not None and duration > max_duration_in_millis:
+        return False
+    if since is not None and timestamp < since:
+        return False
+    if until is not None and timestamp >= until:
+        return False
+    if cold is not None and cold == math.isnan(init_duration):
+        return False
+    return True
+
+
+def arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda query",
+        description="Query a result log, e.g. for the slowest calls, or for "
+                    "all timed out calls with their logs")
+    parser.add_argument("filename", type=str, help="name of result log file")
+    parser.add_argument("--status", choices=_STATUSES, default=None,
+                        help="Only show calls with this status")
+    parser.add_argument("--min-duration", metavar="MILLIS", dest="min_duration",
+                        type=float, default=None,
+                        help="Only show calls lasting at least MILLIS milliseconds")
+    parser.add_argument("--max-duration", metavar="MILLIS", dest="max_duration",
+                        type=float, default=None,
+                        help="Only show calls lasting at most MILLIS milliseconds")
+    parser.add_argument("--cold", action="store_true", dest="cold", default=None,
+                        help="Only show cold starts")
+    parser.add_argument("--warm", action="store_false", dest="cold", default=None,
+                        help="Only show warm calls")
+    parser.add_argument("--slowest", metavar="N", dest="slowest", type=int, default=None,
+                        help="Show the N slowest matching calls, slowest first")
+    parser.add_argument("-n", "--limit", metavar="N", dest="limit", type=int, default=None,
+                        help="Show at most N calls")
+    parser.add_argument("--values", action="store_true", dest="values",
+                        help="Show the value returned by each call")
+    parser.add_argument("--logs", action="store_true", dest="logs",
+                        help="Show the log of each call")
+    parser.add_argument("--count", action="store_true", dest="count",
+                        help="Only show the number of matching calls")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arguments(sys.argv[1:] if argv is None else argv)
+    filters = {"status": args.status, "min_duration_in_millis": args.min_duration,
+               "max_duration_in_millis": args.max_duration, "cold": args.cold}
+    with ResultLog(args.filename) as log:
+        if args.count:
+            sys.stdout.write("{}\n".format(sum(1 for _ in log.query(**filters))))
+            return
+        if args.slowest is not None:
+            records = log.slowest(args.slowest, **filters)
+        else:
+            records = log.query(**filters)
+        display(records, sys.stdout, limit=args.limit, values=args.values, logs=args.logs)
+
+
+def display(records, outfile, limit=None, values=False, logs=False):
+    outfile.write("{:>10}  {:<26}{:<10}{:>14}{:>12}  {}\n".format(
+        "index", "time", "status", "duration (ms)", "memory (MB)", "key"))
+    for count, record in enumerate(records):
+        if limit is not None and count >= limit:
+            break
+        timestamp = datetime.datetime.utcfromtimestamp(record.timestamp)
+        cold = " (cold)" if record.init_duration_in_millis is not None else ""
+        outfile.write("{:>10}  {:<26}{:<10}{:>14.1f}{:>12.1f}  {}{}\n".format(
+            record.index, timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+            record.status, record.duration_in_millis, record.max_memory_used_in_mb,
+            record.key, cold))
+        if values and record.value:
+            outfile.write("    Value: {}\n".format(record.value))
+        if logs:
+            outfile.write("".join("    | " + line + "\n" for line in record.log.splitlines()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
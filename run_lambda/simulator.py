@@ -0,0 +1,435 @@
+"""
+A simulator of the pool of containers behind a Lambda function, for predicting
+how the function behaves when traffic bursts past its pre-warmed containers.
+
+The simulator replays a trace of timestamped arrivals in virtual time. Every
+invocation is a real call to the handler, on a real warm or cold
+:class:`Container <run_lambda.container.Container>`; the measured init and
+call durations determine how long the container stays busy in virtual time.
+
+The pool is modelled as follows:
+
+- ``provisioned_concurrency`` containers are initialized before the first
+  arrival; they never incur a cold start.
+- An arrival is handled by an idle container if there is one. Otherwise a new
+  container is created (a cold start), unless the pool has reached
+  ``reserved_concurrency`` containers, in which case the arrival is throttled.
+- On-demand containers are created at most ``scale_up_rate`` times per second.
+  Arrivals that must wait for a container to be created, or for earlier
+  arrivals that are themselves waiting, are queued in arrival order.
+- If a container fails to initialize, the invocation that triggered the
+  initialization fails, and the container is initialized again on its next
+  invocation. A provisioned container that fails to initialize is initialized
+  on its first invocation instead.
+"""
+import argparse
+import collections
+import heapq
+import json
+import math
+import sys
+import timeit
+import traceback
+
+from run_lambda import context as context_module
+from run_lambda import emf
+from run_lambda import logs
+from run_lambda import utils
+from run_lambda.container import Container, init_error_result
+
+_INFINITY = float("inf")
+
+
+class ConcurrencySimulator(object):
+    def __init__(self, container_factory, provisioned_concurrency=0,
+                 reserved_concurrency=None, scale_up_rate=None,
+                 timeout_in_seconds=None, patches=None, listeners=None):
+        """
+        :param function container_factory: function taking no arguments and
+            returning a new, uninitialized
+            :class:`Container <run_lambda.container.Container>`
+        :param int provisioned_concurrency: number of pre-warmed containers
+        :param int reserved_concurrency: maximum number of containers. If not
+            provided, the pool is unbounded.
+        :param float scale_up_rate: maximum number of on-demand containers
+            created per second. If not provided, containers are created as
+            soon as they are needed.
+        :param int timeout_in_seconds: timeout of each invocation, in seconds
+        :param patches: patches applied to each invocation, as accepted by
+            :func:`run_lambda <run_lambda.run_lambda>`
+        :param list listeners: listeners called after each invocation, as
+            accepted by :func:`run_lambda <run_lambda.run_lambda>`
+        """
+        if reserved_concurrency is not None \
+                and provisioned_concurrency > reserved_concurrency:
+            raise ValueError("provisioned_concurrency ({p}) exceeds "
+                             "reserved_concurrency ({r})"
+                             .format(p=provisioned_concurrency,
+                                     r=reserved_concurrency))
+        self._container_factory = container_factory
+        self._provisioned_concurrency = provisioned_concurrency
+        self._reserved_concurrency = reserved_concurrency
+        self._scale_up_interval = None if scale_up_rate is None else 1.0 / scale_up_rate
+        self._timeout_in_seconds = timeout_in_seconds
+        self._patches = patches
+        self._listeners = listeners
+
+    def run(self, trace):
+        """
+        Replays ``trace``.
+
+        :param trace: iterable of ``(timestamp_in_seconds, event)`` pairs
+        :rtype: SimulationReport
+        """
+        return _Simulation(self).run(sorted(trace, key=lambda arrival: arrival[0]))
+
+
+class _Simulation(object):
+    def __init__(self, simulator):
+        self._simulator = simulator
+        self._capacity = _INFINITY if simulator._reserved_concurrency is None \
+            else simulator._reserved_concurrency
+        self._idle = []  # heap of (busy_until, container_id)
+        self._containers = []
+        self._next_scale_up = 0.0
+        self._queue = collections.deque()
+        self._records = []
+        self._throttles = []
+
+        for _ in range(simulator._provisioned_concurrency):
+            container = simulator._container_factory()
+            try:
+                container.initialize()
+            except Exception:
+                # as in Lambda, the container is initialized again, as a cold
+                # start, when it is first invoked
+                traceback.print_exc(file=sys.stderr)
+            self._add_container(container, busy_until=-_INFINITY)
+
+    def run(self, trace):
+        for timestamp, event in trace:
+            self._dispatch_queue(until=timestamp)
+            if not self._queue and self._idle and self._idle[0][0] <= timestamp:
+                self._invoke_warm(timestamp, timestamp, event)
+            elif len(self._containers) >= self._capacity and \
+                    (not self._idle or self._idle[0][0] > timestamp):
+                self._throttles.append(timestamp)
+            else:
+                self._queue.append((timestamp, event))
+                self._dispatch_queue(until=timestamp)
+        self._dispatch_queue(until=_INFINITY)
+        return SimulationReport(self._records, self._throttles,
+                                len(self._containers))
+
+    def _add_container(self, container, busy_until):
+        container_id = len(self._containers)
+        self._containers.append(container)
+        heapq.heappush(self._idle, (busy_until, container_id))
+
+    def _dispatch_queue(self, until):
+        while self._queue:
+            arrival, event = self._queue[0]
+            free_at = max(self._idle[0][0], arrival) if self._idle else _INFINITY
+            if len(self._containers) < self._capacity:
+                scale_up_at = max(self._next_scale_up, arrival)
+            else:
+                scale_up_at = _INFINITY
+            start = min(free_at, scale_up_at)
+            if start > until or start == _INFINITY:
+                return
+            self._queue.popleft()
+            if free_at <= scale_up_at:
+                self._invoke_warm(arrival, start, event)
+            else:
+                self._invoke_cold(arrival, start, event)
+
+    def _invoke_warm(self, arrival, start, event):
+        _, container_id = heapq.heappop(self._idle)
+        self._invoke(container_id, arrival, start, event)
+
+    def _invoke_cold(self, arrival, start, event):
+        interval = self._simulator._scale_up_interval
+        if interval is not None:
+            self._next_scale_up = start + interval
+        container_id = len(self._containers)
+        self._containers.append(self._simulator._container_factory())
+        self._invoke(container_id, arrival, start, event)
+
+    def _invoke(self, container_id, arrival, start, event):
+        container = self._containers[container_id]
+        context = context_module.MockLambdaContext.Builder()\
+            .set_log_stream_name(container.log_stream_name)\
+            .build()
+        start_time = timeit.default_timer()
+        try:
+            result = container.invoke(
+                event, context=context,
+                timeout_in_seconds=self._simulator._timeout_in_seconds,
+                patches=self._simulator._patches,
+                listeners=self._simulator._listeners)
+        except Exception as e:
+            # the container's initialization failed; as in Lambda, the
+            # invocation fails, and the container is initialized again on its
+            # next invocation
+            init_duration_in_millis = int(math.ceil(
+                1000 * (timeit.default_timer() - start_time)))
+            result = init_error_result(context, e, init_duration_in_millis)
+        record = InvocationRecord(container_id, arrival, start, result)
+        self._records.append(record)
+        heapq.heappush(self._idle, (record.end, container_id))
+
+
+class InvocationRecord(object):
+    """
+    A single invocation made by the simulator.
+    """
+    def __init__(self, container_id, arrival, start, result):
+        self.container_id = container_id
+        self.arrival = arrival
+        self.start = start
+        self.result = result
+
+    @property
+    def cold(self):
+        return self.result.summary.init_duration_in_millis is not None
+
+    @property
+    def queue_delay_in_millis(self):
+        return 1000 * (self.start - self.arrival)
+
+    @property
+    def service_time_in_millis(self):
+        summary = self.result.summary
+        return summary.duration_in_millis + (summary.init_duration_in_millis or 0)
+
+    @property
+    def latency_in_millis(self):
+        return self.queue_delay_in_millis + self.service_time_in_millis
+
+    @property
+    def end(self):
+        return self.start + self.service_time_in_millis / 1000.0
+
+
+class SimulationReport(object):
+    """
+    The outcome of replaying a trace with a
+    :class:`ConcurrencySimulator <run_lambda.simulator.ConcurrencySimulator>`.
+    """
+    def __init__(self, records, throttles, container_count):
+        self._records = records
+        self._throttles = throttles
+        self._container_count = container_count
+
+    @property
+    def records(self):
+        """
+        :property: Invocations made by the simulator, in the order they were
+            made
+        :rtype: list[InvocationRecord]
+        """
+        return self._records
+
+    @property
+    def invocation_count(self):
+        """
+        :property: Number of arrivals that were not throttled
+        :rtype: int
+        """
+        return len(self._records)
+
+    @property
+    def cold_start_count(self):
+        """
+        :property: Number of invocations that were cold starts
+        :rtype: int
+        """
+        return sum(1 for record in self._records if record.cold)
+
+    @property
+    def throttle_count(self):
+        """
+        :property: Number of arrivals that were throttled
+        :rtype: int
+        """
+        return len(self._throttles)
+
+    @property
+    def error_count(self):
+        """
+        :property: Number of invocations that raised an exception or timed out
+        :rtype: int
+        """
+        return sum(1 for record in self._records
+                   if record.result.timed_out or record.result.exception is not None)
+
+    @property
+    def container_count(self):
+        """
+        :property: Number of containers in the pool at the end of the
+            simulation, including provisioned containers
+        :rtype: int
+        """
+        return self._container_count
+
+    def queue_delay_percentile(self, percent):
+        """
+        :param float percent: percentile, between 0 and 100
+        :return: percentile of queueing delays, in milliseconds
+        :rtype: float
+        """
+        return _percentile([r.queue_delay_in_millis for r in self._records], percent)
+
+    def latency_percentile(self, percent):
+        """
+        :param float percent: percentile, between 0 and 100
+        :return: percentile of end-to-end latencies (queueing delay, init
+            duration and call duration), in milliseconds
+        :rtype: float
+        """
+        return _percentile([r.latency_in_millis for r in self._records], percent)
+
+    @property
+    def duration_in_seconds(self):
+        """
+        :property: Simulated time from the first arrival to the end of the
+            last invocation, in seconds
+        :rtype: float
+        """
+        if not self._records:
+            return 0.0
+        return max(r.end for r in self._records) - min(r.arrival for r in self._records)
+
+    def emf_metrics(self):
+        """
+        Aggregates the metrics published by every invocation in Embedded
+        Metric Format records.
+
+        :rtype: EmfAggregator
+        """
+        aggregator = emf.EmfAggregator()
+        for record in self._records:
+            aggregator.add(record.result.summary.emf_metrics)
+        return aggregator
+
+    def windows(self, window_in_seconds=1.0):
+        """
+        Groups arrivals into consecutive windows of ``window_in_seconds``.
+
+        :return: list of ``(window_start, records, throttle_count)`` tuples
+        :rtype: list
+        """
+        buckets = collections.defaultdict(lambda: ([], [0]))
+        for record in self._records:
+            buckets[int(record.arrival // window_in_seconds)][0].append(record)
+        for throttle in self._throttles:
+            buckets[int(throttle // window_in_seconds)][1][0] += 1
+        return [(index * window_in_seconds, records, throttles[0])
+                for index, (records, throttles) in sorted(buckets.items())]
+
+    def display(self, outfile=None, window_in_seconds=1.0):
+        if outfile is None:
+            outfile = sys.stdout
+        outfile.write("Invocations: {}\n".format(self.invocation_count))
+        outfile.write("Cold starts: {}\n".format(self.cold_start_count))
+        outfile.write("Throttles: {}\n".format(self.throttle_count))
+        outfile.write("Errors: {}\n".format(self.error_count))
+        outfile.write("Containers: {}\n\n".format(self._container_count))
+        if self._records:
+            outfile.write("{:<22}{:>10}{:>10}{:>10}{:>10}\n"
+                          .format("", "p50", "p90", "p99", "max"))
+            for label, percentile in [("Queue delay (ms)", self.queue_delay_percentile),
+                                      ("Latency (ms)", self.latency_percentile)]:
+                outfile.write("{:<22}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}\n".format(
+                    label, percentile(50), percentile(90), percentile(99),
+                    percentile(100)))
+
+        outfile.write("\n{:>10}{:>10}{:>8}{:>11}{:>14}{:>14}\n".format(
+            "time (s)", "arrivals", "cold", "throttles",
+            "p50 lat (ms)", "p99 lat (ms)"))
+        for start, records, throttles in self.windows(window_in_seconds):
+            latencies = [r.latency_in_millis for r in records]
+            outfile.write("{:>10.1f}{:>10}{:>8}{:>11}{:>14.1f}{:>14.1f}\n".format(
+                start, len(records) + throttles,
+                sum(1 for r in records if r.cold), throttles,
+                _percentile(latencies, 50), _percentile(latencies, 99)))
+
+        aggregator = self.emf_metrics()
+        if aggregator.statistics():
+            outfile.write("\nEmbedded metrics:\n")
+            aggregator.display(outfile, duration_in_seconds=self.duration_in_seconds)
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    return utils.percentile(sorted(values), percent)
+
+
+def load_trace(filename):
+    """
+    Loads an arrival trace from a JSON lines file. Each line is an object
+    with a ``timestamp`` (in seconds) and an ``event``.
+
+    :param str filename: name of trace file
+    :return: list of ``(timestamp_in_seconds, event)`` pairs
+    :rtype: list
+    """
+    trace = []
+    with open(filename) as trace_file:
+        for line in trace_file:
+            if line.strip():
+                arrival = json.loads(line)
+                trace.append((float(arrival["timestamp"]), arrival["event"]))
+    return trace
+
+
+def arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_lambda simulate",
+        description="Replay a trace of timestamped arrivals against a "
+                    "simulated pool of Lambda containers")
+    parser.add_argument("filename", type=str,
+                        help="name of file containing Lambda function")
+    parser.add_argument("trace", type=str,
+                        help="JSON lines file of arrivals, each an object with "
+                             "a \"timestamp\" (in seconds) and an \"event\"")
+    parser.add_argument("-f", "--function", metavar="HANDLER_FUNCTION",
+                        dest="function_name", type=str, default="handler",
+                        help="Name of handler function. Defaults to \"handler\"")
+    parser.add_argument("-t", "--timeout", metavar="TIMEOUT",
+                        dest="timeout", type=int, default=None,
+                        help="Timeout (in seconds) for each function call")
+    parser.add_argument("--provisioned", metavar="N", type=int, default=0,
+                        help="Provisioned concurrency (pre-warmed containers)")
+    parser.add_argument("--reserved", metavar="N", type=int, default=None,
+                        help="Reserved concurrency (maximum containers)")
+    parser.add_argument("--scale-up-rate", metavar="RATE", dest="scale_up_rate",
+                        type=float, default=None,
+                        help="Maximum number of new containers per second")
+    parser.add_argument("--window", metavar="SECONDS", type=float, default=1.0,
+                        help="Width of report windows, in seconds")
+    parser.add_argument("--log-dir", metavar="DIRECTORY", dest="log_dir",
+                        type=str, default=None,
+                        help="Write the log of each invocation under "
+                             "DIRECTORY/LOG_GROUP/LOG_STREAM, one log stream "
+                             "per container")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arguments(sys.argv[1:] if argv is None else argv)
+    sink = None if args.log_dir is None else logs.LogSink(args.log_dir)
+    simulator = ConcurrencySimulator(
+        lambda: Container.of_file(args.filename, args.function_name),
+        provisioned_concurrency=args.provisioned,
+        reserved_concurrency=args.reserved,
+        scale_up_rate=args.scale_up_rate,
+        timeout_in_seconds=args.timeout,
+        listeners=None if sink is None else [sink.record])
+    try:
+        report = simulator.run(load_trace(args.trace))
+    finally:
+        if sink is not None:
+            sink.close()
+    report.display(sys.stdout, window_in_seconds=args.window)
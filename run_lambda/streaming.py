@@ -0,0 +1,265 @@
+"""
+Support for Lambda functions that stream their responses.
+
+A streaming Lambda function sends its response in chunks, so that clients can
+start receiving it before the function completes. Such a function is decorated
+with :func:`streamify`, and can be written in two ways:
+
+* as a generator (or, on Python 3.6+, an asynchronous generator) function,
+  whose yielded chunks form the response::
+
+      @streamify
+      def handler(event, context):
+          for row in rows(event):
+              yield json.dumps(row) + "\\n"
+
+* as a function which takes a writable response stream between the event and
+  the context::
+
+      @streamify
+      def handler(event, response_stream, context):
+          response_stream.set_content_type("text/plain")
+          response_stream.write("hello")
+
+:func:`run_lambda <run_lambda.run_lambda>` delivers chunks to the
+``response_stream`` it is given as they are produced, rather than buffering
+them, and records the time to first byte, chunk count, total bytes and
+throughput of the response as the call summary's
+:attr:`stream <run_lambda.LambdaCallSummary.stream>`.
+"""
+import inspect
+import sys
+import timeit
+import types
+
+import six
+
+_STREAMING_ATTRIBUTE = "_run_lambda_streaming"
+
+
+def streamify(handler):
+    """
+    Marks ``handler`` as a streaming handler: either a generator (or
+    asynchronous generator) function, which takes the event and the context
+    and yields the chunks of the response, or a function which takes the
+    event, a :class:`ResponseStream` and the context. Handlers that are not
+    marked are not streamed, even if they return a generator.
+
+    :param function handler: handler function
+    :return: ``handler``
+    :rtype: function
+    """
+    setattr(handler, _STREAMING_ATTRIBUTE, True)
+    return handler
+
+
+def is_streaming_handler(handler):
+    """
+    :return: whether ``handler`` was decorated with :func:`streamify`
+    :rtype: bool
+    """
+    return getattr(handler, _STREAMING_ATTRIBUTE, False)
+
+
+def call_streaming_handler(handler, event, response_stream, context):
+    """
+    Calls a handler decorated with :func:`streamify`, delivering its response
+    to ``response_stream``.
+    """
+    if inspect.isgeneratorfunction(handler) or \
+            (hasattr(inspect, "isasyncgenfunction") and inspect.isasyncgenfunction(handler)):
+        stream_value(handler(event, context), response_stream)
+    else:
+        handler(event, response_stream, context)
+
+
+class ResponseStream(object):
+    """
+    A writable response stream, which delivers each chunk written to it to a
+    consumer as soon as it is written.
+    """
+    def __init__(self, consumer=None, encoding="utf-8"):
+        """
+        :param consumer: where to deliver chunks: a function taking each
+            chunk, or a file (opened in binary mode) to write them to. If not
+            provided, chunks are counted and discarded.
+        :param str encoding: encoding of chunks written as text
+        """
+        if consumer is not None and not callable(consumer):
+            consumer = consumer.write
+        self._consumer = consumer
+        self._encoding = encoding
+        self._content_type = None
+        self._start_time = None
+        self._first_byte_time = None
+        self._end_time = None
+        self._chunk_count = 0
+        self._total_bytes = 0
+
+    @property
+    def content_type(self):
+        """
+        :property: Content type of the response, if set
+        :rtype: str
+        """
+        return self._content_type
+
+    @property
+    def closed(self):
+        """
+        :property: Whether the stream has been closed
+        :rtype: bool
+        """
+        return self._end_time is not None
+
+    def set_content_type(self, content_type):
+        self._content_type = content_type
+
+    def start(self):
+        """
+        Marks the start of the response. Time to first byte is measured from
+        this point.
+        """
+        if self._start_time is None:
+            self._start_time = timeit.default_timer()
+
+    def write(self, chunk):
+        """
+        Delivers a chunk of the response.
+
+        :param chunk: chunk of response
+        :type chunk: bytes or str
+        """
+        if self.closed:
+            raise ValueError("write to closed response stream")
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode(self._encoding)
+        if not chunk:
+            return
+        self.start()
+        if self._first_byte_time is None:
+            self._first_byte_time = timeit.default_timer()
+        self._chunk_count += 1
+        self._total_bytes += len(chunk)
+        if self._consumer is not None:
+            self._consumer(chunk)
+
+    def close(self):
+        """
+        Ends the response.
+        """
+        if not self.closed:
+            self.start()
+            self._end_time = timeit.default_timer()
+
+    def summary(self):
+        """
+        :return: summary of the response streamed so far
+        :rtype: StreamSummary
+        """
+        self.start()
+        end_time = self._end_time if self.closed else timeit.default_timer()
+        time_to_first_byte_in_millis = None if self._first_byte_time is None \
+            else 1000 * (self._first_byte_time - self._start_time)
+        return StreamSummary(time_to_first_byte_in_millis, self._chunk_count,
+                             self._total_bytes, 1000 * (end_time - self._start_time))
+
+
+class StreamSummary(object):
+    """
+    Summary of a streamed response.
+    """
+    def __init__(self, time_to_first_byte_in_millis, chunk_count, total_bytes,
+                 duration_in_millis):
+        self._time_to_first_byte_in_millis = time_to_first_byte_in_millis
+        self._chunk_count = chunk_count
+        self._total_bytes = total_bytes
+        self._duration_in_millis = duration_in_millis
+
+    @property
+    def time_to_first_byte_in_millis(self):
+        """
+        :property: Time from the start of the call to the first byte of the
+            response, in milliseconds, or ``None`` if nothing was streamed
+        :rtype: float
+        """
+        return self._time_to_first_byte_in_millis
+
+    @property
+    def chunk_count(self):
+        """
+        :property: Number of (non-empty) chunks streamed
+        :rtype: int
+        """
+        return self._chunk_count
+
+    @property
+    def total_bytes(self):
+        """
+        :property: Total size of the response, in bytes
+        :rtype: int
+        """
+        return self._total_bytes
+
+    @property
+    def duration_in_millis(self):
+        """
+        :property: Time from the start of the call to the end of the response,
+            in milliseconds
+        :rtype: float
+        """
+        return self._duration_in_millis
+
+    @property
+    def throughput_in_bytes_per_second(self):
+        """
+        :property: Total bytes divided by the duration of the response
+        :rtype: float
+        """
+        if self._duration_in_millis <= 0:
+            return 0.0
+        return self._total_bytes / (self._duration_in_millis / 1000.0)
+
+    def __str__(self):
+        return "{{time_to_first_byte={t} milliseconds; chunks={c}; bytes={b}; " \
+               "throughput={p:.0f} bytes/second}}".format(
+                   t=_format_millis(self._time_to_first_byte_in_millis),
+                   c=self._chunk_count, b=self._total_bytes,
+                   p=self.throughput_in_bytes_per_second)
+
+    def display(self, outfile=None):
+        if outfile is None:
+            outfile = sys.stdout
+        outfile.write("Time to first byte: {} ms\n\n".format(
+            _format_millis(self._time_to_first_byte_in_millis)))
+        outfile.write("Streamed: {c} chunks, {b} bytes in {d:.1f} ms ({p:.0f} bytes/s)\n\n"
+                      .format(c=self._chunk_count, b=self._total_bytes,
+                              d=self._duration_in_millis,
+                              p=self.throughput_in_bytes_per_second))
+
+
+def stream_value(value, response_stream):
+    """
+    Writes the chunks of a generator, or asynchronous generator, returned by
+    a handler to ``response_stream``, as they are produced.
+    """
+    if isinstance(value, types.GeneratorType):
+        for chunk in value:
+            response_stream.write(chunk)
+        return
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                chunk = loop.run_until_complete(value.__anext__())
+            except StopAsyncIteration:
+                break
+            response_stream.write(chunk)
+    finally:
+        loop.run_until_complete(value.aclose())
+        loop.close()
+
+
+def _format_millis(millis):
+    return "-" if millis is None else "{:.1f}".format(millis)
@@ -0,0 +1,208 @@
+"""
+Tracing of calls to Lambda functions.
+
+A :class:`Tracer` passed to :func:`run_lambda <run_lambda.run_lambda>` records
+one span per call, tagged with the fields of the call's context, and child
+spans for each call to a patched target. Lambda functions can add spans of
+their own with :func:`span`, which does nothing when no tracer is active::
+
+    from run_lambda import tracing
+
+    def handler(event, context):
+        with tracing.span("parse"):
+            records = parse(event)
+        ...
+
+Spans can be exported in the Chrome trace-event JSON format, which can be
+viewed with ``chrome://tracing`` or `Perfetto <https://ui.perfetto.dev>`_.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+import timeit
+
+_state = threading.local()
+
+# offset from timeit.default_timer() to the Unix epoch
+_EPOCH_OFFSET = time.time() - timeit.default_timer()
+
+
+class Tracer(object):
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+
+    @property
+    def spans(self):
+        """
+        :property: The completed top-level spans, in the order they were
+            started
+        :rtype: list[Span]
+        """
+        with self._lock:
+            return sorted(self._spans, key=lambda s: s.start)
+
+    def start_span(self, name, category="section", attributes=None, start=None):
+        """
+        Starts a span, as a child of the span currently active on this thread
+        (if any), and makes it the active span. Every call must be matched by
+        a call to :meth:`end_span`.
+
+        :param str name: name of span
+        :param str category: category of span, e.g. ``"invocation"``
+        :param dict attributes: attributes of span
+        :param float start: start time of span, as a :func:`timeit.default_timer`
+            value. Defaults to the current time.
+        :rtype: Span
+        """
+        stack = _stack()
+        parent = stack[-1] if stack else None
+        span = Span(name, category, dict(attributes or {}), parent,
+                    timeit.default_timer() if start is None else start)
+        if parent is not None:
+            parent.children.append(span)
+        stack.append(span)
+        if len(stack) == 1:
+            _state.tracer = self
+        return span
+
+    def end_span(self, span, end=None):
+        """
+        Ends ``span``, which must be the span active on this thread.
+
+        :param Span span: span to end
+        :param float end: end time of span. Defaults to the current time.
+        """
+        span.end = timeit.default_timer() if end is None else end
+        stack = _stack()
+        stack.pop()
+        if not stack:
+            _state.tracer = None
+        if span.parent is None:
+            with self._lock:
+                self._spans.append(span)
+
+    def add_span(self, name, start, end, category="section", attributes=None):
+        """
+        Records an already completed span, as a child of the active span (or
+        as a top-level span, if there is none).
+
+        :param str name: name of span
+        :param float start: start time of span, as a
+            :func:`timeit.default_timer` value
+        :param float end: end time of span
+        """
+        self.start_span(name, category=category, attributes=attributes, start=start)
+        self.end_span(_stack()[-1], end=end)
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """
+        Context manager that records a span around its body.
+
+        :param str name: name of span
+        """
+        span = self.start_span(name, attributes=attributes)
+        try:
+            yield span
+        finally:
+            self.end_span(span)
+
+    def chrome_trace_events(self):
+        """
+        :return: the recorded spans, as Chrome trace events
+        :rtype: list[dict]
+        """
+        pid = os.getpid()
+        events = []
+        pending = list(self.spans)
+        while pending:
+            span = pending.pop(0)
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": 1e6 * (span.start + _EPOCH_OFFSET),
+                "dur": 1e6 * (span.end - span.start),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": span.attributes,
+            })
+            pending.extend(span.children)
+        return events
+
+    def export_chrome_trace(self, filename):
+        """
+        Writes the recorded spans to ``filename``, in the Chrome trace-event
+        JSON format.
+
+        :param str filename: name of output file
+        """
+        with open(filename, "w") as trace_file:
+            json.dump({"traceEvents": self.chrome_trace_events(),
+                       "displayTimeUnit": "ms"}, trace_file, default=repr)
+
+    def clear(self):
+        """
+        Discards all recorded spans.
+        """
+        with self._lock:
+            self._spans = []
+
+
+class Span(object):
+    """
+    A timed section of a trace.
+    """
+    def __init__(self, name, category, attributes, parent, start):
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.parent = parent
+        self.children = []
+        self.start = start
+        self.end = None
+        self.thread_id = threading.current_thread().ident
+
+    @property
+    def duration_in_millis(self):
+        """
+        :property: Duration of span, in milliseconds, or ``None`` if the span
+            has not ended
+        :rtype: float
+        """
+        return None if self.end is None else 1000 * (self.end - self.start)
+
+
+def active_tracer():
+    """
+    :return: the tracer with a span active on this thread, or ``None``
+    :rtype: Tracer
+    """
+    return getattr(_state, "tracer", None)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Context manager that records a span around its body, if a tracer is active
+    on this thread (i.e. when called inside of a Lambda function run with a
+    tracer); otherwise, does nothing.
+
+    :param str name: name of span
+    """
+    tracer = active_tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.span(name, **attributes) as active_span:
+        yield active_span
+
+
+def _stack():
+    stack = getattr(_state, "stack", None)
+    if stack is None:
+        stack = _state.stack = []
+    return stack
@@ -0,0 +1,363 @@
+"""
+Resource usage of calls to Lambda functions: CPU time, garbage collection,
+context switches and page faults.
+
+Together with the wall-clock duration of a call, these tell whether a slow
+call was CPU-bound (CPU time close to the duration), waiting on I/O or locks
+(CPU time well below the duration, many voluntary context switches), or
+stuck in garbage collection (long GC pauses).
+
+Where the platform supports it (Linux), CPU time, context switches and page
+faults are those of the calling thread only, so calls running concurrently on
+other threads do not count towards each other's usage; elsewhere, they are
+those of the whole process. Garbage collections are attributed to the call
+running on the thread that triggered them.
+"""
+import gc
+import sys
+import threading
+import time
+import timeit
+
+try:
+    import resource
+except ImportError:  # e.g. on Windows
+    resource = None
+
+GENERATIONS = (0, 1, 2)
+
+_RUSAGE_WHO = None if resource is None \
+    else getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+# meters that are running, per thread, which garbage collections are counted
+# towards
+_local = threading.local()
+_gc_callback_lock = threading.Lock()
+_gc_callback_registered = False
+
+
+class UsageMeter(object):
+    """
+    Measures the resource usage of the current thread between
+    :meth:`start` and :meth:`stop`.
+    """
+    def __init__(self):
+        self._start = None
+        self._gc_collections = [0] * len(GENERATIONS)
+        self._gc_pause_in_seconds = [0.0] * len(GENERATIONS)
+
+    def start(self):
+        _register_gc_callback()
+        meters = getattr(_local, "meters", None)
+        if meters is None:
+            meters = _local.meters = []
+        meters.append(self)
+        self._start = _sample()
+
+    def stop(self):
+        """
+        :return: resource usage since :meth:`start`
+        :rtype: ResourceUsage
+        """
+        end = _sample()
+        meters = _local.meters
+        if self in meters:
+            meters.remove(self)
+        differences = [e - s for s, e in zip(self._start, end)]
+        return ResourceUsage(
+            user_cpu_in_millis=1000 * differences[0],
+            system_cpu_in_millis=1000 * differences[1],
+            gc_collections=tuple(self._gc_collections),
+            gc_pause_in_millis=tuple(1000 * pause for pause in self._gc_pause_in_seconds),
+            voluntary_context_switches=int(differences[2]),
+            involuntary_context_switches=int(differences[3]),
+            minor_page_faults=int(differences[4]),
+            major_page_faults=int(differences[5]))
+
+    def _record_collection(self, generation, pause_in_seconds):
+        self._gc_collections[generation] += 1
+        self._gc_pause_in_seconds[generation] += pause_in_seconds
+
+
+def _sample():
+    if resource is not None:
+        usage = resource.getrusage(_RUSAGE_WHO)
+        return (usage.ru_utime, usage.ru_stime, usage.ru_nvcsw, usage.ru_nivcsw,
+                usage.ru_minflt, usage.ru_majflt)
+    # only the CPU time is available, and it is not split by mode
+    cpu_time = time.thread_time() if hasattr(time, "thread_time") else time.clock()
+    return (cpu_time, 0.0, 0, 0, 0, 0)
+
+
+def _register_gc_callback():
+    global _gc_callback_registered
+    if _gc_callback_registered or not hasattr(gc, "callbacks"):
+        return
+    with _gc_callback_lock:
+        if not _gc_callback_registered:
+            gc.callbacks.append(_on_gc)
+            _gc_callback_registered = True
+
+
+def _on_gc(phase, info):
+    meters = getattr(_local, "meters", None)
+    if not meters:
+        return
+    if phase == "start":
+        _local.gc_start = timeit.default_timer()
+        return
+    start = getattr(_local, "gc_start", None)
+    if start is None:
+        return
+    _local.gc_start = None
+    pause_in_seconds = timeit.default_timer() - start
+    for meter in meters:
+        meter._record_collection(info["generation"], pause_in_seconds)
+
+
+class ResourceUsage(object):
+    """
+    Resource usage of a call to a Lambda function.
+    """
+    def __init__(self, user_cpu_in_millis=0.0, system_cpu_in_millis=0.0,
+                 gc_collections=(0, 0, 0), gc_pause_in_millis=(0.0, 0.0, 0.0),
+                 voluntary_context_switches=0, involuntary_context_switches=0,
+                 minor_page_faults=0, major_page_faults=0):
+        self._user_cpu_in_millis = user_cpu_in_millis
+        self._system_cpu_in_millis = system_cpu_in_millis
+        self._gc_collections = tuple(gc_collections)
+        self._gc_pause_in_millis = tuple(gc_pause_in_millis)
+        self._voluntary_context_switches = voluntary_context_switches
+        self._involuntary_context_switches = involuntary_context_switches
+        self._minor_page_faults = minor_page_faults
+        self._major_page_faults = major_page_faults
+
+    @property
+    def user_cpu_in_millis(self):
+        """
+        :property: CPU time spent in user mode, in milliseconds
+        :rtype: float
+        """
+        return self._user_cpu_in_millis
+
+    @property
+    def system_cpu_in_millis(self):
+        """
+        :property: CPU time spent in the kernel, in milliseconds
+        :rtype: float
+        """
+        return self._system_cpu_in_millis
+
+    @property
+    def cpu_in_millis(self):
+        """
+        :property: Total CPU time, in milliseconds
+        :rtype: float
+        """
+        return self._user_cpu_in_millis + self._system_cpu_in_millis
+
+    @property
+    def gc_collections(self):
+        """
+        :property: Number of garbage collections of each generation
+        :rtype: tuple[int]
+        """
+        return self._gc_collections
+
+    @property
+    def gc_pause_in_millis(self):
+        """
+        :property: Time spent in garbage collections of each generation, in
+            milliseconds
+        :rtype: tuple[float]
+        """
+        return self._gc_pause_in_millis
+
+    @property
+    def total_gc_pause_in_millis(self):
+        """
+        :property: Time spent in garbage collections, in milliseconds
+        :rtype: float
+        """
+        return sum(self._gc_pause_in_millis)
+
+    @property
+    def voluntary_context_switches(self):
+        """
+        :property: Number of times the thread gave up the CPU, e.g. to wait
+            for I/O
+        :rtype: int
+        """
+        return self._voluntary_context_switches
+
+    @property
+    def involuntary_context_switches(self):
+        """
+        :property: Number of times the thread was preempted
+        :rtype: int
+        """
+        return self._involuntary_context_switches
+
+    @property
+    def minor_page_faults(self):
+        """
+        :property: Number of page faults serviced without I/O
+        :rtype: int
+        """
+        return self._minor_page_faults
+
+    @property
+    def major_page_faults(self):
+        """
+        :property: Number of page faults that required I/O
+        :rtype: int
+        """
+        return self._major_page_faults
+
+    def report_fields(self):
+        """
+        :return: the usage, formatted as tab-separated fields of a ``REPORT``
+            log line
+        :rtype: str
+        """
+        return "CPU Time: {u:.0f} ms user, {s:.0f} ms system\t" \
+               "GC Pause: {p:.1f} ms ({c} collections)\t" \
+               "Context Switches: {v} voluntary, {i} involuntary\t" \
+               "Page Faults: {mi} minor, {ma} major".format(
+                   u=self._user_cpu_in_millis, s=self._system_cpu_in_millis,
+                   p=self.total_gc_pause_in_millis, c=sum(self._gc_collections),
+                   v=self._voluntary_context_switches,
+                   i=self._involuntary_context_switches,
+                   mi=self._minor_page_faults, ma=self._major_page_faults)
+
+    def __str__(self):
+        return "{{user_cpu={u:.1f} milliseconds; system_cpu={s:.1f} milliseconds; " \
+               "gc_pause={p:.1f} milliseconds}}".format(
+                   u=self._user_cpu_in_millis, s=self._system_cpu_in_millis,
+                   p=self.total_gc_pause_in_millis)
+
+    def display(self, outfile=None):
+        if outfile is None:
+            outfile = sys.stdout
+        outfile.write("CPU time: {u:.1f} ms user, {s:.1f} ms system\n\n".format(
+            u=self._user_cpu_in_millis, s=self._system_cpu_in_millis))
+        outfile.write("GC: {}\n\n".format(_format_gc(self._gc_collections,
+                                                     self._gc_pause_in_millis)))
+        outfile.write("Context switches: {v} voluntary, {i} involuntary\n\n".format(
+            v=self._voluntary_context_switches, i=self._involuntary_context_switches))
+        outfile.write("Page faults: {mi} minor, {ma} major\n\n".format(
+            mi=self._minor_page_faults, ma=self._major_page_faults))
+
+
+class UsageStatistics(object):
+    """
+    Totals of the resource usage of a batch of calls, and of their
+    wall-clock durations.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration_in_millis = 0.0
+        self.user_cpu_in_millis = 0.0
+        self.system_cpu_in_millis = 0.0
+        self.gc_collections = [0] * len(GENERATIONS)
+        self.gc_pause_in_millis = [0.0] * len(GENERATIONS)
+        self.voluntary_context_switches = 0
+        self.involuntary_context_switches = 0
+        self.minor_page_faults = 0
+        self.major_page_faults = 0
+
+    def observe(self, usage, duration_in_millis):
+        """
+        :param ResourceUsage usage: usage of a call
+        :param float duration_in_millis: wall-clock duration of the call
+        """
+        self.count += 1
+        self.duration_in_millis += duration_in_millis
+        self.user_cpu_in_millis += usage.user_cpu_in_millis
+        self.system_cpu_in_millis += usage.system_cpu_in_millis
+        for generation in GENERATIONS:
+            self.gc_collections[generation] += usage.gc_collections[generation]
+            self.gc_pause_in_millis[generation] += usage.gc_pause_in_millis[generation]
+        self.voluntary_context_switches += usage.voluntary_context_switches
+        self.involuntary_context_switches += usage.involuntary_context_switches
+        self.minor_page_faults += usage.minor_page_faults
+        self.major_page_faults += usage.major_page_faults
+
+    def add(self, other):
+        self.count += other.count
+        self.duration_in_millis += other.duration_in_millis
+        self.user_cpu_in_millis += other.user_cpu_in_millis
+        self.system_cpu_in_millis += other.system_cpu_in_millis
+        for generation in GENERATIONS:
+            self.gc_collections[generation] += other.gc_collections[generation]
+            self.gc_pause_in_millis[generation] += other.gc_pause_in_millis[generation]
+        self.voluntary_context_switches += other.voluntary_context_switches
+        self.involuntary_context_switches += other.involuntary_context_switches
+        self.minor_page_faults += other.minor_page_faults
+        self.major_page_faults += other.major_page_faults
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "duration_in_millis": self.duration_in_millis,
+            "user_cpu_in_millis": self.user_cpu_in_millis,
+            "system_cpu_in_millis": self.system_cpu_in_millis,
+            "gc_collections": list(self.gc_collections),
+            "gc_pause_in_millis": list(self.gc_pause_in_millis),
+            "voluntary_context_switches": self.voluntary_context_switches,
+            "involuntary_context_switches": self.involuntary_context_switches,
+            "minor_page_faults": self.minor_page_faults,
+            "major_page_faults": self.major_page_faults,
+        }
+
+    @staticmethod
+    def of_json(json):
+        statistics = UsageStatistics()
+        statistics.count = json["count"]
+        statistics.duration_in_millis = json["duration_in_millis"]
+        statistics.user_cpu_in_millis = json["user_cpu_in_millis"]
+        statistics.system_cpu_in_millis = json["system_cpu_in_millis"]
+        statistics.gc_collections = list(json["gc_collections"])
+        statistics.gc_pause_in_millis = list(json["gc_pause_in_millis"])
+        statistics.voluntary_context_switches = json["voluntary_context_switches"]
+        statistics.involuntary_context_switches = json["involuntary_context_switches"]
+        statistics.minor_page_faults = json["minor_page_faults"]
+        statistics.major_page_faults = json["major_page_faults"]
+        return statistics
+
+    @property
+    def cpu_fraction(self):
+        """
+        :property: Fraction of the total duration of the calls spent on the
+            CPU; the rest was spent waiting
+        :rtype: float
+        """
+        if self.duration_in_millis <= 0:
+            return 0.0
+        return (self.user_cpu_in_millis + self.system_cpu_in_millis) / self.duration_in_millis
+
+    def display(self, outfile=None):
+        if outfile is None:
+            outfile = sys.stdout
+        if self.count == 0:
+            return
+        outfile.write("{:<24}{:>14}{:>14}\n".format("", "total", "mean"))
+        for label, total in [
+                ("Duration (ms)", self.duration_in_millis),
+                ("User CPU (ms)", self.user_cpu_in_millis),
+                ("System CPU (ms)", self.system_cpu_in_millis),
+                ("GC pause (ms)", sum(self.gc_pause_in_millis)),
+                ("Voluntary switches", self.voluntary_context_switches),
+                ("Involuntary switches", self.involuntary_context_switches),
+                ("Minor page faults", self.minor_page_faults),
+                ("Major page faults", self.major_page_faults)]:
+            outfile.write("{:<24}{:>14.1f}{:>14.1f}\n".format(label, total, total / self.count))
+        outfile.write("CPU: {:.0f}% of duration\n".format(100 * self.cpu_fraction))
+        outfile.write("GC: {}\n".format(_format_gc(self.gc_collections,
+                                                   self.gc_pause_in_millis)))
+
+
+def _format_gc(collections, pauses_in_millis):
+    return ", ".join("gen{g} {c} collections ({p:.1f} ms)".format(
+        g=generation, c=collections[generation], p=pauses_in_millis[generation])
+        for generation in GENERATIONS)
@@ -2,6 +2,8 @@ import binascii
 import datetime
 import os
 
+_PACKAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "")
+
 
 def random_aws_request_id():
     return "-".join(random_hex(l) for l in [8, 4, 4, 4, 12])
@@ -20,3 +22,57 @@ def random_hex(length):
     if length % 2 == 1:
         return result[:-1]
     return result
+
+
+def percentile(sorted_values, percent):
+    """
+    Returns the ``percent``-th percentile of ``sorted_values``, linearly
+    interpolating between the closest ranks.
+
+    :param list sorted_values: non-empty list of values, in ascending order
+    :param float percent: percentile to compute, between 0 and 100
+    :rtype: float
+    """
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * percent / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = rank - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+
+def normalize(value):
+    """
+    Returns a deterministic, hashable representation of ``value``, e.g. of a
+    call's arguments or of an event: dictionaries are sorted by key, sets
+    sorted, and other objects replaced by their type and attributes.
+
+    :return: ``value`` itself for ``None``, booleans, numbers, strings and
+        bytes, and a tuple otherwise
+    """
+    if isinstance(value, dict):
+        return ("dict",) + tuple(sorted((repr(normalize(k)), normalize(v))
+                                        for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(normalize(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return ("set",) + tuple(sorted(repr(normalize(v)) for v in value))
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    attributes = getattr(value, "__dict__", None)
+    if attributes is not None:
+        return (type(value).__name__, normalize(attributes))
+    return repr(value)
+
+
+def is_installed(filename):
+    """
+    :param str filename: absolute path of a source file
+    :return: whether the file belongs to an installed package (or to
+        run_lambda itself), rather than to the code of a Lambda function
+    :rtype: bool
+    """
+    parts = filename.split(os.sep)
+    return "site-packages" in parts or "dist-packages" in parts \
+        or filename.startswith(_PACKAGE_DIRECTORY)
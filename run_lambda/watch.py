@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import timeit
+import traceback
+
+from six.moves import reload_module
+
+from run_lambda import resultcache
+from run_lambda import utils
+
+
+class ModuleWatcher(object):
+    """
+    Watches the source files of the local modules of a Lambda function, and
+    reloads the modules that change. Local modules are the loaded modules whose
+    source files are inside of ``root_directory``, excluding installed
+    packages (such as those under a ``site-packages`` directory); everything
+    else, including third-party dependencies, stays loaded as it is.
+    """
+    def __init__(self, root_module, root_directory=None, poll_interval_in_seconds=0.05):
+        """
+        :param module root_module: module containing the Lambda function
+        :param str root_directory: directory containing the local modules.
+            Defaults to the directory of ``root_module``.
+        :param float poll_interval_in_seconds: how often to check source files
+            for changes
+        """
+        self._root_module = root_module
+        if root_directory is None:
+            root_directory = os.path.dirname(_source_file(root_module))
+        self._root_directory = os.path.join(os.path.realpath(root_directory), "")
+        self._poll_interval_in_seconds = poll_interval_in_seconds
+        self._snapshot = self._take_snapshot()
+
+    @property
+    def root_module(self):
+        """
+        :property: Module containing the Lambda function. This is replaced by
+            its reloaded version after each reload.
+        :rtype: module
+        """
+        return self._root_module
+
+    def local_modules(self):
+        """
+        :return: dictionary mapping the names of local modules to their source
+            files, in the order they were loaded
+        :rtype: dict
+        """
+        modules = {}
+        for name, module in list(sys.modules.items()):
+            filename = _source_file(module)
+            if filename is None:
+                continue
+            filename = os.path.realpath(filename)
+            if filename.startswith(self._root_directory) and not utils.is_installed(filename):
+                modules[name] = filename
+        return modules
+
+    def changed_modules(self):
+        """
+        :return: names of local modules whose source files have changed since
+            they were last loaded
+        :rtype: list[str]
+        """
+        current = self._take_snapshot()
+        return [name for name, stamp in current.items()
+                if self._snapshot.get(name, stamp) != stamp]
+
+    def wait_for_changes(self, timeout_in_seconds=None):
+        """
+        Blocks until at least one local module has changed.
+
+        :param float timeout_in_seconds: maximum time to wait. If not provided,
+            waits indefinitely.
+        :return: names of changed modules; empty if the timeout expired
+        :rtype: list[str]
+        """
+        deadline = None if timeout_in_seconds is None \
+            else timeit.default_timer() + timeout_in_seconds
+        while True:
+            changed = self.changed_modules()
+            if changed or (deadline is not None and timeit.default_timer() >= deadline):
+                return changed
+            time.sleep(self._poll_interval_in_seconds)
+
+    def reload(self, names):
+        """
+        Reloads the modules ``names``, the local modules that import them,
+        directly or not (so that they pick up names imported from changed
+        modules), and finally the root module. Modules are reloaded
+        dependencies-first; modules that do not depend on each other (or
+        that import each other) are reloaded in the reverse of the order they
+        were first loaded.
+
+        :param list[str] names: names of modules to reload
+        :return: the reloaded root module
+        :rtype: module
+        """
+        root_name = self._root_module.__name__
+        imports = self._local_imports()
+        stale = set(names)
+        pending = list(stale)
+        while pending:
+            name = pending.pop()
+            for importer, imported in imports.items():
+                if name in imported and importer not in stale:
+                    stale.add(importer)
+                    pending.append(importer)
+        stale.discard(root_name)
+        # top-level modules are found on sys.path when reloaded
+        sys.path.insert(0, self._root_directory)
+        try:
+            for name in _dependencies_first(stale, imports):
+                reload_module(sys.modules[name])
+            self._root_module = reload_module(self._root_module)
+        finally:
+            sys.path.remove(self._root_directory)
+        self._snapshot = self._take_snapshot()
+        return self._root_module
+
+    def run_forever(self, on_reload, on_error=None):
+        """
+        Waits for changes, reloads changed modules and calls
+        ``on_reload(root_module, changed_names, reload_duration_in_millis)``,
+        until interrupted. If reloading fails (e.g. because of a syntax error),
+        ``on_error(exc_info)`` is called instead and the watcher waits for the
+        next change.
+        """
+        while True:
+            changed = self.wait_for_changes()
+            start_time = timeit.default_timer()
+            try:
+                root_module = self.reload(changed)
+            except Exception:
+                self._snapshot = self._take_snapshot()
+                if on_error is not None:
+                    on_error(sys.exc_info())
+                else:
+                    traceback.print_exc()
+                continue
+            duration_in_millis = 1000 * (timeit.default_timer() - start_time)
+            on_reload(root_module, changed, duration_in_millis)
+
+    def _local_imports(self):
+        # local module name -> names of the local modules it imports
+        modules = self.local_modules()
+        names = dict((filename, name) for name, filename in modules.items())
+        imports = {}
+        for name, filename in modules.items():
+            imported = resultcache.imported_files(filename, self._root_directory)
+            imports[name] = set(names[f] for f in imported if f in names) - {name}
+        return imports
+
+    def _take_snapshot(self):
+        snapshot = {}
+        for name, filename in self.local_modules().items():
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            snapshot[name] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+
+def _dependencies_first(names, imports):
+    order = list(sys.modules)
+    remaining = sorted(names, key=order.index, reverse=True)
+    result = []
+    while remaining:
+        pending = set(remaining)
+        ready = [name for name in remaining if not imports.get(name, set()) & pending]
+        # an import cycle is broken in the order the modules were loaded
+        name = (ready or remaining)[0]
+        remaining.remove(name)
+        result.append(name)
+    return result
+
+
+def _source_file(module):
+    filename = getattr(module, "__file__", None)
+    if not filename:
+        return None
+    if filename.endswith(".pyc") or filename.endswith(".pyo"):
+        filename = filename[:-1]
+    return filename
+
@@ -28,10 +28,11 @@ setup(
     ],
     keywords=["aws", "lambda", "run", "local", "locally"],
     packages=find_packages(),
-    install_requires=["memory_profiler", "mock", "psutil", "six"],
+    install_requires=["mock", "psutil", "six"],
     test_suite="tests",
     entry_points={
         'console_scripts': ['run_lambda=run_lambda.__main__:main',
-                            'run_lambda_context_template=run_lambda.__gen_context:main']
+                            'run_lambda_context_template=run_lambda.__gen_context:main'],
+        'pytest11': ['run_lambda=run_lambda.pytest_plugin']
     }
 )
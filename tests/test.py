@@ -132,6 +132,16 @@ class RunLambdaTest(unittest.TestCase):
         output = six.StringIO()
         result.display(output)
 
+    def test_max_memory(self):
+        def handle(event_arg, context_arg):
+            data = b"x" * (200 * 1048576)
+            del data  # freed before the call ends, but still the peak
+            time.sleep(0.05)
+        result = call_module.run_lambda(handle, {})
+        self.assertGreaterEqual(result.summary.max_memory_used_in_mb, 200)
+        self.assertLess(result.summary.max_memory_used_in_mb, 250)
+        self.assertIsInstance(result.summary.max_memory_used_in_mb, int)
+
     def test_timeout_call(self):
         def handle(event_arg, context_arg):
             time.sleep(2)
@@ -0,0 +1,148 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import run_lambda.asyncinvoke as asyncinvoke_module
+import run_lambda.container as container_module
+import tests.test_cli as test_cli
+
+attempts = {}
+attempts_lock = threading.Lock()
+
+
+def flaky(event, context):
+    # fails the first event["failures"] attempts of each event
+    with attempts_lock:
+        attempts[event["id"]] = attempts.get(event["id"], 0) + 1
+        count = attempts[event["id"]]
+    if count <= event["failures"]:
+        raise ValueError("attempt {}".format(count))
+    time.sleep(event.get("sleep", 0))
+    return count
+
+
+def loop(event, context):
+    while True:
+        pass
+
+
+class AsyncInvokerTest(unittest.TestCase):
+
+    def setUp(self):
+        attempts.clear()
+
+    def invoker(self, handler=flaky, **kwargs):
+        kwargs.setdefault("retry_delay_in_seconds", 0.01)
+        return asyncinvoke_module.AsyncInvoker(
+            lambda: container_module.Container(lambda: handler), **kwargs)
+
+    def test_retries(self):
+        succeeded, failed = [], []
+        _, dead_letter_filename = tempfile.mkstemp()
+        try:
+            invoker = self.invoker(on_success=succeeded.append, on_failure=failed.append,
+                                   dead_letter_filename=dead_letter_filename)
+            for i, failures in enumerate([0, 1, 2, 3]):
+                invoker.invoke({"id": i, "failures": failures})
+            report = invoker.drain()
+            with open(dead_letter_filename) as dead_letter_file:
+                dead_letters = [json.loads(line) for line in dead_letter_file]
+        finally:
+            os.remove(dead_letter_filename)
+
+        self.assertEqual([event.retry_count for event in report.events], [0, 1, 2, 2])
+        self.assertEqual([event.condition for event in report.events],
+                         ["Success", "Success", "Success", "RetriesExhausted"])
+        self.assertEqual([event.attempts[-1].result.value for event in succeeded],
+                         [1, 2, 3])
+        self.assertEqual(len(failed), 1)
+        self.assertEqual((report.success_count, report.failure_count, report.retry_count),
+                         (3, 1, 5))
+        # retries keep the request ID, and wait for the backoff
+        event = report.events[2]
+        self.assertEqual(len(set(a.result.summary.log.split()[2] for a in event.attempts)), 1)
+        self.assertGreaterEqual(event.ages_in_millis()[2] - event.ages_in_millis()[1], 20)
+
+        self.assertEqual(len(dead_letters), 1)
+        record = dead_letters[0]
+        self.assertEqual(record["requestContext"]["condition"], "RetriesExhausted")
+        self.assertEqual(record["requestContext"]["approximateInvokeCount"], 3)
+        self.assertEqual(record["requestPayload"], {"id": 3, "failures": 3})
+        self.assertEqual(record["responsePayload"],
+                         {"errorMessage": "attempt 3", "errorType": "ValueError"})
+
+    def test_maximum_event_age(self):
+        invoker = self.invoker(retry_delay_in_seconds=0.2, maximum_event_age_in_seconds=0.1)
+        invoker.invoke({"id": 0, "failures": 1})
+        report = invoker.drain()
+        self.assertEqual(report.expired_count, 1)
+        self.assertEqual(len(report.events[0].attempts), 1)
+
+    def test_concurrency(self):
+        invoker = self.invoker(concurrency=4)
+        for i in range(8):
+            invoker.invoke({"id": i, "failures": 0, "sleep": 0.1})
+        report = invoker.drain()
+        self.assertEqual(report.success_count, 8)
+        # one after another, the calls would take over 0.8 s
+        self.assertLess(report.duration_in_seconds, 0.6)
+        self.assertGreater(report.throughput, 8 / 0.6)
+        self.assertGreater(report.event_age_percentile(100), 50)
+        # each worker logs to its own container's stream
+        streams = set(event.attempts[0].result.summary.log for event in report.events)
+        self.assertEqual(len(streams), 8)
+
+    def test_timeout_on_worker_thread(self):
+        invoker = self.invoker(handler=loop, maximum_retry_attempts=0,
+                               timeout_in_seconds=1)
+        invoker.invoke({})
+        report = invoker.drain()
+        self.assertTrue(report.events[0].attempts[0].result.timed_out)
+        self.assertEqual(report.failure_count, 1)
+
+    def test_init_error(self):
+        fd, filename = tempfile.mkstemp(suffix=".py")
+        with os.fdopen(fd, "w") as handler_file:
+            handler_file.write("import no_such_module\n\n\ndef handler(event, context):\n"
+                               "    return event\n")
+        try:
+            invoker = asyncinvoke_module.AsyncInvoker(
+                lambda: container_module.Container.of_file(filename, "handler"),
+                concurrency=2, maximum_retry_attempts=1, retry_delay_in_seconds=0.01)
+            for i in range(3):
+                invoker.invoke({"id": i})
+            report = invoker.drain()
+        finally:
+            os.remove(filename)
+        self.assertEqual(report.failure_count, 3)
+        for event in report.events:
+            self.assertEqual(event.condition, "RetriesExhausted")
+            self.assertEqual(len(event.attempts), 2)
+            self.assertIsInstance(event.attempts[-1].result.exception, ImportError)
+            self.assertIn("no_such_module", event.attempts[-1].result.summary.log)
+
+    def test_failing_destination(self):
+        def on_success(event):
+            raise RuntimeError("destination unavailable")
+        invoker = self.invoker(on_success=on_success, concurrency=2)
+        for i in range(3):
+            invoker.invoke({"id": i, "failures": 0})
+        report = invoker.drain()
+        self.assertEqual(len(report.events), 3)
+        self.assertTrue(all(event.condition is not None for event in report.events))
+
+    def test_cli(self):
+        events = test_cli.RunLambdaCliTest.make_json_file({"id": 0, "failures": 1})
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "async", "tests/test_asyncinvoke.py", events, "-f", "flaky",
+             "--retry-delay", "0.01"])
+        self.assertIn("Succeeded: 1", output)
+        self.assertIn("Retries: 1", output)
+        self.assertIn("Event age (ms)", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
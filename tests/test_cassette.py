@@ -0,0 +1,134 @@
+import datetime
+import decimal
+import os
+import tempfile
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.cassette as cassette_module
+
+calls = []
+
+
+def lookup(key, options=None):
+    calls.append(key)
+    if key == "missing":
+        raise KeyError(key)
+    return {"key": key, "call": len(calls), "options": options}
+
+
+class ServiceError(Exception):
+    def __init__(self, message, code):
+        super(ServiceError, self).__init__(message)
+        self.code = code
+
+
+class Item(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def describe(key):
+    if key == "error":
+        raise ServiceError("throttled", code=429)
+    return {"bytes": b"\x00\xff", "tuple": (1, "two"), "price": decimal.Decimal("1.10"),
+            "created": datetime.datetime(2020, 1, 2, 3, 4, 5, 6),
+            "day": datetime.date(2020, 1, 2), "frozen": frozenset([1]),
+            "item": Item("widget"), 3: None}
+
+
+def handle(event, context):
+    results = [lookup(key, options={"consistent": True, "fields": {"a", "b"}})
+               for key in event["keys"]]
+    try:
+        lookup("missing")
+    except KeyError:
+        results.append(None)
+    return results
+
+
+class CassetteTest(unittest.TestCase):
+
+    def setUp(self):
+        _, self.filename = tempfile.mkstemp()
+        del calls[:]
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_record_and_replay(self):
+        event = {"keys": ["a", "b", "a"]}
+        with cassette_module.Cassette.record(self.filename) as cassette:
+            recorded = call_module.run_lambda(
+                handle, event,
+                patches=cassette.patch_set(["tests.test_cassette.lookup"]))
+        self.assertIsNone(recorded.exception)
+        self.assertEqual(len(calls), 4)
+
+        with cassette_module.Cassette.replay(self.filename) as cassette:
+            self.assertEqual(len(cassette), 3)
+            patch_set = cassette.patch_set(["tests.test_cassette.lookup"])
+            replayed = call_module.run_lambda(handle, event, patches=patch_set)
+            # recorded responses are served in order, then the last repeats
+            again = call_module.run_lambda(handle, event, patches=patch_set)
+        self.assertEqual(len(calls), 4)  # no calls passed through
+        self.assertIsNone(replayed.exception)
+        self.assertEqual(replayed.value, recorded.value)
+        self.assertEqual([r["call"] for r in again.value[:3]], [3, 2, 3])
+
+        with cassette_module.Cassette.replay(self.filename) as cassette:
+            result = call_module.run_lambda(
+                handle, {"keys": ["c"]},
+                patches=cassette.patch_set(["tests.test_cassette.lookup"]))
+        self.assertIsInstance(result.exception, cassette_module.CassetteError)
+
+    def test_data_types(self):
+        names = ["tests.test_cassette.describe"]
+        with cassette_module.Cassette.record(self.filename) as cassette:
+            patch_set = cassette.patch_set(names)
+            with patch_set:
+                recorded = describe("key")
+                self.assertRaises(ServiceError, describe, "error")
+        with cassette_module.Cassette.replay(self.filename) as cassette:
+            patch_set = cassette.patch_set(names)
+            with patch_set:
+                replayed = describe("key")
+                try:
+                    describe("error")
+                except ServiceError as e:
+                    error = e
+        item = replayed.pop("item")
+        self.assertIsInstance(item, Item)
+        self.assertEqual(item.name, "widget")
+        recorded.pop("item")
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(str(error), "throttled")
+        self.assertEqual(error.code, 429)
+
+    def test_normalize(self):
+        normalize = cassette_module.normalize_call
+        self.assertEqual(normalize("f", ({"b": 1, "a": {2, 1}},), {}),
+                         normalize("f", ({"a": {1, 2}, "b": 1},), {}))
+        self.assertNotEqual(normalize("f", ([1, 2],), {}),
+                            normalize("f", ((1, 2),), {}))
+
+    def test_invalid_file(self):
+        with open(self.filename, "wb") as f:
+            f.write(b"not a cassette, but long enough to have a footer")
+        self.assertRaises(cassette_module.CassetteError,
+                          cassette_module.Cassette.replay, self.filename)
+        self.assertRaises(ValueError, cassette_module.Cassette, self.filename, "play")
+
+        # an index offset pointing into the middle of the file
+        with cassette_module.Cassette.record(self.filename) as cassette:
+            call_module.run_lambda(handle, {"keys": ["a"]},
+                                   patches=cassette.patch_set(["tests.test_cassette.lookup"]))
+        with open(self.filename, "r+b") as f:
+            f.seek(-cassette_module._FOOTER.size, os.SEEK_END)
+            f.write(cassette_module._FOOTER.pack(3, cassette_module._FOOTER_MAGIC))
+        self.assertRaises(cassette_module.CassetteError,
+                          cassette_module.Cassette.replay, self.filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
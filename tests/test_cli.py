@@ -48,6 +48,48 @@ class RunLambdaCliTest(unittest.TestCase):
         self.check_output(output)
         self.assertIn("Raised an exception: ", output)
 
+    def test_init_duration(self):
+        event = self.make_json_file({"number": 4.0})
+        args = self.arguments("tests/square_root.py", event, "handle")
+        args.insert(1, "-i")
+        output = self.call(args)
+        self.check_output(output)
+        self.assertIn("Init duration: ", output)
+        self.assertIn("Init Duration: ", output)
+        self.assertIn("Import times", output)
+
+    def test_event_set(self):
+        _, events = tempfile.mkstemp(suffix=".jsonl")
+        with open(events, "w") as events_file:
+            events_file.write('{"number": 4.0}\n{"number": 9.0}\n')
+        args = self.arguments("tests/square_root.py", events, "handle")
+        output = self.call(args)
+        self.check_output(output)
+        self.assertIn("Returned value 2.0", output)
+        self.assertIn("Returned value 3.0", output)
+        self.assertEqual(output.count("Init Duration: "), 1)
+
+    def test_trace(self):
+        event = self.make_json_file({"number": 4.0})
+        _, trace = tempfile.mkstemp()
+        args = self.arguments("tests/square_root.py", event, "handle")
+        args[1:1] = ["--trace", trace]
+        output = self.call(args)
+        self.check_output(output)
+        with open(trace) as trace_file:
+            events = json.load(trace_file)["traceEvents"]
+        self.assertEqual([e["cat"] for e in events], ["init", "invocation"])
+
+    def test_coldstart(self):
+        event = self.make_json_file({"number": 4.0})
+        args = ["run_lambda", "coldstart", "-n", "2", "-f", "handle", "-i",
+                "tests/square_root.py", event]
+        output = self.call(args)
+        self.assertIn("Cold starts: 2", output)
+        self.assertIn("Init duration (ms)", output)
+        self.assertIn("Mean import times", output)
+        self.assertNotIn("Failed invocations", output)
+
     # --- helper functions ---
 
     def check_output(self, output):
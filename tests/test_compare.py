@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import run_lambda.compare as compare_module
+import tests.test_cli as test_cli
+
+
+class CompareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old = self.write("old_handler.py",
+                              "def handler(event, context):\n"
+                              "    return event['n'] * 2\n")
+        self.new = self.write("new_handler.py",
+                              "import time\n\n"
+                              "def handler(event, context):\n"
+                              "    time.sleep(0.01)\n"
+                              "    return 0 if event['n'] == 3 else event['n'] * 2\n")
+        self.events = self.write("events.jsonl", "".join(
+            json.dumps({"n": n}) + "\n" for n in range(8)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, source):
+        path = os.path.join(self.directory, filename)
+        with open(path, "w") as f:
+            f.write(source)
+        return path
+
+    def test_compare(self):
+        comparison = compare_module.compare(
+            self.old, self.new, [("e{}".format(n), {"n": n}) for n in range(8)],
+            repetitions=2, workers=2)
+        self.assertEqual([event.key for event in comparison.events],
+                         ["e{}".format(n) for n in range(8)])
+        self.assertEqual([event.key for event in comparison.changed_events], ["e3"])
+        for event in comparison.events:
+            self.assertEqual(len(event.old_durations), 2)
+            self.assertGreater(event.duration_difference_in_millis[0], 5)
+        change, low, high, p_value = comparison.duration_change()
+        self.assertGreater(change, 100)
+        self.assertLessEqual(low, change)
+        self.assertGreaterEqual(high, change)
+        self.assertLess(p_value, 0.05)
+        self.assertEqual(len(comparison.failures(max_slowdown_percent=5)), 1)
+        self.assertEqual(comparison.failures(max_slowdown_percent=10000), [])
+
+    def test_local_modules(self):
+        # each version imports its own helper module, also lazily
+        handler = ("import helper\n\n"
+                   "def handler(event, context):\n"
+                   "    import lazy_helper\n"
+                   "    return [helper.VERSION, lazy_helper.VERSION]\n")
+        for version in ["v1", "v2"]:
+            os.mkdir(os.path.join(self.directory, version))
+            self.write(os.path.join(version, "handler.py"), handler)
+            for module in ["helper", "lazy_helper"]:
+                self.write(os.path.join(version, module + ".py"),
+                           "VERSION = {!r}\n".format(version))
+        comparison = compare_module.compare(
+            os.path.join(self.directory, "v1", "handler.py"),
+            os.path.join(self.directory, "v2", "handler.py"),
+            [("e", {})], repetitions=2, workers=1)
+        event = comparison.events[0]
+        self.assertEqual(event.old_outcome, 'returned ["v1", "v1"]')
+        self.assertEqual(event.new_outcome, 'returned ["v2", "v2"]')
+        self.assertNotIn("helper", sys.modules)
+
+    def test_memory(self):
+        self.write("large_handler.py",
+                   "def handler(event, context):\n"
+                   "    data = b'x' * (64 * 1048576)\n"
+                   "    return event['n'] * 2\n")
+        comparison = compare_module.compare(
+            self.old, os.path.join(self.directory, "large_handler.py"),
+            [("e{}".format(n), {"n": n}) for n in range(8)], repetitions=1, workers=1)
+        change, _, _, p_value = comparison.memory_change()
+        self.assertGreater(change, 50)
+        self.assertLess(p_value, 0.05)
+        self.assertEqual(len(comparison.failures(max_slowdown_percent=None,
+                                                 max_memory_increase_in_mb=20)), 1)
+
+    def test_wilcoxon(self):
+        self.assertEqual(compare_module.wilcoxon_signed_rank([1, 2], [1, 2]), 1.0)
+        self.assertLess(compare_module.wilcoxon_signed_rank(
+            list(range(20)), [v + 1 for v in range(20)]), 0.001)
+        p_value = compare_module.wilcoxon_signed_rank(
+            [0] * 10, [1, -1, 2, -2, 3, -3, 4, -4, 5, -5])
+        self.assertGreater(p_value, 0.5)
+        # exact for few pairs: 5 pairs can never give p < 0.05
+        self.assertEqual(compare_module.wilcoxon_signed_rank([0] * 5, [1, 2, 3, 4, 5]),
+                         0.0625)
+        self.assertAlmostEqual(compare_module.wilcoxon_signed_rank(
+            [0] * 8, [1, 2, 3, 4, 5, 6, 7, -8]), 0.1953125)
+
+    def test_insufficient_samples(self):
+        comparison = compare_module.compare(
+            self.old, self.new, [("e{}".format(n), {"n": n}) for n in range(3)],
+            repetitions=1, workers=1)
+        change, _, _, p_value = comparison.duration_change()
+        self.assertGreater(change, 100)
+        self.assertEqual(p_value, 0.25)
+        failures = comparison.failures(max_slowdown_percent=5)
+        self.assertEqual(len(failures), 1)
+        self.assertIn("insufficient samples: 3 event(s)", failures[0])
+        self.assertEqual(comparison.failures(max_slowdown_percent=10000), [])
+
+    def test_cli(self):
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "compare", "-r", "1", "-w", "1",
+             self.old, self.old, self.events])
+        self.assertIn("Events: 8", output)
+        self.assertIn("Duration change", output)
+        self.assertNotIn("FAIL", output)
+
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "compare", "-r", "1", "-w", "1", "--json",
+             "--fail-on-value-change", self.old, self.new, self.events])
+        self.assertEqual(json.loads(output)["failures"],
+                         ["duration increased by {:.1f}% (budget 5.0%, p={:.3g})"
+                          .format(json.loads(output)["duration_change_percent"]["change"],
+                                  json.loads(output)["duration_change_percent"]["p_value"]),
+                          "1 event(s) returned different values"])
+
+
+if __name__ == "__main__":
+    unittest.main()
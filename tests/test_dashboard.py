@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+import timeit
+import unittest
+
+import six
+
+import run_lambda.call as call_module
+import run_lambda.dashboard as dashboard_module
+import tests.test_cli as test_cli
+
+
+def handler(event, context):
+    print("working on {}".format(event))
+    if event == "loop":
+        while True:
+            time.sleep(0.01)
+    if event < 0:
+        raise ValueError("negative")
+    time.sleep(event / 1000.0)
+    return event
+
+
+class DashboardTest(unittest.TestCase):
+
+    def test_render(self):
+        dashboard = dashboard_module.Dashboard(title="test run", total=10)
+        for event in [1, 2, 30, -1]:
+            dashboard.begin("event-{}".format(event))
+            dashboard.end(call_module.run_lambda(handler, event), "event-{}".format(event))
+        dashboard.begin("event-loop")
+        dashboard.end(call_module.run_lambda(handler, "loop", timeout_in_seconds=0.1),
+                      "event-loop")
+        dashboard.begin("event-in-flight")
+
+        output = dashboard.render()
+        self.assertTrue(output.startswith("test run - "))
+        self.assertIn("Invocations: 5 (", output)
+        self.assertIn("In flight: 1  Errors: 1  Timeouts: 1  Cold starts: 0", output)
+        self.assertIn("Progress: 5/10 (50%)", output)
+        self.assertIn("Duration (last 10 s, 5 calls): p50 ", output)
+        self.assertIn("<=       32 ms |", output)
+        self.assertIn("Memory: p50 ", output)
+        self.assertIn("main", output)
+        self.assertIn("event-in-flight", output)
+        slowest = output[output.index("Slowest recent calls:"):].splitlines()
+        self.assertIn("event-loop  | working on loop", slowest[1])
+        self.assertIn("event-30  | working on 30", slowest[2])
+
+        # calls outside of the window are not recent
+        later = dashboard.render(now=timeit.default_timer() + 60)
+        self.assertIn("Invocations: 5", later)
+        self.assertIn("Duration (last 10 s, 0 calls): no calls", later)
+
+    def test_workers(self):
+        dashboard = dashboard_module.Dashboard()
+        result = call_module.run_lambda(handler, 0)
+
+        def work():
+            for index in range(2000):
+                dashboard.begin(str(index))
+                dashboard.end(result, str(index))
+        threads = [threading.Thread(target=work, name="worker-{}".format(index))
+                   for index in range(4)]
+        for thread in threads:
+            thread.start()
+        renders = []
+        while any(thread.is_alive() for thread in threads):
+            renders.append(dashboard.render())
+        for thread in threads:
+            thread.join()
+        output = dashboard.render()
+        self.assertIn("Invocations: 8000 (", output)
+        self.assertIn("In flight: 0", output)
+        for index in range(4):
+            self.assertIn("worker-{}".format(index), output)
+
+    def test_redraw(self):
+        outfile = six.StringIO()
+        with dashboard_module.Dashboard(outfile=outfile, refresh_interval_in_seconds=0.01) \
+                as dashboard:
+            for event in range(5):
+                dashboard.begin(str(event))
+                dashboard.end(call_module.run_lambda(handler, event), str(event))
+                time.sleep(0.02)
+        frames = outfile.getvalue().split(dashboard_module._CLEAR)
+        self.assertGreater(len(frames), 3)
+        self.assertIn("Invocations: 5 (", frames[-1])
+
+    def test_cli(self):
+        directory = os.path.dirname(test_cli.RunLambdaCliTest.make_json_file({}))
+        events = os.path.join(directory, "dashboard_events.jsonl")
+        with open(events, "w") as events_file:
+            events_file.write('{"number": 4.0}\n{"number": -1}\n')
+        try:
+            output = test_cli.RunLambdaCliTest.call(
+                ["run_lambda", "replay", "--dashboard", "-f", "handle",
+                 "tests/square_root.py", events])
+            self.assertIn(dashboard_module._CLEAR + "run_lambda replay ", output)
+            self.assertIn("Invocations: 2 (", output)
+            output = test_cli.RunLambdaCliTest.call(
+                ["run_lambda", "async", "--dashboard", "--retries", "0", "--concurrency", "2",
+                 "-f", "handle", "tests/square_root.py", events])
+            self.assertIn("Progress: 2/2 (100%)", output)
+            self.assertIn("worker-1", output)
+        finally:
+            os.remove(events)
+
+
+if __name__ == "__main__":
+    unittest.main()
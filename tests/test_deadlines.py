@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+import timeit
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.deadlines as deadlines_module
+
+
+def sleep(event, context):
+    end = time.time() + event
+    while time.time() < end:
+        time.sleep(0.01)
+    return context.get_remaining_time_in_millis()
+
+
+def nested(event, context):
+    inner = call_module.run_lambda(sleep, 0, timeout_in_seconds=5)
+    return sleep(event, context), inner
+
+
+class TimerWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = None
+
+    def tearDown(self):
+        if self.wheel is not None:
+            self.wheel.close()
+
+    def schedule_all(self, delays):
+        fired = {}
+        lock = threading.Lock()
+        deadlines = []
+        for index, delay in enumerate(delays):
+            def callback(index=index):
+                with lock:
+                    fired[index] = timeit.default_timer()
+            deadlines.append(self.wheel.schedule(delay, callback))
+        return deadlines, fired
+
+    def check_fired(self, deadlines, fired, expected, tolerance_in_seconds):
+        self.assertEqual(sorted(fired), sorted(expected))
+        for index in expected:
+            self.assertGreaterEqual(fired[index], deadlines[index].when)
+            self.assertLess(fired[index], deadlines[index].when + tolerance_in_seconds)
+            self.assertTrue(deadlines[index].expired)
+            self.assertFalse(deadlines[index].pending)
+
+    def test_expiry(self):
+        self.wheel = deadlines_module.TimerWheel()
+        deadlines, fired = self.schedule_all([0.2, 0.05, 0.1, 0])
+        self.assertEqual(len(self.wheel), 4)
+        time.sleep(0.4)
+        self.assertEqual(len(self.wheel), 0)
+        self.check_fired(deadlines, fired, range(4), 0.1)
+
+    def test_cancel(self):
+        self.wheel = deadlines_module.TimerWheel()
+        deadlines, fired = self.schedule_all([0.05, 0.05])
+        self.assertTrue(deadlines[0].cancel())
+        self.assertFalse(deadlines[0].cancel())
+        self.assertEqual(len(self.wheel), 1)
+        time.sleep(0.15)
+        self.assertFalse(deadlines[1].cancel())
+        self.check_fired(deadlines, fired, [1], 0.1)
+        self.assertFalse(deadlines[0].expired)
+
+    def test_cascade(self):
+        # a span of 64 ticks, so that deadlines are cascaded between levels,
+        # and the furthest ones lie beyond the span
+        self.wheel = deadlines_module.TimerWheel(tick_in_seconds=0.002,
+                                                 slots_per_level=(4, 4, 4))
+        delays = [0.001 * i for i in range(0, 300, 7)]
+        deadlines, fired = self.schedule_all(delays)
+        time.sleep(0.4)
+        self.check_fired(deadlines, fired, range(len(delays)), 0.05)
+
+    def test_many(self):
+        self.wheel = deadlines_module.TimerWheel()
+        rng = random.Random(0)
+        delays = [rng.uniform(0.25, 0.75) for _ in range(10000)]
+        start = timeit.default_timer()
+        deadlines, fired = self.schedule_all(delays)
+        for deadline in deadlines[::2]:
+            self.assertTrue(deadline.cancel())
+        self.assertLess(timeit.default_timer() - start, 0.25)
+        time.sleep(1)
+        self.check_fired(deadlines, fired, range(1, len(delays), 2), 0.25)
+
+    def test_default_wheel(self):
+        self.assertIs(deadlines_module.default_wheel(), deadlines_module.default_wheel())
+
+
+class CallDeadlineTest(unittest.TestCase):
+
+    def test_nested_calls(self):
+        # the inner call's timeout does not cancel the outer one's
+        result = call_module.run_lambda(nested, 3, timeout_in_seconds=1)
+        self.assertTrue(result.timed_out)
+
+    def test_remaining_time(self):
+        result = call_module.run_lambda(sleep, 0.2, timeout_in_seconds=1)
+        self.assertGreater(result.value, 700)
+        self.assertLessEqual(result.value, 800)
+
+    def test_concurrent_calls(self):
+        results = [None] * 200
+
+        def invoke(index):
+            results[index] = call_module.run_lambda(
+                sleep, 5 if index % 2 else 0.1, timeout_in_seconds=0.5)
+        threads = [threading.Thread(target=invoke, args=(index,))
+                   for index in range(len(results))]
+        start = timeit.default_timer()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(timeit.default_timer() - start, 3)
+        self.assertEqual([result.timed_out for result in results],
+                         [bool(index % 2) for index in range(len(results))])
+
+
+if __name__ == "__main__":
+    unittest.main()
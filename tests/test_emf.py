@@ -0,0 +1,90 @@
+import json
+import sys
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.context as context_module
+import run_lambda.emf as emf_module
+import run_lambda.metrics as metrics_module
+
+
+def emf_record(processed, service="checkout"):
+    return json.dumps({
+        "_aws": {
+            "Timestamp": 1481450400000,
+            "CloudWatchMetrics": [{
+                "Namespace": "orders",
+                "Dimensions": [["Service"], []],
+                "Metrics": [{"Name": "Processed", "Unit": "Count"},
+                            {"Name": "Latency", "Unit": "Milliseconds"}],
+            }],
+        },
+        "Service": service,
+        "Processed": processed,
+        "Latency": [1.5, 2.5],
+    })
+
+
+def publish(event, context):
+    print("not a metric")
+    print(emf_record(event))
+    # written in pieces, and without a trailing newline
+    record = emf_record(event * 10, service="refunds")
+    sys.stdout.write(record[:20])
+    sys.stdout.write(record[20:])
+    return event
+
+
+class EmfTest(unittest.TestCase):
+
+    def test_parse_record(self):
+        data = emf_module.parse_record(emf_record(3))
+        self.assertEqual([(d.key, d.values, d.unit) for d in data], [
+            (("orders", "Processed", (("Service", "checkout"),)), [3.0], "Count"),
+            (("orders", "Processed", ()), [3.0], "Count"),
+            (("orders", "Latency", (("Service", "checkout"),)), [1.5, 2.5], "Milliseconds"),
+            (("orders", "Latency", ()), [1.5, 2.5], "Milliseconds"),
+        ])
+        self.assertEqual(emf_module.parse_record("not a metric"), [])
+        self.assertEqual(emf_module.parse_record('{"_aws": 1}'), [])
+        self.assertEqual(emf_module.parse_record('log mentioning _aws'), [])
+
+    def test_summary(self):
+        result = call_module.run_lambda(publish, 2)
+        processed = [(d.dimensions, d.values) for d in result.summary.emf_metrics
+                     if d.name == "Processed"]
+        self.assertEqual(processed, [((("Service", "checkout"),), [2.0]),
+                                     ((), [2.0]),
+                                     ((("Service", "refunds"),), [20.0]),
+                                     ((), [20.0])])
+
+    def test_aggregate(self):
+        aggregator = emf_module.EmfAggregator()
+        registry = metrics_module.MetricsRegistry()
+        context = context_module.MockLambdaContext.Builder()\
+            .set_function_name("emf_test").build()
+        for processed in (1, 2, 3):
+            call_module.run_lambda(publish, processed, context=context,
+                                   listeners=[aggregator.record, registry.record])
+
+        statistics = aggregator.statistics()
+        checkout = statistics[("orders", "Processed", (("Service", "checkout"),))]
+        self.assertEqual((checkout.sample_count, checkout.sum, checkout.minimum,
+                          checkout.maximum, checkout.average), (3, 6.0, 1.0, 3.0, 2.0))
+        total = statistics[("orders", "Processed", ())]
+        self.assertEqual((total.sample_count, total.sum), (6, 66.0))
+        latency = statistics[("orders", "Latency", ())]
+        self.assertEqual((latency.sample_count, latency.sum, latency.unit),
+                         (12, 24.0, "Milliseconds"))
+
+        self.assertEqual(registry.collect()["emf_test"].emf[("orders", "Processed", ())].sum,
+                         66.0)
+        text = registry.render()
+        self.assertIn("# TYPE run_lambda_emf_Processed summary\n", text)
+        self.assertIn('run_lambda_emf_Processed_sum{function_name="emf_test",'
+                      'namespace="orders",dimension_Service="refunds"} 60.0\n', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
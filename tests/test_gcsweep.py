@@ -0,0 +1,74 @@
+import gc
+import json
+import sys
+import unittest
+
+import run_lambda.container as container_module
+import run_lambda.gcsweep as gcsweep_module
+import tests.test_cli as test_cli
+
+TABLE = [[i] for i in range(1000)]
+
+
+def handler(event, context):
+    return len(TABLE) + event
+
+
+class GcSweepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.threshold = gc.get_threshold()
+
+    def tearDown(self):
+        gc.set_threshold(*self.threshold)
+        if hasattr(gc, "unfreeze"):
+            gc.unfreeze()
+
+    def test_parse(self):
+        setting = gcsweep_module.GcSetting.parse("freeze+threshold=5000,20")
+        self.assertTrue(setting.freeze)
+        self.assertEqual(setting.threshold, (5000, 20))
+        self.assertEqual(str(setting), "freeze+threshold=5000,20")
+        self.assertEqual(str(gcsweep_module.GcSetting.parse("default")), "default")
+        self.assertRaises(ValueError, gcsweep_module.GcSetting.parse, "thaw")
+        self.assertRaises(ValueError, gcsweep_module.parse_threshold, "1,2,3,4")
+
+    @unittest.skipIf(sys.version_info < (3, 7), "gc.freeze requires Python 3.7")
+    def test_container(self):
+        container = container_module.Container.of_file(
+            "tests/test_gcsweep.py", gc_freeze=True, gc_threshold=(5000, 20, 20))
+        self.assertEqual(container.invoke(1).value, 1001)
+        self.assertGreater(gc.get_freeze_count(), 0)
+        self.assertEqual(gc.get_threshold(), (5000, 20, 20))
+
+    @unittest.skipIf(sys.version_info < (3, 7), "gc.freeze requires Python 3.7")
+    def test_cli(self):
+        events = test_cli.RunLambdaCliTest.make_json_file(1)
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "gcsweep", "tests/test_gcsweep.py", events, "-n", "3",
+             "-s", "default", "-s", "freeze+threshold=5000"])
+        lines = output.splitlines()
+        self.assertTrue(lines[0].startswith("setting"))
+        self.assertTrue(lines[1].startswith("default "))
+        self.assertTrue(lines[2].startswith("freeze+threshold=5000 "))
+        self.assertTrue(lines[1].endswith("+0.0%"))
+
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "gcsweep", "tests/test_gcsweep.py", events, "-n", "2",
+             "-s", "freeze", "--json"])
+        run, = json.loads(output)
+        self.assertEqual(run["setting"], "freeze")
+        # the first call is a cold start
+        self.assertEqual(len(run["durations_in_millis"]), 1)
+        self.assertIsNotNone(run["init_duration_in_millis"])
+
+    def test_main_cli(self):
+        events = test_cli.RunLambdaCliTest.make_json_file(1)
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "tests/test_gcsweep.py", events, "--gc-threshold", "4000,15"])
+        self.assertIn("Returned value 1001", output)
+        self.assertEqual(gc.get_threshold()[:2], (4000, 15))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.init as init_module
+
+
+class InitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write("init_test_dependency.py", "import time\ntime.sleep(0.05)\n")
+        self.write("init_test_handler.py",
+                   "import init_test_dependency\n\n"
+                   "def handler(event, context):\n"
+                   "    return event\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, source):
+        with open(os.path.join(self.directory, filename), "w") as f:
+            f.write(source)
+
+    def test_timed_load_module(self):
+        module, summary = init_module.timed_load_module(
+            os.path.join(self.directory, "init_test_handler.py"),
+            profile_imports=True)
+        self.assertEqual(module.handler(1, None), 1)
+        self.assertGreaterEqual(summary.duration_in_millis, 50)
+        names = [t.name for t in summary.imports]
+        self.assertIn("init_test_dependency", names)
+        dependency = summary.imports[names.index("init_test_dependency")]
+        self.assertGreaterEqual(dependency.cumulative_in_millis, 50)
+        self.assertGreaterEqual(dependency.cumulative_in_millis,
+                                dependency.self_in_millis)
+
+        result = call_module.run_lambda(
+            module.handler, {}, init_duration_in_millis=summary.duration_in_millis)
+        self.assertEqual(result.summary.init_duration_in_millis,
+                         summary.duration_in_millis)
+        self.assertIn("\tInit Duration: {} ms\n".format(summary.duration_in_millis),
+                      result.summary.log)
+
+    def test_warm_call(self):
+        result = call_module.run_lambda(lambda event, context: event, {})
+        self.assertIsNone(result.summary.init_duration_in_millis)
+        self.assertNotIn("Init Duration", result.summary.log)
+
+
+if __name__ == "__main__":
+    unittest.main()
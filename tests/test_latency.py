@@ -0,0 +1,108 @@
+import random
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.latency as latency
+
+
+class FakeTable(object):
+    name = "fake_table"
+
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, key, value):
+        self.items[key] = value
+
+    def get_item(self, key):
+        return self.items.get(key)
+
+
+table = FakeTable()
+
+
+def handle(event, context):
+    for key in range(event["count"]):
+        table.put_item(key, key * key)
+    return sum(table.get_item(key) for key in range(event["count"]))
+
+
+class LatencyFakeTest(unittest.TestCase):
+
+    def test_virtual_clock(self):
+        clock = latency.VirtualClock()
+        fake = latency.LatencyFake(FakeTable(), latency.FixedLatency(100), clock=clock)
+        result = call_module.run_lambda(handle, {"count": 20},
+                                        patches={"tests.test_latency.table": fake},
+                                        clock=clock)
+        self.assertEqual(result.value, sum(k * k for k in range(20)))
+        self.assertEqual(fake.name, "fake_table")
+        # 40 calls of 100 ms each, without any real sleeping
+        self.assertGreaterEqual(result.summary.duration_in_millis, 4000)
+        self.assertLess(result.summary.duration_in_millis, 4500)
+        self.assertAlmostEqual(clock.elapsed_in_seconds(), 4.0)
+
+    def test_virtual_timeout(self):
+        clock = latency.VirtualClock()
+        fake = latency.LatencyFake(FakeTable(), latency.FixedLatency(100), clock=clock)
+        remaining = []
+
+        def handle_with_remaining(event, context):
+            for key in range(event["count"]):
+                remaining.append(context.get_remaining_time_in_millis())
+                fake.put_item(key, key)
+            return event["count"]
+
+        result = call_module.run_lambda(handle_with_remaining, {"count": 20},
+                                        timeout_in_seconds=1, clock=clock)
+        self.assertTrue(result.timed_out)
+        self.assertGreaterEqual(result.summary.duration_in_millis, 1000)
+        self.assertLess(result.summary.duration_in_millis, 1100)
+        self.assertEqual(len(remaining), 10)
+        self.assertLessEqual(remaining[5], 500)
+        self.assertGreater(remaining[5], 400)
+
+        # calls within the timeout complete
+        result = call_module.run_lambda(handle_with_remaining, {"count": 5},
+                                        timeout_in_seconds=1, clock=clock)
+        self.assertFalse(result.timed_out)
+        self.assertEqual(result.value, 5)
+
+    def test_real_sleep(self):
+        fake = latency.LatencyFake(lambda n: n + 1, latency.FixedLatency(20))
+        result = call_module.run_lambda(lambda event, context: fake(fake(1)), {})
+        self.assertEqual(result.value, 3)
+        self.assertGreaterEqual(result.summary.duration_in_millis, 40)
+
+    def test_error_injection(self):
+        clock = latency.VirtualClock()
+        fake = latency.LatencyFake(lambda: "ok", latency.FixedLatency(1),
+                                   error_rate=0.2, throttle_rate=0.1,
+                                   clock=clock, seed=1)
+        outcomes = {"ok": 0, "error": 0, "throttle": 0}
+        for _ in range(2000):
+            try:
+                outcomes[fake()] += 1
+            except latency.InjectedThrottle:
+                outcomes["throttle"] += 1
+            except latency.InjectedError:
+                outcomes["error"] += 1
+        self.assertAlmostEqual(outcomes["ok"] / 2000.0, 0.7, delta=0.05)
+        self.assertAlmostEqual(outcomes["error"] / 2000.0, 0.2, delta=0.05)
+        self.assertAlmostEqual(outcomes["throttle"] / 2000.0, 0.1, delta=0.05)
+        self.assertAlmostEqual(clock.elapsed_in_seconds(), 2.0)
+
+    def test_models(self):
+        rng = random.Random(0)
+        lognormal = latency.DistributionLatency.lognormal(10, 0.5)
+        samples = sorted(lognormal.sample(rng) for _ in range(2001))
+        self.assertAlmostEqual(samples[1000], 10, delta=1)
+        self.assertTrue(all(latency.DistributionLatency.normal(1, 5).sample(rng) >= 0
+                            for _ in range(100)))
+        empirical = latency.EmpiricalLatency([3, 5, 7])
+        self.assertIn(empirical.sample(rng), [3, 5, 7])
+        self.assertRaises(ValueError, latency.EmpiricalLatency, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
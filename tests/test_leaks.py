@@ -0,0 +1,73 @@
+import unittest
+
+import run_lambda.container as container_module
+import run_lambda.leaks as leaks_module
+import tests.test_cli as test_cli
+
+RETAINED = []
+
+
+def leak(event, context):
+    RETAINED.append(bytearray(event))  # leaks
+    return len(RETAINED)
+
+
+def steady(event, context):
+    return len(bytearray(event))
+
+
+class LeakDetectorTest(unittest.TestCase):
+
+    def detect(self, function_name, invocations=200):
+        container = container_module.Container.of_file("tests/test_leaks.py", function_name)
+        detector = leaks_module.LeakDetector(container, [1000, 3000],
+                                             invocations=invocations,
+                                             snapshot_interval=20)
+        return detector.run()
+
+    def test_fit_line(self):
+        slope, intercept, r_squared = leaks_module.fit_line([0, 1, 2, 3], [1, 3, 5, 7])
+        self.assertAlmostEqual(slope, 2)
+        self.assertAlmostEqual(intercept, 1)
+        self.assertAlmostEqual(r_squared, 1)
+        self.assertEqual(leaks_module.fit_line([0, 1, 2], [4, 4, 4]), (0.0, 4.0, 1.0))
+
+    def test_leak(self):
+        report = self.detect("leak")
+        self.assertEqual(report.invocation_count, 200)
+        self.assertEqual(report.failure_count, 0)
+        site = report.sites[0]
+        self.assertTrue(site.location.endswith("test_leaks.py:11"), site.location)
+        # 2000 bytes per invocation on average, plus object overheads
+        self.assertGreater(site.bytes_per_invocation, 2000)
+        self.assertLess(site.bytes_per_invocation, 2300)
+        self.assertGreaterEqual(site.growth_in_blocks, 200)
+        self.assertGreater(site.r_squared, 0.99)
+        self.assertGreater(report.bytes_per_invocation, 2000)
+        projected = report.projected_invocations_until_limit()
+        headroom = 256 * 1048576 - report.memory_used_in_bytes
+        self.assertAlmostEqual(projected, headroom / 2100, delta=headroom / 2100 * 0.1)
+
+    def test_no_leak(self):
+        report = self.detect("steady")
+        self.assertEqual([site for site in report.sites
+                          if "test_leaks.py" in site.location], [])
+        self.assertLess(abs(report.bytes_per_invocation), 100)
+
+    def test_too_few_invocations(self):
+        self.assertRaises(ValueError, leaks_module.LeakDetector, None, [{}],
+                          invocations=10, snapshot_interval=10)
+
+    def test_cli(self):
+        event = test_cli.RunLambdaCliTest.make_json_file(500)
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "leaks", "tests/test_leaks.py", event, "-f", "leak",
+             "-n", "100", "--interval", "20", "--frames", "2"])
+        self.assertIn("Invocations: 100 ", output)
+        self.assertIn("Projected memory limit after: ", output)
+        self.assertIn("test_leaks.py:11\n", output)
+        self.assertIn("called from ", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
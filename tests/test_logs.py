@@ -0,0 +1,95 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import six
+
+import run_lambda.call as call_module
+import run_lambda.context as context_module
+import run_lambda.logs as logs_module
+
+
+def echo(event, context):
+    print("event {}".format(event))
+    return event
+
+
+class LogSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def context(self, log_stream_name):
+        return context_module.MockLambdaContext.Builder()\
+            .set_log_group_name("/aws/lambda/logs_test")\
+            .set_log_stream_name(log_stream_name).build()
+
+    def read_lines(self, stream_directory):
+        lines = []
+        for name in sorted(os.listdir(stream_directory)):
+            opener = gzip.open if name.endswith(".gz") else open
+            with opener(os.path.join(stream_directory, name), "rb") as segment:
+                lines.extend(segment.read().decode("utf-8").splitlines())
+        return lines
+
+    def test_partitioned_by_stream(self):
+        with logs_module.LogSink(self.directory) as sink:
+            for i in range(3):
+                for stream in ("a", "b"):
+                    call_module.run_lambda(echo, i, context=self.context(stream),
+                                           listeners=[sink.record])
+
+        for stream in ("a", "b"):
+            stream_directory = os.path.join(self.directory, "aws", "lambda",
+                                            "logs_test", stream)
+            self.assertEqual(stream_directory,
+                             sink.stream_directory("/aws/lambda/logs_test", stream))
+            self.assertEqual(os.listdir(stream_directory), ["000000.log"])
+            lines = self.read_lines(stream_directory)
+            self.assertEqual([line.split(" ", 1)[1] for line in lines
+                              if "event" in line],
+                             ["event 0", "event 1", "event 2"])
+            # each line is prefixed with an ISO 8601 timestamp
+            six.assertRegex(self, lines[0], r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z ")
+            self.assertEqual(len([line for line in lines if " REPORT " in line]), 3)
+
+    def test_rotation(self):
+        with logs_module.LogSink(self.directory, max_segment_bytes=1) as sink:
+            for i in range(3):
+                call_module.run_lambda(echo, i, context=self.context("rotated"),
+                                       listeners=[sink.record])
+
+        stream_directory = sink.stream_directory("/aws/lambda/logs_test", "rotated")
+        self.assertEqual(sorted(os.listdir(stream_directory)),
+                         ["000000.log.gz", "000001.log.gz", "000002.log.gz"])
+        lines = self.read_lines(stream_directory)
+        self.assertEqual([line.split(" ", 1)[1] for line in lines if "event" in line],
+                         ["event 0", "event 1", "event 2"])
+
+        # a new sink continues after the existing segments, without leaving
+        # an empty file next to the last rotated one
+        with logs_module.LogSink(self.directory) as sink:
+            call_module.run_lambda(echo, 3, context=self.context("rotated"),
+                                   listeners=[sink.record])
+        self.assertEqual(sorted(os.listdir(stream_directory)),
+                         ["000000.log.gz", "000001.log.gz", "000002.log.gz",
+                          "000003.log"])
+        self.assertIn("event 3", self.read_lines(stream_directory)[-3])
+
+    def test_writer_failure(self):
+        # a file where the log group's directory would be created
+        open(os.path.join(self.directory, "aws"), "w").close()
+        sink = logs_module.LogSink(self.directory)
+        call_module.run_lambda(echo, 0, context=self.context("failing"),
+                               listeners=[sink.record])
+        self.assertRaises(OSError, sink.close)
+        self.assertRaises(OSError, sink.record, self.context("failing"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import socket
+import threading
+import unittest
+
+from six.moves.urllib.request import urlopen
+
+import run_lambda.call as call_module
+import run_lambda.context as context_module
+import run_lambda.metrics as metrics_module
+
+
+def succeed(event, context):
+    return event
+
+
+def fail(event, context):
+    raise ValueError(event)
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def run_calls(self, registry):
+        context = context_module.MockLambdaContext.Builder()\
+            .set_function_name("metrics_test").build()
+        call_module.run_lambda(succeed, {}, context=context,
+                               init_duration_in_millis=12,
+                               listeners=[registry.record])
+        call_module.run_lambda(succeed, {}, context=context,
+                               listeners=[registry.record])
+        call_module.run_lambda(fail, {}, context=context,
+                               listeners=[registry.record])
+
+    def test_collect(self):
+        registry = metrics_module.MetricsRegistry()
+        self.run_calls(registry)
+        thread = threading.Thread(target=self.run_calls, args=(registry,))
+        thread.start()
+        thread.join()
+
+        metrics = registry.collect()["metrics_test"]
+        self.assertEqual(metrics.invocation_count, 6)
+        self.assertEqual(metrics.error_count, 2)
+        self.assertEqual(metrics.timeout_count, 0)
+        self.assertEqual(metrics.cold_start_count, 2)
+        self.assertEqual(metrics.duration.count, 6)
+        self.assertEqual(metrics.init_duration.count, 2)
+        self.assertEqual(metrics.init_duration.sum, 24)
+        self.assertEqual(metrics.usage.count, 6)
+
+    def test_render_and_serve(self):
+        registry = metrics_module.MetricsRegistry()
+        self.run_calls(registry)
+        server = metrics_module.serve(registry, port=0)
+        try:
+            response = urlopen("http://127.0.0.1:{}/metrics".format(server.server_port))
+            self.assertEqual(response.headers["Content-Type"], metrics_module.CONTENT_TYPE)
+            text = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(text, registry.render())
+        self.assertIn('run_lambda_invocations_total{function_name="metrics_test"} 3\n', text)
+        self.assertIn('run_lambda_errors_total{function_name="metrics_test"} 1\n', text)
+        self.assertIn('run_lambda_cold_starts_total{function_name="metrics_test"} 1\n', text)
+        self.assertIn('run_lambda_init_duration_milliseconds_bucket'
+                      '{function_name="metrics_test",le="25.0"} 1\n', text)
+        self.assertIn('run_lambda_duration_milliseconds_bucket'
+                      '{function_name="metrics_test",le="+Inf"} 3\n', text)
+        self.assertIn('run_lambda_cpu_seconds_total{function_name="metrics_test",mode="user"} ',
+                      text)
+        self.assertIn('run_lambda_gc_collections_total'
+                      '{function_name="metrics_test",generation="2"} ', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+
+    def test_statsd(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(5)
+        try:
+            statsd = metrics_module.StatsdClient(
+                host="127.0.0.1", port=receiver.getsockname()[1])
+            registry = metrics_module.MetricsRegistry(statsd=statsd)
+            context = context_module.MockLambdaContext.Builder()\
+                .set_function_name("statsd.test").build()
+            call_module.run_lambda(fail, {}, context=context,
+                                   listeners=[registry.record])
+            packet = receiver.recv(65536).decode("utf-8").split("\n")
+            statsd.close()
+        finally:
+            receiver.close()
+        self.assertIn("run_lambda.statsd_test.invocations:1|c", packet)
+        self.assertIn("run_lambda.statsd_test.errors:1|c", packet)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+import mock
+
+import run_lambda.container as container_module
+import run_lambda.package as package_module
+import tests.test_cli as test_cli
+
+SITE_PACKAGES = "python/lib/python{}.{}/site-packages/".format(*sys.version_info[:2])
+
+
+class PackageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.directory, "cache")
+        self.function_zip = self.make_zip("function.zip", {
+            "app/__init__.py": "",
+            "app/main.py": "import greeting\nimport punctuation\n"
+                           "def handler(event, context):\n"
+                           "    return greeting.GREETING + event + punctuation.MARK\n",
+        })
+        self.base_layer = self.make_zip("base.zip", {
+            "python/greeting.py": "GREETING = 'hello '\n",
+            "python/punctuation.py": "MARK = '.'\n",
+        })
+        self.override_layer = self.make_zip("override.zip", {
+            SITE_PACKAGES + "punctuation.py": "MARK = '!'\n",
+        })
+        self.layers = [self.base_layer, self.override_layer]
+
+    def tearDown(self):
+        for name in ("app", "app.main", "greeting", "punctuation"):
+            sys.modules.pop(name, None)
+        sys.path[:] = [path for path in sys.path if not path.startswith(self.directory)]
+        for root, directories, filenames in os.walk(self.directory):
+            for filename in filenames:
+                os.chmod(os.path.join(root, filename), 0o644)
+        shutil.rmtree(self.directory)
+
+    def make_zip(self, name, files):
+        filename = os.path.join(self.directory, name)
+        with zipfile.ZipFile(filename, "w") as archive:
+            for path, source in files.items():
+                archive.writestr(path, source)
+        return filename
+
+    def test_split_handler(self):
+        self.assertEqual(package_module.split_handler("app/main.handler"),
+                         ("app.main", "handler"))
+        self.assertEqual(package_module.split_handler("main.handler"),
+                         ("main", "handler"))
+        self.assertRaises(ValueError, package_module.split_handler, "handler")
+
+    def test_extracted(self):
+        package = package_module.Package(self.function_zip, layers=self.layers,
+                                         cache_directory=self.cache_directory)
+        paths = package.paths
+        # function code, then site-packages and python directories of the
+        # layers, the last layer first
+        site_packages = SITE_PACKAGES.rstrip("/")
+        # (each path starts with CACHE_DIRECTORY/SHA256/)
+        self.assertEqual([path[len(self.cache_directory) + 66:] for path in paths],
+                         ["", site_packages, "python", "python"])
+        self.assertEqual(paths[1].rsplit(site_packages)[0], paths[2].rsplit("python")[0])
+        self.assertEqual(len(os.listdir(self.cache_directory)), 3)
+        # extracted files are read-only
+        main_file = os.path.join(paths[0], "app", "main.py")
+        self.assertEqual(os.stat(main_file).st_mode & 0o222, 0)
+
+        module = package.load_module("app.main", isolated=True)
+        self.assertEqual(module.handler("world", None), "hello world!")
+        self.assertNotIn("app.main", sys.modules)
+        self.assertNotIn("greeting", sys.modules)
+
+        # the cache is reused
+        package = package_module.Package(self.function_zip, layers=self.layers,
+                                         cache_directory=self.cache_directory)
+        self.assertEqual(package.paths, paths)
+        self.assertEqual(len(os.listdir(self.cache_directory)), 3)
+
+    def test_zipimport(self):
+        package = package_module.Package(self.function_zip, layers=self.layers,
+                                         extract=False)
+        module = package.load_module("app.main")
+        self.assertEqual(module.handler("world", None), "hello world!")
+        self.assertIn(self.function_zip, module.__file__)
+
+    def test_layout(self):
+        package = package_module.Package(self.function_zip, layers=self.layers,
+                                         cache_directory=self.cache_directory)
+        layout = package.layout()
+        self.assertEqual([(os.path.basename(f), count) for f, count, _, _ in layout],
+                         [("function.zip", 2), ("base.zip", 2), ("override.zip", 1)])
+
+    def test_container(self):
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_directory}):
+            containers = [container_module.Container.of_file(
+                self.function_zip, "app/main.handler", layers=self.layers)
+                for _ in range(2)]
+        for container in containers:
+            result = container.invoke("world")
+            self.assertEqual(result.value, "hello world!")
+            self.assertIsNotNone(result.summary.init_duration_in_millis)
+
+    def test_cli(self):
+        event = test_cli.RunLambdaCliTest.make_json_file("world")
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_directory}):
+            output = test_cli.RunLambdaCliTest.call(
+                ["run_lambda", self.function_zip, event, "-f", "app.main.handler",
+                 "--layer", self.base_layer, "--layer", self.override_layer])
+        self.assertIn("Returned value hello world!", output)
+        self.assertIn("Init duration: ", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
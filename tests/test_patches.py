@@ -0,0 +1,100 @@
+import math
+import threading
+import time
+import unittest
+
+import mock
+
+import run_lambda.call as call_module
+import run_lambda.patches as patches_module
+import tests.square_root as square_root
+
+
+class PatchSetTest(unittest.TestCase):
+
+    def test_repeated_calls(self):
+        patch_set = patches_module.PatchSet({"math.sqrt": lambda n: -n})
+        for number in range(1, 6):
+            result = call_module.run_lambda(square_root.handle,
+                                            {"number": number},
+                                            patches=patch_set)
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.value, -number)
+            self.assertFalse(patch_set.applied)
+            self.assertEqual(math.sqrt(4), 2)  # check patch is gone
+
+        stats = patch_set.stats()
+        self.assertEqual(list(stats.keys()), ["math.sqrt"])
+        self.assertEqual(stats["math.sqrt"].call_count, 5)
+        self.assertGreaterEqual(stats["math.sqrt"].total_duration_in_millis, 0)
+        patch_set.reset_stats()
+        self.assertEqual(patch_set.stats()["math.sqrt"].call_count, 0)
+
+    def test_session(self):
+        mock_sqrt = mock.MagicMock(return_value=7)
+        patch_set = patches_module.PatchSet({"math.sqrt": mock_sqrt,
+                                             "math.tau": 1})
+        with patch_set:
+            self.assertTrue(patch_set.applied)
+            for _ in range(3):
+                result = call_module.run_lambda(square_root.handle,
+                                                {"number": 9},
+                                                patches=patch_set)
+                self.assertEqual(result.value, 7)
+                self.assertTrue(patch_set.applied)
+            self.assertEqual(math.tau, 1)
+        self.assertFalse(patch_set.applied)
+        self.assertEqual(math.sqrt(9), 3)
+        self.assertGreater(math.tau, 6)
+        self.assertEqual(mock_sqrt.call_count, 3)
+        self.assertEqual(patch_set.stats()["math.sqrt"].call_count, 3)
+        self.assertNotIn("math.tau", patch_set.stats())
+
+    def test_threads(self):
+        def slow_sqrt(n):
+            time.sleep(0.001)
+            return -n
+        patch_set = patches_module.PatchSet({"math.sqrt": slow_sqrt})
+        values = []
+
+        def invoke():
+            for _ in range(20):
+                values.append(call_module.run_lambda(
+                    square_root.handle, {"number": 4}, patches=patch_set).value)
+        threads = [threading.Thread(target=invoke) for _ in range(8)]
+        with patch_set:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # other threads' calls do not remove the patches applied here
+            self.assertEqual(math.sqrt(4), -4)
+        self.assertEqual(values, [-4] * 160)
+        self.assertEqual(patch_set.stats()["math.sqrt"].call_count, 161)
+        self.assertFalse(patch_set.applied)
+        self.assertEqual(math.sqrt(4), 2)
+
+        # the nesting depth is per thread
+        patch_set.start()
+        thread = threading.Thread(target=lambda: self.assertRaises(RuntimeError,
+                                                                   patch_set.stop))
+        thread.start()
+        thread.join()
+        self.assertTrue(patch_set.applied)
+        patch_set.stop()
+
+    def test_missing_attribute(self):
+        patch_set = patches_module.PatchSet({"math.not_an_attribute": 1})
+        with patch_set:
+            self.assertEqual(math.not_an_attribute, 1)
+        self.assertFalse(hasattr(math, "not_an_attribute"))
+        self.assertRaises(RuntimeError, patch_set.stop)
+
+    def test_invalid_target(self):
+        self.assertRaises(TypeError, patches_module.PatchSet, {"math": 1})
+        self.assertRaises(ImportError, patches_module.PatchSet,
+                          {"no_such_module.value": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import decimal
+import time
+import unittest
+
+import run_lambda.asyncinvoke as asyncinvoke_module
+import run_lambda.call as call_module
+import run_lambda.payload as payload_module
+import tests.test_cli as test_cli
+
+
+def handler(event, context):
+    if event["kind"] == "echo":
+        return {"event": event, "pair": (1, 2), "price": decimal.Decimal("2.50")}
+    elif event["kind"] == "large":
+        return "x" * payload_module.RESPONSE_LIMIT_IN_BYTES
+    elif event["kind"] == "unserializable":
+        return {"value": object()}
+    elif event["kind"] == "bytes":
+        return b"\x00raw"
+    elif event["kind"] == "slow":
+        return [SlowValue()]
+    raise ValueError(event["kind"])
+
+
+class SlowValue(decimal.Decimal):
+    # a value that takes a while to encode
+    def __new__(cls):
+        return decimal.Decimal.__new__(cls, "1.0")
+
+    def __float__(self):
+        time.sleep(0.1)
+        return 1.0
+
+
+class PayloadTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        result = call_module.run_lambda(handler, {"kind": "echo", "tuple": (1, 2)},
+                                        serialize=True)
+        self.assertIsNone(result.exception)
+        self.assertEqual(result.value, {"event": {"kind": "echo", "tuple": [1, 2]},
+                                        "pair": [1, 2], "price": 2.5})
+        self.assertEqual(result.summary.response_size_in_bytes, len(
+            b'{"event": {"kind": "echo", "tuple": [1, 2]}, "pair": [1, 2], "price": 2.5}'))
+        self.assertIsNotNone(result.summary.serialization_duration_in_millis)
+
+        # without serialization, values are passed through as they are
+        result = call_module.run_lambda(handler, {"kind": "echo"})
+        self.assertEqual(result.value["pair"], (1, 2))
+        self.assertIsNone(result.summary.response_size_in_bytes)
+        self.assertIsNone(result.summary.serialization_duration_in_millis)
+
+    def test_bytes(self):
+        result = call_module.run_lambda(handler, {"kind": "bytes"}, serialize=True)
+        self.assertEqual(result.value, b"\x00raw")
+        self.assertEqual(result.summary.response_size_in_bytes, 4)
+
+    def test_serialization_duration(self):
+        result = call_module.run_lambda(handler, {"kind": "slow"}, serialize=True)
+        self.assertEqual(result.value, [1.0])
+        self.assertGreaterEqual(result.summary.serialization_duration_in_millis, 100)
+        self.assertGreaterEqual(result.summary.duration_in_millis,
+                                result.summary.serialization_duration_in_millis)
+
+    def test_response_too_large(self):
+        result = call_module.run_lambda(handler, {"kind": "large"}, serialize=True)
+        self.assertIsInstance(result.exception, payload_module.LambdaError)
+        self.assertEqual(result.exception.error_type, "Function.ResponseSizeTooLarge")
+        self.assertEqual(result.exception.error_message,
+                         "Response payload size exceeded maximum allowed payload "
+                         "size (6291556 bytes).")
+        self.assertIn("[ERROR] Function.ResponseSizeTooLarge: ", result.summary.log)
+        self.assertIn("REPORT RequestId:", result.summary.log)
+
+    def test_unserializable_response(self):
+        result = call_module.run_lambda(handler, {"kind": "unserializable"}, serialize=True)
+        self.assertEqual(result.exception.error_type, "Runtime.MarshalError")
+        self.assertTrue(result.exception.error_message.startswith(
+            "Unable to marshal response: "))
+
+    def test_request_too_large(self):
+        event = {"kind": "echo", "data": "x" * 300000}
+        self.assertIsNone(call_module.run_lambda(handler, event, serialize=True).exception)
+        result = call_module.run_lambda(handler, event, serialize=True,
+                                        invocation_type=payload_module.EVENT)
+        self.assertEqual(result.exception.error_type, "RequestEntityTooLargeException")
+        self.assertEqual(result.exception.error_message,
+                         "Request must be smaller than 262144 bytes for the "
+                         "InvokeFunction operation")
+
+        event["data"] = "x" * payload_module.REQUEST_LIMITS_IN_BYTES[
+            payload_module.REQUEST_RESPONSE]
+        result = call_module.run_lambda(handler, event, serialize=True)
+        self.assertEqual(result.exception.error_type, "RequestEntityTooLargeException")
+
+    def test_async(self):
+        invoker = asyncinvoke_module.AsyncInvoker(lambda: None, serialize=True)
+        with self.assertRaises(payload_module.LambdaError):
+            invoker.invoke({"kind": "echo", "data": "x" * 300000})
+
+    def test_cli(self):
+        event = test_cli.RunLambdaCliTest.make_json_file({"kind": "echo"})
+        args = test_cli.RunLambdaCliTest.arguments("tests/test_payload.py", event, "handler")
+        args[1:1] = ["--serialize"]
+        output = test_cli.RunLambdaCliTest.call(args)
+        self.assertIn("'pair': [1, 2]", output)
+        self.assertIn("Response size: 57 bytes (serialized in ", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
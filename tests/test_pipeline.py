@@ -0,0 +1,95 @@
+import time
+import unittest
+
+import run_lambda.pipeline as pipeline_module
+
+
+def split(event, context):
+    return list(range(event["count"]))
+
+
+def square(event, context):
+    time.sleep(0.02)
+    return event * event
+
+
+def total(event, context):
+    return sum(event)
+
+
+def slow(event, context):
+    time.sleep(0.3)
+    return "slow"
+
+
+def fast(event, context):
+    return "fast"
+
+
+def fail(event, context):
+    raise ValueError(event)
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_sequence_and_map(self):
+        workflow = pipeline_module.Sequence("workflow", [
+            pipeline_module.Task("split", split),
+            pipeline_module.Map("map", pipeline_module.Task("square", square),
+                                max_concurrency=4),
+            pipeline_module.Task("total", total),
+        ])
+        result = pipeline_module.Pipeline(workflow, max_concurrency=8).run({"count": 8})
+        self.assertEqual(result.value, sum(i * i for i in range(8)))
+        statistics = result.step_statistics()
+        self.assertEqual(statistics["square"][0], 8)
+        self.assertEqual(statistics["workflow"][0], 1)
+        self.assertEqual([run.name for run in result.critical_path()],
+                         ["split", "square", "total"])
+
+    def test_parallel_critical_path(self):
+        payload = {"large": list(range(1000))}
+        received = []
+
+        def keep(event, context):
+            received.append(event)
+            return event
+
+        workflow = pipeline_module.Parallel("branches", [
+            pipeline_module.Task("slow", slow),
+            pipeline_module.Sequence("fast branch", [
+                pipeline_module.Task("fast", fast),
+                pipeline_module.Task("keep", keep),
+            ]),
+        ])
+        result = pipeline_module.Pipeline(workflow).run(payload)
+        self.assertEqual(result.value, ["slow", "fast"])
+        self.assertEqual([run.name for run in result.critical_path()], ["slow"])
+        self.assertEqual(result.bottleneck().name, "slow")
+        self.assertGreaterEqual(result.duration_in_millis, 300)
+
+        # outputs are passed between steps without copying
+        result = pipeline_module.Pipeline(pipeline_module.Task("keep", keep)).run(payload)
+        self.assertIs(received[-1], payload)
+        self.assertIs(result.value, payload)
+
+    def test_nested_map(self):
+        workflow = pipeline_module.Map("outer", pipeline_module.Sequence("inner", [
+            pipeline_module.Task("split", split),
+            pipeline_module.Map("squares", pipeline_module.Task("square", square)),
+            pipeline_module.Task("total", total),
+        ]))
+        result = pipeline_module.Pipeline(workflow, max_concurrency=2).run(
+            [{"count": n} for n in range(4)])
+        self.assertEqual(result.value, [0, 0, 1, 5])
+
+    def test_failure(self):
+        workflow = pipeline_module.Map("map", pipeline_module.Task("fail", fail))
+        with self.assertRaises(pipeline_module.StepFailed) as raised:
+            pipeline_module.Pipeline(workflow).run([1, 2])
+        self.assertEqual(raised.exception.name, "fail")
+        self.assertIsInstance(raised.exception.result.exception, ValueError)
+
+
+if __name__ == "__main__":
+    unittest.main()
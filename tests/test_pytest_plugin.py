@@ -0,0 +1,150 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import six
+
+import run_lambda.call as call_module
+import run_lambda.pytest_plugin as plugin_module
+
+HANDLERS = """
+import time
+
+INITIALIZATIONS = []
+INITIALIZATIONS.append(time.time())
+
+
+def handler(event, context):
+    print("handling " + str(event))
+    return [len(INITIALIZATIONS), context.function_name]
+
+
+def sleep(event, context):
+    time.sleep(event)
+
+
+def hang(event, context):
+    while True:
+        try:
+            time.sleep(10)
+        except BaseException:
+            pass
+"""
+
+TESTS = """
+import os
+
+import pytest
+
+from run_lambda.pytest_plugin import assert_log_contains, assert_succeeded, \\
+    assert_timed_out
+
+HANDLERS = os.path.join(os.path.dirname(__file__), "handlers.py")
+
+
+def test_first(lambda_invoke, lambda_pool):
+    result = lambda_invoke(HANDLERS, 1)
+    assert_succeeded(result)
+    assert result.summary.init_duration_in_millis is not None
+    assert lambda_pool.worker_id == "master"
+
+
+def test_warm(lambda_invoke, lambda_context):
+    result = lambda_invoke(HANDLERS, 2, context=lambda_context(function_name="fn"))
+    assert_succeeded(result, [1, "fn"])
+    assert_log_contains(result, "handling 2")
+    assert result.summary.init_duration_in_millis is None
+
+
+@pytest.mark.lambda_timeout(1)
+def test_timeout(lambda_invoke):
+    assert_timed_out(lambda_invoke(HANDLERS, 3, function_name="sleep"))
+
+
+def test_failing_assertion(lambda_invoke):
+    assert_succeeded(lambda_invoke(HANDLERS, 4), "expected")
+
+
+@pytest.mark.lambda_timeout(1, isolated=True)
+def test_isolated(lambda_invoke):
+    assert_succeeded(lambda_invoke(HANDLERS, 5), [1, "function_name"])
+
+
+@pytest.mark.lambda_timeout(1, isolated=True)
+def test_isolated_failure(lambda_invoke):
+    assert_succeeded(lambda_invoke(HANDLERS, 6), "expected")
+
+
+@pytest.mark.lambda_timeout(1, isolated=True)
+def test_isolated_hang(lambda_invoke):
+    lambda_invoke(HANDLERS, 7, function_name="hang")
+"""
+
+
+def greet(event, context):
+    print("hi")
+    return event
+
+
+class PytestPluginTest(unittest.TestCase):
+
+    def test_make_context(self):
+        context = plugin_module.make_context(function_name="orders",
+                                             memory_limit_in_mb="512")
+        self.assertEqual(context.function_name, "orders")
+        self.assertEqual(context.memory_limit_in_mb, "512")
+        self.assertRaises(TypeError, plugin_module.make_context, colour="red")
+
+    def test_assertions(self):
+        result = call_module.run_lambda(greet, 1)
+        plugin_module.assert_succeeded(result, 1)
+        plugin_module.assert_duration_below(result, 1000)
+        plugin_module.assert_log_contains(result, "hi")
+        with self.assertRaises(AssertionError) as cm:
+            plugin_module.assert_raised(result, ValueError)
+        self.assertIn("Call returned 1, expected it to raise ValueError", str(cm.exception))
+        self.assertIn("\nhi\n", str(cm.exception))
+        self.assertRaises(AssertionError, plugin_module.assert_timed_out, result)
+        self.assertRaises(AssertionError, plugin_module.assert_memory_below, result, 0)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "isolated tests require fork")
+    def test_plugin(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, "handlers.py"), "w") as f:
+                f.write(HANDLERS)
+            with open(os.path.join(directory, "test_lambdas.py"), "w") as f:
+                f.write(TESTS)
+            process = subprocess.Popen(
+                [sys.executable, "-m", "pytest", "-p", "run_lambda.pytest_plugin",
+                 "-p", "no:cacheprovider", "-v", "-o", "console_output_style=classic",
+                 os.path.join(directory, "test_lambdas.py")],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            output = process.communicate()[0].decode("utf-8")
+        finally:
+            shutil.rmtree(directory)
+        # lines of the form "PATH/test_lambdas.py::NAME OUTCOME"
+        outcomes = dict(line.split("::")[1].split()[:2] for line in output.splitlines()
+                        if "test_lambdas.py::" in line.split(" ")[0])
+        self.assertEqual(outcomes, {
+            "test_first": "PASSED",
+            "test_warm": "PASSED",
+            "test_timeout": "PASSED",
+            "test_failing_assertion": "FAILED",
+            "test_isolated": "PASSED",
+            "test_isolated_failure": "FAILED",
+            "test_isolated_hang": "FAILED",
+        }, output)
+        self.assertIn("Call returned [1, 'function_name'], expected 'expected'", output)
+        self.assertIn("handling 6", output)
+        # with the traceback of the failure in the isolated process
+        six.assertRegex(self, output, r'test_lambdas.py", line \d+, in test_isolated_failure')
+        self.assertIn("Isolated test did not complete within 2 seconds", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
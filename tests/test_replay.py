@@ -0,0 +1,142 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import run_lambda.corpus as corpus_module
+import run_lambda.replay as replay_module
+import tests.test_cli as test_cli
+
+
+class LogHistogramTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        rng = random.Random(0)
+        values = [rng.lognormvariate(3, 1) for _ in range(10000)] + [0.0] * 10
+        histogram = replay_module.LogHistogram(relative_accuracy=0.01)
+        for value in values:
+            histogram.observe(value)
+        values.sort()
+        for percent in [0, 1, 50, 90, 99, 99.9, 100]:
+            exact = values[int(percent / 100.0 * (len(values) - 1))]
+            self.assertAlmostEqual(histogram.percentile(percent), exact,
+                                   delta=0.01 * exact + 1e-9)
+        self.assertEqual(histogram.max, values[-1])
+        self.assertAlmostEqual(histogram.mean, sum(values) / len(values))
+        self.assertIsNone(replay_module.LogHistogram().percentile(50))
+
+    def test_merge(self):
+        rng = random.Random(0)
+        whole = replay_module.LogHistogram()
+        parts = [replay_module.LogHistogram() for _ in range(4)]
+        for _ in range(1000):
+            value = rng.expovariate(0.1)
+            whole.observe(value)
+            rng.choice(parts).observe(value)
+        merged = replay_module.LogHistogram.of_json(parts[0].to_json())
+        for part in parts[1:]:
+            merged.add(replay_module.LogHistogram.of_json(part.to_json()))
+        for percent in [50, 90, 99, 99.9]:
+            self.assertEqual(merged.percentile(percent), whole.percentile(percent))
+        self.assertEqual(merged.count, whole.count)
+        with self.assertRaises(ValueError):
+            merged.add(replay_module.LogHistogram(relative_accuracy=0.02))
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_assignment(self):
+        keys = ["events.jsonl:{}".format(n) for n in range(1, 1001)]
+        shards = [corpus_module.Shard(index, 4) for index in range(1, 5)]
+        assigned = [[key for key in keys if shard.contains(key)] for shard in shards]
+        self.assertEqual(sorted(sum(assigned, [])), sorted(keys))
+        for keys_of_shard in assigned:
+            self.assertGreater(len(keys_of_shard), 200)
+        # assignments only depend on the key
+        self.assertEqual(corpus_module.shard_index("events.jsonl:1", 4),
+                         corpus_module.shard_index("events.jsonl:1", 4))
+        self.assertEqual(corpus_module.shard_index("events.jsonl:1", 1), 1)
+
+    def test_parse(self):
+        self.assertEqual(corpus_module.Shard.parse("3/8"), corpus_module.Shard(3, 8))
+        self.assertEqual(str(corpus_module.Shard.parse("3/8")), "3/8")
+        for spec in ["0/8", "9/8", "3", "a/b"]:
+            with self.assertRaises(ValueError):
+                corpus_module.Shard.parse(spec)
+
+
+class ReplayCliTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.events = os.path.join(self.directory, "events.jsonl")
+        with open(self.events, "w") as events_file:
+            for number in range(-2, 40):
+                events_file.write('{{"number": {}.0}}\n'.format(number))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def replay(self, *args):
+        return test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "replay", "-f", "handle", "tests/square_root.py",
+             self.events] + list(args))
+
+    def test_shard_and_merge(self):
+        results = os.path.join(self.directory, "results")
+        for index in range(1, 4):
+            self.replay("--shard", "{}/3".format(index),
+                        "-o", os.path.join(results, "{}.json".format(index)))
+        shards = [replay_module.ReplayResult.load(os.path.join(results, name))
+                  for name in sorted(os.listdir(results))]
+        self.assertEqual(sum(shard.invocations for shard in shards), 42)
+        self.assertEqual([len(shard.shards) for shard in shards], [1, 1, 1])
+
+        merged_filename = os.path.join(self.directory, "merged.json")
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "merge", results, "-o", merged_filename])
+        self.assertIn("Shards: 3 of 3", output)
+        self.assertIn("Invocations: 42", output)
+        self.assertIn("Errors: 2", output)
+        self.assertIn("Cold starts: 3", output)
+        self.assertIn("events.jsonl:1: raised ValueError", output)
+        self.assertNotIn("Missing shards", output)
+
+        merged = replay_module.ReplayResult.load(merged_filename)
+        whole = replay_module.LogHistogram()
+        for shard in shards:
+            whole.add(shard.duration)
+        self.assertEqual(merged.duration.percentile(99), whole.percentile(99))
+        self.assertEqual(merged.usage.count, 42)
+
+    def test_missing_and_duplicate_shards(self):
+        first = os.path.join(self.directory, "1.json")
+        self.replay("--shard", "1/2", "-o", first)
+        self.assertEqual(replay_module.merge_main([first]), 1)
+        self.assertIn("Missing shards: 2/2",
+                      test_cli.RunLambdaCliTest.call(["run_lambda", "merge", first]))
+        self.assertEqual(replay_module.merge_main([first, first]), 2)
+
+    def test_mismatched_results(self):
+        first = replay_module.ReplayResult("handle", "square_root.py", "events.jsonl",
+                                           [corpus_module.Shard(1, 2)])
+        for function_name, filename, events in [
+                ("handle", "other.py", "events.jsonl"),
+                ("handle", "square_root.py", "other.jsonl"),
+                ("other", "square_root.py", "events.jsonl")]:
+            second = replay_module.ReplayResult(function_name, filename, events,
+                                                [corpus_module.Shard(2, 2)])
+            with self.assertRaises(ValueError):
+                first.add(second)
+        self.assertEqual(first.shards, [corpus_module.Shard(1, 2)])
+
+    def test_report(self):
+        output = self.replay()
+        self.assertIn("Invocations: 42", output)
+        self.assertIn("p99.9", output)
+        self.assertNotIn("Shards:", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
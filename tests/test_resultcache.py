@@ -0,0 +1,184 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import run_lambda.context as context_module
+import run_lambda.init as init
+import run_lambda.payload as payload
+import run_lambda.resultcache as resultcache
+import tests.test_cli as test_cli
+
+HANDLER = """
+import helper
+from pkg import sub
+
+CALLS = []
+
+
+def handler(event, context):
+    CALLS.append(event)
+    print("called")
+    return helper.double(event) + sub.one()
+
+
+def fail(event, context):
+    CALLS.append(event)
+    raise ValueError(event)
+
+
+class Value(object):
+    def __init__(self, event):
+        self.event = event
+
+
+def make_value(event, context):
+    CALLS.append(event)
+    return Value(event)
+"""
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write("helper.py", "def double(x):\n    return 2 * x\n")
+        self.write("pkg/__init__.py", "")
+        self.write("pkg/sub.py", "def one():\n    return 1\n")
+        self.write("unused.py", "")
+        self.write("handler.py", HANDLER)
+        self.module = init.load_module(os.path.join(self.directory, "handler.py"))
+        self.cache = resultcache.ResultCache(os.path.join(self.directory, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        for name in ["handler", "helper", "pkg", "pkg.sub"]:
+            sys.modules.pop(name, None)
+
+    def write(self, name, source):
+        filename = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, "w") as source_file:
+            source_file.write(source)
+        # so that a change is seen even within the file system's timestamp
+        # resolution
+        os.utime(filename, (0, os.stat(filename).st_mtime + len(source)))
+
+    def test_local_source_files(self):
+        files = resultcache.local_source_files(
+            os.path.join(self.directory, "handler.py"), self.directory)
+        self.assertEqual(sorted(os.path.relpath(f, os.path.realpath(self.directory))
+                                for f in files),
+                         ["handler.py", "helper.py", os.path.join("pkg", "__init__.py"),
+                          os.path.join("pkg", "sub.py")])
+
+    def test_hit(self):
+        first = self.cache.run_lambda(self.module.handler, 3)
+        second = self.cache.run_lambda(self.module.handler, 3)
+        self.assertEqual(self.module.CALLS, [3])
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.value, 7)
+        self.assertIn("called", second.summary.log)
+        self.assertEqual(second.summary.duration_in_millis, first.summary.duration_in_millis)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # other events, and context fields that results are keyed on, miss
+        self.cache.run_lambda(self.module.handler, 4)
+        context = context_module.MockLambdaContext.Builder() \
+            .set_memory_limit_in_mb("1024").build()
+        self.cache.run_lambda(self.module.handler, 3, context=context)
+        self.assertEqual(self.module.CALLS, [3, 4, 3])
+
+        # cold calls are cached apart from warm ones, whatever their init
+        # duration
+        cold = self.cache.run_lambda(self.module.handler, 3, init_duration_in_millis=10)
+        self.assertFalse(cold.cached)
+        self.assertEqual(cold.summary.init_duration_in_millis, 10)
+        cold = self.cache.run_lambda(self.module.handler, 3, init_duration_in_millis=20)
+        self.assertTrue(cold.cached)
+        self.assertEqual(cold.summary.init_duration_in_millis, 10)
+        self.assertIsNone(self.cache.run_lambda(self.module.handler, 3)
+                          .summary.init_duration_in_millis)
+        self.assertEqual(self.module.CALLS, [3, 4, 3, 3])
+
+        # a new cache on the same directory serves stored results
+        cache = resultcache.ResultCache(self.cache.directory)
+        self.assertEqual(len(cache), 4)
+        self.assertTrue(cache.run_lambda(self.module.handler, 4).cached)
+
+    def test_exception(self):
+        self.cache.run_lambda(self.module.fail, 3)
+        result = self.cache.run_lambda(self.module.fail, 3)
+        self.assertTrue(result.cached)
+        self.assertIsInstance(result.exception, ValueError)
+        self.assertEqual(self.module.CALLS, [3])
+
+    def test_unreadable_results(self):
+        self.cache.run_lambda(self.module.make_value, 3)
+        self.assertEqual(self.cache.run_lambda(self.module.make_value, 3).value.event, 3)
+
+        # the class of the stored value no longer exists
+        del sys.modules["handler"]
+        result = self.cache.run_lambda(self.module.make_value, 3)
+        self.assertFalse(result.cached)
+        self.assertEqual(self.module.CALLS, [3, 3])
+
+        # e.g. a result stored by an older version
+        filename = os.path.join(self.cache.directory,
+                                self.cache.key(self.module.handler, 3) + ".result")
+        self.cache.run_lambda(self.module.handler, 3)
+        with open(filename, "wb") as result_file:
+            result_file.write(b"\x80\x04garbage")
+        self.assertFalse(self.cache.run_lambda(self.module.handler, 3).cached)
+        self.assertTrue(self.cache.run_lambda(self.module.handler, 3).cached)
+
+    def test_serialize(self):
+        event = "x" * 300000
+        self.cache.run_lambda(self.module.fail, event, serialize=True)
+        self.assertTrue(self.cache.run_lambda(self.module.fail, event, serialize=True).cached)
+        result = self.cache.run_lambda(self.module.fail, event, serialize=True,
+                                       invocation_type=payload.EVENT)
+        self.assertFalse(result.cached)
+        self.assertEqual(result.exception.error_type, "RequestEntityTooLargeException")
+        self.assertFalse(self.cache.run_lambda(self.module.fail, event).cached)
+
+    def test_invalidation(self):
+        self.cache.run_lambda(self.module.handler, 3)
+        self.write("unused.py", "x = 1\n")
+        self.assertTrue(self.cache.run_lambda(self.module.handler, 3).cached)
+        self.write("pkg/sub.py", "def one():\n    return 1  # changed\n")
+        self.assertFalse(self.cache.run_lambda(self.module.handler, 3).cached)
+        self.write("handler.py", HANDLER + "\n# changed\n")
+        self.assertFalse(self.cache.run_lambda(self.module.handler, 3).cached)
+        self.assertEqual(self.module.CALLS, [3, 3, 3])
+
+    def test_eviction(self):
+        self.cache.run_lambda(self.module.handler, 0)
+        size = self.cache.size_in_bytes
+        cache = resultcache.ResultCache(self.cache.directory,
+                                        max_size_in_bytes=int(2.5 * size))
+        cache.run_lambda(self.module.handler, 1)
+        cache.run_lambda(self.module.handler, 0)  # most recently used
+        cache.run_lambda(self.module.handler, 2)  # evicts the result for 1
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.size_in_bytes, int(2.5 * size))
+        self.assertTrue(cache.run_lambda(self.module.handler, 0).cached)
+        self.assertTrue(cache.run_lambda(self.module.handler, 2).cached)
+        self.assertFalse(cache.run_lambda(self.module.handler, 1).cached)
+
+    def test_cli(self):
+        event = test_cli.RunLambdaCliTest.make_json_file({"number": 4.0})
+        args = ["run_lambda", "--result-cache", os.path.join(self.directory, "cli"),
+                "-f", "handle", "tests/square_root.py", event]
+        output = test_cli.RunLambdaCliTest.call(args)
+        self.assertNotIn("Served from result cache", output)
+        output = test_cli.RunLambdaCliTest.call(args)
+        self.assertIn("Served from result cache", output)
+        self.assertIn("Returned value 2.0", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
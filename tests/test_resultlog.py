@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import time
+import timeit
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.resultlog as resultlog_module
+import tests.test_cli as test_cli
+
+
+def handler(event, context):
+    print("event {}".format(event))
+    if event == "loop":
+        while True:
+            time.sleep(0.01)
+    if event < 0:
+        raise ValueError("negative")
+    return {"double": 2 * event}
+
+
+class ResultLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "results.rlog")
+        self.results = [call_module.run_lambda(handler, event) for event in [1, 2, -1]]
+        self.results.append(call_module.run_lambda(handler, "loop", timeout_in_seconds=0.1))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, count):
+        with resultlog_module.ResultLogWriter(self.filename) as writer:
+            for index in range(count):
+                writer.append(self.results[index % len(self.results)],
+                              key="events.jsonl:{}".format(index), timestamp=index)
+
+    def test_round_trip(self):
+        self.write(8)
+        with resultlog_module.ResultLog(self.filename) as log:
+            self.assertEqual(len(log), 8)
+            records = list(log)
+            self.assertEqual([record.status for record in records[:4]],
+                             [resultlog_module.SUCCEEDED, resultlog_module.SUCCEEDED,
+                              resultlog_module.FAILED, resultlog_module.TIMED_OUT])
+            self.assertEqual(records[1].value, '{"double": 4}')
+            self.assertEqual(records[2].value, "ValueError: negative")
+            self.assertEqual(records[3].value, "")
+            self.assertEqual(records[5].key, "events.jsonl:5")
+            self.assertEqual(records[5].log, self.results[1].summary.log)
+            self.assertEqual(records[5].timestamp, 5)
+            self.assertEqual(records[5].duration_in_millis,
+                             self.results[1].summary.duration_in_millis)
+            self.assertIsNone(records[5].init_duration_in_millis)
+            self.assertEqual(log[-1].key, "events.jsonl:7")
+
+    def test_query(self):
+        self.write(100)
+        with resultlog_module.ResultLog(self.filename) as log:
+            timeouts = list(log.query(status=resultlog_module.TIMED_OUT))
+            self.assertEqual([record.index for record in timeouts], list(range(3, 100, 4)))
+            self.assertIn("event loop", timeouts[0].log)
+            recent = list(log.query(status=resultlog_module.FAILED, since=50, until=60))
+            self.assertEqual([record.index for record in recent], [50, 54, 58])
+            slowest = log.slowest(5)
+            self.assertEqual(len(slowest), 5)
+            self.assertTrue(all(record.status == resultlog_module.TIMED_OUT
+                                for record in slowest))
+            self.assertEqual(len(list(log.query(min_duration_in_millis=50))), 25)
+            self.assertEqual(len(list(log.query(cold=True))), 0)
+
+    def test_append_and_truncation(self):
+        self.write(4)
+        self.write(4)
+        # a record whose sections were never written
+        with open(self.filename + ".idx", "ab") as index_file:
+            with open(self.filename + ".idx", "rb") as original:
+                original.seek(-resultlog_module._RECORD.size, os.SEEK_END)
+                record = original.read()
+            index_file.write(record[:-4] + b"\xff\xff\xff\x7f")
+        with resultlog_module.ResultLog(self.filename) as log:
+            self.assertEqual(len(log), 8)
+        self.write(1)
+        with resultlog_module.ResultLog(self.filename) as log:
+            self.assertEqual([record.key for record in log][-2:],
+                             ["events.jsonl:3", "events.jsonl:0"])
+            self.assertEqual(log[-1].value, '{"double": 2}')
+
+    def test_throughput(self):
+        count = 50000
+        start = timeit.default_timer()
+        self.write(count)
+        self.assertLess(timeit.default_timer() - start, 2)
+        with resultlog_module.ResultLog(self.filename) as log:
+            start = timeit.default_timer()
+            self.assertEqual(len(list(log.query(status=resultlog_module.FAILED))), count // 4)
+            self.assertLess(timeit.default_timer() - start, 0.5)
+
+    def test_not_a_log(self):
+        with open(self.filename, "w") as log_file:
+            log_file.write("not a log")
+        with self.assertRaises(ValueError):
+            resultlog_module.ResultLogWriter(self.filename)
+
+    def test_cli(self):
+        event = test_cli.RunLambdaCliTest.make_json_file({"number": -4.0})
+        args = test_cli.RunLambdaCliTest.arguments("tests/square_root.py", event, "handle")
+        args[1:1] = ["--result-log", self.filename]
+        test_cli.RunLambdaCliTest.call(args)
+        test_cli.RunLambdaCliTest.call(args)
+
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "query", self.filename, "--status", "failed", "--logs",
+             "--values", "--cold"])
+        self.assertEqual(output.count("Value: ValueError: math domain error"), 2)
+        self.assertEqual(output.count("| ValueError: math domain error"), 2)
+        self.assertEqual(output.count("(cold)"), 2)
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "query", self.filename, "--count"])
+        self.assertEqual(output, "2\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
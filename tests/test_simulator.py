@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import unittest
+
+import run_lambda.container as container_module
+import run_lambda.simulator as simulator_module
+import tests.test_cli as test_cli
+
+
+def container_factory():
+    return container_module.Container.of_file("tests/square_root.py", "handle")
+
+
+class ContainerTest(unittest.TestCase):
+
+    def test_cold_then_warm(self):
+        container = container_factory()
+        self.assertFalse(container.initialized)
+        first = container.invoke({"number": 4})
+        second = container.invoke({"number": 9})
+        self.assertEqual(first.value, 2)
+        self.assertEqual(second.value, 3)
+        self.assertIsNotNone(first.summary.init_duration_in_millis)
+        self.assertIsNone(second.summary.init_duration_in_millis)
+        self.assertEqual(container.invocation_count, 2)
+        self.assertIn("[$LATEST]", container.log_stream_name)
+
+    def test_isolated_modules(self):
+        first, second = container_factory(), container_factory()
+        first.initialize()
+        second.initialize()
+        self.assertIsNot(first._handler, second._handler)
+
+
+class ConcurrencySimulatorTest(unittest.TestCase):
+
+    def test_throttling(self):
+        simulator = simulator_module.ConcurrencySimulator(
+            container_factory, provisioned_concurrency=1, reserved_concurrency=3)
+        report = simulator.run([(0.0, {"number": n}) for n in range(5)])
+        self.assertEqual(report.invocation_count, 3)
+        self.assertEqual(report.cold_start_count, 2)
+        self.assertEqual(report.throttle_count, 2)
+        self.assertEqual(report.error_count, 0)
+        self.assertEqual(report.container_count, 3)
+        self.assertEqual(report.queue_delay_percentile(100), 0)
+        self.assertEqual(sorted(r.result.value for r in report.records), [0, 1, 2 ** 0.5])
+
+    def test_init_error(self):
+        fd, filename = tempfile.mkstemp(suffix=".py")
+        with os.fdopen(fd, "w") as handler_file:
+            handler_file.write("import no_such_module\n\n\ndef handler(event, context):\n"
+                               "    return event\n")
+        try:
+            simulator = simulator_module.ConcurrencySimulator(
+                lambda: container_module.Container.of_file(filename, "handler"),
+                provisioned_concurrency=1)
+            report = simulator.run([(0.0, {}), (0.0, {}), (10.0, {})])
+        finally:
+            os.remove(filename)
+        # every invocation fails, and initializes its container again
+        self.assertEqual(report.invocation_count, 3)
+        self.assertEqual(report.error_count, 3)
+        self.assertEqual(report.cold_start_count, 3)
+        for record in report.records:
+            self.assertIsInstance(record.result.exception, ImportError)
+            self.assertIn("no_such_module", record.result.summary.log)
+
+    def test_scale_up_rate(self):
+        simulator = simulator_module.ConcurrencySimulator(
+            container_factory, scale_up_rate=0.1)
+        report = simulator.run([(0.0, {"number": n}) for n in range(3)]
+                               + [(20.0, {"number": 1})])
+        self.assertEqual(report.invocation_count, 4)
+        self.assertEqual(report.cold_start_count, 1)
+        self.assertEqual(report.throttle_count, 0)
+        self.assertEqual(report.container_count, 1)
+        self.assertGreater(report.queue_delay_percentile(100), 0)
+        self.assertGreater(report.latency_percentile(100),
+                           report.queue_delay_percentile(100))
+        windows = report.windows(10.0)
+        self.assertEqual([(start, len(records)) for start, records, _ in windows],
+                         [(0.0, 3), (20.0, 1)])
+
+    def test_cli(self):
+        _, trace_filename = tempfile.mkstemp()
+        with open(trace_filename, "w") as trace_file:
+            for timestamp in [0.0, 0.0, 0.5, 1.5]:
+                trace_file.write(json.dumps({"timestamp": timestamp,
+                                             "event": {"number": 1}}) + "\n")
+        output = test_cli.RunLambdaCliTest.call(
+            ["run_lambda", "simulate", "-f", "handle", "--reserved", "1",
+             "tests/square_root.py", trace_filename])
+        self.assertIn("Invocations: 3", output)
+        self.assertIn("Throttles: 1", output)
+        self.assertIn("Latency (ms)", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
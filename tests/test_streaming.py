@@ -0,0 +1,113 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.streaming as streaming_module
+import tests.test_cli as test_cli
+
+
+def generate_unmarked(event, context):
+    for i in range(event["chunks"]):
+        yield "chunk {}\n".format(i)
+
+
+@streaming_module.streamify
+def generate(event, context):
+    time.sleep(0.05)
+    for i in range(event["chunks"]):
+        yield "chunk {}\n".format(i)
+
+
+@streaming_module.streamify
+def write(event, response_stream, context):
+    response_stream.set_content_type("text/plain")
+    response_stream.write(b"first")
+    time.sleep(0.05)
+    response_stream.write("second")
+    if event.get("fail"):
+        raise ValueError("failed mid-stream")
+
+
+if sys.version_info >= (3, 6):
+    namespace = {}
+    exec("async def generate_async(event, context):\n"
+         "    for i in range(3):\n"
+         "        yield b'async'\n", namespace)
+    generate_async = streaming_module.streamify(namespace["generate_async"])
+
+
+class StreamingTest(unittest.TestCase):
+
+    def test_generator(self):
+        chunks = []
+        result = call_module.run_lambda(
+            generate, {"chunks": 3},
+            response_stream=streaming_module.ResponseStream(chunks.append))
+        self.assertIsNone(result.exception)
+        self.assertIsNone(result.value)
+        self.assertEqual(chunks, [b"chunk 0\n", b"chunk 1\n", b"chunk 2\n"])
+        stream = result.summary.stream
+        self.assertEqual(stream.chunk_count, 3)
+        self.assertEqual(stream.total_bytes, 24)
+        self.assertGreaterEqual(stream.time_to_first_byte_in_millis, 50)
+        self.assertGreaterEqual(stream.duration_in_millis, stream.time_to_first_byte_in_millis)
+        self.assertGreater(stream.throughput_in_bytes_per_second, 0)
+
+    def test_streamify(self):
+        chunks = []
+        response_stream = streaming_module.ResponseStream(chunks.append)
+        result = call_module.run_lambda(write, {}, response_stream=response_stream)
+        self.assertEqual(chunks, [b"first", b"second"])
+        self.assertEqual(response_stream.content_type, "text/plain")
+        self.assertTrue(response_stream.closed)
+        stream = result.summary.stream
+        self.assertEqual((stream.chunk_count, stream.total_bytes), (2, 11))
+        self.assertLess(stream.time_to_first_byte_in_millis, 50)
+        self.assertGreaterEqual(stream.duration_in_millis, 50)
+
+    def test_failure_mid_stream(self):
+        result = call_module.run_lambda(write, {"fail": True})
+        self.assertIsInstance(result.exception, ValueError)
+        self.assertEqual(result.summary.stream.chunk_count, 2)
+
+    def test_not_streamed(self):
+        result = call_module.run_lambda(lambda event, context: event, 1)
+        self.assertIsNone(result.summary.stream)
+
+        # generators returned by handlers that are not marked are values
+        result = call_module.run_lambda(generate_unmarked, {"chunks": 2})
+        self.assertIsNone(result.summary.stream)
+        self.assertEqual(list(result.value), ["chunk 0\n", "chunk 1\n"])
+
+    @unittest.skipIf(sys.version_info < (3, 6), "asynchronous generators require Python 3.6")
+    def test_async_generator(self):
+        chunks = []
+        result = call_module.run_lambda(
+            generate_async, {},
+            response_stream=streaming_module.ResponseStream(chunks.append))
+        self.assertIsNone(result.exception)
+        self.assertEqual(chunks, [b"async"] * 3)
+
+    def test_cli(self):
+        event = test_cli.RunLambdaCliTest.make_json_file({"chunks": 2})
+        _, output_filename = tempfile.mkstemp()
+        try:
+            # a second run replaces the output of the first
+            for _ in range(2):
+                output = test_cli.RunLambdaCliTest.call(
+                    ["run_lambda", "tests/test_streaming.py", event, "-f", "generate",
+                     "--stream-output", output_filename])
+                with open(output_filename, "rb") as output_file:
+                    self.assertEqual(output_file.read(), b"chunk 0\nchunk 1\n")
+        finally:
+            os.remove(output_filename)
+        self.assertIn("Streamed a response", output)
+        self.assertIn("Time to first byte: ", output)
+        self.assertIn("Streamed: 2 chunks, 16 bytes", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import json
+import math
+import os
+import tempfile
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.context as context_module
+import run_lambda.tracing as tracing
+import tests.square_root as square_root
+
+
+def sectioned_handle(event, context):
+    with tracing.span("parse", size=len(event)):
+        number = event["number"]
+    with tracing.span("compute"):
+        return square_root.handle({"number": number}, context)
+
+
+class TracingTest(unittest.TestCase):
+
+    def test_spans(self):
+        tracer = tracing.Tracer()
+        context = context_module.MockLambdaContext.Builder()\
+            .set_function_name("traced").build()
+        result = call_module.run_lambda(sectioned_handle, {"number": 16},
+                                        context=context,
+                                        patches={"math.sqrt": lambda n: -n},
+                                        init_duration_in_millis=5,
+                                        tracer=tracer)
+        self.assertEqual(result.value, -16)
+        self.assertEqual(math.sqrt(16), 4)
+        self.assertIsNone(tracing.active_tracer())
+
+        init, root = tracer.spans
+        self.assertEqual(init.name, "Initialization")
+        self.assertAlmostEqual(init.duration_in_millis, 5)
+        self.assertEqual(root.name, "traced")
+        self.assertEqual(root.category, "invocation")
+        self.assertEqual(root.attributes["aws_request_id"], context.aws_request_id)
+        self.assertTrue(root.attributes["cold_start"])
+        self.assertFalse(root.attributes["timed_out"])
+        self.assertEqual([child.name for child in root.children], ["parse", "compute"])
+        self.assertEqual(root.children[0].attributes, {"size": 1})
+        patch_span, = root.children[1].children
+        self.assertEqual(patch_span.name, "math.sqrt")
+        self.assertEqual(patch_span.category, "patch")
+        for span in [root] + root.children + [patch_span]:
+            self.assertGreaterEqual(span.duration_in_millis, 0)
+            if span.parent is not None:
+                self.assertGreaterEqual(span.start, span.parent.start)
+                self.assertLessEqual(span.end, span.parent.end)
+
+        _, filename = tempfile.mkstemp()
+        try:
+            tracer.export_chrome_trace(filename)
+            with open(filename) as trace_file:
+                events = json.load(trace_file)["traceEvents"]
+        finally:
+            os.remove(filename)
+        self.assertEqual([e["name"] for e in events],
+                         ["Initialization", "traced", "parse", "compute", "math.sqrt"])
+        self.assertTrue(all(e["ph"] == "X" and e["dur"] >= 0 for e in events))
+
+        tracer.clear()
+        self.assertEqual(tracer.spans, [])
+
+    def test_no_tracer(self):
+        result = call_module.run_lambda(sectioned_handle, {"number": 16})
+        self.assertEqual(result.value, 4)
+
+    def test_exception(self):
+        tracer = tracing.Tracer()
+
+        def handle(event, context):
+            with tracing.span("failing"):
+                raise ValueError()
+        result = call_module.run_lambda(handle, {}, tracer=tracer)
+        self.assertIsInstance(result.exception, ValueError)
+        root, = tracer.spans
+        self.assertEqual(root.attributes["exception"], "ValueError()")
+        self.assertIsNotNone(root.children[0].end)
+        self.assertIsNone(tracing.active_tracer())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import gc
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import run_lambda.call as call_module
+import run_lambda.usage as usage_module
+import tests.test_cli as test_cli
+
+
+def spin(event, context):
+    end = time.time() + event
+    while time.time() < end:
+        pass
+
+
+def wait(event, context):
+    time.sleep(event)
+
+
+def collect(event, context):
+    for _ in range(event):
+        gc.collect()
+
+
+class UsageTest(unittest.TestCase):
+
+    def test_cpu_bound(self):
+        usage = call_module.run_lambda(spin, 0.2).summary.usage
+        self.assertGreater(usage.cpu_in_millis, 150)
+        self.assertAlmostEqual(usage.cpu_in_millis,
+                               usage.user_cpu_in_millis + usage.system_cpu_in_millis)
+
+    def test_waiting(self):
+        result = call_module.run_lambda(wait, 0.2)
+        self.assertGreaterEqual(result.summary.duration_in_millis, 200)
+        self.assertLess(result.summary.usage.cpu_in_millis, 50)
+
+    def test_gc(self):
+        usage = call_module.run_lambda(collect, 3).summary.usage
+        self.assertGreaterEqual(usage.gc_collections[2], 3)
+        self.assertGreater(usage.gc_pause_in_millis[2], 0)
+        self.assertEqual(usage.total_gc_pause_in_millis, sum(usage.gc_pause_in_millis))
+
+    def test_threads(self):
+        # usage is measured per thread, so a concurrent CPU-bound call does
+        # not count towards a waiting one
+        results = {}
+
+        def invoke(handler, event):
+            results[handler] = call_module.run_lambda(handler, event)
+        threads = [threading.Thread(target=invoke, args=(spin, 0.3)),
+                   threading.Thread(target=invoke, args=(wait, 0.3))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if usage_module.resource is not None and \
+                hasattr(usage_module.resource, "RUSAGE_THREAD"):
+            self.assertLess(results[wait].summary.usage.cpu_in_millis, 50)
+        self.assertGreater(results[spin].summary.usage.cpu_in_millis, 100)
+
+    def test_without_resource(self):
+        # as on Windows, where only the CPU time is available
+        resource = usage_module.resource
+        usage_module.resource = None
+        try:
+            usage = call_module.run_lambda(spin, 0.2).summary.usage
+        finally:
+            usage_module.resource = resource
+        self.assertGreater(usage.cpu_in_millis, 150)
+        self.assertEqual(usage.minor_page_faults, 0)
+
+    def test_report(self):
+        result = call_module.run_lambda(collect, 1)
+        report = [line for line in result.summary.log.splitlines()
+                  if line.startswith("REPORT ")][0]
+        self.assertIn("\tCPU Time: ", report)
+        self.assertIn("\tGC Pause: ", report)
+        self.assertIn("\tContext Switches: ", report)
+        self.assertIn("\tPage Faults: ", report)
+
+    def test_statistics(self):
+        statistics = usage_module.UsageStatistics()
+        for user_cpu in (10.0, 30.0):
+            statistics.observe(usage_module.ResourceUsage(
+                user_cpu_in_millis=user_cpu, gc_collections=(1, 0, 1),
+                gc_pause_in_millis=(0.5, 0.0, 2.0), minor_page_faults=3), 80.0)
+        total = usage_module.UsageStatistics()
+        total.add(statistics)
+        self.assertEqual(total.count, 2)
+        self.assertEqual(total.user_cpu_in_millis, 40.0)
+        self.assertEqual(total.gc_collections, [2, 0, 2])
+        self.assertEqual(total.minor_page_faults, 6)
+        self.assertEqual(total.cpu_fraction, 0.25)
+
+    def test_cli(self):
+        _, events = tempfile.mkstemp(suffix=".jsonl")
+        try:
+            with open(events, "w") as events_file:
+                events_file.write("0.01\n0.01\n")
+            output = test_cli.RunLambdaCliTest.call(
+                ["run_lambda", "tests/test_usage.py", events, "-f", "wait"])
+        finally:
+            os.remove(events)
+        self.assertIn("CPU time: ", output)
+        self.assertIn("Resource usage:", output)
+        self.assertIn("CPU: ", output)
+
+if __name__ == "__main__":
+    unittest.main()
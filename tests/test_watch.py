@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import run_lambda.corpus as corpus_module
+import run_lambda.init as init_module
+import run_lambda.watch as watch_module
+
+
+class ModuleWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write("watch_test_dependency.py", "VALUE = 1\n")
+        self.write("watch_test_handler.py",
+                   "from watch_test_dependency import VALUE\n\n"
+                   "def handler(event, context):\n"
+                   "    return VALUE\n")
+        self.module = init_module.load_module(
+            os.path.join(self.directory, "watch_test_handler.py"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        sys.modules.pop("watch_test_handler", None)
+        sys.modules.pop("watch_test_dependency", None)
+        sys.modules.pop("watch_test_middle", None)
+
+    def write(self, filename, source):
+        path = os.path.join(self.directory, filename)
+        with open(path, "w") as f:
+            f.write(source)
+        # make sure the modification is visible, however coarse the file
+        # system's timestamps are
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    def test_reload(self):
+        watcher = watch_module.ModuleWatcher(self.module)
+        self.assertEqual(sorted(watcher.local_modules()),
+                         ["watch_test_dependency", "watch_test_handler"])
+        self.assertEqual(watcher.wait_for_changes(timeout_in_seconds=0.1), [])
+
+        self.write("watch_test_dependency.py", "VALUE = 22\n")
+        self.assertEqual(watcher.wait_for_changes(timeout_in_seconds=1),
+                         ["watch_test_dependency"])
+        module = watcher.reload(["watch_test_dependency"])
+        self.assertEqual(module.handler({}, None), 22)
+        self.assertIs(watcher.root_module, module)
+        self.assertEqual(watcher.changed_modules(), [])
+
+    def test_reload_importers(self):
+        # a local module between the root module and the changed one
+        self.write("watch_test_middle.py",
+                   "from watch_test_dependency import VALUE\n\n"
+                   "DOUBLE = 2 * VALUE\n")
+        self.write("watch_test_handler.py",
+                   "from watch_test_middle import DOUBLE\n\n"
+                   "def handler(event, context):\n"
+                   "    return DOUBLE\n")
+        module = init_module.load_module(
+            os.path.join(self.directory, "watch_test_handler.py"))
+        watcher = watch_module.ModuleWatcher(module)
+        self.assertEqual(module.handler({}, None), 2)
+
+        self.write("watch_test_dependency.py", "VALUE = 22\n")
+        module = watcher.reload(watcher.wait_for_changes(timeout_in_seconds=1))
+        self.assertEqual(module.handler({}, None), 44)
+
+    def test_third_party_modules_ignored(self):
+        watcher = watch_module.ModuleWatcher(self.module, root_directory=os.sep)
+        self.assertNotIn("six", watcher.local_modules())
+        self.assertNotIn("run_lambda.watch", watcher.local_modules())
+
+
+class CorpusTest(unittest.TestCase):
+
+    def test_load_events(self):
+        directory = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(directory, "nested"))
+            with open(os.path.join(directory, "b.json"), "w") as f:
+                json.dump({"name": "b"}, f)
+            with open(os.path.join(directory, "nested", "a.jsonl"), "w") as f:
+                f.write('{"name": "a1"}\n\n{"name": "a2"}\n')
+            with open(os.path.join(directory, "ignored.txt"), "w") as f:
+                f.write("not an event")
+            self.assertEqual(corpus_module.load_events(directory),
+                             [("b.json", {"name": "b"}),
+                              ("nested/a.jsonl:1", {"name": "a1"}),
+                              ("nested/a.jsonl:3", {"name": "a2"})])
+            self.assertEqual(
+                corpus_module.load_events(os.path.join(directory, "b.json")),
+                [("b.json", {"name": "b"})])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()